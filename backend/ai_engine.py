@@ -6,11 +6,11 @@ Uses Google Gemini for AI features and TensorFlow Serving for custom ML models
 
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.decomposition import NMF
 from collections import defaultdict, Counter
 import pandas as pd
-from django.db.models import Q, Count, Avg, F
+from django.db.models import Q, Count, Avg, F, Min, Max, Case, When, Value, FloatField, ExpressionWrapper
+from django.db.models.functions import Abs, Cast, Greatest
 from django.core.cache import cache
 from django.conf import settings
 import logging
@@ -257,6 +257,8 @@ class TensorFlowServingClient:
 class AIRecommendationEngine:
     """AI-powered recommendation engine for product suggestions"""
     
+    PREFERENCES_CACHE_TIMEOUT = 60 * 60 * 6  # Cached behavior profiles
+    
     def __init__(self):
         self.vectorizer = TfidfVectorizer(
             max_features=1000,
@@ -273,59 +275,129 @@ class AIRecommendationEngine:
         
     def analyze_user_behavior(self, user_id=None, session_key=None):
         """Analyze user behavior to build preference profile"""
-        from .models import UserBehavior, Product, Category
+        if not user_id and not session_key:
+            return {}
+        
+        cache_key = self._preferences_cache_key(user_id, session_key)
+        profile = cache.get(cache_key)
+        
+        if profile is None:
+            profile = self._aggregate_behavior_profile(user_id, session_key)
+            cache.set(cache_key, profile, self.PREFERENCES_CACHE_TIMEOUT)
+        
+        return self._profile_to_preferences(profile)
+    
+    def _preferences_cache_key(self, user_id=None, session_key=None):
+        return f'user_preferences_{user_id or session_key}'
+    
+    def _behavior_queryset(self, user_id=None, session_key=None):
+        from .models_advanced import UserBehavior
         
-        # Get user behaviors
         if user_id:
-            behaviors = UserBehavior.objects.filter(user_id=user_id)
+            return UserBehavior.objects.filter(user_id=user_id)
         elif session_key:
-            behaviors = UserBehavior.objects.filter(session_key=session_key)
-        else:
-            return {}
-        
-        # Build preference profile
+            return UserBehavior.objects.filter(session_id=session_key)
+        return UserBehavior.objects.none()
+    
+    def _aggregate_behavior_profile(self, user_id=None, session_key=None):
+        """
+        Build the raw preference profile with a single grouped query.
+        The result only depends on the number of distinct (action, category,
+        condition, city) groups, not on the length of the history, and is
+        JSON-serializable so it can live in the cache.
+        """
+        groups = self._behavior_queryset(user_id, session_key).filter(
+            product__isnull=False
+        ).values(
+            'action_type', 'product__category_id', 'product__condition', 'product__city'
+        ).annotate(
+            interactions=Count('id'),
+            min_price=Min('product__price'),
+            max_price=Max('product__price'),
+        ).order_by()
+        
+        profile = self._empty_profile()
+        for group in groups:
+            self._add_to_profile(
+                profile,
+                action_type=group['action_type'],
+                category_id=group['product__category_id'],
+                condition=group['product__condition'],
+                city=group['product__city'],
+                min_price=group['min_price'],
+                max_price=group['max_price'],
+                count=group['interactions'],
+            )
+        return profile
+    
+    def _empty_profile(self):
+        return {
+            'categories': {},
+            'conditions': {},
+            'cities': {},
+            'price_min': None,
+            'price_max': None,
+        }
+    
+    def _add_to_profile(self, profile, action_type, category_id, condition, city, min_price, max_price, count=1):
+        """Fold ``count`` interactions of one kind into a raw profile"""
+        weight = self._get_behavior_weight(action_type) * count
+        
+        if category_id:
+            key = str(category_id)
+            profile['categories'][key] = profile['categories'].get(key, 0) + weight
+        if condition:
+            profile['conditions'][condition] = profile['conditions'].get(condition, 0) + weight
+        if city:
+            profile['cities'][city] = profile['cities'].get(city, 0) + weight
+        
+        if min_price is not None:
+            min_price = float(min_price)
+            profile['price_min'] = min_price if profile['price_min'] is None else min(profile['price_min'], min_price)
+        if max_price is not None:
+            max_price = float(max_price)
+            profile['price_max'] = max_price if profile['price_max'] is None else max(profile['price_max'], max_price)
+    
+    def _profile_to_preferences(self, profile):
         preferences = {
-            'categories': Counter(),
-            'price_range': {'min': float('inf'), 'max': 0},
-            'conditions': Counter(),
-            'cities': Counter(),
-            'viewed_products': set(),
-            'liked_products': set(),
-            'purchased_products': set(),
+            'categories': Counter(profile['categories']),
+            'conditions': Counter(profile['conditions']),
+            'cities': Counter(profile['cities']),
+            'price_range': {'min': profile['price_min'], 'max': profile['price_max']},
         }
         
-        for behavior in behaviors:
-            if behavior.product:
-                # Category preferences
-                if behavior.product.category:
-                    weight = self._get_behavior_weight(behavior.action_type)
-                    preferences['categories'][behavior.product.category.id] += weight
-                
-                # Price range
-                price = float(behavior.product.price)
-                preferences['price_range']['min'] = min(preferences['price_range']['min'], price)
-                preferences['price_range']['max'] = max(preferences['price_range']['max'], price)
-                
-                # Condition preferences
-                preferences['conditions'][behavior.product.condition] += weight
-                
-                # City preferences
-                preferences['cities'][behavior.product.city] += weight
-                
-                # Product interactions
-                if behavior.action_type == 'VIEW':
-                    preferences['viewed_products'].add(behavior.product.id)
-                elif behavior.action_type == 'LIKE':
-                    preferences['liked_products'].add(behavior.product.id)
-                elif behavior.action_type == 'PURCHASE':
-                    preferences['purchased_products'].add(behavior.product.id)
-        
         # Normalize preferences
-        if preferences['price_range']['min'] == float('inf'):
+        if profile['price_min'] is None:
             preferences['price_range'] = {'min': 0, 'max': 100000}
         
         return preferences
     
+    def record_behavior(self, behavior):
+        """
+        Fold a new UserBehavior row into the cached profile (called from
+        signals.py) so heavy users never need a full re-aggregation.
+        """
+        if not behavior.product_id:
+            return
+        
+        cache_key = self._preferences_cache_key(behavior.user_id, behavior.session_id)
+        profile = cache.get(cache_key)
+        if profile is None:
+            # Nothing cached yet: the next read aggregates from scratch
+            return
+        
+        product = behavior.product
+        self._add_to_profile(
+            profile,
+            action_type=behavior.action_type,
+            category_id=product.category_id,
+            condition=product.condition,
+            city=product.city,
+            min_price=product.price,
+            max_price=product.price,
+        )
+        cache.set(cache_key, profile, self.PREFERENCES_CACHE_TIMEOUT)
+    
     def _get_behavior_weight(self, action_type):
         """Get weight for different behavior types"""
         weights = {
@@ -338,137 +410,100 @@ class AIRecommendationEngine:
         }
         return weights.get(action_type, 1)
     
-    def build_product_similarity_matrix(self):
+    def build_product_similarity_matrix(self, k=10):
         """Build product similarity matrix using TF-IDF and cosine similarity"""
         from .models import Product
+        from .similarity_index import product_document, top_k_neighbours
         
         # Get all active products
-        products = Product.objects.filter(status='ACTIVE').select_related('category', 'seller')
-        
-        if not products:
-            return {}
+        products = Product.objects.filter(status='ACTIVE').select_related('category').only(
+            'id', 'title', 'description', 'condition', 'city', 'category__name'
+        )
         
         # Prepare product features
         product_features = []
         product_ids = []
         
-        for product in products:
-            # Combine product features
-            features = f"{product.title} {product.description} {product.category.name} {product.condition} {product.city}"
-            product_features.append(features)
+        for product in products.iterator(chunk_size=2000):
+            product_features.append(product_document(product))
             product_ids.append(str(product.id))
         
-        # Create TF-IDF matrix
-        tfidf_matrix = self.vectorizer.fit_transform(product_features)
+        if not product_ids:
+            return {}
+        
+        # Create TF-IDF matrix (rows are L2-normalised, so a dot product is the cosine)
+        tfidf_matrix = self.vectorizer.fit_transform(product_features).tocsr().astype(np.float32)
         
-        # Calculate cosine similarity
-        similarity_matrix = cosine_similarity(tfidf_matrix)
+        # Blocked, vectorized top-K: no dense N x N matrix, no per-pair Python tuples
+        neighbors, scores = top_k_neighbours(tfidf_matrix, k)
         
         # Create similarity dictionary
         similarity_dict = {}
         for i, product_id in enumerate(product_ids):
-            similarities = []
-            for j, other_id in enumerate(product_ids):
-                if i != j:
-                    similarities.append((other_id, similarity_matrix[i][j]))
-            
-            # Sort by similarity and keep top 10
-            similarities.sort(key=lambda x: x[1], reverse=True)
-            similarity_dict[product_id] = similarities[:10]
+            valid = neighbors[i] >= 0
+            similarity_dict[product_id] = [
+                (product_ids[j], float(score))
+                for j, score in zip(neighbors[i][valid], scores[i][valid])
+            ]
         
         return similarity_dict
     
     def get_content_based_recommendations(self, product_id, limit=10):
         """Get content-based recommendations for a specific product"""
-        cache_key = f'product_similarities_{product_id}'
-        similarity_dict = cache.get(cache_key)
-        
-        if not similarity_dict:
-            similarity_dict = self.build_product_similarity_matrix()
-            cache.set(cache_key, similarity_dict, 3600)  # Cache for 1 hour
-        
-        if str(product_id) in similarity_dict:
-            similar_products = similarity_dict[str(product_id)]
-            product_ids = [pid for pid, score in similar_products]
-            
-            from .models import Product
-            return Product.objects.filter(
+        from .models import Product
+        from .similarity_index import product_similarity_index
+        
+        # O(K) lookup in the prebuilt index, never a TF-IDF refit on the request path
+        neighbours = product_similarity_index.get_neighbours(product_id)
+        if not neighbours:
+            # Index not built yet or product unknown to it: rule-based fallback
+            return similarity_engine.get_similar_products(product_id, limit)
+        
+        product_ids = [pid for pid, score in neighbours]
+        products = {
+            str(product.id): product
+            for product in Product.objects.filter(
                 id__in=product_ids,
                 status='ACTIVE'
-            ).order_by('?')[:limit]
+            ).select_related('category', 'seller')
+        }
         
-        return []
+        # Keep the similarity order of the index
+        return [products[pid] for pid in product_ids if pid in products][:limit]
     
     def get_collaborative_recommendations(self, user_id=None, session_key=None, limit=10):
         """Get collaborative filtering recommendations"""
-        from .models import Product, UserBehavior, Order
+        from .models import Product
+        from .collaborative_filtering import collaborative_model
         
-        # Get similar users based on behavior
-        similar_users = self._find_similar_users(user_id, session_key)
+        # Item-item neighbours are precomputed offline; scoring reads the recent
+        # history once and never fans out one query per similar user
+        scored = collaborative_model.recommend(user_id, session_key, limit=limit * 2)
         
-        if not similar_users:
+        if not scored:
             return self._get_popular_products(limit)
         
-        # Get products liked/purchased by similar users
-        recommended_products = set()
-        
-        for similar_user_id in similar_users:
-            if similar_user_id:
-                # Get products from similar user
-                user_products = UserBehavior.objects.filter(
-                    user_id=similar_user_id,
-                    action_type__in=['LIKE', 'PURCHASE']
-                ).values_list('product_id', flat=True)
-                
-                recommended_products.update(user_products)
-            else:
-                # Session-based recommendations
-                session_products = UserBehavior.objects.filter(
-                    session_key=session_key,
-                    action_type__in=['LIKE', 'PURCHASE']
-                ).values_list('product_id', flat=True)
-                
-                recommended_products.update(session_products)
-        
-        # Filter and return products
-        from .models import Product
-        products = Product.objects.filter(
-            id__in=recommended_products,
-            status='ACTIVE'
-        ).exclude(
-            id__in=self._get_user_interacted_products(user_id, session_key)
-        ).order_by('-views_count')[:limit]
-        
-        return products
-    
-    def _find_similar_users(self, user_id=None, session_key=None):
-        """Find users with similar behavior patterns"""
-        from .models import UserBehavior
-        
-        if user_id:
-            # Get user's behavior patterns
-            user_behaviors = UserBehavior.objects.filter(user_id=user_id)
-            user_categories = set(user_behaviors.values_list('product__category_id', flat=True))
-            
-            # Find users with similar category preferences
-            similar_users = UserBehavior.objects.filter(
-                product__category_id__in=user_categories
-            ).exclude(user_id=user_id).values_list('user_id', flat=True).distinct()
-            
-            return list(similar_users)[:5]
+        product_ids = [product_id for product_id, score in scored]
+        products = {
+            str(product.id): product
+            for product in Product.objects.filter(
+                id__in=product_ids,
+                status='ACTIVE'
+            ).select_related('category', 'seller')
+        }
         
-        return []
+        return [products[pid] for pid in product_ids if pid in products][:limit]
     
     def _get_user_interacted_products(self, user_id=None, session_key=None):
         """Get products user has already interacted with"""
-        from .models import UserBehavior
-        
-        if user_id:
-            return set(UserBehavior.objects.filter(user_id=user_id).values_list('product_id', flat=True))
-        elif session_key:
-            return set(UserBehavior.objects.filter(session_key=session_key).values_list('product_id', flat=True))
+        if not user_id and not session_key:
+            return set()
         
-        return set()
+        return set(
+            self._behavior_queryset(user_id, session_key).filter(
+                product__isnull=False
+            ).values_list('product_id', flat=True).distinct()
+        )
     
     def _get_popular_products(self, limit=10):
         """Get popular products as fallback"""
@@ -631,27 +666,19 @@ class AIRecommendationEngine:
     
     def update_user_preferences(self, user_id=None, session_key=None, product_id=None, action_type=None):
         """Update user preferences based on new behavior"""
-        from .models import UserBehavior, Product
+        from .models_advanced import UserBehavior
         
-        if not product_id:
+        # UserBehavior rows always belong to a user
+        if not product_id or not user_id:
             return
         
-        # Create behavior record
-        behavior_data = {
-            'action_type': action_type,
-            'product_id': product_id,
-        }
-        
-        if user_id:
-            behavior_data['user_id'] = user_id
-        elif session_key:
-            behavior_data['session_key'] = session_key
-        
-        UserBehavior.objects.create(**behavior_data)
-        
-        # Clear cache for this user
-        cache_key = f'user_preferences_{user_id or session_key}'
-        cache.delete(cache_key)
+        # Create behavior record; signals.py folds it into the cached profile
+        UserBehavior.objects.create(
+            user_id=user_id,
+            session_id=session_key or '',
+            action_type=action_type,
+            product_id=product_id,
+        )
     
     def get_recommendation_explanation(self, product_id, user_id=None, session_key=None):
         """Get explanation for why a product is recommended using Gemini AI"""
@@ -679,8 +706,8 @@ class AIRecommendationEngine:
         explanations = []
         
         # Category-based explanation
-        if preferences.get('categories') and product.category_id in preferences['categories']:
-            category_score = preferences['categories'][product.category_id]
+        if preferences.get('categories') and str(product.category_id) in preferences['categories']:
+            category_score = preferences['categories'][str(product.category_id)]
             if category_score > 2:
                 explanations.append(f"Vous aimez les produits de la catégorie {product.category.name}")
         
@@ -711,81 +738,137 @@ class AIRecommendationEngine:
 class ProductSimilarityEngine:
     """Engine for finding similar products"""
     
+    # Score weights
+    CATEGORY_WEIGHT = 3
+    CONDITION_WEIGHT = 2
+    CITY_WEIGHT = 1
+    PRICE_WEIGHT = 2
+    SELLER_WEIGHT = 1
+    PRICE_TOLERANCE = 0.3
+    
+    CACHE_KEY = 'similar_products_{product_id}:{versions}'
+    CACHE_SIZE = 12  # ids cached per product, sliced per call
+    
     def __init__(self):
-        self.similarity_cache = {}
+        self.cache_timeout = getattr(settings, 'PERFORMANCE_SETTINGS', {}).get('PRODUCT_CACHE_TIMEOUT', 1800)
     
     def get_similar_products(self, product_id, limit=6):
         """Get similar products based on multiple criteria"""
         from .models import Product
         
-        try:
-            product = Product.objects.get(id=product_id, status='ACTIVE')
-        except Product.DoesNotExist:
-            return []
-        
-        # Build similarity query
-        similar_products = Product.objects.filter(
-            status='ACTIVE'
-        ).exclude(id=product_id)
-        
-        # Same category products
-        category_products = similar_products.filter(category=product.category)
-        
-        # Same condition products
-        condition_products = similar_products.filter(condition=product.condition)
-        
-        # Same city products
-        city_products = similar_products.filter(city=product.city)
-        
-        # Price range products (±30%)
-        price_min = float(product.price) * 0.7
-        price_max = float(product.price) * 1.3
-        price_products = similar_products.filter(price__gte=price_min, price__lte=price_max)
+        cache_key = self._cache_key(product_id)
+        cached = cache.get(cache_key) if cache_key else None
         
-        # Combine and rank
-        all_similar = list(category_products) + list(condition_products) + list(city_products) + list(price_products)
-        
-        # Remove duplicates and rank by relevance
-        seen = set()
-        ranked_products = []
-        
-        for p in all_similar:
-            if p.id not in seen:
-                seen.add(p.id)
-                score = self._calculate_similarity_score(product, p)
-                ranked_products.append((p, score))
+        if cached is not None and cached['limit'] >= limit:
+            product_ids = cached['ids'][:limit]
+        else:
+            product_ids = self._rank_similar_product_ids(product_id, max(limit, self.CACHE_SIZE))
+            if product_ids is None:
+                return []
+            cache_key = cache_key or self._cache_key(product_id)
+            if cache_key:
+                cache.set(cache_key, {'limit': max(limit, self.CACHE_SIZE), 'ids': product_ids}, self.cache_timeout)
+            product_ids = product_ids[:limit]
+        
+        if not product_ids:
+            return []
         
-        # Sort by score and return top results
-        ranked_products.sort(key=lambda x: x[1], reverse=True)
-        return [p for p, score in ranked_products[:limit]]
+        # Cached ids are re-checked so sold/suspended products drop out
+        products = {
+            str(product.id): product
+            for product in Product.objects.filter(
+                id__in=product_ids,
+                status='ACTIVE'
+            ).select_related('category', 'seller')
+        }
+        return [products[pid] for pid in product_ids if pid in products]
     
-    def _calculate_similarity_score(self, product1, product2):
-        """Calculate similarity score between two products"""
-        score = 0
-        
-        # Category similarity (weight: 3)
-        if product1.category == product2.category:
-            score += 3
+    def _rank_similar_product_ids(self, product_id, limit):
+        """
+        Score every candidate in SQL and return the ids of the best ``limit``
+        products, or None when the product does not exist.
+        One query for the reference product plus one annotated query.
+        """
+        from .models import Product
         
-        # Condition similarity (weight: 2)
-        if product1.condition == product2.condition:
-            score += 2
+        try:
+            product = Product.objects.only(
+                'id', 'category_id', 'condition', 'city', 'price', 'seller_id'
+            ).get(id=product_id, status='ACTIVE')
+        except Product.DoesNotExist:
+            return None
+        cache.set(self.SCOPE_KEY.format(product_id=product.id), (product.category_id, product.city), self.cache_timeout)
+        
+        price = float(product.price)
+        low = price * (1 - self.PRICE_TOLERANCE)
+        high = price / (1 - self.PRICE_TOLERANCE)
+        
+        # Price similarity: PRICE_WEIGHT * (1 - |p1 - p2| / max(p1, p2)) when within tolerance
+        candidate_price = Cast('price', FloatField())
+        price_score = ExpressionWrapper(
+            Value(float(self.PRICE_WEIGHT)) * (
+                Value(1.0) - Abs(candidate_price - Value(price)) / Greatest(candidate_price, Value(price))
+            ),
+            output_field=FloatField(),
+        )
         
-        # City similarity (weight: 1)
-        if product1.city == product2.city:
-            score += 1
+        score = (
+            Case(When(category_id=product.category_id, then=Value(float(self.CATEGORY_WEIGHT))), default=Value(0.0))
+            + Case(When(Q(condition=product.condition), then=Value(float(self.CONDITION_WEIGHT))), default=Value(0.0))
+            + Case(When(city=product.city, then=Value(float(self.CITY_WEIGHT))), default=Value(0.0))
+            + Case(When(seller_id=product.seller_id, then=Value(float(self.SELLER_WEIGHT))), default=Value(0.0))
+            + Case(When(price__gt=low, price__lt=high, then=price_score), default=Value(0.0))
+        )
         
-        # Price similarity (weight: 2)
-        price_diff = abs(float(product1.price) - float(product2.price)) / max(float(product1.price), float(product2.price))
-        if price_diff < 0.3:
-            score += 2 * (1 - price_diff)
+        # Candidates: same category, condition or city, or a price within ±30%
+        candidates = Product.objects.filter(
+            Q(category_id=product.category_id)
+            | Q(condition=product.condition)
+            | Q(city=product.city)
+            | Q(price__gte=price * 0.7, price__lte=price * 1.3),
+            status='ACTIVE',
+        ).exclude(id=product.id)
         
-        # Seller similarity (weight: 1)
-        if product1.seller == product2.seller:
-            score += 1
+        ranked = candidates.annotate(
+            similarity_score=ExpressionWrapper(score, output_field=FloatField())
+        ).order_by('-similarity_score', '-views_count').values_list('id', flat=True)[:limit]
         
-        return score
-
+        return [str(pid) for pid in ranked]
+    
+    SCOPE_KEY = 'similar_products_scope_{product_id}'
+    
+    @staticmethod
+    def scope_topics(category_id, city):
+        """Fragment cache topics versioning the similar lists of a category and a city"""
+        return [f'similar_products:category:{category_id}', f'similar_products:city:{city}']
+    
+    def _cache_key(self, product_id):
+        """
+        Cache key of a product's ranked ids, versioned by its category and city
+        topics so that any save in either invalidates it. Returns None until the
+        product's scope is known (it is stored on the first ranking).
+        """
+        from .fragment_cache import get_topic_versions
+        
+        scope = cache.get(self.SCOPE_KEY.format(product_id=product_id))
+        if scope is None:
+            return None
+        versions = '.'.join(str(version) for version in get_topic_versions(self.scope_topics(*scope)))
+        return self.CACHE_KEY.format(product_id=product_id, versions=versions)
+    
+    def invalidate(self, product_id, scopes=()):
+        """
+        Drop the cached similar products of a product and of every product
+        sharing one of ``scopes`` ((category_id, city) pairs, called from signals.py)
+        """
+        from .fragment_cache import bump_topics
+        
+        cache.delete(self.SCOPE_KEY.format(product_id=product_id))
+        topics = []
+        for scope in scopes:
+            topics.extend(topic for topic in self.scope_topics(*scope) if topic not in topics)
+        if topics:
+            bump_topics(*topics)
 
 # Global instances
 ai_engine = AIRecommendationEngine()
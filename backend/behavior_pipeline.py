@@ -0,0 +1,328 @@
+# backend/behavior_pipeline.py
+"""
+Asynchronous behavior event pipeline
+Events are queued (in-process queue or Redis stream) and persisted in batches by a consumer
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BEHAVIOR_TRACKING_SETTINGS = {
+    'ENABLED': True,
+    'BACKEND': 'auto',  # auto, redis, memory
+    'QUEUE_SIZE': 10000,
+    'STREAM_MAXLEN': 100000,
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 2,
+    'CONSUMER_THREAD': True,
+    'SAMPLE_RATES': {},  # {'VIEW': 0.5}; missing action types are always kept
+    'CLAIM_IDLE_TIME': 60,  # seconds before an unacknowledged stream entry is redelivered
+    'MAX_DELIVERIES': 5,  # deliveries before an entry is moved to the dead-letter stream
+    'BOT_USER_AGENTS': [
+        'bot', 'crawl', 'spider', 'slurp', 'facebookexternalhit', 'whatsapp', 'preview',
+        'curl', 'wget', 'python-requests', 'httpclient', 'headless', 'lighthouse', 'pingdom',
+    ],
+}
+
+
+def get_behavior_tracking_settings():
+    config = dict(DEFAULT_BEHAVIOR_TRACKING_SETTINGS)
+    config.update(getattr(settings, 'BEHAVIOR_TRACKING_SETTINGS', {}))
+    return config
+
+
+class MemoryEventQueue:
+    """Bounded per-process queue"""
+
+    name = 'memory'
+
+    def __init__(self, maxsize):
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, event):
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+    def get_batch(self, size, timeout):
+        """Block up to ``timeout`` for the first event, then take what is available"""
+        try:
+            events = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return [], None
+        while len(events) < size:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events, None
+
+    def ack(self, token):
+        pass
+
+    def size(self):
+        return self._queue.qsize()
+
+
+class RedisEventStream:
+    """
+    Capped Redis stream read through a consumer group. Entries left pending
+    (persist failed, consumer gone) are claimed again once idle for
+    CLAIM_IDLE_TIME, and dead-lettered after MAX_DELIVERIES.
+    """
+
+    name = 'redis'
+    STREAM = 'behavior_events'
+    DEAD_LETTER_STREAM = 'behavior_events:dead'
+    GROUP = 'behavior_consumers'
+
+    def __init__(self, client, maxlen, claim_idle_time=60, max_deliveries=5):
+        self.client = client
+        self.maxlen = maxlen
+        self.claim_idle_ms = int(claim_idle_time * 1000)
+        self.max_deliveries = max_deliveries
+        self.dead_lettered = 0
+        self.consumer = f'{os.uname().nodename}-{os.getpid()}'
+        try:
+            self.client.xgroup_create(self.STREAM, self.GROUP, id='0', mkstream=True)
+        except Exception:
+            pass  # group already exists
+
+    def put(self, event):
+        self.client.xadd(self.STREAM, {'event': json.dumps(event)}, maxlen=self.maxlen, approximate=True)
+        return True
+
+    def get_batch(self, size, timeout):
+        """Idle pending entries first (redelivery), else new ones"""
+        entries = self.claim_pending(size)
+        if not entries:
+            response = self.client.xreadgroup(
+                self.GROUP, self.consumer, {self.STREAM: '>'}, count=size, block=int(timeout * 1000)
+            )
+            entries = [entry for _stream, stream_entries in response or [] for entry in stream_entries]
+
+        events, ids = [], []
+        for entry_id, fields in entries:
+            ids.append(entry_id)
+            payload = fields.get(b'event') or fields.get('event')
+            try:
+                events.append(json.loads(payload))
+            except (TypeError, ValueError):
+                logger.warning(f"Dropping malformed behavior event {entry_id}")
+        return events, ids
+
+    def claim_pending(self, size):
+        """Claim entries idle for CLAIM_IDLE_TIME in any consumer; dead-letter the ones delivered too often"""
+        pending = self.client.xpending_range(
+            self.STREAM, self.GROUP, min='-', max='+', count=size, idle=self.claim_idle_ms
+        )
+        if not pending:
+            return []
+        dead = [item['message_id'] for item in pending if item['times_delivered'] >= self.max_deliveries]
+        retry = [item['message_id'] for item in pending if item['times_delivered'] < self.max_deliveries]
+
+        if dead:
+            for entry_id, fields in self.client.xclaim(self.STREAM, self.GROUP, self.consumer, self.claim_idle_ms, dead):
+                if fields:
+                    self.client.xadd(self.DEAD_LETTER_STREAM, fields, maxlen=self.maxlen, approximate=True)
+            self.ack(dead)
+            self.dead_lettered += len(dead)
+            logger.error(f"Moved {len(dead)} behavior events to {self.DEAD_LETTER_STREAM} "
+                         f"after {self.max_deliveries} deliveries")
+        if not retry:
+            return []
+        # Entries trimmed from the stream come back without fields: acknowledge them
+        claimed = self.client.xclaim(self.STREAM, self.GROUP, self.consumer, self.claim_idle_ms, retry)
+        self.ack([entry_id for entry_id, fields in claimed if not fields])
+        return [(entry_id, fields) for entry_id, fields in claimed if fields]
+
+    def ack(self, ids):
+        if ids:
+            self.client.xack(self.STREAM, self.GROUP, *ids)
+            self.client.xdel(self.STREAM, *ids)
+
+    def size(self):
+        return self.client.xlen(self.STREAM)
+
+
+def _redis_client():
+    if 'django_redis' not in cache.__class__.__module__:
+        return None
+    try:
+        from django_redis import get_redis_connection
+        client = get_redis_connection('default')
+        client.ping()
+        return client
+    except Exception as e:
+        logger.warning(f"Redis unavailable for behavior events, using in-process queue: {e}")
+        return None
+
+
+def persist_events(events):
+    """Resolve products in one query and bulk insert UserBehavior rows; returns the number saved"""
+    from .models import Product
+    from .models_advanced import UserBehavior
+
+    slugs = {event['product_slug'] for event in events if event.get('product_slug')}
+    products = {}
+    if slugs:
+        products = {
+            product.slug: product
+            for product in Product.objects.filter(slug__in=slugs).only(
+                'id', 'slug', 'category_id', 'condition', 'city', 'price'
+            )
+        }
+
+    behaviors = []
+    for event in events:
+        product = products.get(event.get('product_slug'))
+        if event.get('product_slug') and product is None:
+            continue  # not a product page after all
+        behaviors.append(UserBehavior(
+            user_id=event['user_id'],
+            product=product,
+            category_id=product.category_id if product else None,
+            action_type=event['action_type'],
+            session_id=event.get('session_id') or '',
+            duration=event.get('duration', 0),
+            metadata=event.get('metadata', {}),
+        ))
+
+    created = UserBehavior.objects.bulk_create(behaviors, batch_size=500)
+
+    # bulk_create sends no post_save: fold the batch into cached profiles directly
+    from .ai_engine import ai_engine
+    for behavior in created:
+        if behavior.product_id:
+            try:
+                ai_engine.record_behavior(behavior)
+            except Exception as e:
+                logger.error(f"Error updating behavior profile for user {behavior.user_id}: {e}")
+    return len(created)
+
+
+class BehaviorPipeline:
+    """Publish side (request path) and batch consumer of behavior events"""
+
+    def __init__(self):
+        self._queue = None
+        self._consumer = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+        self.persisted = 0
+
+    def _configure(self):
+        config = get_behavior_tracking_settings()
+        self.enabled = config['ENABLED']
+        self.batch_size = config['BATCH_SIZE']
+        self.flush_interval = config['FLUSH_INTERVAL']
+        self.sample_rates = config['SAMPLE_RATES']
+        self.consumer_thread = config['CONSUMER_THREAD']
+        self.bot_pattern = re.compile('|'.join(re.escape(agent) for agent in config['BOT_USER_AGENTS']), re.I)
+
+        client = _redis_client() if config['BACKEND'] in ('auto', 'redis') else None
+        if client is not None:
+            return RedisEventStream(client, config['STREAM_MAXLEN'], config['CLAIM_IDLE_TIME'], config['MAX_DELIVERIES'])
+        return MemoryEventQueue(config['QUEUE_SIZE'])
+
+    @property
+    def queue(self):
+        if self._queue is None:
+            with self._lock:
+                if self._queue is None:
+                    self._queue = self._configure()
+        return self._queue
+
+    def is_bot(self, user_agent):
+        self.queue  # settings are loaded with the queue
+        return not user_agent or bool(self.bot_pattern.search(user_agent))
+
+    def should_track(self, action_type, user_agent):
+        """Bot filtering and per-action sampling, no I/O"""
+        if self.is_bot(user_agent) or not self.enabled:
+            return False
+        rate = self.sample_rates.get(action_type, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+    def publish(self, user_id, action_type, session_id='', product_slug=None, duration=0, metadata=None):
+        """Queue an event; returns False when filtered, sampled out or the queue is full"""
+        event = {
+            'user_id': str(user_id),
+            'action_type': action_type,
+            'session_id': session_id or '',
+            'product_slug': product_slug,
+            'duration': duration,
+            'metadata': metadata or {},
+        }
+        try:
+            accepted = self.queue.put(event)
+        except Exception as e:
+            logger.error(f"Error publishing behavior event: {e}")
+            accepted = False
+        if not accepted:
+            self.dropped += 1
+            return False
+        self.ensure_consumer()
+        return True
+
+    # ------------------------------------------------------------------
+    # Consumer
+    # ------------------------------------------------------------------
+    def consume_batch(self, timeout=None):
+        """Persist one batch; returns the number of events read"""
+        events, token = self.queue.get_batch(self.batch_size, self.flush_interval if timeout is None else timeout)
+        if not events:
+            return 0
+        try:
+            self.persisted += persist_events(events)
+            self.queue.ack(token)
+        except Exception as e:
+            # Redis redelivers unacknowledged events after CLAIM_IDLE_TIME; in-process events are lost
+            logger.error(f"Error persisting {len(events)} behavior events: {e}")
+        return len(events)
+
+    def run(self, stop_event=None):
+        from django.db import close_old_connections
+
+        while not (stop_event and stop_event.is_set()):
+            try:
+                self.consume_batch()
+            except Exception as e:
+                logger.error(f"Behavior consumer error: {e}")
+                time.sleep(self.flush_interval)
+            finally:
+                close_old_connections()
+
+    def ensure_consumer(self):
+        if not self.consumer_thread or (self._consumer is not None and self._consumer.is_alive()):
+            return
+        with self._lock:
+            if self._consumer is None or not self._consumer.is_alive():
+                self._consumer = threading.Thread(target=self.run, name='behavior-consumer', daemon=True)
+                self._consumer.start()
+
+    def drain(self):
+        """Persist everything currently queued (management command, tests, shutdown)"""
+        total = 0
+        while True:
+            read = self.consume_batch(timeout=0.01)
+            if not read:
+                return total
+            total += read
+
+
+# Global instance
+behavior_pipeline = BehaviorPipeline()
@@ -0,0 +1,156 @@
+# backend/collaborative_filtering.py
+"""
+Item-item collaborative filtering for the recommendation engine
+Top-K product neighbours built offline from user and session behaviors
+"""
+
+import logging
+import math
+import time
+from collections import defaultdict
+
+import numpy as np
+from scipy import sparse
+
+from .similarity_index import NeighbourIndex, get_recommendation_settings, top_k_neighbours
+
+logger = logging.getLogger(__name__)
+
+# Negative or product-less signals never count as interest
+EXCLUDED_ACTIONS = ['SEARCH', 'DISLIKE', 'CART_REMOVE', 'REPORT']
+
+
+def behavior_weight(action_type):
+    from .ai_engine import ai_engine
+    return ai_engine._get_behavior_weight(action_type)
+
+
+class CollaborativeFilteringModel(NeighbourIndex):
+    """Precomputed item-item neighbours with a fast per-user scoring API"""
+
+    name = 'collaborative model'
+
+    def __init__(self, path=None):
+        config = get_recommendation_settings()
+        super().__init__(path or config['COLLABORATIVE_MODEL_DIR'])
+        self.history_size = config['COLLABORATIVE_HISTORY_SIZE']
+
+    # ------------------------------------------------------------------
+    # Build
+    # ------------------------------------------------------------------
+    def iter_interactions(self):
+        """Yield (actor, product_id, weight) aggregated per actor/product/action in the database"""
+        from django.db.models import Count
+        from .models_advanced import UserBehavior
+        from .models_visitor import VisitorBehavior
+
+        sources = [
+            ('u', UserBehavior, 'user_id'),
+            ('s', VisitorBehavior, 'session_key'),
+        ]
+        for prefix, model, actor_field in sources:
+            rows = model.objects.filter(
+                product__isnull=False
+            ).exclude(
+                action_type__in=EXCLUDED_ACTIONS
+            ).values_list(
+                actor_field, 'product_id', 'action_type'
+            ).annotate(
+                interactions=Count('id')
+            ).order_by()
+
+            for actor, product_id, action_type, interactions in rows.iterator(chunk_size=5000):
+                yield f'{prefix}:{actor}', str(product_id), behavior_weight(action_type) * interactions
+
+    def build(self, k=None):
+        """Rebuild the item-item neighbour lists from all recorded behaviors"""
+        return self.build_from_interactions(self.iter_interactions(), k=k)
+
+    def build_from_interactions(self, interactions, k=None):
+        k = k or self.k
+        started = time.time()
+
+        actor_index = {}
+        product_index = {}
+        rows, columns, weights = [], [], []
+        for actor, product_id, weight in interactions:
+            rows.append(actor_index.setdefault(actor, len(actor_index)))
+            columns.append(product_index.setdefault(product_id, len(product_index)))
+            weights.append(weight)
+
+        if not product_index:
+            logger.info("No behaviors recorded, collaborative model not built")
+            return None
+
+        product_ids = list(product_index)
+        order = self._sorted_order(product_ids)
+        position = np.empty(len(order), dtype=np.int64)
+        position[order] = np.arange(len(order))
+
+        # Product x actor matrix; duplicate cells are summed by the COO -> CSR conversion
+        matrix = sparse.coo_matrix(
+            (np.array(weights, dtype=np.float32), (position[np.array(columns)], np.array(rows))),
+            shape=(len(product_ids), len(actor_index)),
+        ).tocsr()
+        matrix.data = np.log1p(matrix.data)  # dampen very heavy single-user activity
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        matrix = sparse.diags(1 / norms).dot(matrix).tocsr().astype(np.float32)
+
+        neighbors, scores = top_k_neighbours(matrix, k)
+        ids = np.array(product_ids)[order]
+
+        return self._save(ids, neighbors, scores, k, started, actors=len(actor_index))
+
+    # ------------------------------------------------------------------
+    # Scoring
+    # ------------------------------------------------------------------
+    def get_history(self, user_id=None, session_key=None):
+        """{product_id: weight} for the most recent interactions of a user or session"""
+        if user_id:
+            from .models_advanced import UserBehavior
+            queryset = UserBehavior.objects.filter(user_id=user_id)
+        elif session_key:
+            from .models_visitor import VisitorBehavior
+            queryset = VisitorBehavior.objects.filter(session_key=session_key)
+        else:
+            return {}
+
+        recent = queryset.filter(
+            product__isnull=False
+        ).exclude(
+            action_type__in=EXCLUDED_ACTIONS
+        ).order_by('-created_at').values_list('product_id', 'action_type')[:self.history_size]
+
+        history = defaultdict(float)
+        for product_id, action_type in recent:
+            history[str(product_id)] += behavior_weight(action_type)
+        return history
+
+    def score(self, history, limit=10, exclude=()):
+        """
+        Rank candidate products for an interaction history. Each interacted
+        product votes for its stored neighbours:
+        score = sum(log(1 + weight) x similarity).
+        Returns [(product_id, score), ...] best first.
+        """
+        state = self._load()
+        if state is None or not history:
+            return []
+
+        excluded = set(history) | {str(product_id) for product_id in exclude}
+        scores = defaultdict(float)
+        for product_id, weight in history.items():
+            for neighbour_id, similarity in self._stored_neighbours(state, product_id, state['meta']['k']):
+                if neighbour_id not in excluded:
+                    scores[neighbour_id] += math.log1p(weight) * similarity
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def recommend(self, user_id=None, session_key=None, limit=10, exclude=()):
+        """Per-user (or anonymous session) scoring: one history query plus O(H x K) lookups"""
+        return self.score(self.get_history(user_id, session_key), limit=limit, exclude=exclude)
+
+
+# Global instance
+collaborative_model = CollaborativeFilteringModel()
@@ -2,8 +2,8 @@
 
 # backend/context_processors.py
 from django.conf import settings
-from django.db.models import Q
-from .models import Notification, Message, Chat, Category
+from .models import Notification
+from .user_badges import RequestBadges, get_main_categories
 
 
 def global_context(request):
@@ -15,38 +15,24 @@ def global_context(request):
         'SITE_NAME': 'Vidé-Grenier Kamer',
         'SITE_TAGLINE': 'Vendez, Achetez, Économisez – Simplicité et Sécurité',
         'CURRENT_YEAR': timezone.now().year,
-        'MAIN_CATEGORIES': Category.objects.filter(
-            parent=None, is_active=True
-        ).order_by('order')[:6],
+        # Catégories principales partagées par le processus (voir user_badges)
+        'MAIN_CATEGORIES': get_main_categories,
         'SUPPORTED_CITIES': {city: None for city in settings.VGK_SETTINGS['SUPPORTED_CITIES']} if isinstance(settings.VGK_SETTINGS.get('SUPPORTED_CITIES'), list) else {},
         'PICKUP_POINTS': settings.VGK_SETTINGS.get('PICKUP_POINTS', {}),
     }
     
     if request.user.is_authenticated:
-        # Notifications non lues
-        context['unread_notifications_count'] = Notification.objects.filter(
-            user=request.user, is_read=False
-        ).count()
+        # Compteurs des badges: lus dans le cache uniquement si le template les affiche
+        badges = RequestBadges(request.user.id)
+        context['unread_notifications_count'] = badges.counter('unread_notifications')
+        context['unread_messages_count'] = badges.counter('unread_messages')
+        context['favorites_count'] = badges.counter('favorites')
         
+        # Notifications non lues (queryset paresseux, évalué seulement si affiché)
         context['recent_notifications'] = Notification.objects.filter(
             user=request.user, is_read=False
         ).order_by('-created_at')[:5]
         
-        # Messages non lus
-        user_chats = Chat.objects.filter(
-            Q(buyer=request.user) | Q(seller=request.user)
-        )
-        
-        unread_messages_count = Message.objects.filter(
-            chat__in=user_chats,
-            is_read=False
-        ).exclude(sender=request.user).count()
-        
-        context['unread_messages_count'] = unread_messages_count
-        
-        # Produits favoris
-        context['favorites_count'] = request.user.favorites.count()
-        
         # Niveau de fidélité
         context['user_loyalty_level'] = request.user.loyalty_level
         
@@ -0,0 +1,328 @@
+# backend/daily_metrics.py
+"""
+Daily rollup of the admin dashboard figures (DailyMetrics)
+Kept current by the Order/User/Payment signals, rebuilt with manage.py backfill_daily_metrics
+"""
+
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .time_series import iter_days
+
+logger = logging.getLogger(__name__)
+
+METRIC_FIELDS = (
+    'orders_count', 'delivered_orders', 'revenue', 'commission',
+    'signups', 'client_signups', 'completed_payments', 'payments_amount',
+)
+DECIMAL_FIELDS = ('revenue', 'commission', 'payments_amount')
+
+CENT = Decimal('0.01')
+
+
+def commission_rate():
+    return Decimal(str(settings.VGK_SETTINGS.get('COMMISSION_RATE', 0.08)))
+
+
+def _local_date(value):
+    if value is None:
+        return None
+    return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+
+
+def _empty_row():
+    return {field: Decimal('0') if field in DECIMAL_FIELDS else 0 for field in METRIC_FIELDS}
+
+
+# ============ CONTRIBUTIONS ============
+# A snapshot is the tuple of fields a row contributes through; it is taken
+# from __dict__ so deferred fields never trigger a query.
+
+def order_snapshot(order):
+    fields = order.__dict__
+    return (fields.get('created_at'), fields.get('status'), fields.get('total_amount'),
+            fields.get('payment_method'), fields.get('product_id'))
+
+
+def user_snapshot(user):
+    fields = user.__dict__
+    return (fields.get('date_joined'), fields.get('user_type'), fields.get('city'))
+
+
+def payment_snapshot(payment):
+    fields = payment.__dict__
+    return (fields.get('created_at'), fields.get('status'), fields.get('amount'), fields.get('order_id'))
+
+
+def _product_of(order, product_id):
+    """(city, category id, source) of a product, without a query when the order has it loaded"""
+    from .models import Order, Product
+
+    if Order.product.is_cached(order) and order.product.pk == product_id:
+        product = order.product
+        return product.city, product.category_id, product.source
+    # Both states of a saved order usually share the product: look it up once
+    memo = order.__dict__.setdefault('_metrics_products', {})
+    if product_id not in memo:
+        memo[product_id] = Product.objects.filter(pk=product_id).values_list('city', 'category_id', 'source').first()
+    return memo[product_id]
+
+
+def _payment_method_of(payment):
+    from .models import Order, Payment
+
+    if Payment.order.is_cached(payment):
+        return payment.order.payment_method
+    return Order.objects.filter(pk=payment.order_id).values_list('payment_method', flat=True).first()
+
+
+def order_contribution(order, snapshot):
+    """{(date, dimension, key): values} counted for an order in the state ``snapshot``"""
+    created_at, status, total_amount, payment_method, product_id = snapshot
+    day = _local_date(created_at)
+    if day is None or product_id is None:
+        return {}
+
+    values = {'orders_count': 1}
+    product = _product_of(order, product_id)
+    if status == 'DELIVERED':
+        amount = total_amount or Decimal('0')
+        values.update(delivered_orders=1, revenue=amount)
+        if product is not None and product[2] == 'CLIENT':
+            values['commission'] = (amount * commission_rate()).quantize(CENT)
+
+    keys = [('ALL', ''), ('PAYMENT_METHOD', payment_method or '')]
+    if product is not None:
+        keys += [('CITY', product[0] or ''), ('CATEGORY', str(product[1]))]
+    return {(day, dimension, key): values for dimension, key in keys}
+
+
+def user_contribution(user, snapshot):
+    date_joined, user_type, city = snapshot
+    day = _local_date(date_joined)
+    if day is None:
+        return {}
+
+    values = {'signups': 1, 'client_signups': 1 if user_type == 'CLIENT' else 0}
+    contribution = {(day, 'ALL', ''): values}
+    if city:
+        contribution[(day, 'CITY', city)] = values
+    return contribution
+
+
+def payment_contribution(payment, snapshot):
+    created_at, status, amount, order_id = snapshot
+    day = _local_date(created_at)
+    if day is None or status != 'COMPLETED':
+        return {}
+
+    values = {'completed_payments': 1, 'payments_amount': amount or Decimal('0')}
+    contribution = {(day, 'ALL', ''): values}
+    payment_method = _payment_method_of(payment) if order_id else None
+    if payment_method:
+        contribution[(day, 'PAYMENT_METHOD', payment_method)] = values
+    return contribution
+
+
+CONTRIBUTIONS = {
+    'Order': (order_snapshot, order_contribution),
+    'User': (user_snapshot, user_contribution),
+    'Payment': (payment_snapshot, payment_contribution),
+}
+
+
+def record_change(instance, old_snapshot, new_snapshot):
+    """Apply the difference between two states of an Order, User or Payment to the rollup"""
+    if old_snapshot == new_snapshot:
+        return
+    contribution = CONTRIBUTIONS[instance.__class__.__name__][1]
+
+    deltas = defaultdict(dict)
+    for sign, snapshot in ((-1, old_snapshot), (1, new_snapshot)):
+        if snapshot is None:
+            continue
+        for row, values in contribution(instance, snapshot).items():
+            for field, value in values.items():
+                deltas[row][field] = deltas[row].get(field, 0) + sign * value
+
+    apply_deltas({row: values for row, values in deltas.items() if any(values.values())})
+
+
+def apply_deltas(deltas):
+    """Add ``{(date, dimension, key): {field: delta}}`` to the rollup rows, creating missing ones"""
+    from .models import DailyMetrics
+
+    if not deltas:
+        return
+    try:
+        with transaction.atomic():
+            for (day, dimension, key), values in deltas.items():
+                rows = DailyMetrics.objects.filter(date=day, dimension=dimension, key=key)
+                updates = {field: F(field) + value for field, value in values.items() if value}
+                if rows.update(**updates):
+                    continue
+                try:
+                    with transaction.atomic():
+                        DailyMetrics.objects.create(date=day, dimension=dimension, key=key, **values)
+                except IntegrityError:
+                    # Created concurrently since the update
+                    rows.update(**updates)
+    except Exception as e:
+        logger.error(f"Error updating daily metrics: {e}")
+
+
+# ============ REBUILD ============
+
+def _rebuild_models(apps=None):
+    """Order, Payment, User and DailyMetrics, from a migration's ``apps`` registry when given"""
+    if apps is None:
+        from .models import DailyMetrics, Order, Payment, User
+        return Order, Payment, User, DailyMetrics
+    return tuple(apps.get_model('backend', name) for name in ('Order', 'Payment', 'User', 'DailyMetrics'))
+
+
+def _add(rows, day, dimension, key, **values):
+    row = rows.setdefault((day, dimension, key), _empty_row())
+    for field, value in values.items():
+        row[field] += value or 0
+
+
+def compute(start, end, apps=None):
+    """Rollup rows of ``start``..``end`` (inclusive) computed from the source tables"""
+    Order, Payment, User, DailyMetrics = _rebuild_models(apps)
+
+    rate = commission_rate()
+    rows = {}
+
+    orders = Order.objects.filter(
+        created_at__date__gte=start, created_at__date__lte=end
+    ).annotate(day=TruncDate('created_at')).values(
+        'day', 'payment_method', 'product__city', 'product__category_id', 'product__source'
+    ).annotate(
+        orders_count=Count('id'),
+        delivered_orders=Count('id', filter=Q(status='DELIVERED')),
+        revenue=Sum('total_amount', filter=Q(status='DELIVERED')),
+    ).order_by()
+    for group in orders:
+        revenue = group['revenue'] or Decimal('0')
+        values = {
+            'orders_count': group['orders_count'],
+            'delivered_orders': group['delivered_orders'],
+            'revenue': revenue,
+            'commission': (revenue * rate).quantize(CENT) if group['product__source'] == 'CLIENT' else 0,
+        }
+        _add(rows, group['day'], 'ALL', '', **values)
+        _add(rows, group['day'], 'PAYMENT_METHOD', group['payment_method'] or '', **values)
+        _add(rows, group['day'], 'CITY', group['product__city'] or '', **values)
+        _add(rows, group['day'], 'CATEGORY', str(group['product__category_id']), **values)
+
+    users = User.objects.filter(
+        date_joined__date__gte=start, date_joined__date__lte=end
+    ).annotate(day=TruncDate('date_joined')).values('day', 'city').annotate(
+        signups=Count('id'),
+        client_signups=Count('id', filter=Q(user_type='CLIENT')),
+    ).order_by()
+    for group in users:
+        values = {'signups': group['signups'], 'client_signups': group['client_signups']}
+        _add(rows, group['day'], 'ALL', '', **values)
+        if group['city']:
+            _add(rows, group['day'], 'CITY', group['city'], **values)
+
+    payments = Payment.objects.filter(
+        status='COMPLETED', created_at__date__gte=start, created_at__date__lte=end
+    ).annotate(day=TruncDate('created_at')).values('day', 'order__payment_method').annotate(
+        completed_payments=Count('id'),
+        payments_amount=Sum('amount'),
+    ).order_by()
+    for group in payments:
+        values = {'completed_payments': group['completed_payments'], 'payments_amount': group['payments_amount']}
+        _add(rows, group['day'], 'ALL', '', **values)
+        if group['order__payment_method']:
+            _add(rows, group['day'], 'PAYMENT_METHOD', group['order__payment_method'], **values)
+
+    return rows
+
+
+def rebuild(start, end, batch_size=1000, apps=None):
+    """Replace the rollup rows of ``start``..``end`` (inclusive); returns the number of rows written"""
+    DailyMetrics = _rebuild_models(apps)[3]
+
+    with transaction.atomic():
+        existing = DailyMetrics.objects.filter(date__gte=start, date__lte=end)
+        # Writers holding a row of the range commit before the source tables are read
+        list(existing.select_for_update().values_list('pk', flat=True))
+        rows = compute(start, end, apps)
+        existing.delete()
+        DailyMetrics.objects.bulk_create([
+            DailyMetrics(date=day, dimension=dimension, key=key, **values)
+            for (day, dimension, key), values in rows.items()
+        ], batch_size=batch_size)
+    return len(rows)
+
+
+def source_date_range(apps=None):
+    """(first, last) local day with orders, users or payments, or None"""
+    Order, Payment, User, DailyMetrics = _rebuild_models(apps)
+
+    bounds = []
+    for queryset, field in ((Order.objects, 'created_at'), (User.objects, 'date_joined'), (Payment.objects, 'created_at')):
+        values = queryset.aggregate(first=Min(field), last=Max(field))
+        bounds += [value for value in values.values() if value]
+    if not bounds:
+        return None
+    return _local_date(min(bounds)), _local_date(max(bounds))
+
+
+# ============ READERS ============
+
+def daily_metrics(start, end, dimension='ALL', key=''):
+    """One row (dict with ``date`` and every metric) per day of ``start``..``end``, zero-filled"""
+    from .models import DailyMetrics
+
+    stored = {
+        row['date']: row for row in DailyMetrics.objects.filter(
+            dimension=dimension, key=key, date__gte=start, date__lte=end
+        ).values('date', *METRIC_FIELDS)
+    }
+    return [stored.get(day) or dict(_empty_row(), date=day) for day in iter_days(start, end)]
+
+
+def metric_totals(start=None, end=None, dimension='ALL', keys=None):
+    """Sum of every metric over ``start``..``end`` (open ended when None)"""
+    from .models import DailyMetrics
+
+    rows = DailyMetrics.objects.filter(dimension=dimension)
+    if dimension == 'ALL':
+        rows = rows.filter(key='')
+    if keys is not None:
+        rows = rows.filter(key__in=keys)
+    if start is not None:
+        rows = rows.filter(date__gte=start)
+    if end is not None:
+        rows = rows.filter(date__lte=end)
+
+    totals = rows.aggregate(**{field: Sum(field) for field in METRIC_FIELDS})
+    return {field: value or _empty_row()[field] for field, value in totals.items()}
+
+
+def metric_breakdown(dimension, start=None, end=None):
+    """{key: {metric: sum}} of a dimension over ``start``..``end``"""
+    from .models import DailyMetrics
+
+    rows = DailyMetrics.objects.filter(dimension=dimension)
+    if start is not None:
+        rows = rows.filter(date__gte=start)
+    if end is not None:
+        rows = rows.filter(date__lte=end)
+
+    breakdown = {}
+    for row in rows.values('key').annotate(**{f'{field}_sum': Sum(field) for field in METRIC_FIELDS}).order_by():
+        breakdown[row['key']] = {field: row[f'{field}_sum'] or _empty_row()[field] for field in METRIC_FIELDS}
+    return breakdown
@@ -5,9 +5,13 @@ Handles heavy file storage when database size threshold is reached
 
 import os
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
-from django.core.files.storage import Storage
+from django.core.cache import cache
+from django.core.files.storage import Storage, FileSystemStorage
 from django.core.files.base import ContentFile
+from django.utils import timezone
 from django.utils.deconstruct import deconstructible
 import requests
 import json
@@ -16,6 +20,23 @@ import hashlib
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_DROPBOX_STORAGE_SETTINGS = {
+    'DB_SIZE_CHECK_INTERVAL': 300,  # seconds the database size (routing decision) is cached
+    'SHARED_URL_TTL': 60 * 60 * 24 * 6,  # seconds a shared link is reused before being refreshed
+    'CHUNKED_UPLOAD_THRESHOLD': 16 * 1024 * 1024,  # files from this size use an upload session
+    'CHUNK_SIZE': 8 * 1024 * 1024,  # multiple of 4 MB (Dropbox concurrent sessions)
+    'UPLOAD_WORKERS': 4,
+    'INDEX_CACHE_TIMEOUT': 60 * 60 * 24,
+}
+
+INDEX_CACHE_KEY = 'stored_file:{digest}'
+
+
+def get_dropbox_storage_settings():
+    config = dict(DEFAULT_DROPBOX_STORAGE_SETTINGS)
+    config.update(getattr(settings, 'DROPBOX_STORAGE_SETTINGS', {}))
+    return config
+
 class DropboxStorageService:
     """Dropbox storage service for heavy files"""
     
@@ -33,6 +54,10 @@ class DropboxStorageService:
         # File size thresholds
         self.large_file_threshold_mb = 10  # Files larger than 10MB go to Dropbox
         self.image_compression_threshold_mb = 5  # Images larger than 5MB get compressed
+        
+        # Database size cache (routing decision)
+        self._db_size_gb = None
+        self._db_size_checked_at = 0
     
     def is_enabled(self):
         """Check if Dropbox storage is enabled and configured"""
@@ -53,13 +78,21 @@ class DropboxStorageService:
             logger.error(f"Error getting database size: {e}")
             return 0
     
+    def get_cached_database_size_gb(self):
+        """Database size, re-read at most every DB_SIZE_CHECK_INTERVAL seconds"""
+        now = time.monotonic()
+        if self._db_size_gb is None or now - self._db_size_checked_at >= get_dropbox_storage_settings()['DB_SIZE_CHECK_INTERVAL']:
+            self._db_size_gb = self.get_database_size_gb()
+            self._db_size_checked_at = now
+        return self._db_size_gb
+    
     def should_use_dropbox(self, file_size_bytes=None):
         """Determine if Dropbox should be used based on database size and file size"""
         if not self.is_enabled():
             return False
         
         # Check database size threshold
-        db_size_gb = self.get_database_size_gb()
+        db_size_gb = self.get_cached_database_size_gb()
         if db_size_gb >= self.db_size_threshold_gb:
             return True
         
@@ -353,87 +386,247 @@ class DropboxStorageService:
                 'error': str(e)
             }
 
+class DropboxError(Exception):
+    """Dropbox API call failed"""
+
+
+class DropboxClient:
+    """Dropbox API v2 calls used by DropboxStorage; paths are absolute Dropbox paths"""
+    
+    api_base_url = 'https://api.dropboxapi.com/2'
+    content_base_url = 'https://content.dropboxapi.com/2'
+    
+    def __init__(self, access_token, timeout=60):
+        self.access_token = access_token
+        self.timeout = timeout
+        self.session = requests.Session()
+    
+    def _call(self, url, arg=None, data=None, json_body=None):
+        headers = {'Authorization': f'Bearer {self.access_token}'}
+        if arg is not None:
+            headers['Dropbox-API-Arg'] = json.dumps(arg)
+            headers['Content-Type'] = 'application/octet-stream'
+        response = self.session.post(url, headers=headers, data=data, json=json_body, timeout=self.timeout)
+        if response.status_code != 200:
+            raise DropboxError(f'{url.rsplit("/2/", 1)[-1]} failed: {response.status_code} - {response.text[:200]}')
+        return response
+    
+    def upload(self, path, data):
+        arg = {'path': path, 'mode': 'add', 'autorename': False, 'mute': True}
+        return self._call(f'{self.content_base_url}/files/upload', arg, data=data).json()
+    
+    def start_upload_session(self):
+        arg = {'close': False, 'session_type': 'concurrent'}
+        return self._call(f'{self.content_base_url}/files/upload_session/start', arg, data=b'').json()['session_id']
+    
+    def append_upload_session(self, session_id, offset, data, close=False):
+        arg = {'cursor': {'session_id': session_id, 'offset': offset}, 'close': close}
+        self._call(f'{self.content_base_url}/files/upload_session/append_v2', arg, data=data)
+    
+    def finish_upload_session(self, session_id, size, path):
+        arg = {
+            'cursor': {'session_id': session_id, 'offset': size},
+            'commit': {'path': path, 'mode': 'add', 'autorename': False, 'mute': True},
+        }
+        return self._call(f'{self.content_base_url}/files/upload_session/finish', arg, data=b'').json()
+    
+    def download(self, path):
+        return self._call(f'{self.content_base_url}/files/download', {'path': path}).content
+    
+    def delete(self, path):
+        self._call(f'{self.api_base_url}/files/delete_v2', json_body={'path': path})
+    
+    def get_metadata(self, path):
+        """File metadata, or None when the path does not exist"""
+        try:
+            return self._call(f'{self.api_base_url}/files/get_metadata', json_body={'path': path}).json()
+        except DropboxError as e:
+            if 'not_found' in str(e):
+                return None
+            raise
+    
+    def create_shared_link(self, path):
+        try:
+            result = self._call(
+                f'{self.api_base_url}/sharing/create_shared_link_with_settings',
+                json_body={'path': path, 'settings': {'requested_visibility': 'public'}},
+            ).json()
+        except DropboxError as e:
+            if 'shared_link_already_exists' not in str(e):
+                raise
+            result = self._call(
+                f'{self.api_base_url}/sharing/list_shared_links', json_body={'path': path, 'direct_only': True}
+            ).json()['links'][0]
+        return result['url']
+
+
+class StorageIndex:
+    """StoredFile rows fronted by the Django cache: one cache hit per lookup on the hot path"""
+    
+    MISSING = 'missing'
+    
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+    
+    def _key(self, name):
+        return INDEX_CACHE_KEY.format(digest=hashlib.sha1(name.encode('utf-8')).hexdigest())
+    
+    def _timeout(self):
+        return self.timeout or get_dropbox_storage_settings()['INDEX_CACHE_TIMEOUT']
+    
+    def get(self, name):
+        """Indexed entry of ``name`` as a dict, or None"""
+        from .models import StoredFile
+        
+        entry = cache.get(self._key(name))
+        if entry is None:
+            entry = StoredFile.objects.filter(name=name).values(
+                'backend', 'size', 'etag', 'shared_url', 'shared_url_expires_at'
+            ).first() or self.MISSING
+            cache.set(self._key(name), entry, self._timeout())
+        return None if entry == self.MISSING else entry
+    
+    def set(self, name, **fields):
+        from .models import StoredFile
+        
+        StoredFile.objects.update_or_create(name=name, defaults=fields)
+        cache.delete(self._key(name))
+    
+    def delete(self, name):
+        from .models import StoredFile
+        
+        StoredFile.objects.filter(name=name).delete()
+        cache.delete(self._key(name))
+
+
+def direct_link(shared_link):
+    """Shared link page -> direct download URL"""
+    return shared_link.replace('www.dropbox.com', 'dl.dropboxusercontent.com').replace('?dl=0', '')
+
+
 @deconstructible
 class DropboxStorage(Storage):
-    """Django storage backend for Dropbox"""
+    """Django storage routing files between the local file system and Dropbox"""
     
-    def __init__(self, location=None, base_url=None):
+    def __init__(self, location=None, base_url=None, local_storage=None, client=None, index=None, config=None):
         self.dropbox_service = DropboxStorageService()
         self.location = location or 'vgk_files'
         self.base_url = base_url
+        self.local = local_storage or FileSystemStorage()
+        self._client = client
+        self.index = index or StorageIndex()
+        self.config = config or get_dropbox_storage_settings()
+    
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = DropboxClient(self.dropbox_service.access_token)
+        return self._client
+    
+    def _dropbox_path(self, name):
+        return f'/{self.location}/{name}'
+    
+    def _backend(self, name):
+        entry = self.index.get(name)
+        return entry['backend'] if entry else 'local'
     
     def _open(self, name, mode='rb'):
-        """Open file from Dropbox"""
-        if not self.dropbox_service.should_use_dropbox():
-            return None
-        
-        dropbox_path = f'/{self.location}/{name}'
-        result = self.dropbox_service.download_file(dropbox_path)
-        
-        if result.get('success'):
-            return ContentFile(result.get('content', b''))
-        else:
-            raise FileNotFoundError(f"File not found in Dropbox: {name}")
+        """Open file from Dropbox or the local storage"""
+        if self._backend(name) != 'dropbox':
+            return self.local._open(name, mode)
+        try:
+            return ContentFile(self.client.download(self._dropbox_path(name)), name=name)
+        except DropboxError as e:
+            raise FileNotFoundError(f"File not found in Dropbox: {name} ({e})")
     
     def _save(self, name, content):
-        """Save file to Dropbox"""
-        if not self.dropbox_service.should_use_dropbox(content.size):
+        """Save file to Dropbox when routed there, locally otherwise"""
+        size = content.size
+        if not self.dropbox_service.should_use_dropbox(size):
+            name = self.local._save(name, content)
+            self.index.set(name, backend='local', size=size, etag='', shared_url='', shared_url_expires_at=None)
             return name
         
-        dropbox_path = f'/{self.location}/{name}'
-        result = self.dropbox_service.upload_file(
-            file_path=None,
-            dropbox_path=dropbox_path,
-            file_content=content.read()
+        dropbox_path = self._dropbox_path(name)
+        try:
+            if size >= self.config['CHUNKED_UPLOAD_THRESHOLD']:
+                metadata = self._upload_chunked(dropbox_path, content, size)
+            else:
+                content.seek(0)
+                metadata = self.client.upload(dropbox_path, content.read())
+        except DropboxError as e:
+            raise Exception(f"Failed to upload to Dropbox: {e}")
+        
+        self.index.set(
+            name, backend='dropbox', size=metadata.get('size', size), etag=metadata.get('content_hash', ''),
+            shared_url='', shared_url_expires_at=None,
         )
+        return name
+    
+    def _upload_chunked(self, dropbox_path, content, size):
+        """Concurrent upload session: chunks read in order, sent in parallel (at most 2 per worker in memory)"""
+        chunk_size = self.config['CHUNK_SIZE']
+        workers = max(self.config['UPLOAD_WORKERS'], 1)
+        session_id = self.client.start_upload_session()
         
-        if result.get('success'):
-            return name
-        else:
-            raise Exception(f"Failed to upload to Dropbox: {result.get('error')}")
+        content.seek(0)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending, offset = [], 0
+            for chunk in content.chunks(chunk_size):
+                close = offset + len(chunk) >= size
+                pending.append(executor.submit(self.client.append_upload_session, session_id, offset, chunk, close))
+                offset += len(chunk)
+                if len(pending) >= workers * 2:
+                    pending.pop(0).result()
+            for future in pending:
+                future.result()
+        return self.client.finish_upload_session(session_id, offset, dropbox_path)
     
     def delete(self, name):
-        """Delete file from Dropbox"""
-        if not self.dropbox_service.should_use_dropbox():
-            return
-        
-        dropbox_path = f'/{self.location}/{name}'
-        self.dropbox_service.delete_file(dropbox_path)
+        """Delete file from its backend"""
+        if self._backend(name) == 'dropbox':
+            try:
+                self.client.delete(self._dropbox_path(name))
+            except DropboxError as e:
+                logger.warning(f"Error deleting {name} from Dropbox: {e}")
+        else:
+            self.local.delete(name)
+        self.index.delete(name)
     
     def exists(self, name):
-        """Check if file exists in Dropbox"""
-        if not self.dropbox_service.should_use_dropbox():
-            return False
-        
-        dropbox_path = f'/{self.location}/{name}'
-        result = self.dropbox_service.get_file_info(dropbox_path)
-        return result.get('success', False)
+        """Check if file exists (index lookup, local storage for unindexed files)"""
+        return self.index.get(name) is not None or self.local.exists(name)
     
     def url(self, name):
-        """Get URL for file in Dropbox"""
-        if not self.dropbox_service.should_use_dropbox():
-            return None
+        """Get URL for file; Dropbox shared links are created once and reused until they expire"""
+        entry = self.index.get(name)
+        if not entry or entry['backend'] != 'dropbox':
+            return self.local.url(name)
         
-        dropbox_path = f'/{self.location}/{name}'
-        result = self.dropbox_service.create_shared_link(dropbox_path)
-        
-        if result.get('success'):
-            return result.get('direct_link')
-        else:
+        if entry['shared_url'] and entry['shared_url_expires_at'] and entry['shared_url_expires_at'] > timezone.now():
+            return entry['shared_url']
+        try:
+            shared_url = direct_link(self.client.create_shared_link(self._dropbox_path(name)))
+        except DropboxError as e:
+            logger.error(f"Error creating Dropbox shared link for {name}: {e}")
             return None
+        self.index.set(
+            name, shared_url=shared_url,
+            shared_url_expires_at=timezone.now() + timedelta(seconds=self.config['SHARED_URL_TTL']),
+        )
+        return shared_url
     
     def size(self, name):
-        """Get file size from Dropbox"""
-        if not self.dropbox_service.should_use_dropbox():
-            return 0
-        
-        dropbox_path = f'/{self.location}/{name}'
-        result = self.dropbox_service.get_file_info(dropbox_path)
-        
-        if result.get('success'):
-            return result.get('size', 0)
-        else:
-            return 0
+        """Get file size from the index"""
+        entry = self.index.get(name)
+        if entry:
+            return entry['size']
+        return self.local.size(name)
+    
+    def path(self, name):
+        if self._backend(name) == 'dropbox':
+            raise NotImplementedError("Dropbox files have no local path")
+        return self.local.path(name)
 
 # Global instance
 dropbox_storage_service = DropboxStorageService()
@@ -1,6 +1,5 @@
 # backend/email_service.py - Comprehensive Email Notification System
 
-import yagmail
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -8,7 +7,7 @@ from email.mime.base import MIMEBase
 from email import encoders
 from django.conf import settings
 from django.template.loader import render_to_string
-from django.core.mail import send_mail, send_mass_mail
+from django.core.mail import send_mass_mail
 from django.utils import timezone
 from datetime import datetime, timedelta
 import logging
@@ -17,11 +16,13 @@ from typing import List, Dict, Optional, Union
 import json
 import os
 
+from .smtp_pool import smtp_pool
+
 logger = logging.getLogger(__name__)
 
 class EmailNotificationService:
     """
-    Comprehensive email notification service with yagmail integration
+    Comprehensive email notification service sending through the shared SMTP connection pool
     """
     
     def __init__(self):
@@ -33,53 +34,25 @@ class EmailNotificationService:
         self.from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@vide-grenier-kamer.com')
         self.from_name = getattr(settings, 'EMAIL_FROM_NAME', 'Vidé-Grenier Kamer')
         
-        # Initialize yagmail
-        self.yag = None
-        self.setup_yagmail()
-    
-    def setup_yagmail(self):
-        """Setup yagmail connection"""
-        try:
-            if self.smtp_username and self.smtp_password:
-                self.yag = yagmail.SMTP(
-                    user=self.smtp_username,
-                    password=self.smtp_password,
-                    host=self.smtp_host,
-                    port=self.smtp_port
-                )
-                logger.info("Yagmail connection established successfully")
-            else:
-                logger.warning("SMTP credentials not configured, using Django's email backend")
-        except Exception as e:
-            logger.error(f"Failed to setup yagmail: {e}")
-            self.yag = None
+        # Persistent sessions and rate limiting are shared with the other senders
+        self.pool = smtp_pool
     
     def send_email(self, to_email: str, subject: str, html_content: str, 
                    text_content: str = None, attachments: List[str] = None,
                    reply_to: str = None) -> bool:
         """
-        Send email using yagmail or Django's email backend
+        Send email through the shared SMTP connection pool
         """
         try:
-            if self.yag:
-                # Use yagmail
-                self.yag.send(
-                    to=to_email,
-                    subject=subject,
-                    contents=[html_content],
-                    attachments=attachments or [],
-                    headers={'Reply-To': reply_to} if reply_to else {}
-                )
-            else:
-                # Use Django's email backend
-                send_mail(
-                    subject=subject,
-                    message=text_content or self.html_to_text(html_content),
-                    from_email=self.from_email,
-                    recipient_list=[to_email],
-                    html_message=html_content,
-                    fail_silently=False
-                )
+            self.pool.send(
+                to=to_email,
+                subject=subject,
+                html_content=html_content,
+                text_content=text_content or self.html_to_text(html_content),
+                from_email=self.from_email,
+                reply_to=reply_to,
+                attachments=attachments
+            )
             
             logger.info(f"Email sent successfully to {to_email}")
             return True
@@ -467,18 +440,12 @@ class EmailNotificationService:
         Test email connection
         """
         try:
-            if self.yag:
-                # Test yagmail connection
-                self.yag.send(to=self.smtp_username, subject="Test", contents="Test email")
-            else:
-                # Test Django email backend
-                send_mail(
-                    subject="Test",
-                    message="Test email",
-                    from_email=self.from_email,
-                    recipient_list=[self.smtp_username],
-                    fail_silently=False
-                )
+            self.pool.send(
+                to=self.smtp_username,
+                subject="Test",
+                html_content="Test email",
+                from_email=self.from_email
+            )
             return True
         except Exception as e:
             logger.error(f"Email connection test failed: {e}")
@@ -488,11 +455,11 @@ class EmailNotificationService:
         """
         Get email sending statistics
         """
-        # This would typically query a database table tracking email sends
+        # Counters of the shared SMTP pool since the process started
         return {
-            'total_sent': 0,
-            'successful': 0,
-            'failed': 0,
+            'total_sent': self.pool.sent + self.pool.failed,
+            'successful': self.pool.sent,
+            'failed': self.pool.failed,
             'last_sent': None
         }
 
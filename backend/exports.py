@@ -0,0 +1,437 @@
+# backend/exports.py
+"""
+Streaming CSV/XLSX exports for the admin panel
+Large exports run as background jobs writing to the default storage
+"""
+
+import csv
+import io
+import logging
+import tempfile
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect, render
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.styles import Font, PatternFill
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXPORT_SETTINGS = {
+    'CHUNK_SIZE': 2000,  # rows fetched per cursor round trip and written per CSV chunk
+    'BACKGROUND_THRESHOLD': 100000,  # rows above which an export runs as a job, None: never
+    'STORAGE_DIR': 'exports',  # job files in the default storage
+    'JOB_TIMEOUT': 60 * 60 * 24,  # seconds a job (and its download link) is kept
+}
+
+JOB_KEY = 'export_job:{job_id}'
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+HEADER_FONT = Font(bold=True)
+HEADER_FILL = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
+
+
+def get_export_settings():
+    config = dict(DEFAULT_EXPORT_SETTINGS)
+    config.update(getattr(settings, 'EXPORT_SETTINGS', {}))
+    return config
+
+
+# ============ FORMATTERS ============
+
+def as_value(value):
+    return '' if value is None else value
+
+
+def as_datetime(value, default=''):
+    return value.strftime('%Y-%m-%d %H:%M') if value else default
+
+
+def as_yes_no(value):
+    return 'Oui' if value else 'Non'
+
+
+def as_choice(choices):
+    labels = dict(choices)
+    return lambda value: labels.get(value, value or '')
+
+
+# ============ EXPORT DEFINITIONS ============
+
+class Export:
+    """
+    One exportable table: ``columns`` are (header, queryset field, formatter)
+    triples read with a single values_list query.
+    """
+
+    name = None
+    title = None  # worksheet title and file name prefix
+    columns = []
+
+    def get_queryset(self, params):
+        raise NotImplementedError
+
+    @property
+    def headers(self):
+        return [header for header, _, _ in self.columns]
+
+    def filter_dates(self, queryset, params, field='created_at'):
+        if params.get('date_from'):
+            queryset = queryset.filter(**{f'{field}__date__gte': params['date_from']})
+        if params.get('date_to'):
+            queryset = queryset.filter(**{f'{field}__date__lte': params['date_to']})
+        return queryset
+
+    def values(self, params, chunk_size):
+        fields = [field for _, field, _ in self.columns]
+        return self.get_queryset(params).values_list(*fields).iterator(chunk_size=chunk_size)
+
+    def count(self, params):
+        return self.get_queryset(params).count()
+
+    def rows(self, params, chunk_size=None):
+        chunk_size = chunk_size or get_export_settings()['CHUNK_SIZE']
+        formatters = [formatter or as_value for _, _, formatter in self.columns]
+        for values in self.values(params, chunk_size):
+            yield [formatter(value) for formatter, value in zip(formatters, values)]
+
+    def filename(self, extension):
+        return f'{self.name}_export_{timezone.now().strftime("%Y%m%d_%H%M")}.{extension}'
+
+
+class UsersExport(Export):
+    name = 'users'
+    title = 'Utilisateurs'
+
+    def __init__(self):
+        from .models import User
+        self.columns = [
+            ('ID', 'id', str),
+            ('Email', 'email', None),
+            ('Prénom', 'first_name', None),
+            ('Nom', 'last_name', None),
+            ('Téléphone', 'phone', None),
+            ('Ville', 'city', None),
+            ('Type utilisateur', 'user_type', as_choice(User.USER_TYPES)),
+            ('Statut', 'is_active', lambda value: 'Actif' if value else 'Inactif'),
+            ('Vérifié', 'is_verified', as_yes_no),
+            ('Score confiance', 'trust_score', lambda value: value or 0),
+            ('Points fidélité', 'loyalty_points', lambda value: value or 0),
+            ('Date inscription', 'date_joined', as_datetime),
+            ('Dernière connexion', 'last_login', lambda value: as_datetime(value, 'Jamais')),
+        ]
+
+    def get_queryset(self, params):
+        from .models import User
+        queryset = User.objects.order_by('-date_joined')
+        user_ids = [user_id for user_id in params.get('user_ids', '').split(',') if user_id]
+        if user_ids:
+            queryset = queryset.filter(id__in=user_ids)
+        if params.get('user_type'):
+            queryset = queryset.filter(user_type=params['user_type'])
+        return self.filter_dates(queryset, params, 'date_joined')
+
+
+class OrdersExport(Export):
+    name = 'orders'
+    title = 'Commandes'
+
+    def __init__(self):
+        from .models import Order
+        self.columns = [
+            ('Numéro', 'order_number', None),
+            ('Date', 'created_at', as_datetime),
+            ('Acheteur', 'buyer__email', None),
+            ('Visiteur', 'visitor_name', None),
+            ('Produit', 'product__title', None),
+            ('Quantité', 'quantity', None),
+            ('Prix unitaire', 'unit_price', None),
+            ('Montant total', 'total_amount', None),
+            ('Statut', 'status', as_choice(Order.STATUSES)),
+            ('Paiement', 'payment_method', as_choice(Order.PAYMENT_METHODS)),
+            ('Livraison', 'delivery_method', as_choice(Order.DELIVERY_METHODS)),
+            ('Point de retrait', 'pickup_point__name', None),
+            ('Livrée le', 'delivered_at', as_datetime),
+        ]
+
+    def get_queryset(self, params):
+        from .models import Order
+        queryset = Order.objects.order_by('-created_at')
+        if params.get('status'):
+            queryset = queryset.filter(status=params['status'])
+        return self.filter_dates(queryset, params)
+
+
+class PaymentsExport(Export):
+    name = 'payments'
+    title = 'Paiements'
+
+    def __init__(self):
+        from .models import Payment
+        self.columns = [
+            ('Référence', 'payment_reference', None),
+            ('Commande', 'order__order_number', None),
+            ('Montant', 'amount', None),
+            ('Statut', 'status', as_choice(Payment.STATUSES)),
+            ('Transaction', 'transaction_id', None),
+            ('Date', 'created_at', as_datetime),
+            ('Complété le', 'completed_at', as_datetime),
+        ]
+
+    def get_queryset(self, params):
+        from .models import Payment
+        queryset = Payment.objects.order_by('-created_at')
+        if params.get('status'):
+            queryset = queryset.filter(status=params['status'])
+        return self.filter_dates(queryset, params)
+
+
+class StockExport(Export):
+    name = 'stock'
+    title = 'Stock'
+    columns = [
+        ('Produit', 'product__title', None),
+        ('Quantité', 'quantity', None),
+        ('Emplacement', 'location', None),
+        ('Notes', 'notes', None),
+        ('Ajouté le', 'created_at', as_datetime),
+        ('Mis à jour le', 'updated_at', as_datetime),
+    ]
+
+    def get_queryset(self, params):
+        from .models import AdminStock
+        queryset = AdminStock.objects.order_by('-updated_at')
+        if params.get('max_quantity'):
+            queryset = queryset.filter(quantity__lte=params['max_quantity'])
+        return queryset
+
+
+EXPORTS = {
+    'users': UsersExport,
+    'orders': OrdersExport,
+    'payments': PaymentsExport,
+    'stock': StockExport,
+}
+
+
+def get_export(name):
+    try:
+        return EXPORTS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown export: {name}")
+
+
+# ============ WRITERS ============
+
+class _Echo:
+    """File-like object handing csv.writer's output straight back"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(export, params, chunk_size=None):
+    """CSV text of ``export``, one chunk of rows at a time"""
+    chunk_size = chunk_size or get_export_settings()['CHUNK_SIZE']
+    writer = csv.writer(_Echo())
+    yield writer.writerow(export.headers)
+
+    buffer = []
+    for row in export.rows(params, chunk_size):
+        buffer.append(writer.writerow(row))
+        if len(buffer) >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _xlsx_value(value):
+    if isinstance(value, str):
+        return ILLEGAL_CHARACTERS_RE.sub('', value)
+    return value
+
+
+def write_xlsx(export, params, fileobj, chunk_size=None):
+    """Write ``export`` to ``fileobj`` with a write-only workbook; returns the row count"""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(export.title)
+
+    header = []
+    for title in export.headers:
+        cell = WriteOnlyCell(sheet, value=title)
+        cell.font = HEADER_FONT
+        cell.fill = HEADER_FILL
+        header.append(cell)
+    sheet.append(header)
+
+    count = 0
+    for row in export.rows(params, chunk_size):
+        sheet.append([_xlsx_value(value) for value in row])
+        count += 1
+    workbook.save(fileobj)
+    return count
+
+
+def write_csv(export, params, fileobj, chunk_size=None):
+    """Write ``export`` as UTF-8 CSV to the binary ``fileobj``; returns the row count"""
+    text = io.TextIOWrapper(fileobj, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    writer.writerow(export.headers)
+    count = 0
+    try:
+        for row in export.rows(params, chunk_size):
+            writer.writerow(row)
+            count += 1
+    finally:
+        text.flush()
+        text.detach()
+    return count
+
+
+WRITERS = {'csv': write_csv, 'xlsx': write_xlsx}
+
+
+def export_format(value):
+    return 'xlsx' if value in ('excel', 'xlsx') else 'csv'
+
+
+# ============ BACKGROUND JOBS ============
+
+def get_export_job(job_id):
+    return cache.get(JOB_KEY.format(job_id=job_id))
+
+
+def _save_job(job):
+    cache.set(JOB_KEY.format(job_id=job['id']), job, get_export_settings()['JOB_TIMEOUT'])
+
+
+def start_export_job(name, file_format, params, user_id=None):
+    """Queue an export to a file in the default storage; returns the job"""
+    get_export(name)  # unknown names fail here rather than in the worker
+    job = {
+        'id': uuid.uuid4().hex,
+        'name': name,
+        'format': file_format,
+        'params': dict(params),
+        'user_id': str(user_id) if user_id else None,
+        'status': 'pending',
+        'rows': None,
+        'path': None,
+        'filename': None,
+        'error': None,
+    }
+    _save_job(job)
+
+    try:
+        from .tasks import export_job_task
+        export_job_task.delay(job['id'])
+    except Exception as e:
+        logger.warning(f"Celery unavailable for export {job['id']}, running it in a thread: {e}")
+        threading.Thread(target=run_export_job, args=(job['id'],), daemon=True).start()
+    return job
+
+
+def run_export_job(job_id):
+    """Write the file of a queued export job; returns the job"""
+    job = get_export_job(job_id)
+    if job is None:
+        raise ValueError(f"Unknown export job: {job_id}")
+
+    job['status'] = 'running'
+    _save_job(job)
+    try:
+        export = get_export(job['name'])
+        filename = export.filename(job['format'])
+        with tempfile.TemporaryFile() as fileobj:
+            rows = WRITERS[job['format']](export, job['params'], fileobj)
+            fileobj.seek(0)
+            path = default_storage.save(f"{get_export_settings()['STORAGE_DIR']}/{job_id}/{filename}", File(fileobj))
+        job.update(status='done', rows=rows, path=path, filename=filename)
+    except Exception as e:
+        logger.error(f"Error running export job {job_id}: {e}")
+        job.update(status='failed', error=str(e))
+    _save_job(job)
+    return job
+
+
+# ============ RESPONSES ============
+
+def streaming_response(export, file_format, params):
+    """Export answered directly: streamed CSV or a write-only XLSX temporary file"""
+    if file_format == 'xlsx':
+        fileobj = tempfile.TemporaryFile()
+        write_xlsx(export, params, fileobj)
+        fileobj.seek(0)
+        return FileResponse(fileobj, as_attachment=True, filename=export.filename('xlsx'),
+                            content_type=CONTENT_TYPES['xlsx'])
+
+    response = StreamingHttpResponse(iter_csv(export, params), content_type=CONTENT_TYPES['csv'])
+    response['Content-Disposition'] = f'attachment; filename="{export.filename("csv")}"'
+    return response
+
+
+def job_status(job):
+    status = {key: job[key] for key in ('id', 'name', 'format', 'status', 'rows', 'error')}
+    status['status_url'] = reverse('admin_panel:export_job', args=[job['id']])
+    if job['status'] == 'done':
+        status['download_url'] = f"{status['status_url']}?download=1"
+    return status
+
+
+def wants_page(request):
+    """Browser navigation (an export button) rather than a script polling for JSON"""
+    return 'text/html' in request.headers.get('Accept', '')
+
+
+def export_response(request, name):
+    """
+    Answer an admin export request (``?format=excel|csv``), as a download or,
+    for large exports and ``?background=1``, as a 202 with the job status.
+    Browser navigations are redirected to the job page instead, which polls
+    the status and starts the download when the file is ready.
+    """
+    export = get_export(name)
+    file_format = export_format(request.GET.get('format', 'excel'))
+    params = request.GET.dict()
+
+    threshold = get_export_settings()['BACKGROUND_THRESHOLD']
+    background = request.GET.get('background') == '1'
+    if not background and threshold is not None:
+        background = export.count(params) > threshold
+
+    if background:
+        job = start_export_job(name, file_format, params, request.user.pk)
+        if wants_page(request):
+            return redirect(job_status(job)['status_url'])
+        return JsonResponse(job_status(job), status=202)
+    return streaming_response(export, file_format, params)
+
+
+def export_job_response(request, job_id):
+    """Status of an export job, or its file with ``?download=1``"""
+    job = get_export_job(job_id)
+    if job is None or (job['user_id'] != str(request.user.pk) and not request.user.is_superuser):
+        return JsonResponse({'error': 'Export introuvable'}, status=404)
+
+    if request.GET.get('download') == '1':
+        if job['status'] != 'done':
+            return JsonResponse(job_status(job), status=409)
+        return FileResponse(default_storage.open(job['path'], 'rb'), as_attachment=True,
+                            filename=job['filename'], content_type=CONTENT_TYPES[job['format']])
+    if wants_page(request):
+        return render(request, 'backend/admin/exports/job.html', {'job': job_status(job)})
+    return JsonResponse(job_status(job))
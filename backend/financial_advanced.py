@@ -22,6 +22,8 @@ from .models_advanced import (
     EscrowPayment, InstallmentPlan, InstallmentPayment
 )
 from .smart_notifications import smart_notifications
+from .daily_metrics import commission_rate
+from .time_series import daily_buckets, series
 
 logger = logging.getLogger(__name__)
 
@@ -666,35 +668,37 @@ class SellerAnalyticsView(LoginRequiredMixin, TemplateView):
     
     def _get_revenue_analytics(self, user):
         """Get comprehensive revenue analytics"""
+        now = timezone.now()
         orders = Order.objects.filter(
             product__seller=user,
             status='DELIVERED'
         )
         
-        # Monthly revenue
-        monthly_revenue = orders.filter(
-            delivered_at__gte=timezone.now() - timedelta(days=30)
-        ).aggregate(total=Sum('total_amount'))['total'] or 0
-        
-        # Annual revenue
-        annual_revenue = orders.filter(
-            delivered_at__gte=timezone.now() - timedelta(days=365)
-        ).aggregate(total=Sum('total_amount'))['total'] or 0
+        # Monthly/annual revenue, average order value and commission base in one pass
+        totals = orders.aggregate(
+            monthly_revenue=Sum('total_amount', filter=Q(delivered_at__gte=now - timedelta(days=30))),
+            annual_revenue=Sum('total_amount', filter=Q(delivered_at__gte=now - timedelta(days=365))),
+            avg_order_value=Avg('total_amount'),
+            client_revenue=Sum('total_amount', filter=Q(product__source='CLIENT')),
+        )
+        monthly_revenue = totals['monthly_revenue'] or 0
+        annual_revenue = totals['annual_revenue'] or 0
+        avg_order_value = totals['avg_order_value'] or 0
         
-        # Average order value
-        avg_order_value = orders.aggregate(avg=Avg('total_amount'))['avg'] or 0
+        # Commission paid (COMMISSION_RATE on client products, as Product.commission_amount)
+        total_commission = (totals['client_revenue'] or Decimal('0')) * commission_rate()
         
-        # Commission paid
-        total_commission = orders.aggregate(
-            total=Sum('commission_amount')
-        )['total'] or 0
+        # Daily revenue of the last 30 days, one grouped query
+        daily = daily_buckets(orders, 'delivered_at', days=30, revenue=Sum('total_amount'))
         
         return {
             'monthly_revenue': monthly_revenue,
             'annual_revenue': annual_revenue,
             'avg_order_value': avg_order_value,
             'total_commission': total_commission,
-            'net_revenue': annual_revenue - total_commission
+            'net_revenue': annual_revenue - total_commission,
+            'daily_labels': [bucket['date'].strftime('%d/%m') for bucket in daily],
+            'daily_revenue': [float(value) for value in series(daily, 'revenue')],
         }
     
     def _get_payment_method_analytics(self, user):
@@ -0,0 +1,62 @@
+# backend/fragment_cache.py
+"""
+Versioned cache for session-independent page fragments
+Signals bump a topic version when its data changes, invalidating every fragment built from it
+"""
+
+import logging
+import time
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'fragment_version:{topic}'
+FRAGMENT_KEY = 'fragment:{name}:{versions}'
+DEFAULT_TIMEOUT = 60 * 15  # safety net, invalidation is signal driven
+
+
+def _new_version():
+    # Millisecond clock: a version key lost to eviction never restarts at an already used value
+    return int(time.time() * 1000)
+
+
+def get_topic_versions(topics):
+    """Current version of each topic, creating missing ones"""
+    keys = {topic: VERSION_KEY.format(topic=topic) for topic in topics}
+    stored = cache.get_many(list(keys.values()))
+
+    versions = []
+    for topic in topics:
+        version = stored.get(keys[topic])
+        if version is None:
+            version = _new_version()
+            if not cache.add(keys[topic], version, None):
+                version = cache.get(keys[topic], version)
+        versions.append(version)
+    return versions
+
+
+def bump_topics(*topics):
+    """Invalidate every fragment depending on one of ``topics``"""
+    for topic in topics:
+        key = VERSION_KEY.format(topic=topic)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), None)
+
+
+def get_fragment(name, builder, topics, timeout=DEFAULT_TIMEOUT):
+    """Return the cached fragment ``name`` for the current topic versions, building it on a miss"""
+    versions = '.'.join(str(version) for version in get_topic_versions(topics))
+    key = FRAGMENT_KEY.format(name=name, versions=versions)
+
+    fragment = cache.get(key)
+    if fragment is None:
+        fragment = builder()
+        try:
+            cache.set(key, fragment, timeout)
+        except Exception as e:
+            logger.error(f"Error caching fragment {name}: {e}")
+    return fragment
@@ -0,0 +1,51 @@
+"""
+Management command to (re)build the daily_metrics rollup from orders, users and payments
+Run with: python manage.py backfill_daily_metrics [--days 30] [--start 2025-01-01] [--end 2025-12-31]
+
+Without options the whole history is rebuilt, one block of --chunk-days at a time.
+"""
+
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from backend.daily_metrics import rebuild, source_date_range
+
+
+class Command(BaseCommand):
+    help = 'Backfill the DailyMetrics rollup read by the admin dashboards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Only rebuild the last N days (including today)')
+        parser.add_argument('--start', default=None, help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--end', default=None, help='Last day to rebuild (YYYY-MM-DD, default: today)')
+        parser.add_argument('--chunk-days', type=int, default=31, help='Days rebuilt per transaction (default: 31)')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else None
+            end = date.fromisoformat(options['end']) if options['end'] else today
+        except ValueError:
+            raise CommandError('--start and --end must be YYYY-MM-DD dates')
+
+        if options['days']:
+            start = today - timedelta(days=options['days'] - 1)
+        elif start is None:
+            bounds = source_date_range()
+            if bounds is None:
+                self.stdout.write(self.style.WARNING('No orders, users or payments, nothing to backfill.'))
+                return
+            start = bounds[0]
+            end = max(end, bounds[1])
+
+        self.stdout.write(f"Rebuilding daily metrics from {start} to {end}...")
+        rows = 0
+        block_start = start
+        while block_start <= end:
+            block_end = min(end, block_start + timedelta(days=options['chunk_days'] - 1))
+            rows += rebuild(block_start, block_end)
+            block_start = block_end + timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(f"{rows} daily metrics rows written ({(end - start).days + 1} days)"))
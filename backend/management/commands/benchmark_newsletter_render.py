@@ -0,0 +1,96 @@
+"""
+Management command to benchmark newsletter personalization cost per 10k recipients
+Run with: python manage.py benchmark_newsletter_render [--recipients 10000] [--products 20]
+
+Renders a synthetic newsletter (style block, product grid, name/email/city
+slots) for every recipient with:
+- format+inline: str.format on the whole HTML, then premailer per send
+  (sampled and extrapolated, it is by far the slowest)
+- format: str.format on the whole HTML, no CSS inlining
+- compiled: compile_template once (premailer included), then slot rendering
+
+No database access, nothing is sent.
+"""
+
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from backend.newsletter_templates import _compile, inline_css, subscriber_variables
+
+STYLE = """
+<style>
+  body {{ font-family: Arial, sans-serif; background: #f4f4f4; }}
+  .header {{ background: #2e7d32; color: #ffffff; padding: 20px; }}
+  .product {{ display: inline-block; width: 45%; margin: 2%; border: 1px solid #dddddd; }}
+  .product h3 {{ font-size: 16px; color: #333333; }}
+  .price {{ color: #2e7d32; font-weight: bold; }}
+  .footer {{ font-size: 12px; color: #888888; text-align: center; }}
+</style>
+"""
+
+PRODUCT = """
+<div class="product">
+  <img src="https://videgrenierkamer.com/media/products/{index}.jpg" alt="Produit {index}">
+  <h3>Article d'occasion numéro {index} en très bon état</h3>
+  <p class="price">{price} FCFA</p>
+  <a href="https://videgrenierkamer.com/produits/{index}/?utm_source=newsletter">Voir l'annonce</a>
+</div>
+"""
+
+
+def newsletter_source(products):
+    grid = ''.join(
+        PRODUCT.format(index=index, price=f'{(index + 1) * 2500:,}'.replace(',', ' ')) for index in range(products)
+    )
+    return (
+        '<html><head>' + STYLE + '</head><body>'
+        '<div class="header"><h1>Bonjour {name} !</h1><p>Les bonnes affaires de la semaine à {city}</p></div>'
+        + grid.replace('{', '{{').replace('}', '}}') +
+        '<div class="footer"><p>Envoyé à {email}. '
+        '<a href="https://videgrenierkamer.com/newsletter/unsubscribe/?email={email}">Se désabonner</a></p></div>'
+        '</body></html>'
+    )
+
+
+class Command(BaseCommand):
+    help = 'Benchmark newsletter rendering: str.format (+ premailer) per recipient vs precompiled templates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, default=10000, help='Recipients to render (default: 10000)')
+        parser.add_argument('--products', type=int, default=20, help='Products in the newsletter (default: 20)')
+
+    def handle(self, *args, **options):
+        recipients = options['recipients']
+        source = newsletter_source(options['products'])
+        subscribers = [
+            subscriber_variables(SimpleNamespace(name=f'Abonné {index}', email=f'user{index}@example.cm', city='DOUALA'))
+            for index in range(recipients)
+        ]
+        self.stdout.write(f"Template: {len(source)} characters, {recipients} recipients")
+        self.stdout.write(f"{'engine':>14} {'total (s)':>10} {'per 10k (s)':>12} {'per mail (µs)':>14}")
+
+        sample = subscribers[:min(recipients, 200)]
+        started = time.perf_counter()
+        for variables in sample:
+            inline_css(source.format(**variables))
+        self.report('format+inline', (time.perf_counter() - started) * recipients / len(sample), recipients)
+
+        started = time.perf_counter()
+        for variables in subscribers:
+            source.format(**variables)
+        self.report('format', time.perf_counter() - started, recipients)
+
+        started = time.perf_counter()
+        compiled = _compile(source, html=True)
+        for variables in subscribers:
+            compiled.render(variables)
+        self.report('compiled', time.perf_counter() - started, recipients)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completed.'))
+
+    def report(self, engine, elapsed, recipients):
+        self.stdout.write(
+            f"{engine:>14} {elapsed:>10.3f} {elapsed * 10000 / recipients:>12.3f} {elapsed * 1e6 / recipients:>14.1f}"
+        )
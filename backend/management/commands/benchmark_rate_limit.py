@@ -0,0 +1,91 @@
+"""
+Management command to benchmark the per-request overhead of API rate limiting
+Run with: python manage.py benchmark_rate_limit [--requests 100000] [--ips 5000]
+
+Replays ``--requests`` API requests spread over ``--ips`` client addresses
+through:
+- legacy: the former per-process dict (IP -> minute -> count)
+- memory: MemoryRateLimitBackend (bounded LRU, sliding window)
+- redis: RedisRateLimitBackend, when the default cache is django_redis
+- middleware: APIThrottleMiddleware.process_request with the configured limiter
+
+and reports microseconds per request and the number of tracked keys.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from backend.middleware import APIThrottleMiddleware
+from backend.rate_limit import MemoryRateLimitBackend, RedisRateLimitBackend, _redis_client, rate_limiter
+
+
+class LegacyThrottle:
+    """The per-process dict APIThrottleMiddleware used to keep"""
+
+    def __init__(self):
+        self.api_requests = {}
+
+    def hit(self, ip):
+        current_minute = int(time.time() / 60)
+        minutes = self.api_requests.setdefault(ip, {})
+        minutes[current_minute] = minutes.get(current_minute, 0) + 1
+        for old_minute in [minute for minute in minutes if minute < current_minute - 1]:
+            del minutes[old_minute]
+        return minutes[current_minute] <= 100
+
+
+class Command(BaseCommand):
+    help = 'Benchmark per-request overhead of the sliding-window rate limiter backends'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100000, help='Requests to replay (default: 100000)')
+        parser.add_argument('--ips', type=int, default=5000, help='Distinct client IPs (default: 5000)')
+        parser.add_argument('--max-keys', type=int, default=1000, help='Memory backend LRU bound (default: 1000)')
+
+    def handle(self, *args, **options):
+        requests = options['requests']
+        ips = [f'10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}' for index in range(options['ips'])]
+        sequence = [ips[index % len(ips)] for index in range(requests)]
+        self.stdout.write(f"{requests} requests from {len(ips)} IPs")
+        self.stdout.write(f"{'limiter':>11} {'µs/request':>11} {'keys':>7}")
+
+        legacy = LegacyThrottle()
+        started = time.perf_counter()
+        for ip in sequence:
+            legacy.hit(ip)
+        self.report('legacy', time.perf_counter() - started, requests, len(legacy.api_requests))
+
+        memory = MemoryRateLimitBackend(options['max_keys'])
+        started = time.perf_counter()
+        for ip in sequence:
+            memory.hit(f'route:/api/:{ip}', 100, 60)
+        self.report('memory', time.perf_counter() - started, requests, len(memory._counters))
+
+        client = _redis_client()
+        if client is not None:
+            redis = RedisRateLimitBackend(client)
+            sample = sequence[:min(requests, 20000)]
+            started = time.perf_counter()
+            for ip in sample:
+                redis.hit(f'benchmark:{ip}', 100, 60)
+            self.report('redis', time.perf_counter() - started, len(sample), '-')
+            for key in client.scan_iter(match='ratelimit:benchmark:*', count=1000):
+                client.delete(key)
+        else:
+            self.stdout.write(f"{'redis':>11} {'skipped (default cache is not django_redis)':>11}")
+
+        middleware = APIThrottleMiddleware(lambda request: HttpResponse())
+        factory = RequestFactory()
+        prepared = [factory.get('/api/dashboard-stats/', REMOTE_ADDR=ip) for ip in sequence]
+        started = time.perf_counter()
+        for request in prepared:
+            middleware.process_request(request)
+        self.report('middleware', time.perf_counter() - started, requests, rate_limiter.backend.name)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completed.'))
+
+    def report(self, name, elapsed, requests, keys):
+        self.stdout.write(f"{name:>11} {elapsed * 1e6 / requests:>11.2f} {keys:>7}")
@@ -0,0 +1,85 @@
+"""
+Management command to benchmark PDF receipt rendering in receipts/second
+Run with: python manage.py benchmark_receipts [--receipts 2000] [--lines 5] [--workers 1,2,4]
+
+Renders synthetic receipts (``--lines`` order lines each, a distinct QR
+payload per receipt) to a temporary directory with:
+- serial: one process, QR codes computed for every receipt
+- warm-qr: one process, QR matrices already cached (repeat downloads)
+- pool-N: render_receipts with N worker processes
+
+No database access.
+"""
+
+import json
+import tempfile
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.receipts import iter_receipt_pdf, qr_modules, render_receipts
+
+
+def synthetic_receipt(index, lines):
+    return {
+        'number': f'VGK{index:08d}',
+        'date': '18/10/2026 14:30',
+        'name': f'Visiteur {index}',
+        'phone': f'+2376{index:08d}',
+        'email': f'visiteur{index}@example.cm',
+        'address': 'Rue de la Joie, Akwa, Douala',
+        'lines': [{
+            'title': f"Article d'occasion numéro {line} en très bon état",
+            'quantity': line % 3 + 1,
+            'unit_price': Decimal(2500 * (line + 1)),
+            'total': Decimal(2500 * (line + 1) * (line % 3 + 1)),
+        } for line in range(lines)],
+        'subtotal': Decimal(150000),
+        'delivery': Decimal(2000),
+        'total': Decimal(152000),
+        'qr_payload': json.dumps({'receipt_number': f'VGK{index:08d}', 'orders': [f'order-{index}-{line}' for line in range(lines)]}),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark streaming PDF receipt rendering: serial, cached QR codes and process pools'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--receipts', type=int, default=2000, help='Receipts per run (default: 2000)')
+        parser.add_argument('--lines', type=int, default=5, help='Order lines per receipt (default: 5)')
+        parser.add_argument('--workers', default='1,2,4', help='Comma separated pool sizes (default: 1,2,4)')
+
+    def handle(self, *args, **options):
+        try:
+            pool_sizes = [int(size) for size in options['workers'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError('--workers must be a comma separated list of integers')
+
+        receipts = [synthetic_receipt(index, options['lines']) for index in range(options['receipts'])]
+        self.stdout.write(f"{len(receipts)} receipts, {options['lines']} lines each")
+        self.stdout.write(f"{'renderer':>10} {'seconds':>8} {'receipts/s':>11} {'avg KB':>7}")
+
+        with tempfile.TemporaryDirectory() as directory:
+            qr_modules.cache_clear()
+            started = time.perf_counter()
+            size = sum(len(b''.join(iter_receipt_pdf(data))) for data in receipts)
+            self.report('serial', len(receipts), time.perf_counter() - started, size)
+
+            # The LRU now holds the last 256 payloads: warm a sample that fits it
+            sample = receipts[-256:]
+            started = time.perf_counter()
+            size = sum(len(b''.join(iter_receipt_pdf(data))) for data in sample)
+            self.report('warm-qr', len(sample), time.perf_counter() - started, size)
+
+            for workers in pool_sizes:
+                qr_modules.cache_clear()
+                started = time.perf_counter()
+                render_receipts(receipts, directory, workers=workers)
+                self.report(f'pool-{workers}', len(receipts), time.perf_counter() - started)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completed.'))
+
+    def report(self, name, count, elapsed, size=None):
+        average = f'{size / count / 1024:>7.1f}' if size else f"{'':>7}"
+        self.stdout.write(f"{name:>10} {elapsed:>8.2f} {count / elapsed:>11.1f} {average}")
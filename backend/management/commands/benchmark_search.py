@@ -0,0 +1,144 @@
+"""
+Management command to benchmark product search latency against catalog size
+Run with: python manage.py benchmark_search [--sizes 1000,10000,100000] [--queries 200]
+
+Compares, on the same synthetic catalog:
+- like: the former title/description/category LIKE '%term%' scan
+- fts5: the SQLite FTS5 table used by the sqlite_fts backend (bm25 ranked)
+- memory: the in-process inverted index of the memory backend
+
+Catalogs are built in a private in-memory SQLite database, the project
+database is never touched.
+"""
+
+import random
+import sqlite3
+import statistics
+import time
+import uuid
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.search import InMemorySearchBackend, SQLiteFTSSearchBackend, product_fields
+
+WORDS = [
+    'téléphone', 'samsung', 'galaxy', 'iphone', 'écran', 'chargeur', 'ordinateur', 'portable',
+    'canapé', 'cuir', 'table', 'chaise', 'réfrigérateur', 'télévision', 'télécommande', 'vélo',
+    'chaussures', 'robe', 'sac', 'montre', 'lunettes', 'matelas', 'armoire', 'bébé', 'poussette',
+    'livre', 'guitare', 'enceinte', 'casque', 'clavier', 'souris', 'imprimante', 'caméra',
+    'état', 'neuf', 'occasion', 'garantie', 'noir', 'blanc', 'rouge', 'bleu', 'cuisine', 'four',
+    'micro-ondes', 'ventilateur', 'climatiseur', 'console', 'manette', 'jeu', 'tablette',
+]
+CATEGORIES = ['Électronique', 'Maison & Jardin', 'Mode', 'Bébé & Enfants', 'Loisirs', 'Électroménager']
+CITIES = ['DOUALA', 'YAOUNDE', 'BAFOUSSAM', 'GAROUA']
+QUERIES = ['telephone samsung', 'canape cuir', 'tele', 'écran', 'refrigerateur', 'velo', 'mot1234', 'console manette']
+
+
+def synthetic_products(size, vocabulary=20000, seed=42):
+    """Zipf-distributed listings: common French words first, then a long tail of rarer ones"""
+    rng = random.Random(seed)
+    words = WORDS + [f'mot{index}' for index in range(vocabulary - len(WORDS))]
+    weights = [1 / (rank + 1) ** 1.1 for rank in range(len(words))]
+    for _ in range(size):
+        listing = rng.choices(words, weights=weights, k=30)
+        yield SimpleNamespace(
+            pk=uuid.uuid4(),
+            status='ACTIVE',
+            title=' '.join(listing[:5]).capitalize(),
+            description=' '.join(listing[5:]),
+            category=SimpleNamespace(name=rng.choice(CATEGORIES)),
+            city=rng.choice(CITIES),
+        )
+
+
+def timed(function, queries, repeat):
+    timings = []
+    for _ in range(repeat):
+        for query in queries:
+            started = time.perf_counter()
+            function(query)
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark product search latency (LIKE scan vs FTS5 vs in-process index) against catalog size'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='1000,10000,100000',
+            help='Comma separated catalog sizes (default: 1000,10000,100000)',
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=200,
+            help='Number of timed queries per engine and size (default: 200)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError('--sizes must be a comma separated list of integers')
+        repeat = max(1, options['queries'] // len(QUERIES))
+
+        self.stdout.write(f"{'products':>10} {'engine':>8} {'index (s)':>10} {'p50 (ms)':>9} {'p95 (ms)':>9}")
+        for size in sizes:
+            products = list(synthetic_products(size))
+            for engine, index_time, (p50, p95) in self.run(products, repeat):
+                self.stdout.write(f"{size:>10} {engine:>8} {index_time:>10.2f} {p50:>9.2f} {p95:>9.2f}")
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completed.'))
+
+    def run(self, products, repeat):
+        fts = SQLiteFTSSearchBackend()
+        database = sqlite3.connect(':memory:')
+        database.execute('CREATE TABLE products (id TEXT PRIMARY KEY, title TEXT, description TEXT, category TEXT)')
+        database.execute(
+            f'CREATE VIRTUAL TABLE {fts.TABLE} USING fts5('
+            'product_id UNINDEXED, title, category, description, city, '
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+
+        started = time.perf_counter()
+        database.executemany(
+            'INSERT INTO products VALUES (?, ?, ?, ?)',
+            [(str(product.pk), product.title, product.description, product.category.name) for product in products],
+        )
+        like_index_time = time.perf_counter() - started
+
+        def like(query):
+            # What the views used to run for their pagination count: a full scan
+            term = f'%{query}%'
+            return database.execute(
+                'SELECT COUNT(*) FROM products WHERE title LIKE ? OR description LIKE ? OR category LIKE ?',
+                [term, term, term],
+            ).fetchall()
+
+        yield 'like', like_index_time, timed(like, QUERIES, repeat)
+
+        started = time.perf_counter()
+        rows = []
+        for product in products:
+            fields = product_fields(product)
+            rows.append([str(product.pk)] + [fields[column] for column in fts.COLUMNS])
+        database.executemany(f'INSERT INTO {fts.TABLE} VALUES (?, ?, ?, ?, ?)', rows)
+        fts_index_time = time.perf_counter() - started
+        rank_sql = fts.rank_sql(placeholder='?')
+
+        def fts5(query):
+            return database.execute(rank_sql, [fts.match_expression(query), fts.max_results]).fetchall()
+
+        yield 'fts5', fts_index_time, timed(fts5, QUERIES, repeat)
+
+        memory = InMemorySearchBackend(loader=lambda: products)
+        started = time.perf_counter()
+        memory.rebuild(products)
+        memory_index_time = time.perf_counter() - started
+
+        yield 'memory', memory_index_time, timed(memory.rank, QUERIES, repeat)
+        database.close()
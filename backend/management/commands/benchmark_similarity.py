@@ -0,0 +1,127 @@
+"""
+Management command to benchmark the top-K similarity builder on synthetic catalogs
+Run with: python manage.py benchmark_similarity [--sizes 1000,10000,100000] [--k 20]
+
+Each size runs in its own child process so the reported peak RSS belongs to
+that run only.
+"""
+
+import multiprocessing
+import queue as queue_module
+import resource
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.similarity_index import get_recommendation_settings, top_k_neighbours
+
+
+def _read_status_kb(field):
+    """Read a memory counter (VmRSS, VmHWM) from /proc, in kB"""
+    try:
+        with open('/proc/self/status') as handle:
+            for line in handle:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def synthetic_documents(size, vocabulary=5000, words_per_document=30, seed=42):
+    """Zipf-distributed word soup resembling short product listings"""
+    rng = np.random.default_rng(seed)
+    words = np.minimum(rng.zipf(1.3, size=(size, words_per_document)), vocabulary)
+    return [' '.join(f'w{word}' for word in row) for row in words]
+
+
+def run_benchmark(size, k, block_elements, queue):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    baseline_kb = _read_status_kb('VmRSS')
+    documents = synthetic_documents(size)
+
+    started = time.perf_counter()
+    matrix = TfidfVectorizer(max_features=1000).fit_transform(documents).tocsr().astype(np.float32)
+    vectorize_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    neighbors, scores = top_k_neighbours(matrix, k, block_elements=block_elements)
+    top_k_time = time.perf_counter() - started
+
+    peak_kb = _read_status_kb('VmHWM') or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put({
+        'size': size,
+        'vectorize_time': vectorize_time,
+        'top_k_time': top_k_time,
+        'peak_rss_mb': peak_kb / 1024,
+        'baseline_rss_mb': (baseline_kb or 0) / 1024,
+        'filled': float((neighbors >= 0).mean()),
+    })
+
+
+class Command(BaseCommand):
+    help = 'Benchmark wall time and peak RSS of the blocked top-K similarity builder'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='1000,10000,100000',
+            help='Comma separated catalog sizes (default: 1000,10000,100000)',
+        )
+        parser.add_argument(
+            '--k',
+            type=int,
+            default=None,
+            help='Neighbours per product (default: RECOMMENDATION_SETTINGS SIMILARITY_TOP_K)',
+        )
+        parser.add_argument(
+            '--block-elements',
+            type=int,
+            default=None,
+            help='Max floats per dense similarity block (default: SIMILARITY_BLOCK_ELEMENTS)',
+        )
+
+    def _wait_for_result(self, process, queue, size):
+        """Poll the child's queue, failing instead of hanging if the child dies without reporting"""
+        while True:
+            try:
+                return queue.get(timeout=1)
+            except queue_module.Empty:
+                if not process.is_alive():
+                    try:
+                        return queue.get(timeout=1)
+                    except queue_module.Empty:
+                        raise CommandError(
+                            f'Benchmark for {size} products exited with code {process.exitcode} without a result'
+                        )
+
+    def handle(self, *args, **options):
+        config = get_recommendation_settings()
+        k = options['k'] or config['SIMILARITY_TOP_K']
+        block_elements = options['block_elements'] or config['SIMILARITY_BLOCK_ELEMENTS']
+
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError('--sizes must be a comma separated list of integers')
+
+        self.stdout.write(f'k={k}, block={block_elements} floats ({block_elements * 4 / 1024 / 1024:.0f} MB)')
+        self.stdout.write(f"{'products':>10} {'tf-idf (s)':>11} {'top-k (s)':>10} {'peak RSS (MB)':>14} {'+RSS (MB)':>10} {'filled':>7}")
+
+        context = multiprocessing.get_context('fork')
+        for size in sizes:
+            queue = context.Queue()
+            process = context.Process(target=run_benchmark, args=(size, k, block_elements, queue))
+            process.start()
+            result = self._wait_for_result(process, queue, size)
+            process.join()
+
+            self.stdout.write(
+                f"{result['size']:>10} {result['vectorize_time']:>11.2f} {result['top_k_time']:>10.2f} "
+                f"{result['peak_rss_mb']:>14.1f} {result['peak_rss_mb'] - result['baseline_rss_mb']:>10.1f} "
+                f"{result['filled']:>7.0%}"
+            )
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completed.'))
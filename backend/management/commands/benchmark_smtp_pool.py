@@ -0,0 +1,132 @@
+"""
+Management command to benchmark sustained email throughput of the SMTP pool
+Run with: python manage.py benchmark_smtp_pool [--messages 2000] [--pool-sizes 1,4,8] [--latency-ms 5]
+
+Starts a local SMTP sink on 127.0.0.1 (accepts and discards everything,
+optionally sleeping ``--latency-ms`` before each reply to simulate the
+network round trips to a real provider) and compares:
+- per-message: a new SMTP connection for every mail (Django send_mail)
+- pool-N: smtp_pool with N persistent sessions and one sender thread per session
+
+Rate limiting is disabled unless ``--rate-per-minute`` is given, so the
+numbers are the transport ceiling. No real email is sent.
+"""
+
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from backend.smtp_pool import SMTPConnectionPool, get_smtp_pool_settings
+
+SMTP_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Minimal SMTP dialogue: enough for smtplib, everything is discarded"""
+
+    def reply(self, line):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 localhost SMTP sink')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.strip().upper()
+            if command.startswith(b'EHLO'):
+                self.reply('250-localhost\r\n250 PIPELINING')
+            elif command.startswith(b'DATA'):
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                for data in iter(self.rfile.readline, b''):
+                    if data in (b'.\r\n', b'.\n'):
+                        break
+                self.server.received += 1
+                self.reply('250 OK queued')
+            elif command.startswith(b'QUIT'):
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency):
+        super().__init__(('127.0.0.1', 0), SMTPSinkHandler)
+        self.latency = latency
+        self.received = 0
+
+
+class Command(BaseCommand):
+    help = 'Benchmark sustained mails/second: per-message SMTP connections vs the pooled transport'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000, help='Mails per run (default: 2000)')
+        parser.add_argument('--pool-sizes', default='1,4,8', help='Comma separated pool sizes (default: 1,4,8)')
+        parser.add_argument(
+            '--latency-ms', type=float, default=5,
+            help='Simulated server round trip per SMTP reply in ms (default: 5)',
+        )
+        parser.add_argument(
+            '--rate-per-minute', type=int, default=0,
+            help='Pool rate limit to apply (default: 0, unlimited)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            pool_sizes = [int(size) for size in options['pool_sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError('--pool-sizes must be a comma separated list of integers')
+
+        sink = SMTPSink(options['latency_ms'] / 1000.0)
+        threading.Thread(target=sink.serve_forever, daemon=True).start()
+        host, port = sink.server_address
+        self.stdout.write(f"SMTP sink on {host}:{port}, {options['latency_ms']} ms per reply")
+
+        messages = options['messages']
+        with override_settings(EMAIL_HOST=host, EMAIL_PORT=port, EMAIL_USE_TLS=False, EMAIL_USE_SSL=False,
+                               EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD=''):
+            self.stdout.write(f"{'transport':>12} {'mails':>7} {'seconds':>8} {'mails/s':>9}")
+            self.report('per-message', messages, self.run_per_message(messages))
+            for size in pool_sizes:
+                self.report(f'pool-{size}', messages, self.run_pool(messages, size, options['rate_per_minute']))
+
+        sink.shutdown()
+        self.stdout.write(self.style.SUCCESS(f"Benchmark completed, {sink.received} mails received by the sink."))
+
+    def report(self, name, messages, elapsed):
+        self.stdout.write(f"{name:>12} {messages:>7} {elapsed:>8.2f} {messages / elapsed:>9.1f}")
+
+    def run_per_message(self, messages):
+        # Capped: one connection per mail is the slow baseline, a few hundred are enough to measure it
+        pool = SMTPConnectionPool()
+        sample = min(messages, 200)
+        started = time.perf_counter()
+        for index in range(sample):
+            connection = get_connection(SMTP_BACKEND)
+            connection.send_messages([pool.build_message(f'user{index}@example.cm', 'Benchmark', '<p>Bonjour</p>')])
+        return (time.perf_counter() - started) * messages / sample
+
+    def run_pool(self, messages, size, rate_per_minute):
+        config = get_smtp_pool_settings()
+        config.update(BACKEND=SMTP_BACKEND, POOL_SIZE=size, RATE_PER_MINUTE=rate_per_minute)
+        pool = SMTPConnectionPool(config)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=size) as executor:
+            list(executor.map(
+                lambda index: pool.send(f'user{index}@example.cm', 'Benchmark', '<p>Bonjour</p>'),
+                range(messages),
+            ))
+        elapsed = time.perf_counter() - started
+        pool.close_all()
+        return elapsed
@@ -0,0 +1,126 @@
+"""
+Management command to benchmark daily chart queries: per-day loops vs one grouped query
+Run with: python manage.py benchmark_time_series [--orders 20000] [--days 7,30,90] [--repeat 5]
+
+Inserts ``--orders`` synthetic orders spread over the longest period (inside a
+transaction that is rolled back, 0 uses the existing orders), then builds the
+admin sales chart (orders per day + delivered revenue per day) with:
+- loop: one COUNT and one SUM per day, as get_daily_sales_data used to
+- grouped: time_series.daily_buckets, one TruncDate + GROUP BY query
+- rollup: daily_metrics.daily_metrics, reading precomputed rows
+
+and reports queries and milliseconds (best of --repeat) per chart.
+"""
+
+import random
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from backend.daily_metrics import daily_metrics
+from backend.models import Order
+from backend.time_series import daily_buckets, day_range, iter_days, series
+
+
+def loop_chart(start, end):
+    """The former get_daily_sales_data: two queries per day"""
+    sales, revenue = [], []
+    for day in iter_days(start, end):
+        sales.append(Order.objects.filter(created_at__date=day).count())
+        revenue.append(Order.objects.filter(
+            created_at__date=day, status='DELIVERED'
+        ).aggregate(total=Sum('total_amount'))['total'] or 0)
+    return sales, revenue
+
+
+def grouped_chart(start, end):
+    buckets = daily_buckets(
+        Order.objects.all(), 'created_at', start=start, end=end,
+        sales=Count('id'), revenue=Sum('total_amount', filter=Q(status='DELIVERED')),
+    )
+    return series(buckets, 'sales'), series(buckets, 'revenue')
+
+
+def rollup_chart(start, end):
+    rows = daily_metrics(start, end)
+    return [row['orders_count'] for row in rows], [row['revenue'] for row in rows]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark daily chart queries: per-day loops, grouped TruncDate query and the daily_metrics rollup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=20000, help='Synthetic orders, rolled back (default: 20000)')
+        parser.add_argument('--days', default='7,30,90', help='Comma separated chart lengths (default: 7,30,90)')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement, best kept (default: 5)')
+
+    def handle(self, *args, **options):
+        try:
+            lengths = [int(days) for days in options['days'].split(',') if days.strip()]
+        except ValueError:
+            raise CommandError('--days must be a comma separated list of integers')
+
+        try:
+            with transaction.atomic():
+                if options['orders']:
+                    self.insert_orders(options['orders'], max(lengths))
+                self.stdout.write(f"{Order.objects.count()} orders")
+                self.stdout.write(f"{'chart':>12} {'queries':>8} {'ms':>9}")
+                for days in lengths:
+                    start, end = day_range(days)
+                    expected = None
+                    for name, chart in (('loop', loop_chart), ('grouped', grouped_chart), ('rollup', rollup_chart)):
+                        result = self.measure(f'{name}-{days}d', chart, start, end, options['repeat'])
+                        if name == 'loop':
+                            expected = result
+                        elif name == 'grouped' and result != expected:
+                            self.stdout.write(self.style.ERROR(f'grouped-{days}d differs from loop-{days}d'))
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completed.'))
+
+    def insert_orders(self, count, days):
+        """Orders with dangling product/buyer ids (foreign keys are only checked at commit)"""
+        statuses = [status for status, _ in Order.STATUSES]
+        orders = [Order(
+            order_number=f'BENCH{index:09d}',
+            product_id=uuid.uuid4(),
+            buyer_id=uuid.uuid4(),
+            unit_price=Decimal(2500),
+            total_amount=Decimal(random.randint(1, 40) * 2500),
+            status=random.choice(statuses),
+            payment_method='MTN_MONEY',
+            delivery_method='PICKUP',
+        ) for index in range(count)]
+        Order.objects.bulk_create(orders, batch_size=1000)
+
+        # created_at is auto_now_add: spread the orders over the period afterwards
+        now = timezone.now()
+        for offset in range(days):
+            ids = [order.pk for order in orders[offset::days]]
+            for chunk in range(0, len(ids), 500):
+                Order.objects.filter(pk__in=ids[chunk:chunk + 500]).update(created_at=now - timedelta(days=offset))
+
+    def measure(self, name, chart, start, end, repeat):
+        best = None
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                result = chart(start, end)
+                elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        self.stdout.write(f"{name:>12} {len(queries):>8} {best * 1000:>9.2f}")
+        return result
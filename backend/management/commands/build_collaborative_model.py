@@ -0,0 +1,36 @@
+"""
+Management command to rebuild the item-item collaborative filtering model
+Run with: python manage.py build_collaborative_model [--k 20]
+"""
+
+from django.core.management.base import BaseCommand
+
+from backend.collaborative_filtering import collaborative_model
+
+
+class Command(BaseCommand):
+    help = 'Build the item-item collaborative filtering neighbours from user and visitor behaviors'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--k',
+            type=int,
+            default=None,
+            help='Number of neighbours kept per product (default: RECOMMENDATION_SETTINGS SIMILARITY_TOP_K)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Building collaborative filtering model...')
+
+        meta = collaborative_model.build(k=options['k'])
+
+        if not meta:
+            self.stdout.write(self.style.WARNING('No behaviors recorded, model not built.'))
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Model built in {collaborative_model.path}: "
+                f"{meta['size']} products, {meta['actors']} users/sessions, k={meta['k']}, {meta['duration']:.2f}s"
+            )
+        )
@@ -0,0 +1,36 @@
+"""
+Management command to rebuild the persisted product similarity index
+Run with: python manage.py build_similarity_index [--k 20]
+"""
+
+from django.core.management.base import BaseCommand
+
+from backend.similarity_index import product_similarity_index
+
+
+class Command(BaseCommand):
+    help = 'Build the top-K product similarity index used by content-based recommendations'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--k',
+            type=int,
+            default=None,
+            help='Number of neighbours kept per product (default: RECOMMENDATION_SETTINGS SIMILARITY_TOP_K)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Building product similarity index...')
+
+        meta = product_similarity_index.build(k=options['k'])
+
+        if not meta:
+            self.stdout.write(self.style.WARNING('No active products, index not built.'))
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Index built in {product_similarity_index.path}: "
+                f"{meta['size']} products, k={meta['k']}, {meta['duration']:.2f}s"
+            )
+        )
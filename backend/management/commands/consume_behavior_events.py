@@ -0,0 +1,37 @@
+"""
+Management command to persist queued behavior events
+Run with: python manage.py consume_behavior_events [--once]
+
+Use it as a dedicated consumer with BEHAVIOR_TRACKING_SETTINGS['CONSUMER_THREAD']
+set to False (Redis stream backend), or with --once to drain the queue.
+"""
+
+from django.core.management.base import BaseCommand
+
+from backend.behavior_pipeline import behavior_pipeline
+
+
+class Command(BaseCommand):
+    help = 'Persist behavior events from the tracking queue in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the queue and exit instead of consuming forever',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Consuming behavior events ({behavior_pipeline.queue.name} queue)...')
+
+        if options['once']:
+            read = behavior_pipeline.drain()
+            self.stdout.write(
+                self.style.SUCCESS(f'{read} events read, {behavior_pipeline.persisted} behaviors saved.')
+            )
+            return
+
+        try:
+            behavior_pipeline.run()
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS(f'Stopped, {behavior_pipeline.persisted} behaviors saved.'))
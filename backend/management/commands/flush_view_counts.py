@@ -0,0 +1,18 @@
+"""
+Management command to flush buffered product views to the database
+Run with: python manage.py flush_view_counts (e.g. every minute from cron)
+"""
+
+from django.core.management.base import BaseCommand
+
+from backend.view_counter import view_counter
+
+
+class Command(BaseCommand):
+    help = 'Flush buffered product view counts to products.views_count'
+
+    def handle(self, *args, **options):
+        flushed = view_counter.flush()
+        self.stdout.write(
+            self.style.SUCCESS(f"{flushed} product views flushed ({view_counter.buffer.name} buffer)")
+        )
@@ -1,6 +1,13 @@
 # backend/management/commands/optimize_performance.py
 """
 Django management command to optimize database performance and cache
+Run with: python manage.py optimize_performance [--analyze] [--optimize] [--cache] [--all]
+          python manage.py optimize_performance --queries [--sort n_plus_one] [--limit 20]
+          python manage.py optimize_performance --profile /some/path/ [--profile /other/]
+
+--queries prints the query fingerprints sampled by backend.query_profiler in
+every worker (N+1 patterns, slow queries with their EXPLAIN), --profile
+requests paths locally with every query profiled.
 """
 
 from django.core.management.base import BaseCommand
@@ -11,6 +18,9 @@ from django.utils import timezone
 from datetime import timedelta
 import logging
 
+from backend.performance import query_optimizer
+from backend.query_profiler import SORTS, query_profiler
+
 logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
@@ -37,6 +47,31 @@ class Command(BaseCommand):
             action='store_true',
             help='Run all optimizations',
         )
+        parser.add_argument(
+            '--queries',
+            action='store_true',
+            help='Report profiled query fingerprints (N+1, slow queries)',
+        )
+        parser.add_argument(
+            '--profile',
+            action='append',
+            default=[],
+            metavar='PATH',
+            help='Request PATH locally with every query profiled (repeatable)',
+        )
+        parser.add_argument('--host', default='localhost', help='Host header of --profile requests (default: localhost)')
+        parser.add_argument(
+            '--sort',
+            choices=SORTS,
+            default='total_time',
+            help='Ranking of the query report (default: total_time)',
+        )
+        parser.add_argument('--limit', type=int, default=20, help='Fingerprints in the query report (default: 20)')
+        parser.add_argument(
+            '--reset-queries',
+            action='store_true',
+            help="Clear this process' profiled queries first",
+        )
 
     def handle(self, *args, **options):
         if options['all'] or options['analyze']:
@@ -48,6 +83,17 @@ class Command(BaseCommand):
         if options['all'] or options['cache']:
             self.optimize_cache()
         
+        if options['reset_queries']:
+            query_profiler.reset()
+        
+        if options['profile']:
+            self.profile_paths(options['profile'], options['host'])
+        
+        if options['all'] or options['queries'] or options['profile']:
+            labels = options['profile'] or [None]
+            for label in labels:
+                self.report_queries(options['sort'], options['limit'], label)
+        
         self.stdout.write(
             self.style.SUCCESS('Performance optimization completed successfully!')
         )
@@ -189,4 +235,50 @@ class Command(BaseCommand):
             cache.set('active_products_count', product_count, 1800)
         
         except Exception as e:
-            logger.error(f'Error pre-warming cache: {e}') 
\ No newline at end of file
+            logger.error(f'Error pre-warming cache: {e}') 
+
+    def profile_paths(self, paths, host):
+        """Request each path with every query profiled"""
+        from django.test import Client
+        
+        client = Client(HTTP_HOST=host)
+        self.stdout.write('Profiling requests...')
+        for path in paths:
+            try:
+                with query_profiler.profile(path) as profile:
+                    response = client.get(path)
+                self.stdout.write(
+                    f'  {path}: {response.status_code}, {profile.queries} queries, '
+                    f'{profile.db_time * 1000:.1f}ms in database'
+                )
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'  {path}: {e}'))
+
+    def report_queries(self, sort, limit, label=None):
+        """Ranked query fingerprints with N+1 flags and EXPLAIN of slow queries"""
+        report = query_profiler.report(limit=limit, sort=sort, label=label)
+        self.stdout.write(f'\nQuery fingerprints{f" of {label}" if label else ""} by {sort}:')
+        if not report:
+            self.stdout.write('  No profiled queries yet')
+            return
+        
+        self.stdout.write(f"  {'calls':>7} {'/req':>6} {'total ms':>9} {'max ms':>8}  {'N+1':<4} view / query")
+        for query in report:
+            flag = 'N+1' if query['is_n_plus_one'] else ''
+            self.stdout.write(
+                f"  {query['calls']:>7} {query['calls_per_request']:>6.1f} {query['total_time'] * 1000:>9.1f} "
+                f"{query['max_time'] * 1000:>8.1f}  {flag:<4} {query['label']}"
+            )
+            self.stdout.write(f"      {query['sql'][:160]}")
+            if query['explain']:
+                for line in query['explain'].splitlines():
+                    self.stdout.write(f'      | {line}')
+        
+        if query_profiler.dropped:
+            self.stdout.write(f'  {query_profiler.dropped} fingerprints dropped (MAX_FINGERPRINTS reached)')
+        
+        suggestions = query_optimizer.suggest_optimizations(query_optimizer.analyze_queries())
+        if suggestions and label is None:
+            self.stdout.write('\nSuggestions:')
+            for suggestion in suggestions:
+                self.stdout.write(f"  [{suggestion['priority']}] {suggestion['message']}")
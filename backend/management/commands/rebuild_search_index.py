@@ -0,0 +1,27 @@
+"""
+Management command to rebuild the product full-text search index
+Run with: python manage.py rebuild_search_index
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from backend.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product full-text search index (PostgreSQL tsvector, SQLite FTS5 or in-process)'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding product search index...')
+
+        started = time.time()
+        backend, count = rebuild_search_index()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Search index rebuilt with the {backend} backend: "
+                f"{count} products, {time.time() - started:.2f}s"
+            )
+        )
@@ -0,0 +1,40 @@
+"""
+Management command to resume newsletter campaigns interrupted mid-send
+Run with: python manage.py resume_newsletter_campaigns [--campaign <uuid>]
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.models_newsletter import NewsletterCampaign
+from backend.newsletter_dispatch import resume_stale_campaigns
+from backend.newsletter_email_service import newsletter_email_service
+
+
+class Command(BaseCommand):
+    help = 'Resume SENDING newsletter campaigns from their last checkpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--campaign',
+            help='Resume this campaign now, even if its checkpoint is recent',
+        )
+
+    def handle(self, *args, **options):
+        if options['campaign']:
+            try:
+                campaign = NewsletterCampaign.objects.get(pk=options['campaign'], status='SENDING')
+            except (NewsletterCampaign.DoesNotExist, ValueError):
+                raise CommandError(f"No SENDING campaign {options['campaign']}")
+            
+            stats = newsletter_email_service.send_campaign(campaign)
+            if stats is None:
+                self.stdout.write(self.style.WARNING(f"Campaign {campaign.name} not dispatched (locked or no subscribers)"))
+                return
+            self.stdout.write(self.style.SUCCESS(
+                f"Campaign {campaign.name}: {stats['sent']} sent, {stats['failed']} failed "
+                f"in {stats['elapsed']:.1f}s ({stats['mails_per_second']:.1f} mails/s)"
+            ))
+            return
+        
+        resumed = resume_stale_campaigns(newsletter_email_service)
+        self.stdout.write(self.style.SUCCESS(f"{len(resumed)} newsletter campaigns resumed"))
@@ -9,13 +9,21 @@ import logging
 import time
 import json
 from django.db import models
-import settings
+from django.conf import settings
+from django.core.cache import caches
+
+from .query_profiler import query_profiler
+from .rate_limit import get_rate_limit_settings, rate_limiter
+from .telemetry import instrument_cache, route_of, telemetry
 
 logger = logging.getLogger(__name__)
 
 class UserBehaviorTrackingMiddleware(MiddlewareMixin):
     """
-    Middleware to track user behavior for AI recommendations
+    Middleware to track user behavior for AI recommendations.
+    Events are handed to the asynchronous behavior pipeline (bots filtered,
+    sampled, persisted in batches): no database work in the response cycle,
+    and no session is created for anonymous requests.
     """
     
     def __init__(self, get_response):
@@ -25,25 +33,16 @@ class UserBehaviorTrackingMiddleware(MiddlewareMixin):
     def process_request(self, request):
         # Record request start time
         request.start_time = time.time()
-        
-        # Get or create session ID
-        if not request.session.session_key:
-            request.session.create()
-        
-        request.behavior_data = {
-            'session_id': request.session.session_key,
-            'user_agent': request.META.get('HTTP_USER_AGENT', ''),
-            'ip_address': self.get_client_ip(request),
-            'referrer': request.META.get('HTTP_REFERER', ''),
-            'start_time': request.start_time
-        }
     
     def process_response(self, request, response):
-        # Skip tracking for non-authenticated users on certain paths
-        if isinstance(request.user, AnonymousUser):
-            skip_paths = ['/admin/', '/api/', '/static/', '/media/']
-            if any(request.path.startswith(path) for path in skip_paths):
-                return response
+        # Only authenticated users have a UserBehavior history
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return response
+        
+        skip_paths = ['/admin/', '/api/', '/static/', '/media/']
+        if any(request.path.startswith(path) for path in skip_paths):
+            return response
         
         # Calculate page duration
         duration = int((time.time() - getattr(request, 'start_time', time.time())) * 1000)
@@ -53,81 +52,64 @@ class UserBehaviorTrackingMiddleware(MiddlewareMixin):
             self.track_product_view(request, duration)
         
         # Track search behavior
-        if 'search' in request.path and request.GET.get('q'):
+        elif 'search' in request.path and request.GET.get('q'):
             self.track_search_behavior(request, duration)
         
         return response
     
+    def get_behavior_data(self, request):
+        return {
+            'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+            'referrer': request.META.get('HTTP_REFERER', ''),
+            'ip_address': self.get_client_ip(request),
+        }
+    
     def track_product_view(self, request, duration):
-        """Track product page views"""
-        try:
-            from .ai_engine import ai_engine
-            from .models import Product
-            
-            # Extract product ID from URL
-            path_parts = request.path.strip('/').split('/')
-            if len(path_parts) >= 2:
-                product_slug = path_parts[-1]
-                
-                try:
-                    product = Product.objects.get(slug=product_slug)
-                    
-                    # Track behavior if user is authenticated
-                    if not isinstance(request.user, AnonymousUser):
-                        ai_engine.track_user_behavior(
-                            user=request.user,
-                            action_type='VIEW',
-                            product=product,
-                            category=product.category,
-                            session_id=request.behavior_data['session_id'],
-                            duration=duration,
-                            metadata={
-                                'user_agent': request.behavior_data['user_agent'],
-                                'referrer': request.behavior_data['referrer'],
-                                'ip_address': request.behavior_data['ip_address']
-                            }
-                        )
-                    
-                    # Update product view count
-                    Product.objects.filter(id=product.id).update(
-                        views_count=models.F('views_count') + 1
-                    )
-                    
-                except Product.DoesNotExist:
-                    pass
-                
-        except Exception as e:
-            logger.error(f"Error tracking product view: {e}")
+        """Track product page views (the product is resolved by the consumer)"""
+        from .behavior_pipeline import behavior_pipeline
+        
+        user_agent = request.META.get('HTTP_USER_AGENT', '')
+        if not behavior_pipeline.should_track('VIEW', user_agent):
+            return
+        
+        # Extract product slug from URL
+        path_parts = request.path.strip('/').split('/')
+        if len(path_parts) >= 2:
+            behavior_pipeline.publish(
+                user_id=request.user.pk,
+                action_type='VIEW',
+                session_id=request.session.session_key,
+                product_slug=path_parts[-1],
+                duration=duration,
+                metadata=self.get_behavior_data(request),
+            )
     
     def track_search_behavior(self, request, duration):
         """Track search behavior"""
-        try:
-            from .ai_engine import ai_engine
-            
-            search_query = request.GET.get('q', '')
-            filters = {
-                'category': request.GET.get('category', ''),
-                'min_price': request.GET.get('min_price', ''),
-                'max_price': request.GET.get('max_price', ''),
-                'city': request.GET.get('city', ''),
-                'condition': request.GET.get('condition', '')
-            }
-            
-            if not isinstance(request.user, AnonymousUser) and search_query:
-                ai_engine.track_user_behavior(
-                    user=request.user,
-                    action_type='SEARCH',
-                    session_id=request.behavior_data['session_id'],
-                    duration=duration,
-                    metadata={
-                        'search_query': search_query,
-                        'filters': filters,
-                        'user_agent': request.behavior_data['user_agent']
-                    }
-                )
-                
-        except Exception as e:
-            logger.error(f"Error tracking search behavior: {e}")
+        from .behavior_pipeline import behavior_pipeline
+        
+        user_agent = request.META.get('HTTP_USER_AGENT', '')
+        if not behavior_pipeline.should_track('SEARCH', user_agent):
+            return
+        
+        filters = {
+            'category': request.GET.get('category', ''),
+            'min_price': request.GET.get('min_price', ''),
+            'max_price': request.GET.get('max_price', ''),
+            'city': request.GET.get('city', ''),
+            'condition': request.GET.get('condition', '')
+        }
+        behavior_pipeline.publish(
+            user_id=request.user.pk,
+            action_type='SEARCH',
+            session_id=request.session.session_key,
+            duration=duration,
+            metadata={
+                'search_query': request.GET.get('q', ''),
+                'filters': filters,
+                'user_agent': user_agent,
+            },
+        )
     
     def get_client_ip(self, request):
         """Get client IP address"""
@@ -278,17 +260,22 @@ class SmartNotificationMiddleware(MiddlewareMixin):
 
 class SecurityMiddleware(MiddlewareMixin):
     """
-    Enhanced security middleware
+    Enhanced security middleware.
+    Failed login attempts are counted per IP in the shared sliding-window
+    limiter (RATE_LIMIT_SETTINGS['LOGIN']), so every worker sees them.
     """
     
     def __init__(self, get_response):
         self.get_response = get_response
-        self.failed_attempts = {}
+        self.login = get_rate_limit_settings()['LOGIN']
         super().__init__(get_response)
     
+    def _is_login_post(self, request):
+        return request.path == self.login['path'] and request.method == 'POST'
+    
     def process_request(self, request):
         # Rate limiting for login attempts
-        if request.path == '/auth/login/' and request.method == 'POST':
+        if self._is_login_post(request):
             client_ip = self.get_client_ip(request)
             
             if self.is_rate_limited(client_ip):
@@ -297,21 +284,16 @@ class SecurityMiddleware(MiddlewareMixin):
                 }, status=429)
     
     def process_response(self, request, response):
+        if not self._is_login_post(request):
+            return response
+        
         # Track failed login attempts
-        if (request.path == '/auth/login/' and 
-            request.method == 'POST' and 
-            response.status_code == 400):
-            
-            client_ip = self.get_client_ip(request)
-            self.record_failed_attempt(client_ip)
+        if response.status_code == 400:
+            self.record_failed_attempt(self.get_client_ip(request))
         
         # Clear failed attempts on successful login
-        elif (request.path == '/auth/login/' and 
-              request.method == 'POST' and 
-              response.status_code == 200):
-            
-            client_ip = self.get_client_ip(request)
-            self.clear_failed_attempts(client_ip)
+        elif response.status_code == 200:
+            self.clear_failed_attempts(self.get_client_ip(request))
         
         return response
     
@@ -325,75 +307,55 @@ class SecurityMiddleware(MiddlewareMixin):
         return ip
     
     def is_rate_limited(self, ip):
-        """Check if IP is rate limited"""
-        if ip not in self.failed_attempts:
-            return False
-        
-        attempts, last_attempt = self.failed_attempts[ip]
-        
-        # Reset if last attempt was more than 1 hour ago
-        if (timezone.now() - last_attempt).total_seconds() > 3600:
-            del self.failed_attempts[ip]
-            return False
-        
-        # Rate limit after 5 failed attempts
-        return attempts >= 5
+        """Check if IP reached the failed attempts limit within the window"""
+        result = rate_limiter.peek(f'login:{ip}', self.login['limit'], self.login['window'])
+        return result.count >= self.login['limit']
     
     def record_failed_attempt(self, ip):
         """Record a failed login attempt"""
-        if ip not in self.failed_attempts:
-            self.failed_attempts[ip] = [0, timezone.now()]
-        
-        self.failed_attempts[ip][0] += 1
-        self.failed_attempts[ip][1] = timezone.now()
+        rate_limiter.record(f'login:{ip}', self.login['window'])
     
     def clear_failed_attempts(self, ip):
         """Clear failed attempts for IP"""
-        if ip in self.failed_attempts:
-            del self.failed_attempts[ip]
+        rate_limiter.reset(f'login:{ip}', self.login['window'])
 
 
 class APIThrottleMiddleware(MiddlewareMixin):
     """
-    API request throttling middleware
+    API request throttling middleware.
+    Limits per path prefix come from RATE_LIMIT_SETTINGS['ROUTES'] and are
+    enforced through the shared sliding-window limiter.
     """
     
     def __init__(self, get_response):
         self.get_response = get_response
-        self.api_requests = {}
         super().__init__(get_response)
     
     def process_request(self, request):
-        # Only apply to API endpoints
-        if not request.path.startswith('/api/'):
+        route = rate_limiter.route_for(request.path, request.method)
+        if route is None:
             return None
         
         client_ip = self.get_client_ip(request)
-        current_minute = int(time.time() / 60)
-        
-        # Initialize or update request count
-        if client_ip not in self.api_requests:
-            self.api_requests[client_ip] = {}
-        
-        if current_minute not in self.api_requests[client_ip]:
-            self.api_requests[client_ip][current_minute] = 0
-        
-        self.api_requests[client_ip][current_minute] += 1
+        result = rate_limiter.hit(f"route:{route['prefix']}:{client_ip}", route['limit'], route['window'])
+        request.rate_limit = result
         
-        # Clean old entries (older than 1 minute)
-        old_minutes = [minute for minute in self.api_requests[client_ip] 
-                      if minute < current_minute - 1]
-        for old_minute in old_minutes:
-            del self.api_requests[client_ip][old_minute]
-        
-        # Check rate limit (100 requests per minute)
-        if self.api_requests[client_ip][current_minute] > 100:
-            return JsonResponse({
+        if not result.allowed:
+            response = JsonResponse({
                 'error': 'Rate limit exceeded. Try again later.'
             }, status=429)
+            response['Retry-After'] = str(result.retry_after)
+            return response
         
         return None
     
+    def process_response(self, request, response):
+        result = getattr(request, 'rate_limit', None)
+        if result is not None:
+            response['X-RateLimit-Limit'] = str(result.limit)
+            response['X-RateLimit-Remaining'] = str(max(0, int(result.limit - result.count)))
+        return response
+    
     def get_client_ip(self, request):
         """Get client IP address"""
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -404,28 +366,39 @@ class APIThrottleMiddleware(MiddlewareMixin):
         return ip
 
 
-class PerformanceMonitoringMiddleware(MiddlewareMixin):
+class PerformanceMonitoringMiddleware:
     """
-    Performance monitoring middleware
+    Performance monitoring middleware: latency, database queries and cache
+    hits/misses of every request recorded per route in ``telemetry``
+    (histograms scraped from ``metrics/``), slow requests logged, a sample
+    of requests profiled by ``query_profiler``
     """
     
-    def process_request(self, request):
-        request.start_time = time.time()
+    def __init__(self, get_response):
+        self.get_response = get_response
     
-    def process_response(self, request, response):
-        if hasattr(request, 'start_time'):
-            duration = time.time() - request.start_time
-            
-            # Log slow requests (>2 seconds)
-            if duration > 2.0:
-                logger.warning(
-                    f"Slow request: {request.method} {request.path} "
-                    f"took {duration:.2f}s"
-                )
-            
-            # Add performance header for development
-            if settings.DEBUG:
-                response['X-Response-Time'] = f"{duration:.3f}s"
+    def __call__(self, request):
+        if not telemetry.enabled:
+            return self.get_response(request)
+        
+        instrument_cache(caches['default'])
+        # Sampled requests also group their queries by fingerprint (N+1, slow queries)
+        profile = query_profiler.sample()
+        started = time.perf_counter()
+        with telemetry.measure(profile) as stats:
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        
+        route = route_of(request)
+        telemetry.record_request(route, request.method, response.status_code, duration, stats)
+        if profile is not None:
+            query_profiler.record(route, profile)
+        telemetry.maybe_publish()
+        query_profiler.maybe_publish()
+        
+        # Add performance header for development
+        if settings.DEBUG:
+            response['X-Response-Time'] = f"{duration:.3f}s"
         
         return response
 
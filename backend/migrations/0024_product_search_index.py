@@ -0,0 +1,42 @@
+# Generated manually
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS products_search_vector_gin '
+            'ON products USING gin (search_vector)'
+        )
+    elif connection.vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS product_search_fts USING fts5('
+                'product_id UNINDEXED, title, category, description, city, '
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        except Exception:
+            # SQLite built without FTS5: backend.search falls back to its in-process index
+            pass
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS products_search_vector_gin')
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS product_search_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0023_fix_visitor_cart_fields'),
+    ]
+
+    # Product.search_vector itself was added by 0014_database_optimization
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,23 @@
+# Generated manually
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0024_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newslettercampaign',
+            name='dispatch_cursor',
+            field=models.UUIDField(blank=True, help_text='Dernier abonné traité', null=True),
+        ),
+        migrations.AddField(
+            model_name='newslettercampaign',
+            name='dispatch_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated manually
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def backfill_cart_totals(apps, schema_editor):
+    VisitorCart = apps.get_model('backend', 'VisitorCart')
+    VisitorCartItem = apps.get_model('backend', 'VisitorCartItem')
+
+    totals = VisitorCartItem.objects.values('cart_id').annotate(
+        count=Sum('quantity'),
+        amount=Sum(F('quantity') * F('unit_price'), output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+    ).order_by()
+    for row in totals:
+        VisitorCart.objects.filter(pk=row['cart_id']).update(
+            items_count=row['count'] or 0,
+            items_total=row['amount'] or Decimal('0'),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0026_newsletter_campaign_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visitorcart',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='visitorcart',
+            name='items_total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=12),
+        ),
+        migrations.RunPython(backfill_cart_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated manually
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0027_visitor_cart_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=500, unique=True)),
+                ('backend', models.CharField(choices=[('local', 'Stockage local'), ('dropbox', 'Dropbox')], max_length=10)),
+                ('size', models.BigIntegerField(default=0)),
+                ('etag', models.CharField(blank=True, max_length=128)),
+                ('shared_url', models.URLField(blank=True, max_length=500)),
+                ('shared_url_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'stored_files',
+                'indexes': [models.Index(fields=['backend', 'created_at'], name='stored_file_backend_3eeba6_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated manually
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0028_stored_file_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('dimension', models.CharField(choices=[('ALL', 'Total'), ('PAYMENT_METHOD', 'Mode de paiement'), ('CITY', 'Ville'), ('CATEGORY', 'Catégorie')], default='ALL', max_length=20)),
+                ('key', models.CharField(blank=True, max_length=64)),
+                ('orders_count', models.IntegerField(default=0)),
+                ('delivered_orders', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, help_text='Montant des commandes livrées', max_digits=14)),
+                ('commission', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('signups', models.IntegerField(default=0)),
+                ('client_signups', models.IntegerField(default=0)),
+                ('completed_payments', models.IntegerField(default=0)),
+                ('payments_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Métriques journalières',
+                'verbose_name_plural': 'Métriques journalières',
+                'db_table': 'daily_metrics',
+                'indexes': [models.Index(fields=['dimension', 'date'], name='daily_metri_dimensi_b80cfe_idx')],
+                'unique_together': {('date', 'dimension', 'key')},
+            },
+        ),
+    ]
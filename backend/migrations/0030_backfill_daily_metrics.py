@@ -0,0 +1,30 @@
+# Generated manually
+
+from datetime import timedelta
+
+from django.db import migrations
+
+
+def backfill_daily_metrics(apps, schema_editor):
+    from backend.daily_metrics import rebuild, source_date_range
+
+    # The dashboards read all-time figures from the rollup: fill it before they do
+    bounds = source_date_range(apps)
+    if bounds is None:
+        return
+    start, end = bounds
+    while start <= end:
+        block_end = min(end, start + timedelta(days=30))
+        rebuild(start, block_end, apps=apps)
+        start = block_end + timedelta(days=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0029_daily_metrics'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_daily_metrics, migrations.RunPython.noop),
+    ]
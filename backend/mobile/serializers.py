@@ -276,10 +276,10 @@ class VisitorCartSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'session_key', 'created_at']
     
     def get_total_items(self, obj):
-        return obj.items.count()
+        return obj.total_items
     
     def get_total_amount(self, obj):
-        return sum(item.product.price * item.quantity for item in obj.items.all())
+        return obj.total_amount
 
 # Payment Serializers
 class PaymentSerializer(serializers.Serializer):
@@ -186,8 +186,9 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
-    # Full-text search field for PostgreSQL (optional)
-    # Removed for SQLite compatibility
+    # Full-text search vector, filled by backend.search on PostgreSQL only
+    # (GIN index created by migration 0024; other databases use their own index)
+    search_vector = SearchVectorField(null=True, blank=True)
     
     class Meta:
         db_table = 'products'
@@ -772,4 +773,71 @@ class ProductAlert(models.Model):
         ]
     
     def __str__(self):
-        return f"Alerte {self.type} - {self.product.title}"
\ No newline at end of file
+        return f"Alerte {self.type} - {self.product.title}"
+
+class StoredFile(models.Model):
+    """Index des fichiers du routeur de stockage: backend, taille, etag et lien partagé (voir dropbox_storage.py)"""
+    
+    BACKENDS = [
+        ('local', 'Stockage local'),
+        ('dropbox', 'Dropbox'),
+    ]
+    
+    name = models.CharField(max_length=500, unique=True)
+    backend = models.CharField(max_length=10, choices=BACKENDS)
+    size = models.BigIntegerField(default=0)
+    etag = models.CharField(max_length=128, blank=True)
+    shared_url = models.URLField(max_length=500, blank=True)
+    shared_url_expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'stored_files'
+        indexes = [
+            models.Index(fields=['backend', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.backend})"
+
+
+class DailyMetrics(models.Model):
+    """
+    Agrégats journaliers des tableaux de bord admin (voir daily_metrics.py).
+    Une ligne par jour et par dimension: ALL (clé vide), mode de paiement,
+    ville (ville du produit pour les commandes, de l'utilisateur pour les inscriptions)
+    et catégorie du produit.
+    """
+    
+    DIMENSIONS = [
+        ('ALL', 'Total'),
+        ('PAYMENT_METHOD', 'Mode de paiement'),
+        ('CITY', 'Ville'),
+        ('CATEGORY', 'Catégorie'),
+    ]
+    
+    date = models.DateField()
+    dimension = models.CharField(max_length=20, choices=DIMENSIONS, default='ALL')
+    key = models.CharField(max_length=64, blank=True)
+    orders_count = models.IntegerField(default=0)
+    delivered_orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, help_text="Montant des commandes livrées")
+    commission = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    signups = models.IntegerField(default=0)
+    client_signups = models.IntegerField(default=0)
+    completed_payments = models.IntegerField(default=0)
+    payments_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'daily_metrics'
+        verbose_name = 'Métriques journalières'
+        verbose_name_plural = 'Métriques journalières'
+        unique_together = ['date', 'dimension', 'key']
+        indexes = [
+            models.Index(fields=['dimension', 'date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} {self.dimension} {self.key}".strip()
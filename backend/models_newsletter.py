@@ -80,6 +80,10 @@ class NewsletterCampaign(models.Model):
     clicked_count = models.PositiveIntegerField(default=0)
     unsubscribed_count = models.PositiveIntegerField(default=0)
     
+    # Dispatch checkpoint (backend/newsletter_dispatch.py)
+    dispatch_cursor = models.UUIDField(null=True, blank=True, help_text="Dernier abonné traité")
+    dispatch_updated_at = models.DateTimeField(null=True, blank=True)
+    
     # Metadata
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='campaigns_created')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -179,6 +183,25 @@ class NewsletterLog(models.Model):
         return f"{self.campaign.name} -> {self.subscriber.email} ({self.status})"
 
 
+class NewsletterCampaignStats(models.Model):
+    """Compteurs matérialisés des logs d'une campagne, par statut (voir newsletter_stats.py)"""
+    campaign = models.OneToOneField(NewsletterCampaign, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    pending = models.PositiveIntegerField(default=0)
+    sent = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    bounced = models.PositiveIntegerField(default=0)
+    opened = models.PositiveIntegerField(default=0)
+    clicked = models.PositiveIntegerField(default=0)
+    unsubscribed = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'newsletter_campaign_stats'
+    
+    def __str__(self):
+        return f"Stats {self.campaign_id}"
+
+
 class ScheduledNewsletter(models.Model):
     """Newsletters programmées"""
     FREQUENCY_CHOICES = [
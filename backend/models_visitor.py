@@ -1,13 +1,12 @@
 # backend/models_visitor.py - ENHANCED VISITOR SYSTEM FOR VGK
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Sum
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from decimal import Decimal
 import uuid
 import json
-import qrcode
-import io
 import base64
 from PIL import Image
 from .models import Product, Order, Category, PickupPoint
@@ -59,6 +58,10 @@ class VisitorCart(models.Model):
     ai_recommendations_shown = models.JSONField(default=list)  # Track shown recommendations
     behavior_data = models.JSONField(default=dict)  # Store visitor behavior
     
+    # Denormalized totals, maintained by the VisitorCartItem signals
+    items_count = models.PositiveIntegerField(default=0)
+    items_total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0'))
+    
     # Status and tracking
     is_active = models.BooleanField(default=True)
     is_abandoned = models.BooleanField(default=False)
@@ -78,18 +81,30 @@ class VisitorCart(models.Model):
             models.Index(fields=['is_abandoned', 'abandoned_at']),
         ]
     
+    TOTALS_FIELDS = ('items_count', 'items_total')
+    
     def __str__(self):
         return f"Cart {self.session_key[:8]} - {self.visitor_name or 'Anonymous'}"
     
+    def save(self, *args, **kwargs):
+        # Totals are only written by apply_totals_delta/refresh_totals: a cart
+        # loaded before its items changed must not save stale values over them
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.TOTALS_FIELDS
+            ]
+        super().save(*args, **kwargs)
+    
     @property
     def total_amount(self):
-        """Calculate total amount of all items"""
-        return sum(item.total_price for item in self.items.all())
+        """Total amount of all items (denormalized, no query)"""
+        return self.items_total
     
     @property
     def total_items(self):
-        """Calculate total number of items"""
-        return sum(item.quantity for item in self.items.all())
+        """Total number of items (denormalized, no query)"""
+        return self.items_count
     
     @property
     def delivery_cost(self):
@@ -106,32 +121,58 @@ class VisitorCart(models.Model):
     @property
     def is_empty(self):
         """Check if cart is empty"""
-        return not self.items.exists()
+        return self.items_count == 0
     
     def add_item(self, product, quantity=1):
         """Add item to cart"""
-        cart_item, created = VisitorCartItem.objects.get_or_create(
-            cart=self,
-            product=product,
-            defaults={
-                'quantity': quantity,
-                'unit_price': product.price
-            }
-        )
-        
-        if not created:
-            cart_item.quantity += quantity
-            cart_item.save()
+        with transaction.atomic():
+            cart_item, created = VisitorCartItem.objects.get_or_create(
+                cart=self,
+                product=product,
+                defaults={
+                    'quantity': quantity,
+                    'unit_price': product.price
+                }
+            )
+            
+            if not created:
+                cart_item.quantity += quantity
+                cart_item.save()
         
         return cart_item
     
     def remove_item(self, product):
         """Remove item from cart"""
-        self.items.filter(product=product).delete()
+        with transaction.atomic():
+            self.items.filter(product=product).delete()
+            self.refresh_totals()
     
     def clear(self):
         """Clear all items from cart"""
-        self.items.all().delete()
+        with transaction.atomic():
+            self.items.all().delete()
+            self.refresh_totals()
+    
+    def apply_totals_delta(self, count, amount):
+        """Add ``count`` items worth ``amount`` to the cached totals, in one UPDATE"""
+        if not count and not amount:
+            return
+        VisitorCart.objects.filter(pk=self.pk).update(
+            items_count=F('items_count') + count,
+            items_total=F('items_total') + amount,
+        )
+        self.items_count += count
+        self.items_total += amount
+    
+    def refresh_totals(self):
+        """Recompute the cached totals from the items (one aggregate query)"""
+        totals = self.items.aggregate(
+            count=Sum('quantity'),
+            amount=Sum(F('quantity') * F('unit_price'), output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+        )
+        self.items_count = totals['count'] or 0
+        self.items_total = totals['amount'] or Decimal('0')
+        VisitorCart.objects.filter(pk=self.pk).update(items_count=self.items_count, items_total=self.items_total)
     
     def mark_abandoned(self):
         """Mark cart as abandoned"""
@@ -149,16 +190,9 @@ class VisitorCart(models.Model):
             'timestamp': self.created_at.isoformat()
         }
         
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(json.dumps(qr_data))
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert to base64
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        img_str = base64.b64encode(buffer.getvalue()).decode()
+        # Rendered once per payload and stored under its content hash
+        from .receipts import qr_png
+        img_str = base64.b64encode(qr_png(json.dumps(qr_data, sort_keys=True))).decode()
         
         return img_str
 
@@ -198,6 +232,12 @@ class VisitorCartItem(models.Model):
         """Calculate total price for this item"""
         return self.quantity * self.unit_price
     
+    def totals_snapshot(self):
+        """(quantity, amount) this item currently contributes to the cart totals"""
+        quantity = self.__dict__.get('quantity') or 0
+        unit_price = self.__dict__.get('unit_price') or Decimal('0')
+        return quantity, quantity * Decimal(unit_price)
+    
     @property
     def is_available(self):
         """Check if product is still available"""
@@ -561,7 +601,7 @@ class QRReceipt(models.Model):
     
     # Receipt data
     receipt_number = models.CharField(max_length=20, unique=True)
-    qr_code_data = models.TextField()  # Base64 encoded QR code
+    qr_code_data = models.TextField()  # JSON QR payload (older receipts: base64 PNG), see receipts.py
     receipt_pdf = models.FileField(upload_to='receipts/pdfs/', blank=True, null=True)
     
     # Order information
@@ -29,6 +29,7 @@ from .models_newsletter import (
     NewsletterLog, ScheduledNewsletter
 )
 from .newsletter_email_service import newsletter_email_service
+from .newsletter_stats import get_campaigns_stats, top_campaigns_by_open_rate
 
 logger = logging.getLogger(__name__)
 
@@ -56,12 +57,10 @@ def newsletter_dashboard(request):
             subscribed_at__gte=timezone.now() - timedelta(days=7)
         ).order_by('-subscribed_at')[:10]
         
-        # Get top performing campaigns
-        top_campaigns = NewsletterCampaign.objects.filter(
-            status='SENT'
-        ).annotate(
-            open_rate=Count('logs', filter=Q(logs__status='OPENED')) * 100.0 / Count('logs')
-        ).order_by('-open_rate')[:5]
+        # Get top performing campaigns (materialized counters, no join on logs)
+        top_campaigns = top_campaigns_by_open_rate(
+            NewsletterCampaign.objects.filter(status='SENT'), limit=5
+        )
         
         # Get subscriber growth data
         growth_data = []
@@ -123,13 +122,18 @@ class NewsletterCampaignListView:
                 )
             
             # Order by creation date
-            campaigns = campaigns.order_by('-created_at')
+            campaigns = campaigns.select_related('stats').order_by('-created_at')
             
             # Pagination
             paginator = Paginator(campaigns, 20)
             page_number = request.GET.get('page')
             page_obj = paginator.get_page(page_number)
             
+            # Stats of the whole page from the materialized counters
+            page_obj.object_list = get_campaigns_stats(page_obj.object_list)
+            for campaign in page_obj.object_list:
+                campaign.recipient_count = campaign.total_recipients
+            
             context = {
                 'campaigns': page_obj,
                 'status_choices': NewsletterCampaign.STATUS_CHOICES,
@@ -298,8 +302,9 @@ def send_campaign(request, campaign_id):
         
         # Get target subscribers
         subscribers = newsletter_email_service._get_target_subscribers(campaign)
+        recipients = subscribers.count()
         
-        if not subscribers:
+        if not recipients:
             messages.warning(request, 'Aucun abonné trouvé pour cette campagne')
             return redirect('admin_panel:newsletter_campaign_detail', pk=campaign.id)
         
@@ -307,11 +312,11 @@ def send_campaign(request, campaign_id):
         import threading
         thread = threading.Thread(
             target=newsletter_email_service.send_campaign,
-            args=(campaign, subscribers)
+            args=(campaign,)
         )
         thread.start()
         
-        messages.success(request, f'Campagne "{campaign.name}" en cours d\'envoi à {len(subscribers)} abonnés')
+        messages.success(request, f'Campagne "{campaign.name}" en cours d\'envoi à {recipients} abonnés')
         return redirect('admin_panel:newsletter_campaign_detail', pk=campaign.id)
         
     except Exception as e:
@@ -675,13 +680,10 @@ def newsletter_analytics(request):
         campaigns = NewsletterCampaign.objects.filter(
             created_at__gte=start_date,
             status='SENT'
-        ).annotate(
-            open_rate=Count('logs', filter=Q(logs__status='OPENED')) * 100.0 / Count('logs'),
-            click_rate=Count('logs', filter=Q(logs__status='CLICKED')) * 100.0 / Count('logs')
-        ).order_by('-sent_at')
+        ).select_related('stats').order_by('-sent_at')
         
         # Top performing campaigns
-        top_campaigns = campaigns.order_by('-open_rate')[:10]
+        top_campaigns = top_campaigns_by_open_rate(campaigns, limit=10)
         
         # City distribution
         city_distribution = NewsletterSubscriber.objects.filter(
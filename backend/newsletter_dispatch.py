@@ -0,0 +1,287 @@
+# backend/newsletter_dispatch.py
+"""
+Streaming, resumable newsletter campaign dispatcher
+Sends subscribers in keyset chunks, checkpoints each chunk and writes send logs in bulk
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NEWSLETTER_SETTINGS = {
+    'BATCH_SIZE': 50,
+    'BATCH_DELAY': 5,
+    'MAX_RETRIES': 3,  # failed dispatch attempts before a campaign is marked FAILED
+    'RETRY_DELAY': 300,
+    'DISPATCH_CHUNK_SIZE': 1000,
+    'DISPATCH_STALE_AFTER': 600,
+    'LOG_BATCH_SIZE': 200,
+}
+
+LOCK_KEY = 'newsletter_dispatch_lock:{campaign_id}'
+FAILURES_KEY = 'newsletter_dispatch_failures:{campaign_id}'
+# A FAILED campaign with a checkpoint is resumed too: a resend never re-mails
+RESUMABLE_STATUSES = ('SENDING', 'FAILED')
+
+
+def get_newsletter_settings():
+    config = dict(DEFAULT_NEWSLETTER_SETTINGS)
+    config.update(getattr(settings, 'NEWSLETTER_SETTINGS', {}))
+    return config
+
+
+def iter_keyset_chunks(queryset, chunk_size, after=None):
+    """Yield lists of objects ordered by pk, starting after the pk ``after``"""
+    queryset = queryset.order_by('pk')
+    while True:
+        page = queryset.filter(pk__gt=after) if after is not None else queryset
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        after = chunk[-1].pk
+
+
+def write_send_logs(campaign, results, sent_at=None):
+    """
+    Persist ``[(subscriber_id, error or None)]`` for a campaign: one bulk INSERT
+    of NewsletterLog rows and one UPDATE of the successfully mailed subscribers
+    """
+    from .models_newsletter import NewsletterLog, NewsletterSubscriber
+
+    if not results:
+        return
+    sent_at = sent_at or timezone.now()
+    NewsletterLog.objects.bulk_create([
+        NewsletterLog(
+            campaign_id=campaign.pk,
+            subscriber_id=subscriber_id,
+            status='FAILED' if error else 'SENT',
+            sent_at=None if error else sent_at,
+            error_message=error or '',
+        )
+        for subscriber_id, error in results
+    ], batch_size=500)
+
+    sent_ids = sorted((subscriber_id for subscriber_id, error in results if not error), key=str)
+    if sent_ids:
+        NewsletterSubscriber.objects.filter(pk__in=sent_ids).update(
+            email_count=F('email_count') + 1, last_email_sent=sent_at
+        )
+
+    # bulk_create sends no post_save: add the batch to the materialized campaign counters
+    from .newsletter_stats import apply_status_deltas
+    apply_status_deltas({campaign.pk: Counter({'SENT': len(sent_ids), 'FAILED': len(results) - len(sent_ids)})})
+
+
+class SendLogBuffer:
+    """Thread-safe accumulator of send results, flushed with write_send_logs every ``batch_size`` results"""
+
+    def __init__(self, campaign, batch_size=None):
+        self.campaign = campaign
+        self.batch_size = batch_size or get_newsletter_settings()['LOG_BATCH_SIZE']
+        self._lock = threading.Lock()
+        self._results = []
+        self.sent = 0
+        self.failed = 0
+
+    def add(self, subscriber_id, error=None):
+        with self._lock:
+            self._results.append((subscriber_id, error))
+            if error:
+                self.failed += 1
+            else:
+                self.sent += 1
+            full = len(self._results) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            results, self._results = self._results, []
+        try:
+            write_send_logs(self.campaign, results)
+        except Exception as e:
+            # The emails are gone already: losing their logs must not stop the campaign
+            logger.error(f"Error writing {len(results)} newsletter logs for campaign {self.campaign.name}: {e}")
+        return len(results)
+
+
+class ThroughputMeter:
+    """Mails per second since the dispatch started"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.sent = 0
+        self.failed = 0
+
+    def add(self, sent, failed=0):
+        self.sent += sent
+        self.failed += failed
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self):
+        elapsed = self.elapsed
+        return self.sent / elapsed if elapsed > 0 else 0.0
+
+
+class CampaignDispatcher:
+    """
+    Walk a campaign's subscribers chunk by chunk and checkpoint after each one.
+
+    ``send_chunk(campaign, subscribers)`` does the actual sending and returns
+    the number of emails sent.
+    """
+
+    def __init__(self, send_chunk, chunk_size=None, lock_timeout=None):
+        config = get_newsletter_settings()
+        self.send_chunk = send_chunk
+        self.chunk_size = chunk_size or config['DISPATCH_CHUNK_SIZE']
+        self.lock_timeout = lock_timeout or config['DISPATCH_STALE_AFTER']
+
+    def _acquire(self, campaign):
+        token = uuid.uuid4().hex
+        if cache.add(LOCK_KEY.format(campaign_id=campaign.pk), token, self.lock_timeout):
+            return token
+        return None
+
+    def _refresh(self, campaign, token):
+        cache.set(LOCK_KEY.format(campaign_id=campaign.pk), token, self.lock_timeout)
+
+    def _release(self, campaign, token):
+        key = LOCK_KEY.format(campaign_id=campaign.pk)
+        if cache.get(key) == token:
+            cache.delete(key)
+
+    def _already_sent(self, campaign, subscribers):
+        """Subscribers of a resumed chunk that were mailed before the interruption"""
+        from .models_newsletter import NewsletterLog
+
+        return set(NewsletterLog.objects.filter(
+            campaign=campaign, subscriber_id__in=[subscriber.pk for subscriber in subscribers], status='SENT'
+        ).values_list('subscriber_id', flat=True))
+
+    def _checkpoint(self, campaign, cursor, sent):
+        from .models_newsletter import NewsletterCampaign
+
+        now = timezone.now()
+        NewsletterCampaign.objects.filter(pk=campaign.pk).update(
+            dispatch_cursor=cursor, dispatch_updated_at=now, sent_count=F('sent_count') + sent
+        )
+        campaign.dispatch_cursor = cursor
+        campaign.dispatch_updated_at = now
+        campaign.sent_count += sent
+
+    def dispatch(self, campaign, queryset):
+        """Send ``campaign`` to ``queryset``, resuming from its checkpoint; returns a stats dict or None if locked"""
+        from .models_newsletter import NewsletterCampaign
+
+        token = self._acquire(campaign)
+        if token is None:
+            logger.warning(f"Campaign {campaign.name} is already being dispatched by another worker")
+            return None
+
+        meter = ThroughputMeter()
+        resuming = campaign.status in RESUMABLE_STATUSES and campaign.dispatch_updated_at is not None
+        try:
+            if resuming:
+                if campaign.status != 'SENDING':
+                    campaign.status = 'SENDING'
+                    NewsletterCampaign.objects.filter(pk=campaign.pk).update(status='SENDING')
+                logger.info(f"Resuming campaign {campaign.name} after subscriber {campaign.dispatch_cursor or '-'} "
+                            f"({campaign.sent_count}/{campaign.total_recipients} sent)")
+            else:
+                campaign.total_recipients = queryset.count()
+                campaign.sent_count = 0
+                campaign.dispatch_cursor = None
+                campaign.dispatch_updated_at = timezone.now()
+                campaign.status = 'SENDING'
+                NewsletterCampaign.objects.filter(pk=campaign.pk).update(
+                    status='SENDING', total_recipients=campaign.total_recipients, sent_count=0,
+                    dispatch_cursor=None, dispatch_updated_at=campaign.dispatch_updated_at,
+                )
+                logger.info(f"Starting campaign {campaign.name} to {campaign.total_recipients} subscribers")
+
+            first_chunk = resuming
+            for chunk in iter_keyset_chunks(queryset, self.chunk_size, after=campaign.dispatch_cursor):
+                to_send = chunk
+                if first_chunk:
+                    # The interrupted chunk may have been partly sent
+                    done = self._already_sent(campaign, chunk)
+                    to_send = [subscriber for subscriber in chunk if subscriber.pk not in done]
+                    first_chunk = False
+
+                sent = self.send_chunk(campaign, to_send) if to_send else 0
+                meter.add(sent, len(to_send) - sent)
+                self._checkpoint(campaign, chunk[-1].pk, sent)
+                self._refresh(campaign, token)
+                logger.info(f"Campaign {campaign.name}: {campaign.sent_count}/{campaign.total_recipients} sent, "
+                            f"{meter.rate:.1f} mails/s")
+
+            campaign.status = 'SENT'
+            campaign.sent_at = timezone.now()
+            NewsletterCampaign.objects.filter(pk=campaign.pk).update(status='SENT', sent_at=campaign.sent_at)
+            cache.delete(FAILURES_KEY.format(campaign_id=campaign.pk))
+            logger.info(f"Campaign {campaign.name} completed. Sent {campaign.sent_count} emails "
+                        f"({meter.sent} in this run, {meter.rate:.1f} mails/s)")
+            return {
+                'sent': meter.sent,
+                'failed': meter.failed,
+                'elapsed': meter.elapsed,
+                'mails_per_second': meter.rate,
+                'resumed': resuming,
+            }
+        finally:
+            self._release(campaign, token)
+
+
+def record_dispatch_failure(campaign):
+    """
+    Count a failed dispatch attempt; the campaign stays SENDING (resumed from
+    its checkpoint) until MAX_RETRIES attempts failed. Returns True once FAILED.
+    """
+    from .models_newsletter import NewsletterCampaign
+
+    key = FAILURES_KEY.format(campaign_id=campaign.pk)
+    cache.add(key, 0, None)
+    failures = cache.incr(key)
+    if failures < get_newsletter_settings()['MAX_RETRIES']:
+        return False
+    NewsletterCampaign.objects.filter(pk=campaign.pk).update(status='FAILED')
+    campaign.status = 'FAILED'
+    cache.delete(key)
+    return True
+
+
+def resume_stale_campaigns(service=None):
+    """Resume SENDING campaigns whose worker stopped sending heartbeats; returns the campaigns resumed"""
+    from datetime import timedelta
+    from .models_newsletter import NewsletterCampaign
+
+    if service is None:
+        from .newsletter_email_service import newsletter_email_service as service
+
+    stale_before = timezone.now() - timedelta(seconds=get_newsletter_settings()['DISPATCH_STALE_AFTER'])
+    campaigns = NewsletterCampaign.objects.filter(status='SENDING', dispatch_updated_at__lt=stale_before)
+
+    resumed = []
+    for campaign in campaigns:
+        logger.info(f"Resuming stale campaign {campaign.name}")
+        service.send_campaign(campaign)
+        resumed.append(campaign)
+    return resumed
@@ -1,18 +1,15 @@
 """
-Enhanced Newsletter Email Service using Yagmail
+Enhanced Newsletter Email Service using the pooled SMTP transport (smtp_pool.py)
 Optimized for handling millions of subscribers with advanced features
 """
 
-import yagmail
 import logging
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.utils import timezone
 from datetime import datetime, timedelta
 import threading
 import queue
-import time
 from typing import List, Dict, Any, Optional
 import json
 import os
@@ -25,6 +22,10 @@ from .models_newsletter import (
     NewsletterSubscriber, NewsletterCampaign, NewsletterLog, 
     NewsletterTemplate, ScheduledNewsletter
 )
+from .newsletter_dispatch import CampaignDispatcher, SendLogBuffer, record_dispatch_failure
+from .newsletter_stats import counter_updates_suspended, get_campaign_stats, get_system_stats, rebuild_campaign_stats
+from .newsletter_templates import compile_newsletter_template, compile_template, subscriber_variables
+from .smtp_pool import smtp_pool, get_smtp_pool_settings
 
 logger = logging.getLogger(__name__)
 
@@ -35,39 +36,13 @@ class NewsletterEmailService:
     """
     
     def __init__(self):
-        self.yag = None
         self.email_queue = queue.Queue()
-        self.max_workers = 10
+        # One worker per pooled SMTP session: the pool does the rate limiting
+        self.max_workers = get_smtp_pool_settings()['POOL_SIZE']
         self.batch_size = 100
-        self.rate_limit_per_minute = 1000
-        self.last_send_time = 0
-        self._setup_yagmail()
+        self.cleanup_batch_size = 1000
         self._start_worker_threads()
     
-    def _setup_yagmail(self):
-        """Setup yagmail with environment credentials"""
-        try:
-            email_user = getattr(settings, 'EMAIL_HOST_USER', None)
-            email_password = getattr(settings, 'EMAIL_HOST_PASSWORD', None)
-            
-            if not email_user or not email_password:
-                logger.error("Email credentials not configured in environment")
-                return
-            
-            self.yag = yagmail.SMTP(
-                user=email_user,
-                password=email_password,
-                host=getattr(settings, 'EMAIL_HOST', 'smtp.gmail.com'),
-                port=getattr(settings, 'EMAIL_PORT', 587),
-                smtp_starttls=True,
-                smtp_ssl=False
-            )
-            logger.info("Yagmail configured successfully")
-            
-        except Exception as e:
-            logger.error(f"Failed to setup yagmail: {str(e)}")
-            self.yag = None
-    
     def _start_worker_threads(self):
         """Start background worker threads for email processing"""
         self.workers = []
@@ -84,138 +59,102 @@ class NewsletterEmailService:
                 email_task = self.email_queue.get(timeout=1)
                 if email_task is None:
                     break
-                
-                self._send_single_email(email_task)
-                self.email_queue.task_done()
-                
             except queue.Empty:
                 continue
+            
+            try:
+                error = self._send_single_email(email_task)
+                email_task['log_buffer'].add(email_task['subscriber'].pk, error)
             except Exception as e:
                 logger.error(f"Email worker error: {str(e)}")
+            finally:
+                self.email_queue.task_done()
     
-    def _send_single_email(self, email_task: Dict[str, Any]):
-        """Send a single email with error handling"""
+    def _send_single_email(self, email_task: Dict[str, Any]) -> Optional[str]:
+        """
+        Send a single email with error handling; returns None on success or the error message
+        No database write here: results are logged in bulk by the task's SendLogBuffer
+        """
+        subscriber = email_task['subscriber']
         try:
-            subscriber = email_task['subscriber']
-            campaign = email_task['campaign']
             subject = email_task['subject']
             html_content = email_task['html_content']
             text_content = email_task['text_content']
             
-            # Create log entry
-            log = NewsletterLog.objects.create(
-                campaign=campaign,
-                subscriber=subscriber,
-                status='PENDING'
+            # Pooled persistent session, rate limited per session
+            smtp_pool.send(
+                to=subscriber.email,
+                subject=subject,
+                html_content=html_content,
+                text_content=text_content,
+                headers={'List-Unsubscribe': f'<mailto:{settings.DEFAULT_FROM_EMAIL}?subject=unsubscribe>'}
             )
             
-            # Rate limiting
-            self._rate_limit()
-            
-            # Send email using yagmail
-            if self.yag:
-                self.yag.send(
-                    to=subscriber.email,
-                    subject=subject,
-                    contents=[html_content],
-                    headers={'List-Unsubscribe': f'<mailto:{settings.DEFAULT_FROM_EMAIL}?subject=unsubscribe>'})
-            else:
-                # Fallback to Django email backend
-                msg = EmailMultiAlternatives(
-                    subject=subject,
-                    body=text_content,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    to=[subscriber.email]
-                )
-                msg.attach_alternative(html_content, "text/html")
-                msg.send()
-            
-            # Update log
-            log.status = 'SENT'
-            log.sent_at = timezone.now()
-            log.save()
-            
-            # Update subscriber stats
-            subscriber.email_count += 1
-            subscriber.last_email_sent = timezone.now()
-            subscriber.save()
-            
-            logger.info(f"Email sent successfully to {subscriber.email}")
+            logger.debug(f"Email sent successfully to {subscriber.email}")
+            return None
             
         except Exception as e:
             logger.error(f"Failed to send email to {subscriber.email}: {str(e)}")
-            if 'log' in locals():
-                log.status = 'FAILED'
-                log.error_message = str(e)
-                log.save()
+            return str(e) or e.__class__.__name__
     
-    def _rate_limit(self):
-        """Implement rate limiting to avoid being blocked"""
-        current_time = time.time()
-        time_since_last = current_time - self.last_send_time
-        min_interval = 60.0 / self.rate_limit_per_minute
-        
-        if time_since_last < min_interval:
-            time.sleep(min_interval - time_since_last)
-        
-        self.last_send_time = time.time()
-    
-    def send_campaign(self, campaign: NewsletterCampaign, subscribers: List[NewsletterSubscriber] = None):
+    def send_campaign(self, campaign: NewsletterCampaign, subscribers=None):
         """
         Send a newsletter campaign to subscribers
-        Optimized for large subscriber lists
+        Subscribers are streamed in keyset-paginated chunks and the campaign is
+        checkpointed after each chunk, so an interrupted campaign resumes where
+        it stopped (see newsletter_dispatch.py)
         """
         try:
-            if not subscribers:
-                subscribers = self._get_target_subscribers(campaign)
-            
-            if not subscribers:
+            queryset = self._subscriber_queryset(campaign, subscribers)
+            if not queryset.exists():
                 logger.warning(f"No subscribers found for campaign {campaign.name}")
                 return
             
-            logger.info(f"Starting campaign {campaign.name} to {len(subscribers)} subscribers")
-            
-            # Update campaign status
-            campaign.status = 'SENDING'
-            campaign.total_recipients = len(subscribers)
-            campaign.save()
-            
-            # Prepare email content
-            subject = campaign.subject
-            html_content = campaign.html_content or campaign.content
-            text_content = campaign.content
-            
-            # Queue emails for background processing
-            sent_count = 0
-            for subscriber in subscribers:
-                email_task = {
-                    'subscriber': subscriber,
-                    'campaign': campaign,
-                    'subject': subject,
-                    'html_content': html_content,
-                    'text_content': text_content
-                }
-                self.email_queue.put(email_task)
-                sent_count += 1
-            
-            # Wait for all emails to be processed
-            self.email_queue.join()
-            
-            # Update campaign
-            campaign.status = 'SENT'
-            campaign.sent_at = timezone.now()
-            campaign.sent_count = sent_count
-            campaign.save()
-            
-            logger.info(f"Campaign {campaign.name} completed. Sent {sent_count} emails.")
+            dispatcher = CampaignDispatcher(self._send_chunk)
+            return dispatcher.dispatch(campaign, queryset)
             
         except Exception as e:
+            # The campaign stays SENDING with its checkpoint (resume_stale_campaigns
+            # or a resend continues it) until MAX_RETRIES attempts have failed
             logger.error(f"Campaign {campaign.name} failed: {str(e)}")
-            campaign.status = 'FAILED'
-            campaign.save()
+            if record_dispatch_failure(campaign):
+                logger.error(f"Campaign {campaign.name} marked FAILED after repeated dispatch failures")
     
-    def _get_target_subscribers(self, campaign: NewsletterCampaign) -> List[NewsletterSubscriber]:
-        """Get targeted subscribers based on campaign criteria"""
+    def _send_chunk(self, campaign: NewsletterCampaign, subscribers: List[NewsletterSubscriber]) -> int:
+        """Send one chunk through the worker threads and wait for it; returns the number sent"""
+        log_buffer = SendLogBuffer(campaign)
+        
+        # Compiled (CSS inlined, slots located) once per campaign, cached by content
+        subject = compile_template(campaign.subject)
+        text = compile_template(campaign.content)
+        html = compile_template(campaign.html_content, html=True) if campaign.html_content else text
+        
+        for subscriber in subscribers:
+            variables = subscriber_variables(subscriber)
+            text_content = text.render(variables)
+            self.email_queue.put({
+                'subscriber': subscriber,
+                'campaign': campaign,
+                'subject': subject.render(variables),
+                'html_content': html.render(variables) if html is not text else text_content,
+                'text_content': text_content,
+                'log_buffer': log_buffer,
+            })
+        
+        self.email_queue.join()
+        log_buffer.flush()
+        return log_buffer.sent
+    
+    def _subscriber_queryset(self, campaign: NewsletterCampaign, subscribers=None):
+        """Queryset of recipients: targeting criteria, or an explicit queryset/list of subscribers"""
+        if subscribers is None:
+            return self._get_target_subscribers(campaign)
+        if hasattr(subscribers, 'filter'):
+            return subscribers
+        return NewsletterSubscriber.objects.filter(pk__in=[subscriber.pk for subscriber in subscribers])
+    
+    def _get_target_subscribers(self, campaign: NewsletterCampaign):
+        """Get targeted subscribers based on campaign criteria (lazy queryset)"""
         queryset = NewsletterSubscriber.objects.filter(is_active=True)
         
         # Apply targeting filters
@@ -231,19 +170,21 @@ class NewsletterEmailService:
             thirty_days_ago = timezone.now() - timedelta(days=30)
             queryset = queryset.filter(subscribed_at__gte=thirty_days_ago)
         
-        return list(queryset)
+        return queryset
     
-    def send_template_email(self, template: NewsletterTemplate, subscribers: List[NewsletterSubscriber], 
+    def send_template_email(self, template: NewsletterTemplate, subscribers, 
                           variables: Dict[str, Any] = None):
         """Send email using a template with variable substitution"""
         try:
             if not variables:
                 variables = {}
             
-            # Render template with variables
-            subject = template.subject_template.format(**variables)
-            content = template.content_template.format(**variables)
-            html_content = template.html_template.format(**variables) if template.html_template else content
+            # Compiled once per template version; campaign-wide variables are bound now,
+            # subscriber variables ({name}, {email}, {city}) are filled per recipient at send time
+            compiled = compile_newsletter_template(template)
+            subject = compiled['subject'].bind(variables).to_source()
+            content = compiled['content'].bind(variables).to_source()
+            html_content = compiled['html'].bind(variables).to_source() if template.html_template else content
             
             # Create temporary campaign for tracking
             campaign = NewsletterCampaign.objects.create(
@@ -276,7 +217,7 @@ class NewsletterEmailService:
                     subscribers = NewsletterSubscriber.objects.filter(is_active=True)
                     
                     # Send template email
-                    self.send_template_email(scheduled.template, list(subscribers))
+                    self.send_template_email(scheduled.template, subscribers)
                     
                     # Update next send date
                     scheduled.last_sent_date = now
@@ -305,27 +246,8 @@ class NewsletterEmailService:
             return now + timedelta(weeks=1)
     
     def get_campaign_stats(self, campaign: NewsletterCampaign) -> Dict[str, Any]:
-        """Get comprehensive campaign statistics"""
-        logs = NewsletterLog.objects.filter(campaign=campaign)
-        
-        stats = {
-            'total_recipients': campaign.total_recipients,
-            'sent_count': logs.filter(status='SENT').count(),
-            'failed_count': logs.filter(status='FAILED').count(),
-            'opened_count': logs.filter(status='OPENED').count(),
-            'clicked_count': logs.filter(status='CLICKED').count(),
-            'unsubscribed_count': logs.filter(status='UNSUBSCRIBED').count(),
-            'open_rate': 0,
-            'click_rate': 0,
-            'failure_rate': 0
-        }
-        
-        if stats['sent_count'] > 0:
-            stats['open_rate'] = (stats['opened_count'] / stats['sent_count']) * 100
-            stats['click_rate'] = (stats['clicked_count'] / stats['sent_count']) * 100
-            stats['failure_rate'] = (stats['failed_count'] / stats['sent_count']) * 100
-        
-        return stats
+        """Get comprehensive campaign statistics (materialized counters, see newsletter_stats.py)"""
+        return get_campaign_stats(campaign)
     
     def export_subscribers_to_excel(self, subscribers: List[NewsletterSubscriber], filename: str = None):
         """Export subscribers to Excel file"""
@@ -370,33 +292,28 @@ class NewsletterEmailService:
         """Clean up old newsletter logs to maintain performance"""
         try:
             cutoff_date = timezone.now() - timedelta(days=days)
-            deleted_count = NewsletterLog.objects.filter(sent_at__lt=cutoff_date).delete()[0]
+            old_logs = NewsletterLog.objects.filter(sent_at__lt=cutoff_date)
+            campaign_ids = list(old_logs.values_list('campaign_id', flat=True).distinct().order_by())
+            deleted_count = 0
+            # Deleted in pk batches without per-log counter updates: recount the campaigns concerned
+            with counter_updates_suspended():
+                while True:
+                    batch = list(old_logs.values_list('pk', flat=True)[:self.cleanup_batch_size])
+                    if not batch:
+                        break
+                    deleted_count += NewsletterLog.objects.filter(pk__in=batch).delete()[0]
+            rebuild_campaign_stats(campaign_ids)
             logger.info(f"Cleaned up {deleted_count} old newsletter logs")
+            return deleted_count
         except Exception as e:
             logger.error(f"Log cleanup failed: {str(e)}")
     
     def get_system_stats(self) -> Dict[str, Any]:
         """Get overall newsletter system statistics"""
         try:
-            total_subscribers = NewsletterSubscriber.objects.count()
-            active_subscribers = NewsletterSubscriber.objects.filter(is_active=True).count()
-            total_campaigns = NewsletterCampaign.objects.count()
-            sent_campaigns = NewsletterCampaign.objects.filter(status='SENT').count()
-            
-            # Recent activity
-            last_24h = timezone.now() - timedelta(hours=24)
-            recent_subscribers = NewsletterSubscriber.objects.filter(subscribed_at__gte=last_24h).count()
-            recent_emails = NewsletterLog.objects.filter(sent_at__gte=last_24h).count()
-            
-            return {
-                'total_subscribers': total_subscribers,
-                'active_subscribers': active_subscribers,
-                'total_campaigns': total_campaigns,
-                'sent_campaigns': sent_campaigns,
-                'recent_subscribers_24h': recent_subscribers,
-                'recent_emails_24h': recent_emails,
-                'system_status': 'healthy' if self.yag else 'email_service_disabled'
-            }
+            stats = get_system_stats()
+            stats['system_status'] = 'healthy' if smtp_pool.is_configured else 'email_service_disabled'
+            return stats
         except Exception as e:
             logger.error(f"Failed to get system stats: {str(e)}")
             return {}
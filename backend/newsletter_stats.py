@@ -0,0 +1,204 @@
+# backend/newsletter_stats.py
+"""
+Newsletter campaign statistics
+Counters materialized per campaign in NewsletterCampaignStats
+"""
+
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db.models import Count, F, FloatField, ExpressionWrapper, Q
+from django.db.models.functions import NullIf
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+STATUS_FIELDS = {
+    'PENDING': 'pending',
+    'SENT': 'sent',
+    'FAILED': 'failed',
+    'BOUNCED': 'bounced',
+    'OPENED': 'opened',
+    'CLICKED': 'clicked',
+    'UNSUBSCRIBED': 'unsubscribed',
+}
+
+
+def aggregate_campaign_counts(campaign_ids):
+    """{campaign_id: {field: count}} for all ``campaign_ids`` in one grouped query"""
+    from .models_newsletter import NewsletterLog
+
+    rows = NewsletterLog.objects.filter(campaign_id__in=campaign_ids).values('campaign_id').annotate(**{
+        field: Count('pk', filter=Q(status=status)) for status, field in STATUS_FIELDS.items()
+    }).order_by()
+
+    counts = {campaign_id: dict.fromkeys(STATUS_FIELDS.values(), 0) for campaign_id in campaign_ids}
+    for row in rows:
+        counts[row.pop('campaign_id')] = row
+    return counts
+
+
+def rebuild_campaign_stats(campaign_ids):
+    """Recompute the materialized counters of ``campaign_ids`` from their logs; returns the counts"""
+    from .models_newsletter import NewsletterCampaignStats
+
+    campaign_ids = list(campaign_ids)
+    if not campaign_ids:
+        return {}
+    counts = aggregate_campaign_counts(campaign_ids)
+    rows = [NewsletterCampaignStats(campaign_id=campaign_id, **fields) for campaign_id, fields in counts.items()]
+
+    existing = set(NewsletterCampaignStats.objects.filter(campaign_id__in=campaign_ids).values_list('campaign_id', flat=True))
+    if existing:
+        NewsletterCampaignStats.objects.bulk_update(
+            [row for row in rows if row.campaign_id in existing], list(STATUS_FIELDS.values()) + ['updated_at']
+        )
+    NewsletterCampaignStats.objects.bulk_create(
+        [row for row in rows if row.campaign_id not in existing], ignore_conflicts=True
+    )
+    return counts
+
+
+def apply_status_deltas(deltas):
+    """
+    Add ``{campaign_id: Counter({status: n})}`` to the materialized counters
+    (n may be negative). Call after the logs are written: campaigns without a
+    counters row are rebuilt from their logs instead of incremented, unless
+    the delta only removes logs (the next read rebuilds them).
+    """
+    from .models_newsletter import NewsletterCampaignStats
+
+    deltas = {campaign_id: delta for campaign_id, delta in deltas.items() if any(delta.values())}
+    if not deltas:
+        return
+    existing = set(NewsletterCampaignStats.objects.filter(campaign_id__in=list(deltas)).values_list('campaign_id', flat=True))
+
+    for campaign_id, delta in deltas.items():
+        if campaign_id not in existing:
+            continue
+        NewsletterCampaignStats.objects.filter(campaign_id=campaign_id).update(updated_at=timezone.now(), **{
+            STATUS_FIELDS[status]: F(STATUS_FIELDS[status]) + amount
+            for status, amount in delta.items() if amount and status in STATUS_FIELDS
+        })
+    rebuild_campaign_stats(
+        campaign_id for campaign_id, delta in deltas.items()
+        if campaign_id not in existing and any(amount > 0 for amount in delta.values())
+    )
+
+
+_suspended = threading.local()
+
+
+@contextmanager
+def counter_updates_suspended():
+    """Ignore per-log status changes in this thread; the caller rebuilds the counters afterwards"""
+    _suspended.active = True
+    try:
+        yield
+    finally:
+        _suspended.active = False
+
+
+def record_status_change(campaign_id, old_status, new_status):
+    """One log moved from ``old_status`` (None for a new log) to ``new_status`` (None for a deleted log)"""
+    if old_status == new_status or getattr(_suspended, 'active', False):
+        return
+    delta = Counter()
+    if new_status:
+        delta[new_status] += 1
+    if old_status:
+        delta[old_status] -= 1
+    apply_status_deltas({campaign_id: delta})
+
+
+def summarize(counts, campaign):
+    """Stats dict shown by the admin from raw per-status counts"""
+    # Opened/clicked/unsubscribed logs were delivered first, a click implies an open
+    delivered = counts['sent'] + counts['opened'] + counts['clicked'] + counts['unsubscribed']
+    failed = counts['failed'] + counts['bounced']
+    stats = {
+        'total_recipients': campaign.total_recipients,
+        'sent_count': delivered,
+        'failed_count': failed,
+        'opened_count': counts['opened'] + counts['clicked'],
+        'clicked_count': counts['clicked'],
+        'unsubscribed_count': counts['unsubscribed'],
+        'pending_count': counts['pending'],
+        'open_rate': 0,
+        'click_rate': 0,
+        'failure_rate': 0,
+    }
+    if delivered > 0:
+        stats['open_rate'] = (stats['opened_count'] / delivered) * 100
+        stats['click_rate'] = (stats['clicked_count'] / delivered) * 100
+    if delivered + failed > 0:
+        stats['failure_rate'] = (failed / (delivered + failed)) * 100
+    return stats
+
+
+def _materialized_counts(campaign):
+    from .models_newsletter import NewsletterCampaignStats
+
+    try:
+        row = campaign.stats
+    except NewsletterCampaignStats.DoesNotExist:
+        return None
+    return {field: getattr(row, field) for field in STATUS_FIELDS.values()}
+
+
+def get_campaigns_stats(campaigns):
+    """
+    Attach ``campaign_stats`` to each campaign of a list or page and return
+    them as a list. Select ``stats`` with the campaigns (``select_related('stats')``)
+    for a single query.
+    """
+    campaigns = list(campaigns)
+    counts = {campaign.pk: _materialized_counts(campaign) for campaign in campaigns}
+    missing = [campaign_id for campaign_id, value in counts.items() if value is None]
+    if missing:
+        counts.update(rebuild_campaign_stats(missing))
+
+    for campaign in campaigns:
+        campaign.campaign_stats = summarize(counts[campaign.pk], campaign)
+    return campaigns
+
+
+def get_campaign_stats(campaign):
+    return get_campaigns_stats([campaign])[0].campaign_stats
+
+
+def top_campaigns_by_open_rate(queryset, limit=10):
+    """Campaigns ordered by materialized open rate (best first)"""
+    delivered = F('stats__sent') + F('stats__opened') + F('stats__clicked') + F('stats__unsubscribed')
+    return queryset.select_related('stats').annotate(
+        opens_ratio=ExpressionWrapper(
+            (F('stats__opened') + F('stats__clicked')) * 100.0 / NullIf(delivered, 0), output_field=FloatField()
+        )
+    ).order_by(F('opens_ratio').desc(nulls_last=True))[:limit]
+
+
+def get_system_stats():
+    """Overall newsletter statistics in three aggregate queries"""
+    from .models_newsletter import NewsletterSubscriber, NewsletterCampaign, NewsletterLog
+
+    last_24h = timezone.now() - timedelta(hours=24)
+    subscribers = NewsletterSubscriber.objects.aggregate(
+        total=Count('pk'),
+        active=Count('pk', filter=Q(is_active=True)),
+        recent=Count('pk', filter=Q(subscribed_at__gte=last_24h)),
+    )
+    campaigns = NewsletterCampaign.objects.aggregate(
+        total=Count('pk'),
+        sent=Count('pk', filter=Q(status='SENT')),
+    )
+    return {
+        'total_subscribers': subscribers['total'],
+        'active_subscribers': subscribers['active'],
+        'total_campaigns': campaigns['total'],
+        'sent_campaigns': campaigns['sent'],
+        'recent_subscribers_24h': subscribers['recent'],
+        'recent_emails_24h': NewsletterLog.objects.filter(sent_at__gte=last_24h).count(),
+    }
@@ -0,0 +1,163 @@
+# backend/newsletter_templates.py
+"""
+Precompiled newsletter templates
+CSS is inlined once, recipients are rendered by filling the compiled slots
+"""
+
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.utils.html import conditional_escape
+
+try:
+    import premailer
+    PREMAILER_AVAILABLE = True
+except ImportError:
+    PREMAILER_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+SLOT_PATTERN = re.compile(r'\{\{|\}\}|\{(\w+)\}')
+SENTINEL = 'vgkslot{index}x'
+SENTINEL_PATTERN = re.compile(r'vgkslot(\d+)x')
+CACHE_KEY = 'newsletter_compiled:{key}'
+CACHE_TIMEOUT = 60 * 60 * 24
+LOCAL_CACHE_SIZE = 64
+
+_local_cache = OrderedDict()
+_local_lock = threading.Lock()
+
+
+class CompiledTemplate:
+    """Literal segments interleaved with slot names: ``segments[0] slots[0] segments[1] ...``"""
+
+    def __init__(self, segments, slots, html=False):
+        self.segments = tuple(segments)
+        self.slots = tuple(slots)
+        self.html = html
+
+    @property
+    def variables(self):
+        return set(self.slots)
+
+    def render(self, variables):
+        """Fill every slot; a slot without value is left as ``{slot}`` rather than failing the send"""
+        escape = conditional_escape if self.html else str
+        parts = [self.segments[0]]
+        for slot, segment in zip(self.slots, self.segments[1:]):
+            value = variables.get(slot)
+            parts.append('{' + slot + '}' if value is None else escape(value))
+            parts.append(segment)
+        return ''.join(parts)
+
+    def bind(self, variables):
+        """Fill the slots known now (campaign wide values), keep the others for per-recipient rendering"""
+        segments, slots = [self.segments[0]], []
+        escape = conditional_escape if self.html else str
+        for slot, segment in zip(self.slots, self.segments[1:]):
+            if slot in variables:
+                segments[-1] += escape(variables[slot]) + segment
+            else:
+                slots.append(slot)
+                segments.append(segment)
+        return CompiledTemplate(segments, slots, self.html)
+
+    def to_source(self):
+        """``str.format`` compatible source, e.g. to store a partially bound template on a campaign"""
+        def literal(text):
+            return text.replace('{', '{{').replace('}', '}}')
+
+        parts = [literal(self.segments[0])]
+        for slot, segment in zip(self.slots, self.segments[1:]):
+            parts.append('{' + slot + '}')
+            parts.append(literal(segment))
+        return ''.join(parts)
+
+
+def inline_css(html):
+    if not PREMAILER_AVAILABLE or '<style' not in html.lower():
+        return html
+    try:
+        return premailer.transform(
+            html, disable_validation=True, keep_style_tags=False, cssutils_logging_level=logging.CRITICAL
+        )
+    except Exception as e:
+        logger.warning(f"CSS inlining failed, sending the template as is: {e}")
+        return html
+
+
+def _compile(source, html):
+    slots = []
+
+    def protect(match):
+        if match.group(1) is None:
+            return match.group(0)[0]  # escaped brace
+        slots.append(match.group(1))
+        return SENTINEL.format(index=len(slots) - 1)
+
+    protected = SLOT_PATTERN.sub(protect, source or '')
+    if html:
+        protected = inline_css(protected)
+
+    segments, ordered_slots, position = [], [], 0
+    for match in SENTINEL_PATTERN.finditer(protected):
+        segments.append(protected[position:match.start()])
+        ordered_slots.append(slots[int(match.group(1))])
+        position = match.end()
+    segments.append(protected[position:])
+    return CompiledTemplate(segments, ordered_slots, html)
+
+
+def _cached(key, build):
+    with _local_lock:
+        compiled = _local_cache.get(key)
+        if compiled is not None:
+            _local_cache.move_to_end(key)
+            return compiled
+
+    cache_key = CACHE_KEY.format(key=key)
+    compiled = cache.get(cache_key)
+    if compiled is None:
+        compiled = build()
+        try:
+            cache.set(cache_key, compiled, CACHE_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Error caching compiled newsletter template: {e}")
+
+    with _local_lock:
+        _local_cache[key] = compiled
+        while len(_local_cache) > LOCAL_CACHE_SIZE:
+            _local_cache.popitem(last=False)
+    return compiled
+
+
+def compile_template(source, html=False):
+    """Compiled form of ``source``, cached by content hash"""
+    digest = hashlib.sha1((source or '').encode('utf-8')).hexdigest()
+    return _cached(f"{'html' if html else 'text'}:{digest}", lambda: _compile(source, html))
+
+
+def compile_newsletter_template(template):
+    """{'subject', 'content', 'html'} compiled forms of a NewsletterTemplate, cached per template version"""
+    version = int(template.updated_at.timestamp() * 1000) if template.updated_at else 0
+    return _cached(f'template:{template.pk}:{version}', lambda: {
+        'subject': _compile(template.subject_template, html=False),
+        'content': _compile(template.content_template, html=False),
+        'html': _compile(template.html_template or template.content_template, html=bool(template.html_template)),
+    })
+
+
+def subscriber_variables(subscriber, extra=None):
+    """Per-recipient slot values"""
+    variables = {
+        'name': getattr(subscriber, 'name', '') or 'Abonné',
+        'email': getattr(subscriber, 'email', ''),
+        'city': getattr(subscriber, 'city', '') or '',
+    }
+    if extra:
+        variables.update(extra)
+    return variables
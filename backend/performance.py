@@ -4,6 +4,7 @@ Performance Monitoring and Optimization for VGK
 Tracks query performance, response times, and provides optimization insights
 """
 
+import re
 import time
 import logging
 from functools import wraps
@@ -14,6 +15,9 @@ from django.utils import timezone
 from datetime import datetime, timedelta
 import json
 
+from .query_profiler import query_profiler
+from .telemetry import route_of, telemetry
+
 logger = logging.getLogger(__name__)
 
 class PerformanceMonitor:
@@ -24,89 +28,19 @@ class PerformanceMonitor:
         self.max_queries_threshold = getattr(settings, 'PERFORMANCE_SETTINGS', {}).get('MAX_QUERIES_PER_REQUEST', 20)
     
     def monitor_request(self, request, response):
-        """Monitor request performance"""
+        """Monitor request performance (PerformanceMonitoringMiddleware measures queries itself)"""
         start_time = getattr(request, '_start_time', time.time())
         duration = time.time() - start_time
-        
-        # Get query count
-        query_count = len(connection.queries)
-        
-        # Log slow requests
-        if duration > self.slow_query_threshold:
-            logger.warning(
-                f"Slow request: {request.path} took {duration:.2f}s "
-                f"with {query_count} queries"
-            )
-        
-        # Log high query count
-        if query_count > self.max_queries_threshold:
-            logger.warning(
-                f"High query count: {request.path} made {query_count} queries "
-                f"in {duration:.2f}s"
-            )
-        
-        # Store performance metrics
-        self.store_performance_metrics(request.path, duration, query_count)
-        
+        telemetry.record_request(route_of(request), request.method, response.status_code, duration)
         return response
     
-    def store_performance_metrics(self, path, duration, query_count):
-        """Store performance metrics in cache for analysis"""
-        try:
-            metrics_key = f"performance_metrics_{path.replace('/', '_')}"
-            metrics = cache.get(metrics_key, {
-                'count': 0,
-                'total_duration': 0,
-                'total_queries': 0,
-                'max_duration': 0,
-                'max_queries': 0,
-                'last_updated': timezone.now().isoformat()
-            })
-            
-            metrics['count'] += 1
-            metrics['total_duration'] += duration
-            metrics['total_queries'] += query_count
-            metrics['max_duration'] = max(metrics['max_duration'], duration)
-            metrics['max_queries'] = max(metrics['max_queries'], query_count)
-            metrics['last_updated'] = timezone.now().isoformat()
-            
-            cache.set(metrics_key, metrics, 3600)  # Cache for 1 hour
-        except Exception as e:
-            logger.error(f"Error storing performance metrics: {e}")
-    
     def get_performance_report(self, path=None, hours=24):
-        """Get performance report for analysis"""
+        """
+        Get performance report for analysis: per route request count, average
+        and p50/p95/p99 latency, average queries, merged across workers
+        """
         try:
-            if path:
-                metrics_key = f"performance_metrics_{path.replace('/', '_')}"
-                metrics = cache.get(metrics_key)
-                if metrics:
-                    return {
-                        'path': path,
-                        'avg_duration': metrics['total_duration'] / metrics['count'],
-                        'avg_queries': metrics['total_queries'] / metrics['count'],
-                        'max_duration': metrics['max_duration'],
-                        'max_queries': metrics['max_queries'],
-                        'request_count': metrics['count'],
-                        'last_updated': metrics['last_updated']
-                    }
-                return None
-            
-            # Get all performance metrics
-            all_metrics = {}
-            for key in cache.keys('performance_metrics_*'):
-                metrics = cache.get(key)
-                if metrics:
-                    path_name = key.replace('performance_metrics_', '').replace('_', '/')
-                    all_metrics[path_name] = {
-                        'avg_duration': metrics['total_duration'] / metrics['count'],
-                        'avg_queries': metrics['total_queries'] / metrics['count'],
-                        'max_duration': metrics['max_duration'],
-                        'max_queries': metrics['max_queries'],
-                        'request_count': metrics['count']
-                    }
-            
-            return all_metrics
+            return telemetry.report(route=path)
         except Exception as e:
             logger.error(f"Error getting performance report: {e}")
             return None
@@ -119,43 +53,41 @@ class QueryOptimizer:
         self.slow_queries = []
     
     def analyze_queries(self):
-        """Analyze current queries for optimization opportunities"""
+        """
+        Analyze profiled queries for optimization opportunities: slow
+        fingerprints, fingerprints repeated across requests and N+1 patterns
+        (query_profiler samples requests with DEBUG off, on any backend)
+        """
         try:
-            queries = connection.queries
+            report = query_profiler.report(limit=None)
+            threshold = query_profiler.config['SLOW_QUERY_THRESHOLD']
             analysis = {
-                'total_queries': len(queries),
-                'total_time': sum(float(q['time']) for q in queries),
+                'total_queries': sum(q['calls'] for q in report),
+                'total_time': sum(q['total_time'] for q in report),
                 'slow_queries': [],
                 'duplicate_queries': [],
                 'n_plus_one_queries': []
             }
             
-            # Find slow queries
-            for query in queries:
-                if float(query['time']) > 0.1:  # Queries taking more than 100ms
-                    analysis['slow_queries'].append({
-                        'sql': query['sql'],
-                        'time': query['time'],
-                        'count': 1
-                    })
-            
-            # Find duplicate queries
-            query_counts = {}
-            for query in queries:
-                sql = query['sql']
-                if sql in query_counts:
-                    query_counts[sql]['count'] += 1
-                    query_counts[sql]['total_time'] += float(query['time'])
-                else:
-                    query_counts[sql] = {
-                        'sql': sql,
-                        'count': 1,
-                        'total_time': float(query['time'])
-                    }
-            
-            analysis['duplicate_queries'] = [
-                q for q in query_counts.values() if q['count'] > 1
-            ]
+            for query in report:
+                summary = {
+                    'sql': query['sql'],
+                    'view': query['label'],
+                    'time': query['max_time'],
+                    'count': query['calls'],
+                    'total_time': query['total_time'],
+                    'calls_per_request': query['calls_per_request'],
+                    'explain': query['explain'],
+                }
+                # Find slow queries
+                if query['max_time'] > threshold:
+                    analysis['slow_queries'].append(summary)
+                # Find duplicate queries (more than once per request on average)
+                if query['calls_per_request'] > 1:
+                    analysis['duplicate_queries'].append(summary)
+                # Find N+1 patterns (one query per row of a list)
+                if query['is_n_plus_one']:
+                    analysis['n_plus_one_queries'].append(summary)
             
             return analysis
         except Exception as e:
@@ -177,23 +109,26 @@ class QueryOptimizer:
                         'query': query['sql'][:100] + '...'
                     })
             
-            # Suggest select_related/prefetch_related for duplicate queries
-            for query in analysis['duplicate_queries']:
-                if query['count'] > 3:  # Many duplicates
+            # Suggest select_related/prefetch_related for N+1 queries
+            for query in analysis['n_plus_one_queries']:
+                suggestions.append({
+                    'type': 'optimization',
+                    'priority': 'high',
+                    'message': f"Query executed {query['calls_per_request']:.1f} times per request in {query['view']}, "
+                               f"consider select_related/prefetch_related",
+                    'query': query['sql'][:100] + '...'
+                })
+            
+            # Suggest database indexes for slow queries scanning a whole table
+            for query in analysis['slow_queries']:
+                plan = query['explain'] or ''
+                if 'Seq Scan' in plan or re.search(r'\bSCAN (?!CONSTANT)', plan):
                     suggestions.append({
-                        'type': 'optimization',
+                        'type': 'index',
                         'priority': 'medium',
-                        'message': f"Query executed {query['count']} times, consider select_related/prefetch_related",
+                        'message': f"Slow query in {query['view']} scans a whole table, consider adding a database index",
                         'query': query['sql'][:100] + '...'
                     })
-            
-            # Suggest database indexes
-            if analysis['total_queries'] > 20:
-                suggestions.append({
-                    'type': 'index',
-                    'priority': 'medium',
-                    'message': f"High query count ({analysis['total_queries']}), consider adding database indexes"
-                })
         
         return suggestions
 
@@ -251,26 +186,24 @@ def monitor_performance(func):
     """Decorator to monitor function performance"""
     @wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.time()
-        start_queries = len(connection.queries)
+        start_time = time.perf_counter()
         
-        try:
-            result = func(*args, **kwargs)
-            return result
-        finally:
-            duration = time.time() - start_time
-            query_count = len(connection.queries) - start_queries
-            
-            # Log if function is slow
-            if duration > 1.0:  # More than 1 second
-                logger.warning(
-                    f"Slow function: {func.__name__} took {duration:.2f}s "
-                    f"with {query_count} queries"
-                )
-            
-            # Store metrics
-            monitor = PerformanceMonitor()
-            monitor.store_performance_metrics(f"function_{func.__name__}", duration, query_count)
+        with telemetry.measure() as stats:
+            try:
+                result = func(*args, **kwargs)
+                return result
+            finally:
+                duration = time.perf_counter() - start_time
+                
+                # Log if function is slow
+                if duration > 1.0:  # More than 1 second
+                    logger.warning(
+                        f"Slow function: {func.__name__} took {duration:.2f}s "
+                        f"with {stats.queries} queries"
+                    )
+                
+                # Store metrics
+                telemetry.record_function(func.__name__, duration, stats)
     
     return wrapper
 
@@ -360,24 +293,33 @@ class DatabaseOptimizer:
     
     @staticmethod
     def get_slow_queries():
-        """Get slow query statistics (requires pg_stat_statements extension)"""
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT 
-                        query,
-                        calls,
-                        total_time,
-                        mean_time,
-                        rows
-                    FROM pg_stat_statements 
-                    ORDER BY mean_time DESC 
-                    LIMIT 10;
-                """)
-                return cursor.fetchall()
-        except Exception as e:
-            logger.error(f"Error getting slow queries: {e}")
-            return []
+        """
+        Get slow query statistics: pg_stat_statements on PostgreSQL when the
+        extension is installed, else the slowest profiled fingerprints
+        (query, calls, total_time, mean_time in milliseconds, rows unknown)
+        """
+        if connection.vendor == 'postgresql':
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT 
+                            query,
+                            calls,
+                            total_time,
+                            mean_time,
+                            rows
+                        FROM pg_stat_statements 
+                        ORDER BY mean_time DESC 
+                        LIMIT 10;
+                    """)
+                    return cursor.fetchall()
+            except Exception as e:
+                logger.warning(f"pg_stat_statements unavailable, using profiled queries: {e}")
+        
+        return [
+            (query['sql'], query['calls'], query['total_time'] * 1000, query['avg_time'] * 1000, None)
+            for query in query_profiler.report(limit=10, sort='avg_time')
+        ]
 
 
 # Global instances
@@ -0,0 +1,104 @@
+# backend/product_cards.py
+"""
+Product card annotations shared by the listing views
+Counts and visitor flags for a whole page of products in a constant number of queries
+"""
+
+from django.db.models import Count, Value, CharField
+
+from .models_visitor import (
+    VisitorFavorite, VisitorCompare, VisitorCartItem, ProductComment, ProductLike
+)
+
+FAVORITE, CART, COMPARE = 'favorite', 'cart', 'compare'
+
+
+def get_like_counts(product_ids):
+    """{product_id: {'LIKE': n, 'DISLIKE': n}} in one grouped query"""
+    counts = {}
+    rows = ProductLike.objects.filter(
+        product_id__in=product_ids
+    ).values_list('product_id', 'like_type').annotate(total=Count('id')).order_by()
+    for product_id, like_type, total in rows:
+        counts.setdefault(product_id, {})[like_type] = total
+    return counts
+
+
+def get_comment_counts(product_ids, top_level_only=True):
+    """{product_id: approved comments} in one grouped query, replies excluded unless ``top_level_only`` is False"""
+    comments = ProductComment.objects.filter(product_id__in=product_ids, is_approved=True)
+    if top_level_only:
+        comments = comments.filter(parent=None)
+    return dict(comments.values_list('product_id').annotate(total=Count('id')).order_by())
+
+
+def get_visitor_flags(session_key, product_ids):
+    """{product_id: {'favorite', 'cart', 'compare'}} for a session, in one UNION query"""
+    if not session_key:
+        return {}
+
+    def tagged(queryset, kind):
+        return queryset.filter(product_id__in=product_ids).annotate(
+            kind=Value(kind, output_field=CharField())
+        ).values_list('product_id', 'kind').order_by()
+
+    rows = tagged(VisitorFavorite.objects.filter(session_key=session_key), FAVORITE).union(
+        tagged(VisitorCartItem.objects.filter(cart__session_key=session_key), CART),
+        tagged(VisitorCompare.objects.filter(session_key=session_key), COMPARE),
+        all=True,
+    )
+
+    flags = {}
+    for product_id, kind in rows:
+        flags.setdefault(product_id, set()).add(kind)
+    return flags
+
+
+def annotate_card_counts(products, top_level_only=True):
+    """Set likes_count, dislikes_count and comments_count (session independent, cacheable)"""
+    product_ids = [product.id for product in products]
+    if not product_ids:
+        return products
+
+    like_counts = get_like_counts(product_ids)
+    comment_counts = get_comment_counts(product_ids, top_level_only)
+
+    for product in products:
+        likes = like_counts.get(product.id, {})
+        product.likes_count = likes.get('LIKE', 0)
+        product.dislikes_count = likes.get('DISLIKE', 0)
+        product.comments_count = comment_counts.get(product.id, 0)
+    return products
+
+
+def annotate_visitor_flags(products, session_key=None):
+    """Set is_favorited, is_in_cart and is_comparing for a visitor session"""
+    flags = get_visitor_flags(session_key, [product.id for product in products]) if products else {}
+
+    for product in products:
+        product_flags = flags.get(product.id, ())
+        product.is_favorited = FAVORITE in product_flags
+        product.is_in_cart = CART in product_flags
+        product.is_comparing = COMPARE in product_flags
+    return products
+
+
+def annotate_product_cards(products, session_key=None):
+    """
+    Set likes_count, dislikes_count, comments_count, is_favorited, is_in_cart
+    and is_comparing on each product. Accepts a queryset, a page or a list and
+    returns the products as a list.
+    """
+    products = list(products)
+    annotate_card_counts(products)
+    annotate_visitor_flags(products, session_key)
+    return products
+
+
+def annotate_listing_context(context, session_key=None, name='products'):
+    """Annotate the current page of a ListView context in place"""
+    products = annotate_product_cards(context[name], session_key)
+    context[name] = context['object_list'] = products
+    if context.get('page_obj') is not None:
+        context['page_obj'].object_list = products
+    return products
@@ -0,0 +1,272 @@
+# backend/query_profiler.py
+"""
+Sampling SQL profiler: query fingerprints per view, N+1 detection and EXPLAIN of slow queries
+"""
+
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from .telemetry import SEPARATOR, WORKERS_KEY, RequestStats, telemetry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERY_PROFILER_SETTINGS = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 0.05,  # fraction of requests profiled
+    'N_PLUS_ONE_THRESHOLD': 5,  # same fingerprint this many times in one request
+    'SLOW_QUERY_THRESHOLD': 0.1,  # seconds before a query is EXPLAINed
+    'EXPLAIN': True,
+    'MAX_EXPLAINS_PER_REQUEST': 3,
+    'MAX_FINGERPRINTS': 1000,  # entries kept per process, later fingerprints are dropped
+    'MAX_SQL_LENGTH': 2000,  # characters of SQL kept per entry
+}
+
+WORKER_KEY = 'query_profiler:worker:{worker}'
+SORTS = ('total_time', 'calls', 'avg_time', 'max_time', 'n_plus_one')
+
+_STRING = re.compile(r"'(?:''|[^'])*'")
+_NUMBER = re.compile(r'(?<![\w."])-?\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|%\(\w+\)s|\?')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_VALUES = re.compile(r'\bVALUES\s*\([^()]*\)(?:\s*,\s*\([^()]*\))*', re.IGNORECASE)
+_SPACES = re.compile(r'\s+')
+
+
+def get_query_profiler_settings():
+    config = dict(DEFAULT_QUERY_PROFILER_SETTINGS)
+    config.update(getattr(settings, 'QUERY_PROFILER_SETTINGS', {}))
+    return config
+
+
+@lru_cache(maxsize=2048)
+def normalize(sql):
+    """SQL with literals and placeholders as ``?``, IN and VALUES lists collapsed"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _VALUES.sub('VALUES (...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """(fingerprint id, normalized SQL) of a statement"""
+    normalized = normalize(sql)
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16], normalized
+
+
+class QueryProfile(RequestStats):
+    """RequestStats that also groups the queries of one request by fingerprint"""
+
+    __slots__ = ('queries_by_fingerprint',)
+
+    def __init__(self):
+        super().__init__()
+        # fingerprint: [normalized sql, calls, time, slowest time, (sql, params, alias) of the slowest]
+        self.queries_by_fingerprint = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            key, normalized = fingerprint(sql)
+            entry = self.queries_by_fingerprint.get(key)
+            if entry is None:
+                entry = self.queries_by_fingerprint[key] = [normalized, 0, 0.0, -1.0, None]
+            entry[1] += 1
+            entry[2] += elapsed
+            if elapsed > entry[3]:
+                entry[3] = elapsed
+                entry[4] = (sql, None if many else params, context['connection'].alias)
+
+
+def explain(sql, params, alias):
+    """Execution plan of a SELECT in the backend's EXPLAIN dialect"""
+    connection = connections[alias]
+    prefix = connection.ops.explain_query_prefix()
+    with connection.cursor() as cursor:
+        cursor.execute(f'{prefix} {sql}', params)
+        return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+
+def _merge(target, snapshot):
+    for label, count in snapshot['requests'].items():
+        target['requests'][label] = target['requests'].get(label, 0) + count
+    for key, entry in snapshot['entries'].items():
+        merged = target['entries'].get(key)
+        if merged is None:
+            target['entries'][key] = dict(entry)
+            continue
+        for field in ('calls', 'requests', 'total_time', 'n_plus_one'):
+            merged[field] += entry[field]
+        for field in ('max_time', 'max_repeat'):
+            merged[field] = max(merged[field], entry[field])
+        merged['explain'] = merged['explain'] or entry['explain']
+    return target
+
+
+class QueryProfiler:
+    """Per-process fingerprint statistics of the sampled requests"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._entries = {}
+        self._config = None
+        self._published_at = 0.0
+        self.dropped = 0
+
+    @property
+    def config(self):
+        if self._config is None:
+            self._config = get_query_profiler_settings()
+        return self._config
+
+    def sample(self):
+        """A QueryProfile for this request if it is sampled, else None"""
+        config = self.config
+        if not config['ENABLED'] or random.random() >= config['SAMPLE_RATE']:
+            return None
+        return QueryProfile()
+
+    @contextmanager
+    def profile(self, label):
+        """Profile the queries of a block (management commands, tasks) under ``label``"""
+        profile = QueryProfile()
+        with telemetry.measure(profile):
+            yield profile
+        self.record(label, profile)
+
+    # ============ RECORDING ============
+
+    def record(self, label, profile):
+        """Add a finished QueryProfile; EXPLAINs its new slow SELECTs (outside the lock)"""
+        config = self.config
+        threshold = config['N_PLUS_ONE_THRESHOLD']
+        to_explain = []
+        with self._lock:
+            self._requests[label] = self._requests.get(label, 0) + 1
+            for key, (normalized, calls, total, slowest, statement) in profile.queries_by_fingerprint.items():
+                entry_key = label + SEPARATOR + key
+                entry = self._entries.get(entry_key)
+                if entry is None:
+                    if len(self._entries) >= config['MAX_FINGERPRINTS']:
+                        self.dropped += 1
+                        continue
+                    entry = self._entries[entry_key] = {
+                        'sql': normalized[:config['MAX_SQL_LENGTH']],
+                        'calls': 0, 'requests': 0, 'total_time': 0.0, 'max_time': 0.0,
+                        'max_repeat': 0, 'n_plus_one': 0, 'explain': None,
+                    }
+                entry['calls'] += calls
+                entry['requests'] += 1
+                entry['total_time'] += total
+                entry['max_time'] = max(entry['max_time'], slowest)
+                entry['max_repeat'] = max(entry['max_repeat'], calls)
+                if calls >= threshold:
+                    entry['n_plus_one'] += 1
+                if (config['EXPLAIN'] and entry['explain'] is None and slowest >= config['SLOW_QUERY_THRESHOLD']
+                        and normalized[:6].upper() == 'SELECT'):
+                    entry['explain'] = ''  # claimed: one EXPLAIN per fingerprint
+                    to_explain.append((entry, statement))
+
+        for entry, (sql, params, alias) in to_explain[:config['MAX_EXPLAINS_PER_REQUEST']]:
+            try:
+                entry['explain'] = explain(sql, params, alias)[:config['MAX_SQL_LENGTH']]
+            except Exception as e:
+                entry['explain'] = None
+                logger.error(f"Error explaining slow query: {e}")
+        for entry, _ in to_explain[config['MAX_EXPLAINS_PER_REQUEST']:]:
+            entry['explain'] = None  # retried by a later request
+
+    # ============ AGGREGATION ============
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'requests': dict(self._requests),
+                'entries': {key: dict(entry) for key, entry in self._entries.items()},
+            }
+
+    def maybe_publish(self):
+        interval = telemetry.config['PUBLISH_INTERVAL']
+        if interval is None or time.monotonic() - self._published_at < interval:
+            return
+        self.publish()
+
+    def publish(self):
+        """Store this worker's entries in the cache (the worker is registered by telemetry.publish)"""
+        self._published_at = time.monotonic()
+        try:
+            cache.set(WORKER_KEY.format(worker=telemetry.worker), self.snapshot(), telemetry.config['WORKER_TTL'])
+        except Exception as e:
+            logger.error(f"Error publishing query profile: {e}")
+
+    def collect(self):
+        """Entries of every live worker (this one read live)"""
+        merged = self.snapshot()
+        if telemetry.config['PUBLISH_INTERVAL'] is None:
+            return merged
+        try:
+            worker = telemetry.worker
+            others = [name for name in (cache.get(WORKERS_KEY) or {}) if name != worker]
+            snapshots = cache.get_many([WORKER_KEY.format(worker=name) for name in others])
+            for snapshot in snapshots.values():
+                _merge(merged, snapshot)
+        except Exception as e:
+            logger.error(f"Error collecting query profiles: {e}")
+        return merged
+
+    def reset(self):
+        with self._lock:
+            self._requests.clear()
+            self._entries.clear()
+            self.dropped = 0
+        try:
+            cache.delete(WORKER_KEY.format(worker=telemetry.worker))
+        except Exception as e:
+            logger.error(f"Error resetting query profile: {e}")
+
+    # ============ REPORT ============
+
+    def report(self, limit=20, sort='total_time', label=None, snapshot=None):
+        """Fingerprints ranked by ``sort`` (one of SORTS), with per-request averages and N+1 flags"""
+        if sort not in SORTS:
+            raise ValueError(f"sort must be one of {', '.join(SORTS)}")
+        snapshot = snapshot or self.collect()
+        rows = []
+        for key, entry in snapshot['entries'].items():
+            entry_label, entry_fingerprint = key.split(SEPARATOR)
+            if label is not None and entry_label != label:
+                continue
+            sampled = snapshot['requests'].get(entry_label, 0) or entry['requests']
+            rows.append(dict(
+                entry,
+                label=entry_label,
+                fingerprint=entry_fingerprint,
+                avg_time=entry['total_time'] / entry['calls'] if entry['calls'] else 0,
+                calls_per_request=entry['calls'] / sampled,
+                sampled_requests=sampled,
+                is_n_plus_one=entry['n_plus_one'] > 0,
+            ))
+        rows.sort(key=lambda row: (row[sort], row['total_time']), reverse=True)
+        return rows[:limit] if limit else rows
+
+
+# Global instance
+query_profiler = QueryProfiler()
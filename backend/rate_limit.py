@@ -0,0 +1,205 @@
+# backend/rate_limit.py
+"""
+Sliding-window rate limiter shared by APIThrottleMiddleware and SecurityMiddleware
+Counters live in Redis when available, else in a per-process LRU
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATE_LIMIT_SETTINGS = {
+    'BACKEND': 'auto',  # auto, redis, memory
+    'MAX_KEYS': 10000,  # memory backend: least recently used counters are dropped beyond this
+    'ROUTES': [
+        {'prefix': '/api/', 'limit': 100, 'window': 60},
+    ],
+    'LOGIN': {'path': '/auth/login/', 'limit': 5, 'window': 3600},  # failed attempts per IP
+}
+
+KEY_PREFIX = 'ratelimit'
+
+RateLimitResult = namedtuple('RateLimitResult', ['allowed', 'count', 'limit', 'retry_after'])
+
+
+def get_rate_limit_settings():
+    config = dict(DEFAULT_RATE_LIMIT_SETTINGS)
+    config.update(getattr(settings, 'RATE_LIMIT_SETTINGS', {}))
+    return config
+
+
+def _window_position(window, now=None):
+    """(current window index, fraction of the current window elapsed)"""
+    now = time.time() if now is None else now
+    index = int(now // window)
+    return index, (now - index * window) / window
+
+
+def _result(allowed, count, limit, window, elapsed):
+    retry_after = 0 if allowed else max(1, math.ceil(window * (1 - elapsed)))
+    return RateLimitResult(allowed, count, limit, retry_after)
+
+
+class MemoryRateLimitBackend:
+    """Per-process counters in a bounded LRU"""
+
+    name = 'memory'
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._counters = OrderedDict()  # key -> [window index, current count, previous count]
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, window, cost=1, now=None):
+        index, elapsed = _window_position(window, now)
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None:
+                counter = self._counters[key] = [index, 0, 0]
+                if len(self._counters) > self.max_keys:
+                    self._counters.popitem(last=False)
+            else:
+                self._counters.move_to_end(key)
+                if counter[0] != index:
+                    counter[2] = counter[1] if counter[0] == index - 1 else 0
+                    counter[0], counter[1] = index, 0
+
+            count = counter[2] * (1 - elapsed) + counter[1]
+            allowed = limit is None or count + cost <= limit
+            if allowed:
+                counter[1] += cost
+                count += cost
+        return _result(allowed, count, limit, window, elapsed)
+
+    def reset(self, key, window):
+        with self._lock:
+            self._counters.pop(key, None)
+
+
+class RedisRateLimitBackend:
+    """Counters shared by every worker, checked and incremented atomically in Lua"""
+
+    name = 'redis'
+
+    # KEYS: current window, previous window; ARGV: cost, limit (-1: none), elapsed fraction, ttl
+    SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local count = previous * (1 - tonumber(ARGV[3])) + current
+local cost = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+if limit >= 0 and count + cost > limit then
+    return {0, tostring(count)}
+end
+if cost > 0 then
+    redis.call('INCRBY', KEYS[1], cost)
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+end
+return {1, tostring(count + cost)}
+"""
+
+    def __init__(self, client):
+        self.client = client
+        self.script = client.register_script(self.SCRIPT)
+
+    def _key(self, key, index):
+        return f'{KEY_PREFIX}:{key}:{index}'
+
+    def hit(self, key, limit, window, cost=1, now=None):
+        index, elapsed = _window_position(window, now)
+        allowed, count = self.script(
+            keys=[self._key(key, index), self._key(key, index - 1)],
+            args=[cost, -1 if limit is None else limit, elapsed, window * 2],
+        )
+        return _result(bool(allowed), float(count), limit, window, elapsed)
+
+    def reset(self, key, window, now=None):
+        # Only the current and previous windows are ever read
+        index, _ = _window_position(window, now)
+        self.client.delete(self._key(key, index), self._key(key, index - 1))
+
+
+def _redis_client():
+    try:
+        from django_redis import get_redis_connection
+    except ImportError:
+        return None
+    if 'django_redis' not in cache.__class__.__module__:
+        return None
+    try:
+        client = get_redis_connection('default')
+        client.ping()
+        return client
+    except Exception as e:
+        logger.warning(f"Redis unavailable for rate limiting, using per-process counters: {e}")
+        return None
+
+
+class RateLimiter:
+    """Single entry point for request rate limiting"""
+
+    def __init__(self):
+        self._backend = None
+        self._routes = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            config = get_rate_limit_settings()
+            client = _redis_client() if config['BACKEND'] in ('auto', 'redis') else None
+            if client is not None:
+                self._backend = RedisRateLimitBackend(client)
+            else:
+                self._backend = MemoryRateLimitBackend(config['MAX_KEYS'])
+        return self._backend
+
+    @property
+    def routes(self):
+        if self._routes is None:
+            self._routes = list(get_rate_limit_settings()['ROUTES'])
+        return self._routes
+
+    def route_for(self, path, method='GET'):
+        """First configured route whose prefix (and methods, if given) matches the request"""
+        for route in self.routes:
+            if path.startswith(route['prefix']) and method in route.get('methods', (method,)):
+                return route
+        return None
+
+    def _call(self, key, limit, window, cost):
+        try:
+            return self.backend.hit(key, limit, window, cost)
+        except Exception as e:
+            # Fail open: a limiter outage must not take the site down
+            logger.error(f"Rate limiter error for {key}: {e}")
+            return RateLimitResult(True, 0, limit, 0)
+
+    def hit(self, key, limit, window, cost=1):
+        """Count ``cost`` against ``key`` if it stays within ``limit`` per sliding ``window`` seconds"""
+        return self._call(key, limit, window, cost)
+
+    def peek(self, key, limit, window):
+        """Current state of ``key`` without counting anything"""
+        return self._call(key, limit, window, 0)
+
+    def record(self, key, window, cost=1):
+        """Count unconditionally (e.g. a failed login); returns the new count"""
+        return self._call(key, None, window, cost).count
+
+    def reset(self, key, window):
+        """Forget everything counted against ``key`` in its sliding ``window``"""
+        try:
+            self.backend.reset(key, window)
+        except Exception as e:
+            logger.error(f"Rate limiter reset error for {key}: {e}")
+
+
+# Global instance
+rate_limiter = RateLimiter()
@@ -0,0 +1,359 @@
+# backend/receipts.py
+"""
+PDF receipts for visitor orders
+Streamed PDF generation, QR codes cached by content
+"""
+
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from functools import lru_cache
+
+import qrcode
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RECEIPT_SETTINGS = {
+    'QR_STORAGE_DIR': 'receipts/qr',  # content-addressed QR PNGs in the default storage
+    'QR_CACHE_TIMEOUT': 60 * 60 * 24 * 30,
+    'WORKERS': None,  # process pool size for batch rendering, None: one per CPU
+}
+
+QR_CACHE_KEY = 'receipt_qr:{key}'
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 in points
+MARGIN = 50
+LINE_HEIGHT = 16
+QR_SIZE = 110
+
+# Helvetica advance widths (1/1000 em) of the characters used in amounts
+HELVETICA_WIDTHS = {' ': 278, ',': 278, '.': 278, 'A': 667, 'C': 722, 'F': 611}
+
+
+def get_receipt_settings():
+    config = dict(DEFAULT_RECEIPT_SETTINGS)
+    config.update(getattr(settings, 'RECEIPT_SETTINGS', {}))
+    return config
+
+
+# ============= QR CODES =============
+
+def qr_key(payload):
+    """Content address of a QR payload"""
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+@lru_cache(maxsize=256)
+def qr_modules(payload):
+    """QR module matrix of ``payload`` as rows of '0'/'1', without quiet zone"""
+    qr = qrcode.QRCode(border=0, error_correction=qrcode.constants.ERROR_CORRECT_M)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    return tuple(''.join('1' if module else '0' for module in row) for row in qr.get_matrix())
+
+
+def qr_matrix(payload):
+    """``qr_modules`` shared between processes through the Django cache"""
+    cache_key = QR_CACHE_KEY.format(key=qr_key(payload))
+    rows = cache.get(cache_key)
+    if rows is None:
+        rows = qr_modules(payload)
+        try:
+            cache.set(cache_key, rows, get_receipt_settings()['QR_CACHE_TIMEOUT'])
+        except Exception as e:
+            logger.error(f"Error caching QR matrix: {e}")
+    return rows
+
+
+def qr_png(payload, box_size=10, border=4):
+    """PNG bytes of the QR code, rendered once and stored under its content key"""
+    from django.core.files.base import ContentFile
+    from django.core.files.storage import default_storage
+
+    path = f"{get_receipt_settings()['QR_STORAGE_DIR']}/{qr_key(payload)}.png"
+    if default_storage.exists(path):
+        with default_storage.open(path, 'rb') as handle:
+            return handle.read()
+
+    from PIL import Image
+
+    rows = qr_matrix(payload)
+    size = len(rows) + 2 * border
+    image = Image.new('1', (size, size), 1)
+    image.putdata([
+        0 if border <= y < size - border and border <= x < size - border and rows[y - border][x - border] == '1' else 1
+        for y in range(size) for x in range(size)
+    ])
+    buffer = io.BytesIO()
+    image.resize((size * box_size, size * box_size), Image.NEAREST).save(buffer, format='PNG')
+    content = buffer.getvalue()
+    try:
+        default_storage.save(path, ContentFile(content))
+    except Exception as e:
+        logger.error(f"Error storing QR code {path}: {e}")
+    return content
+
+
+def receipt_qr_payload(qr_receipt):
+    """JSON payload stored on the receipt (older receipts stored a base64 PNG instead)"""
+    if qr_receipt.qr_code_data.startswith('{'):
+        return qr_receipt.qr_code_data
+    return json.dumps({'receipt_number': qr_receipt.receipt_number})
+
+
+# ============= PDF =============
+
+def format_amount(value):
+    return f"{Decimal(value or 0):,.0f}".replace(',', ' ') + ' FCFA'
+
+
+def text_width(text, size):
+    return sum(HELVETICA_WIDTHS.get(char, 556) for char in text) * size / 1000.0
+
+
+def _pdf_text(text):
+    encoded = str(text).encode('cp1252', 'replace')
+    return encoded.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+class PDFStreamWriter:
+    """Emits numbered PDF objects as bytes while tracking their offsets for the xref table"""
+
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+
+    def _emit(self, data):
+        self.offset += len(data)
+        return data
+
+    def header(self):
+        return self._emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def object(self, number, body):
+        self.offsets[number] = self.offset
+        return self._emit(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+
+    def stream(self, number, content):
+        data = zlib.compress(content)
+        return self.object(number, b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(data), data))
+
+    def trailer(self, root):
+        size = max(self.offsets) + 1
+        xref_offset = self.offset
+        entries = [b'0000000000 65535 f \n'] + [
+            b'%010d 00000 n \n' % self.offsets[number] for number in range(1, size)
+        ]
+        return self._emit(
+            b'xref\n0 %d\n%s' % (size, b''.join(entries))
+            + b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (size, root, xref_offset)
+        )
+
+
+class ReceiptPage:
+    """Content stream of one page, written top to bottom"""
+
+    def __init__(self):
+        self.ops = []
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def text(self, x, text, size=10, bold=False):
+        self.ops.append(b'BT /%s %d Tf %.2f %.2f Td (%s) Tj ET' % (
+            b'F2' if bold else b'F1', size, x, self.y, _pdf_text(text)
+        ))
+
+    def text_right(self, right, text, size=10, bold=False):
+        self.text(right - text_width(text, size), text, size, bold)
+
+    def rule(self):
+        self.ops.append(b'%.2f %.2f m %.2f %.2f l 0.5 w S' % (MARGIN, self.y + 5, PAGE_WIDTH - MARGIN, self.y + 5))
+
+    def qr(self, rows, x, y, size):
+        module = size / len(rows)
+        self.ops.append(b'0 g')
+        for row_index, row in enumerate(rows):
+            top = y + size - (row_index + 1) * module
+            column = row.find('1')
+            while column != -1:
+                end = row.find('0', column)
+                end = len(row) if end == -1 else end
+                # One rectangle per horizontal run of dark modules
+                self.ops.append(b'%.2f %.2f %.2f %.2f re' % (x + column * module, top, (end - column) * module, module))
+                column = row.find('1', end)
+        self.ops.append(b'f')
+
+    def newline(self, count=1):
+        self.y -= LINE_HEIGHT * count
+
+    @property
+    def full(self):
+        return self.y < MARGIN + 3 * LINE_HEIGHT
+
+    def content(self):
+        return b'\n'.join(self.ops)
+
+
+def iter_receipt_pages(data, qr_rows):
+    """Yield finished ReceiptPage objects for the receipt ``data``"""
+    right = PAGE_WIDTH - MARGIN
+    page = ReceiptPage()
+    page.qr(qr_rows, right - QR_SIZE, PAGE_HEIGHT - MARGIN - QR_SIZE, QR_SIZE)
+    page.text(MARGIN, 'VIDÉ-GRENIER KAMER', size=18, bold=True)
+    page.newline(1.5)
+    page.text(MARGIN, 'Reçu de commande', size=12)
+    page.newline(2)
+    page.text(MARGIN, f"Reçu N° {data['number']}", bold=True)
+    page.newline()
+    page.text(MARGIN, f"Date : {data['date']}")
+    page.newline(2)
+    page.text(MARGIN, 'Client', bold=True)
+    page.newline()
+    for label, key in (('Nom', 'name'), ('Téléphone', 'phone'), ('Email', 'email'), ('Adresse', 'address')):
+        if data.get(key):
+            page.text(MARGIN, f"{label} : {data[key]}")
+            page.newline()
+    page.y = min(page.y, PAGE_HEIGHT - MARGIN - QR_SIZE - LINE_HEIGHT) - LINE_HEIGHT
+
+    def table_header(page):
+        page.text(MARGIN, 'Article', bold=True)
+        page.text_right(right - 200, 'Qté', bold=True)
+        page.text_right(right - 100, 'Prix unitaire', bold=True)
+        page.text_right(right, 'Total', bold=True)
+        page.newline()
+        page.rule()
+
+    table_header(page)
+    for line in data['lines']:
+        if page.full:
+            yield page
+            page = ReceiptPage()
+            table_header(page)
+        title = line['title'] if len(line['title']) <= 40 else line['title'][:39] + '…'
+        page.text(MARGIN, title)
+        page.text_right(right - 200, str(line['quantity']))
+        page.text_right(right - 100, format_amount(line['unit_price']))
+        page.text_right(right, format_amount(line['total']))
+        page.newline()
+
+    if page.y < MARGIN + 6 * LINE_HEIGHT:
+        yield page
+        page = ReceiptPage()
+    page.rule()
+    page.newline(0.5)
+    for label, key, bold in (('Sous-total', 'subtotal', False), ('Livraison', 'delivery', False), ('Total', 'total', True)):
+        page.text_right(right - 120, label, bold=bold)
+        page.text_right(right, format_amount(data[key]), bold=bold)
+        page.newline()
+    page.newline()
+    page.text(MARGIN, 'Merci pour votre achat ! Présentez ce QR code au retrait de votre commande.', size=9)
+    yield page
+
+
+def iter_receipt_pdf(data, qr_rows=None):
+    """
+    Yield the PDF receipt for ``data`` (see ``receipt_data``) chunk by chunk.
+    ``qr_rows`` defaults to ``qr_modules(data['qr_payload'])``.
+    """
+    writer = PDFStreamWriter()
+    yield writer.header()
+    yield writer.object(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+    yield writer.object(4, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>')
+
+    kids = []
+    number = 5
+    for page in iter_receipt_pages(data, qr_rows or qr_modules(data['qr_payload'])):
+        yield writer.stream(number, page.content())
+        yield writer.object(number + 1, (
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+            b'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>'
+        ) % (PAGE_WIDTH, PAGE_HEIGHT, number))
+        kids.append(b'%d 0 R' % (number + 1))
+        number += 2
+
+    yield writer.object(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(kids), len(kids)))
+    yield writer.object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    yield writer.trailer(root=1)
+
+
+def receipt_data(qr_receipt, orders):
+    """Plain (picklable) receipt content from a QRReceipt and its orders"""
+    lines = [{
+        'title': order.product.title,
+        'quantity': order.quantity,
+        'unit_price': order.unit_price,
+        'total': order.total_amount,
+    } for order in orders]
+    return {
+        'number': qr_receipt.receipt_number,
+        'date': qr_receipt.created_at.strftime('%d/%m/%Y %H:%M') if qr_receipt.created_at else '',
+        'name': qr_receipt.visitor_name,
+        'phone': qr_receipt.visitor_phone,
+        'email': qr_receipt.visitor_email,
+        'address': qr_receipt.delivery_address,
+        'lines': lines,
+        'subtotal': qr_receipt.total_amount,
+        'delivery': qr_receipt.delivery_cost,
+        'total': (qr_receipt.total_amount or 0) + (qr_receipt.delivery_cost or 0),
+        'qr_payload': receipt_qr_payload(qr_receipt),
+    }
+
+
+# ============= BATCH RENDERING =============
+
+def render_receipt_file(job):
+    """Process pool worker: stream one receipt into ``path``"""
+    data, path = job
+    with open(path, 'wb') as handle:
+        for chunk in iter_receipt_pdf(data):
+            handle.write(chunk)
+    return path
+
+
+def render_receipts(receipts, directory, workers=None, chunksize=4):
+    """
+    Render receipt ``data`` dicts to ``directory/receipt_<number>.pdf`` with a
+    process pool; returns the paths in input order. Workers only need the
+    plain dicts (no database access).
+    """
+    jobs = [(data, os.path.join(directory, f"receipt_{data['number']}.pdf")) for data in receipts]
+    workers = workers or get_receipt_settings()['WORKERS'] or os.cpu_count() or 1
+    if workers == 1 or len(jobs) < 2:
+        return [render_receipt_file(job) for job in jobs]
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+        return list(executor.map(render_receipt_file, jobs, chunksize=chunksize))
+
+
+def store_receipt_pdfs(receipt_ids, workers=None):
+    """Render QRReceipts in a process pool and attach the files to ``receipt_pdf``; returns the count"""
+    from django.core.files import File
+    from .models import Order
+    from .models_visitor import QRReceipt
+
+    receipts = list(QRReceipt.objects.filter(id__in=receipt_ids))
+    order_ids = {order_id for receipt in receipts for order_id in receipt.orders}
+    orders = {
+        str(order.pk): order for order in Order.objects.filter(id__in=order_ids).select_related('product')
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = render_receipts(
+            [receipt_data(receipt, [orders[order_id] for order_id in receipt.orders if order_id in orders])
+             for receipt in receipts],
+            directory, workers,
+        )
+        for receipt, path in zip(receipts, paths):
+            with open(path, 'rb') as handle:
+                receipt.receipt_pdf.save(os.path.basename(path), File(handle), save=False)
+
+    QRReceipt.objects.bulk_update(receipts, ['receipt_pdf'])
+    return len(receipts)
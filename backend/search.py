@@ -0,0 +1,483 @@
+# backend/search.py
+"""
+Full-text product search with pluggable backends (PostgreSQL, SQLite FTS5, in-memory)
+Kept up to date by the Product/Category signals, rebuilt with manage.py rebuild_search_index
+"""
+
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Case, When, Value, FloatField
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Relative weight of each indexed field (PostgreSQL weights A, B, C, D)
+FIELD_WEIGHTS = {
+    'title': 1.0,
+    'category': 0.4,
+    'description': 0.2,
+    'city': 0.1,
+}
+POSTGRES_WEIGHTS = {'title': 'A', 'category': 'B', 'description': 'C', 'city': 'D'}
+
+DEFAULT_SEARCH_SETTINGS = {
+    'BACKEND': 'auto',  # auto, postgres, sqlite_fts, memory
+    'MAX_RESULTS': 500,  # ranked ids handed back to the ORM (sqlite_fts/memory)
+    'MIN_PREFIX_LENGTH': 2,
+    'MEMORY_RELOAD_INTERVAL': 60,
+    'MEMORY_CHANGE_LOG_TIMEOUT': 60 * 60 * 24,  # seconds a product change stays in the shared log
+    'MEMORY_MAX_CHANGES': 1000,  # a worker further behind reloads the whole index
+}
+
+
+def get_search_settings():
+    config = dict(DEFAULT_SEARCH_SETTINGS)
+    config.update(getattr(settings, 'SEARCH_SETTINGS', {}))
+    return config
+
+
+def fold(text):
+    """Lowercase and strip accents: 'Téléphone Œuvre' -> 'telephone oeuvre'"""
+    if not text:
+        return ''
+    text = str(text).lower().replace('œ', 'oe').replace('æ', 'ae')
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(fold(text))
+
+
+def product_fields(product):
+    """Folded text of every indexed field of a product"""
+    category = getattr(product, 'category', None)
+    return {
+        'title': fold(product.title),
+        'category': fold(category.name if category else ''),
+        'description': fold(product.description),
+        'city': fold(product.city),
+    }
+
+
+def no_results(queryset):
+    """Empty result that still carries ``search_rank``, so callers can order by it"""
+    return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+def ranked_queryset(queryset, ranked):
+    """Restrict a queryset to [(product_id, rank), ...] and annotate ``search_rank``"""
+    if not ranked:
+        return no_results(queryset)
+    return queryset.filter(
+        pk__in=[product_id for product_id, rank in ranked]
+    ).annotate(
+        search_rank=Case(
+            *[When(pk=product_id, then=Value(float(rank))) for product_id, rank in ranked],
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    )
+
+
+class SearchBackend:
+    """Interface shared by the search backends"""
+
+    name = None
+
+    def __init__(self):
+        config = get_search_settings()
+        self.max_results = config['MAX_RESULTS']
+        self.min_prefix_length = config['MIN_PREFIX_LENGTH']
+
+    def search(self, queryset, query):
+        """Filter ``queryset`` to products matching ``query``, annotated with ``search_rank`` (higher is better)"""
+        raise NotImplementedError
+
+    def index_product(self, product):
+        raise NotImplementedError
+
+    def remove_product(self, product_id):
+        raise NotImplementedError
+
+    def rebuild(self, products):
+        """Reindex from an iterable of ACTIVE products; returns the number indexed"""
+        count = 0
+        for product in products:
+            self.index_product(product)
+            count += 1
+        return count
+
+    def query_terms(self, query):
+        """Folded tokens; the last one is a prefix when long enough"""
+        tokens = tokenize(query)
+        if not tokens:
+            return [], None
+        if len(tokens[-1]) >= self.min_prefix_length:
+            return tokens[:-1], tokens[-1]
+        return tokens, None
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Weighted tsvector on Product.search_vector, GIN indexed"""
+
+    name = 'postgres'
+    CONFIG = 'simple'  # documents are folded in Python, no stemming dictionary needed
+
+    def search(self, queryset, query):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        terms, prefix = self.query_terms(query)
+        lexemes = terms + ([f'{prefix}:*'] if prefix else [])
+        if not lexemes:
+            return no_results(queryset)
+
+        search_query = SearchQuery(' & '.join(lexemes), search_type='raw', config=self.CONFIG)
+        return queryset.filter(
+            search_vector=search_query
+        ).annotate(
+            search_rank=SearchRank('search_vector', search_query)
+        )
+
+    def _vector(self, fields):
+        from django.contrib.postgres.search import SearchVector
+
+        vector = None
+        for field, weight in POSTGRES_WEIGHTS.items():
+            part = SearchVector(Value(fields[field]), weight=weight, config=self.CONFIG)
+            vector = part if vector is None else vector + part
+        return vector
+
+    def index_product(self, product):
+        from .models import Product
+
+        vector = self._vector(product_fields(product)) if product.status == 'ACTIVE' else None
+        # update() does not send post_save, so indexing never loops back into the signal
+        Product.objects.filter(pk=product.pk).update(search_vector=vector)
+
+    def remove_product(self, product_id):
+        # The row (and its vector) goes away with the product
+        pass
+
+
+class SQLiteFTSSearchBackend(SearchBackend):
+    """SQLite FTS5 table ranked with bm25 column weights"""
+
+    name = 'sqlite_fts'
+    TABLE = 'product_search_fts'
+    COLUMNS = ['title', 'category', 'description', 'city']
+
+    def match_expression(self, query):
+        """FTS5 MATCH expression: every term required, the last one as a prefix"""
+        terms, prefix = self.query_terms(query)
+        phrases = [f'"{term}"' for term in terms] + ([f'"{prefix}"*'] if prefix else [])
+        return ' '.join(phrases)
+
+    def rank_sql(self, placeholder='%s'):
+        # bm25() is lower for better matches; product_id is the first (unweighted) column
+        weights = ', '.join(str(FIELD_WEIGHTS[column] * 10) for column in self.COLUMNS)
+        return (
+            f'SELECT product_id, bm25({self.TABLE}, 0, {weights}) AS score '
+            f'FROM {self.TABLE} WHERE {self.TABLE} MATCH {placeholder} ORDER BY score LIMIT {placeholder}'
+        )
+
+    def search(self, queryset, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return no_results(queryset)
+
+        with connection.cursor() as cursor:
+            cursor.execute(self.rank_sql(), [expression, self.max_results])
+            ranked = [(uuid.UUID(product_id), -score) for product_id, score in cursor.fetchall()]
+        return ranked_queryset(queryset, ranked)
+
+    def index_product(self, product):
+        self.remove_product(product.pk)
+        if product.status != 'ACTIVE':
+            return
+        fields = product_fields(product)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.TABLE} (product_id, {", ".join(self.COLUMNS)}) VALUES (%s, %s, %s, %s, %s)',
+                [str(product.pk)] + [fields[column] for column in self.COLUMNS],
+            )
+
+    def remove_product(self, product_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.TABLE} WHERE product_id = %s', [str(product_id)])
+
+    def rebuild(self, products):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.TABLE}')
+        return super().rebuild(products)
+
+
+class InMemorySearchBackend(SearchBackend):
+    """
+    Process-local inverted index: token -> {product_id: weight}, with a sorted
+    vocabulary for prefix lookups. Loaded lazily from the database; product
+    changes are published as a numbered log in the cache and replayed by the
+    other workers, a rebuild bumps the generation and makes them reload.
+    """
+
+    name = 'memory'
+    VERSION_KEY = 'search_index_version'
+    SEQUENCE_KEY = 'search_index_sequence'
+    CHANGE_KEY = 'search_index_change:{version}:{sequence}'
+
+    def __init__(self, loader=None):
+        super().__init__()
+        config = get_search_settings()
+        self.reload_interval = config['MEMORY_RELOAD_INTERVAL']
+        self.change_log_timeout = config['MEMORY_CHANGE_LOG_TIMEOUT']
+        self.max_changes = config['MEMORY_MAX_CHANGES']
+        self.loader = loader or self._load_products
+        self._lock = threading.RLock()
+        self._postings = defaultdict(dict)
+        self._documents = {}
+        self._vocabulary = None
+        self._loaded = False
+        self._version = None
+        self._sequence = 0
+        self._stalled_at = None
+        self._checked_at = 0
+
+    def _load_products(self):
+        from .models import Product
+        return Product.objects.filter(status='ACTIVE').select_related('category').iterator(chunk_size=2000)
+
+    def _ensure_loaded(self):
+        now = time.time()
+        if self._loaded and now - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            shared = cache.get_many([self.VERSION_KEY, self.SEQUENCE_KEY])
+            version = shared.get(self.VERSION_KEY)
+            sequence = shared.get(self.SEQUENCE_KEY) or 0
+            if self._loaded and version == self._version:
+                if sequence <= self._sequence or self._replay(version, sequence):
+                    return
+            self._reload(version, sequence)
+
+    def _reload(self, version, sequence):
+        """Whole index from the database; changes published meanwhile are replayed later"""
+        self._clear()
+        for product in self.loader():
+            self._add(str(product.pk), product_fields(product))
+        self._loaded = True
+        self._version = version
+        self._sequence = sequence
+        self._stalled_at = None
+
+    def _replay(self, version, sequence):
+        """Apply the published changes after ours; False when a full reload is needed"""
+        if sequence - self._sequence > self.max_changes:
+            return False
+        keys = [self.CHANGE_KEY.format(version=version, sequence=number)
+                for number in range(self._sequence + 1, sequence + 1)]
+        changes = cache.get_many(keys)
+        for key in keys:
+            if key not in changes:
+                # Numbered but not written yet, or expired if it is still missing next time
+                missing = int(key.rsplit(':', 1)[1])
+                if self._stalled_at == missing:
+                    return False
+                self._stalled_at = missing
+                return True
+            product_id, fields = changes[key]
+            self._discard(product_id)
+            if fields is not None:
+                self._add(product_id, fields)
+            self._sequence += 1
+        self._stalled_at = None
+        return True
+
+    def _publish(self, product_id, fields):
+        """Append a change (fields None: removal) to the shared log"""
+        cache.add(self.SEQUENCE_KEY, 0, None)
+        sequence = cache.incr(self.SEQUENCE_KEY)
+        cache.set(self.CHANGE_KEY.format(version=self._version, sequence=sequence),
+                  [product_id, fields], self.change_log_timeout)
+        if sequence == self._sequence + 1:
+            # Otherwise earlier changes of other workers are still to replay (ours again, harmlessly)
+            self._sequence = sequence
+
+    def _clear(self):
+        self._postings = defaultdict(dict)
+        self._documents = {}
+        self._vocabulary = None
+
+    def _add(self, product_id, fields):
+        weights = defaultdict(float)
+        for field, text in fields.items():
+            for token in TOKEN_RE.findall(text):
+                weights[token] += FIELD_WEIGHTS[field]
+        for token, weight in weights.items():
+            self._postings[token][product_id] = weight
+        self._documents[product_id] = list(weights)
+        self._vocabulary = None
+
+    def _discard(self, product_id):
+        for token in self._documents.pop(product_id, []):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(product_id, None)
+                if not postings:
+                    del self._postings[token]
+        self._vocabulary = None
+
+    def _bump_version(self):
+        version = time.time()
+        cache.set_many({self.VERSION_KEY: version, self.SEQUENCE_KEY: 0}, None)
+        self._version = version
+        self._sequence = 0
+
+    def _matches(self, term, prefix=False):
+        """{product_id: weight} for a term, or for every token starting with it"""
+        if not prefix:
+            return self._postings.get(term, {})
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        matches = defaultdict(float)
+        position = bisect_left(self._vocabulary, term)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(term):
+            token = self._vocabulary[position]
+            # Exact hits outrank completions of the prefix
+            factor = 1.0 if token == term else 0.5
+            for product_id, weight in self._postings[token].items():
+                matches[product_id] = max(matches[product_id], weight * factor)
+            position += 1
+        return matches
+
+    def rank(self, query):
+        """[(product_id, score), ...] best first; every term must match (AND)"""
+        terms, prefix = self.query_terms(query)
+        if not terms and not prefix:
+            return []
+
+        with self._lock:
+            self._ensure_loaded()
+            total = max(len(self._documents), 1)
+            candidates = [(self._matches(term), term) for term in terms]
+            if prefix:
+                candidates.append((self._matches(prefix, prefix=True), prefix))
+
+            # Start from the rarest term to keep the intersection small
+            candidates.sort(key=lambda item: len(item[0]))
+            scores = None
+            for matches, term in candidates:
+                idf = math.log(1 + total / (len(matches) or 1))
+                if scores is None:
+                    scores = {product_id: weight * idf for product_id, weight in matches.items()}
+                else:
+                    scores = {
+                        product_id: score + matches[product_id] * idf
+                        for product_id, score in scores.items() if product_id in matches
+                    }
+                if not scores:
+                    return []
+
+        return heapq.nlargest(self.max_results, scores.items(), key=lambda item: item[1])
+
+    def search(self, queryset, query):
+        return ranked_queryset(queryset, self.rank(query))
+
+    def index_product(self, product):
+        product_id = str(product.pk)
+        fields = product_fields(product) if product.status == 'ACTIVE' else None
+        with self._lock:
+            self._ensure_loaded()
+            self._discard(product_id)
+            if fields is not None:
+                self._add(product_id, fields)
+            self._publish(product_id, fields)
+
+    def remove_product(self, product_id):
+        with self._lock:
+            self._ensure_loaded()
+            self._discard(str(product_id))
+            self._publish(str(product_id), None)
+
+    def rebuild(self, products):
+        with self._lock:
+            self._clear()
+            count = 0
+            for product in products:
+                self._add(str(product.pk), product_fields(product))
+                count += 1
+            self._loaded = True
+            self._checked_at = time.time()
+            self._bump_version()
+        return count
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (PostgresSearchBackend, SQLiteFTSSearchBackend, InMemorySearchBackend)
+}
+
+_backend = None
+
+
+def _detect_backend_name():
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend.name
+    if connection.vendor == 'sqlite' and SQLiteFTSSearchBackend.TABLE in connection.introspection.table_names():
+        return SQLiteFTSSearchBackend.name
+    return InMemorySearchBackend.name
+
+
+def get_search_backend():
+    """Backend configured in SEARCH_SETTINGS['BACKEND'] ('auto' picks the best available)"""
+    global _backend
+    if _backend is None:
+        name = get_search_settings()['BACKEND']
+        if name == 'auto':
+            name = _detect_backend_name()
+        _backend = BACKENDS[name]()
+        logger.info(f"Product search backend: {name}")
+    return _backend
+
+
+def search_products(queryset, query):
+    """Full-text filter ``queryset`` (of Product) and annotate ``search_rank``"""
+    return get_search_backend().search(queryset, query)
+
+
+def index_product(product):
+    try:
+        get_search_backend().index_product(product)
+    except Exception as e:
+        logger.error(f"Search indexing failed for product {product.pk}: {e}")
+
+
+def remove_product(product_id):
+    try:
+        get_search_backend().remove_product(product_id)
+    except Exception as e:
+        logger.error(f"Search index removal failed for product {product_id}: {e}")
+
+
+def rebuild_search_index():
+    from .models import Product
+
+    backend = get_search_backend()
+    products = Product.objects.filter(status='ACTIVE').select_related('category').iterator(chunk_size=2000)
+    if backend.name == PostgresSearchBackend.name:
+        # Inactive products must not keep a stale vector
+        Product.objects.exclude(status='ACTIVE').update(search_vector=None)
+    return backend.name, backend.rebuild(products)
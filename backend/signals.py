@@ -1,7 +1,7 @@
 
 
 # backend/signals.py
-from django.db.models.signals import post_save, pre_save, post_delete
+from django.db.models.signals import post_init, post_save, pre_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from django.core.mail import send_mail
@@ -10,6 +10,9 @@ from .models import Order, Payment, Review, Product, Notification, AdminStock
 from .utils import send_sms_notification, create_system_notification
 from django.utils import timezone
 from decimal import Decimal
+import logging
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
@@ -219,6 +222,299 @@ def product_status_change(sender, instance, **kwargs):
         except Product.DoesNotExist:
             pass
 
+@receiver(post_init, sender=Product)
+def remember_similarity_snapshot(sender, instance, **kwargs):
+    """Mémoriser les champs indexés (titre, description, catégorie...) tels que chargés"""
+    from .similarity_index import product_index_snapshot
+    
+    instance._similarity_snapshot = product_index_snapshot(instance)
+    instance._similar_products_scope = (instance.__dict__.get('category_id'), instance.__dict__.get('city'))
+
+
+@receiver(post_save, sender=Product)
+def update_product_similarity_index(sender, instance, created=False, raw=False, **kwargs):
+    """Mettre à jour l'index de similarité après création/modification/vente d'un produit"""
+    from django.db import transaction
+    from .similarity_index import product_index_snapshot, product_similarity_index
+    
+    # Les sauvegardes qui ne touchent pas les champs indexés (vues, likes...) ne coûtent rien
+    snapshot = product_index_snapshot(instance)
+    if raw or (not created and snapshot == instance._similarity_snapshot):
+        return
+    instance._similarity_snapshot = snapshot
+    
+    def apply_update():
+        try:
+            product_similarity_index.update_product(instance)
+        except Exception as e:
+            logger.error(f"Error updating similarity index for product {instance.pk}: {e}")
+    
+    transaction.on_commit(apply_update)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_similar_products_cache(sender, instance, **kwargs):
+    """Invalider les produits similaires en cache du produit modifié et de sa catégorie/ville (avant et après)"""
+    from .ai_engine import similarity_engine
+    
+    scope = (instance.__dict__.get('category_id'), instance.__dict__.get('city'))
+    scopes = {scope, getattr(instance, '_similar_products_scope', scope)}
+    instance._similar_products_scope = scope
+    similarity_engine.invalidate(instance.pk, scopes)
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_index(sender, instance, **kwargs):
+    """Indexer le produit pour la recherche plein texte (retiré s'il n'est plus actif)"""
+    from django.db import transaction
+    from .search import index_product
+    
+    transaction.on_commit(lambda: index_product(instance))
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_search_index(sender, instance, **kwargs):
+    """Retirer un produit supprimé de l'index de recherche"""
+    from django.db import transaction
+    from .search import remove_product
+    
+    product_id = instance.pk
+    transaction.on_commit(lambda: remove_product(product_id))
+
+
+@receiver(post_save, sender='backend.Category')
+def reindex_category_products(sender, instance, created, update_fields=None, **kwargs):
+    """Le nom de la catégorie fait partie du document indexé"""
+    if created or (update_fields is not None and 'name' not in update_fields):
+        return
+    
+    from django.db import transaction
+    from .search import index_product
+    
+    def apply_update():
+        for product in instance.products.filter(status='ACTIVE').select_related('category').iterator():
+            index_product(product)
+    
+    transaction.on_commit(apply_update)
+
+
+@receiver(post_save, sender='backend.UserBehavior')
+def update_cached_behavior_profile(sender, instance, created, **kwargs):
+    """Mettre à jour le profil de préférences en cache avec le nouveau comportement"""
+    if not created:
+        return
+    
+    from .ai_engine import ai_engine
+    
+    try:
+        ai_engine.record_behavior(instance)
+    except Exception as e:
+        logger.error(f"Error updating behavior profile for user {instance.user_id}: {e}")
+
+# ============= FRAGMENT CACHE INVALIDATION =============
+
+def bump_fragment_topics(*topics):
+    """Invalider les fragments en cache (page d'accueil) après validation de la transaction"""
+    from django.db import transaction
+    from .fragment_cache import bump_topics
+    
+    transaction.on_commit(lambda: bump_topics(*topics))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_fragments(sender, instance, **kwargs):
+    bump_fragment_topics('products')
+
+
+@receiver(post_save, sender=Order)
+def invalidate_order_fragments(sender, instance, **kwargs):
+    bump_fragment_topics('orders')
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_review_fragments(sender, instance, **kwargs):
+    bump_fragment_topics('reviews')
+
+
+@receiver(post_save, sender='backend.Category')
+@receiver(post_delete, sender='backend.Category')
+def invalidate_category_fragments(sender, instance, **kwargs):
+    bump_fragment_topics('categories')
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_fragments(sender, instance, created, **kwargs):
+    if created:
+        bump_fragment_topics('users')
+
+
+@receiver(post_save, sender='backend.ProductLike')
+@receiver(post_delete, sender='backend.ProductLike')
+@receiver(post_save, sender='backend.ProductComment')
+@receiver(post_delete, sender='backend.ProductComment')
+def invalidate_engagement_fragments(sender, instance, **kwargs):
+    bump_fragment_topics('engagement')
+
+
+# ============= USER BADGE COUNTERS =============
+
+def invalidate_user_badges(user_ids, *fields):
+    """Oublier les compteurs de badges en cache après validation de la transaction"""
+    from django.db import transaction
+    from .user_badges import user_badges
+    
+    transaction.on_commit(lambda: user_badges.invalidate(user_ids, *fields))
+
+
+@receiver(post_save, sender=Notification)
+@receiver(post_delete, sender=Notification)
+def invalidate_notification_badge(sender, instance, **kwargs):
+    invalidate_user_badges(instance.user_id, 'unread_notifications')
+
+
+@receiver(post_save, sender='backend.Message')
+@receiver(post_delete, sender='backend.Message')
+def invalidate_message_badges(sender, instance, **kwargs):
+    """Un message change le compteur de non-lus de l'acheteur et du vendeur de la conversation"""
+    from .models import Chat
+    
+    participants = Chat.objects.filter(pk=instance.chat_id).values_list('buyer_id', 'seller_id').first()
+    if participants:
+        invalidate_user_badges(list(participants), 'unread_messages')
+
+
+@receiver(post_save, sender='backend.Favorite')
+@receiver(post_delete, sender='backend.Favorite')
+def invalidate_favorite_badge(sender, instance, **kwargs):
+    invalidate_user_badges(instance.user_id, 'favorites')
+
+
+@receiver(post_save, sender='backend.Category')
+@receiver(post_delete, sender='backend.Category')
+def reset_cached_main_categories(sender, instance, **kwargs):
+    from .user_badges import reset_main_categories
+    
+    reset_main_categories()
+
+
+# ============= NEWSLETTER CAMPAIGN COUNTERS =============
+
+@receiver(post_init, sender='backend.NewsletterLog')
+def remember_newsletter_log_status(sender, instance, **kwargs):
+    """Mémoriser le statut chargé pour détecter les changements au save()"""
+    instance._stats_status = instance.status
+
+
+@receiver(post_save, sender='backend.NewsletterLog')
+def update_newsletter_campaign_counters(sender, instance, created, **kwargs):
+    """Déplacer le log d'un compteur matérialisé de campagne à l'autre (ouvertures, clics...)"""
+    from .newsletter_stats import record_status_change
+    
+    old_status = None if created else instance._stats_status
+    if old_status == instance.status:
+        return
+    try:
+        record_status_change(instance.campaign_id, old_status, instance.status)
+    except Exception as e:
+        logger.error(f"Error updating counters of newsletter campaign {instance.campaign_id}: {e}")
+    instance._stats_status = instance.status
+
+
+@receiver(post_delete, sender='backend.NewsletterLog')
+def decrement_newsletter_campaign_counters(sender, instance, **kwargs):
+    """Retirer un log supprimé (ex. abonné supprimé en cascade) du compteur de sa campagne"""
+    from .newsletter_stats import record_status_change
+    
+    try:
+        record_status_change(instance.campaign_id, instance._stats_status, None)
+    except Exception as e:
+        logger.error(f"Error updating counters of newsletter campaign {instance.campaign_id}: {e}")
+
+
+# ============= VISITOR CART TOTALS =============
+
+def _visitor_cart_of(item):
+    """Le panier déjà chargé de l'article (garde l'instance en mémoire à jour), sinon un panier par pk"""
+    from .models_visitor import VisitorCart
+    
+    if VisitorCart.items.field.is_cached(item):
+        return item.cart
+    return VisitorCart(pk=item.cart_id, items_count=0, items_total=Decimal('0'))
+
+
+@receiver(post_init, sender='backend.VisitorCartItem')
+def remember_visitor_cart_item_totals(sender, instance, **kwargs):
+    """Mémoriser la contribution chargée de l'article aux totaux du panier"""
+    instance._cart_totals = instance.totals_snapshot()
+
+
+@receiver(post_save, sender='backend.VisitorCartItem')
+def update_visitor_cart_totals_on_save(sender, instance, created, **kwargs):
+    """Reporter la différence de quantité/montant sur les totaux dénormalisés du panier"""
+    old_quantity, old_amount = (0, Decimal('0')) if created else instance._cart_totals
+    quantity, amount = instance.totals_snapshot()
+    _visitor_cart_of(instance).apply_totals_delta(quantity - old_quantity, amount - old_amount)
+    instance._cart_totals = (quantity, amount)
+
+
+@receiver(post_delete, sender='backend.VisitorCartItem')
+def update_visitor_cart_totals_on_delete(sender, instance, **kwargs):
+    """Retirer l'article supprimé des totaux dénormalisés du panier"""
+    quantity, amount = instance._cart_totals
+    _visitor_cart_of(instance).apply_totals_delta(-quantity, -amount)
+    instance._cart_totals = (0, Decimal('0'))
+
+
+# ============= DAILY METRICS ROLLUP =============
+
+DAILY_METRICS_SNAPSHOTS = {
+    Order: 'order_snapshot',
+    User: 'user_snapshot',
+    Payment: 'payment_snapshot',
+}
+
+
+def _daily_metrics_snapshot(instance):
+    from . import daily_metrics
+    return getattr(daily_metrics, DAILY_METRICS_SNAPSHOTS[type(instance)])(instance)
+
+
+@receiver(post_init, sender=Order)
+@receiver(post_init, sender=User)
+@receiver(post_init, sender=Payment)
+def remember_daily_metrics_snapshot(sender, instance, **kwargs):
+    """Mémoriser l'état chargé (date, statut, montant...) compté dans les métriques journalières"""
+    instance._daily_metrics = _daily_metrics_snapshot(instance)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Payment)
+def update_daily_metrics_on_save(sender, instance, created, raw=False, **kwargs):
+    """Reporter la différence entre l'état chargé et l'état enregistré sur les métriques journalières"""
+    from .daily_metrics import record_change
+    
+    if raw:
+        return
+    snapshot = _daily_metrics_snapshot(instance)
+    record_change(instance, None if created else instance._daily_metrics, snapshot)
+    instance._daily_metrics = snapshot
+
+
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Payment)
+def update_daily_metrics_on_delete(sender, instance, **kwargs):
+    """Retirer la contribution de l'objet supprimé des métriques journalières"""
+    from .daily_metrics import record_change
+    
+    record_change(instance, instance._daily_metrics, None)
+    instance._daily_metrics = None
+
+
 # ============= WALLET & COMMISSION SIGNALS =============
 
 @receiver(post_save, sender=Order)
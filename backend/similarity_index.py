@@ -0,0 +1,431 @@
+# backend/similarity_index.py
+"""
+Persisted top-K product similarity index for the recommendation engine
+Built offline, memory-mapped by every worker and updated incrementally on product saves
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+
+def get_recommendation_settings():
+    """Return the RECOMMENDATION_SETTINGS dict with defaults applied"""
+    defaults = {
+        'SIMILARITY_INDEX_DIR': os.path.join(settings.BASE_DIR, 'ml_cache', 'similarity'),
+        'SIMILARITY_TOP_K': 20,
+        'SIMILARITY_BLOCK_ELEMENTS': 16 * 1024 * 1024,
+        'SIMILARITY_RELOAD_INTERVAL': 60,
+        'SIMILARITY_OVERLAY_TIMEOUT': 60 * 60 * 24,
+        'SIMILARITY_OVERLAY_LOCK_WAIT': 5,
+        'COLLABORATIVE_MODEL_DIR': os.path.join(settings.BASE_DIR, 'ml_cache', 'collaborative'),
+        'COLLABORATIVE_HISTORY_SIZE': 50,
+    }
+    defaults.update(getattr(settings, 'RECOMMENDATION_SETTINGS', {}))
+    return defaults
+
+
+def product_document(product):
+    """Text representation of a product fed to the TF-IDF vectorizer"""
+    category_name = product.category.name if product.category_id else ''
+    return f"{product.title} {product.description} {category_name} {product.condition} {product.city}"
+
+
+def product_index_snapshot(product):
+    """Fields the index depends on, read from __dict__ (deferred fields never trigger a query)"""
+    fields = product.__dict__
+    return (fields.get('title'), fields.get('description'), fields.get('category_id'),
+            fields.get('condition'), fields.get('city'), fields.get('status') == 'ACTIVE')
+
+
+def top_k_neighbours(matrix, k, block_elements=None):
+    """
+    Compute the K most similar rows for every row of an L2-normalised sparse
+    matrix. Returns (neighbors, scores) arrays of shape N x K, padded with -1/0.
+
+    Rows are processed in blocks whose dense similarity slab holds at most
+    ``block_elements`` floats, so peak memory stays bounded whatever N is;
+    selection inside a block is a single vectorized ``argpartition``.
+    """
+    if block_elements is None:
+        block_elements = get_recommendation_settings()['SIMILARITY_BLOCK_ELEMENTS']
+
+    n_rows = matrix.shape[0]
+    neighbors = np.full((n_rows, k), -1, dtype=np.int32)
+    scores = np.zeros((n_rows, k), dtype=np.float32)
+    if n_rows < 2 or k < 1:
+        return neighbors, scores
+
+    kth = min(k, n_rows - 1)
+    block_size = max(1, min(n_rows, block_elements // n_rows))
+
+    for start in range(0, n_rows, block_size):
+        stop = min(start + block_size, n_rows)
+        # sparse @ dense is several times faster than sparse @ sparse for a
+        # result this dense; the block is then laid out one product per row
+        dense_block = matrix[start:stop].T.toarray()
+        block = np.ascontiguousarray((matrix @ dense_block).T, dtype=np.float32)
+        rows = np.arange(stop - start)
+
+        # A product is never its own neighbour
+        block[rows, rows + start] = -np.inf
+
+        top = np.argpartition(block, n_rows - kth, axis=1)[:, n_rows - kth:]
+        top_scores = block[rows[:, None], top]
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        # Zero similarity means "no shared term": not a neighbour
+        empty = top_scores <= 0
+        top[empty] = -1
+        top_scores[empty] = 0
+
+        neighbors[start:stop, :kth] = top
+        scores[start:stop, :kth] = top_scores
+
+    return neighbors, scores
+
+
+class NeighbourIndex:
+    """
+    On-disk, memory-mapped top-K neighbour lists keyed by sorted string ids.
+    Subclasses decide how the lists are computed and may persist extra arrays.
+    """
+
+    name = 'neighbour index'
+
+    def __init__(self, path):
+        config = get_recommendation_settings()
+        self.path = str(path)
+        self.k = config['SIMILARITY_TOP_K']
+        self.reload_interval = config['SIMILARITY_RELOAD_INTERVAL']
+        self._lock = threading.Lock()
+        self._state = None
+        self._meta_mtime = None
+        self._checked_at = 0
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _save_array(self, name, array):
+        tmp_name = self._file(name + '.tmp')
+        with open(tmp_name, 'wb') as handle:
+            np.save(handle, array)
+        os.replace(tmp_name, self._file(name))
+
+    def _save(self, ids, neighbors, scores, k, started, **extra_meta):
+        """Persist the neighbour arrays; meta.json is written last so readers only switch once everything is in place"""
+        os.makedirs(self.path, exist_ok=True)
+        self._save_array('ids.npy', ids)
+        self._save_array('neighbors.npy', neighbors)
+        self._save_array('scores.npy', scores)
+
+        meta = {
+            'version': str(int(time.time() * 1000)),
+            'k': k,
+            'size': len(ids),
+            'built_at': time.time(),
+            'duration': time.time() - started,
+        }
+        meta.update(extra_meta)
+        with open(self._file('meta.json.tmp'), 'w') as handle:
+            json.dump(meta, handle)
+        os.replace(self._file('meta.json.tmp'), self._file('meta.json'))
+
+        with self._lock:
+            self._state = None
+            self._meta_mtime = None
+            self._checked_at = 0
+
+        logger.info(f"{self.name.capitalize()} built: {len(ids)} products, k={k} in {meta['duration']:.2f}s")
+        return meta
+
+    @staticmethod
+    def _sorted_order(product_ids):
+        """Rows must be sorted by id so lookups can use a binary search"""
+        return np.argsort(np.array(product_ids))
+
+    # ------------------------------------------------------------------
+    # Load
+    # ------------------------------------------------------------------
+    def _load(self):
+        """Return the memory-mapped index, reloading it when a rebuild happened"""
+        now = time.time()
+        if now - self._checked_at < self.reload_interval:
+            return self._state
+
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.stat(self._file('meta.json')).st_mtime
+            except OSError:
+                self._state = None
+                return None
+
+            if self._state is not None and mtime == self._meta_mtime:
+                return self._state
+
+            try:
+                with open(self._file('meta.json')) as handle:
+                    meta = json.load(handle)
+                state = {
+                    'meta': meta,
+                    'ids': np.load(self._file('ids.npy'), mmap_mode='r'),
+                    'neighbors': np.load(self._file('neighbors.npy'), mmap_mode='r'),
+                    'scores': np.load(self._file('scores.npy'), mmap_mode='r'),
+                }
+                self._load_extra(state)
+                self._state = state
+                self._meta_mtime = mtime
+            except Exception as e:
+                logger.error(f"Error loading {self.name} from {self.path}: {e}")
+                self._state = None
+
+            return self._state
+
+    def _load_extra(self, state):
+        """Hook for subclasses persisting more than the neighbour lists"""
+
+    def is_available(self):
+        return self._load() is not None
+
+    def _row(self, state, product_id):
+        ids = state['ids']
+        row = int(np.searchsorted(ids, product_id))
+        if row < len(ids) and ids[row] == product_id:
+            return row
+        return None
+
+    # ------------------------------------------------------------------
+    # Query
+    # ------------------------------------------------------------------
+    def _stored_neighbours(self, state, product_id, limit):
+        row = self._row(state, product_id)
+        if row is None:
+            return []
+
+        ids = state['ids']
+        neighbours = []
+        for column, score in zip(state['neighbors'][row], state['scores'][row]):
+            if column < 0 or len(neighbours) >= limit:
+                break
+            neighbours.append((str(ids[column]), float(score)))
+        return neighbours
+
+    def get_neighbours(self, product_id, limit=None):
+        """
+        Return [(product_id, score), ...] for the nearest neighbours of a
+        product, best first. O(K) work: a binary search plus one row read.
+        """
+        state = self._load()
+        if state is None:
+            return []
+        return self._stored_neighbours(state, str(product_id), limit or state['meta']['k'])
+
+
+class ProductSimilarityIndex(NeighbourIndex):
+    """Content (TF-IDF) neighbour index with a cache-backed incremental overlay"""
+
+    name = 'similarity index'
+    OVERLAY_KEY = 'similarity_index:{version}:{product_id}'
+    OVERLAY_LOCK_KEY = 'similarity_index:{version}:lock'
+
+    def __init__(self, path=None):
+        config = get_recommendation_settings()
+        super().__init__(path or config['SIMILARITY_INDEX_DIR'])
+        self.overlay_timeout = config['SIMILARITY_OVERLAY_TIMEOUT']
+        self.overlay_lock_wait = config['SIMILARITY_OVERLAY_LOCK_WAIT']
+
+    # ------------------------------------------------------------------
+    # Build
+    # ------------------------------------------------------------------
+    def build(self, k=None):
+        """Rebuild the whole index from the ACTIVE products and persist it"""
+        from .models import Product
+
+        products = (
+            Product.objects.filter(status='ACTIVE')
+            .select_related('category')
+            .only('id', 'title', 'description', 'condition', 'city', 'category__name')
+            .order_by('id')
+        )
+        product_ids = []
+        documents = []
+        for product in products.iterator(chunk_size=2000):
+            product_ids.append(str(product.id))
+            documents.append(product_document(product))
+
+        if not product_ids:
+            logger.info("No active products, similarity index not built")
+            return None
+
+        return self.build_from_documents(product_ids, documents, k=k)
+
+    def build_from_documents(self, product_ids, documents, k=None):
+        """Fit TF-IDF on the given documents, compute the top-K lists and persist them"""
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        import joblib
+
+        k = k or self.k
+        started = time.time()
+
+        order = self._sorted_order(product_ids)
+        ids = np.array(product_ids)[order]
+        documents = [documents[i] for i in order]
+
+        vectorizer = TfidfVectorizer(max_features=1000, stop_words='english', ngram_range=(1, 2))
+        matrix = vectorizer.fit_transform(documents).tocsr().astype(np.float32)
+        neighbors, scores = top_k_neighbours(matrix, k)
+
+        os.makedirs(self.path, exist_ok=True)
+        self._save_array('tfidf_data.npy', matrix.data)
+        self._save_array('tfidf_indices.npy', matrix.indices)
+        self._save_array('tfidf_indptr.npy', matrix.indptr)
+        joblib.dump(vectorizer, self._file('vectorizer.joblib.tmp'))
+        os.replace(self._file('vectorizer.joblib.tmp'), self._file('vectorizer.joblib'))
+
+        return self._save(ids, neighbors, scores, k, started, shape=list(matrix.shape))
+
+    # ------------------------------------------------------------------
+    # Load / query
+    # ------------------------------------------------------------------
+    def _load_extra(self, state):
+        state['matrix'] = sparse.csr_matrix(
+            (
+                np.load(self._file('tfidf_data.npy'), mmap_mode='r'),
+                np.load(self._file('tfidf_indices.npy'), mmap_mode='r'),
+                np.load(self._file('tfidf_indptr.npy'), mmap_mode='r'),
+            ),
+            shape=tuple(state['meta']['shape']),
+            copy=False,
+        )
+        state['vectorizer'] = None
+
+    def _get_vectorizer(self, state):
+        if state['vectorizer'] is None:
+            import joblib
+            state['vectorizer'] = joblib.load(self._file('vectorizer.joblib'))
+        return state['vectorizer']
+
+    def _overlay_key(self, state, product_id):
+        return self.OVERLAY_KEY.format(version=state['meta']['version'], product_id=product_id)
+
+    def get_neighbours(self, product_id, limit=None):
+        state = self._load()
+        if state is None:
+            return []
+
+        product_id = str(product_id)
+        limit = limit or state['meta']['k']
+
+        overlay = cache.get(self._overlay_key(state, product_id))
+        if overlay is not None:
+            return [tuple(item) for item in overlay[:limit]]
+
+        return self._stored_neighbours(state, product_id, limit)
+
+    # ------------------------------------------------------------------
+    # Incremental updates
+    # ------------------------------------------------------------------
+    def update_product(self, product):
+        """Apply a product creation/edit/status change to the overlay"""
+        if self._load() is None:
+            return
+        self.update_document(
+            str(product.id),
+            product_document(product) if product.status == 'ACTIVE' else None,
+        )
+
+    @contextmanager
+    def _overlay_lock(self, state):
+        """
+        Serialise overlay read/modify/write cycles across workers with a cache
+        lock. After ``overlay_lock_wait`` seconds the update goes ahead anyway:
+        a lost update only lasts until the next rebuild.
+        """
+        key = self.OVERLAY_LOCK_KEY.format(version=state['meta']['version'])
+        token = uuid.uuid4().hex
+        deadline = time.time() + self.overlay_lock_wait
+        acquired = cache.add(key, token, self.overlay_lock_wait * 2)
+        while not acquired and time.time() < deadline:
+            time.sleep(0.05)
+            acquired = cache.add(key, token, self.overlay_lock_wait * 2)
+        if not acquired:
+            logger.warning(f"Could not lock the {self.name} overlay, updating without the lock")
+        try:
+            yield
+        finally:
+            if acquired and cache.get(key) == token:
+                cache.delete(key)
+
+    def update_document(self, product_id, document):
+        """
+        Recompute the neighbours of one product, push it into the lists of the
+        products it now outranks and drop it from the lists of the products it
+        no longer resembles. ``document=None`` removes the product.
+        """
+        state = self._load()
+        if state is None:
+            return
+
+        product_id = str(product_id)
+        own_key = self._overlay_key(state, product_id)
+
+        if document is None:
+            # Lookups filter on ACTIVE products, so a sold/suspended product only
+            # needs its own neighbour list emptied until the next rebuild.
+            cache.set(own_key, [], self.overlay_timeout)
+            return
+
+        k = state['meta']['k']
+        vector = self._get_vectorizer(state).transform([document])
+        similarities = np.asarray((state['matrix'] @ vector.T).todense()).ravel()
+
+        own_row = self._row(state, product_id)
+        if own_row is not None:
+            similarities[own_row] = -1
+
+        candidates = np.flatnonzero(similarities > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-similarities[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-similarities[candidates], kind='stable')]
+
+        ids = state['ids']
+        neighbours = [(str(ids[column]), float(similarities[column])) for column in candidates]
+
+        with self._overlay_lock(state):
+            new_ids = {other_id for other_id, score in neighbours}
+            previous_ids = {other_id for other_id, score in self.get_neighbours(product_id, k)}
+            cache.set(own_key, neighbours, self.overlay_timeout)
+
+            for other_id in previous_ids - new_ids:
+                current = self.get_neighbours(other_id, k)
+                if any(item[0] == product_id for item in current):
+                    current = [item for item in current if item[0] != product_id]
+                    cache.set(self._overlay_key(state, other_id), current, self.overlay_timeout)
+
+            for other_id, score in neighbours:
+                current = [item for item in self.get_neighbours(other_id, k) if item[0] != product_id]
+                if len(current) >= k and score <= current[-1][1]:
+                    continue
+                current.append((product_id, score))
+                current.sort(key=lambda item: item[1], reverse=True)
+                cache.set(self._overlay_key(state, other_id), current[:k], self.overlay_timeout)
+
+# Global instance
+product_similarity_index = ProductSimilarityIndex()
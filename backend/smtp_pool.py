@@ -0,0 +1,200 @@
+# backend/smtp_pool.py
+"""
+Pooled SMTP transport shared by every bulk email sender
+Persistent authenticated sessions behind one pool-wide rate limit
+"""
+
+import logging
+import queue
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.utils.html import strip_tags
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SMTP_POOL_SETTINGS = {
+    'BACKEND': None,  # dotted Django email backend, defaults to EMAIL_BACKEND
+    'POOL_SIZE': 4,
+    'RATE_PER_MINUTE': 1000,  # whole pool; 0 disables rate limiting
+    'BURST': 10,  # tokens the pool may spend at once after being idle
+    'MAX_MESSAGES_PER_CONNECTION': 500,
+    'TIMEOUT': 30,
+    'CHECKOUT_TIMEOUT': 60,
+}
+
+
+def get_smtp_pool_settings():
+    config = dict(DEFAULT_SMTP_POOL_SETTINGS)
+    config.update(getattr(settings, 'SMTP_POOL_SETTINGS', {}))
+    return config
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, at most ``capacity`` stored"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take a token, possibly in advance; returns how long the caller must wait"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self):
+        if not self.rate:
+            return 0
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class PooledConnection:
+    """One persistent email backend session"""
+
+    # Session level failures only: a refused recipient is not fixed by reconnecting
+    RETRYABLE_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+
+    def __init__(self, backend, max_messages, timeout):
+        self.backend = backend
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self.connection = None
+        self.sent = 0
+        self.reconnects = 0
+
+    def open(self):
+        self.connection = get_connection(self.backend, fail_silently=False, timeout=self.timeout)
+        self.connection.open()
+        self.sent = 0
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass  # the session is being discarded anyway
+            self.connection = None
+
+    def reconnect(self):
+        self.close()
+        self.reconnects += 1
+        self.open()
+
+    def send(self, message):
+        if self.connection is None:
+            self.open()
+        elif self.max_messages and self.sent >= self.max_messages:
+            self.reconnect()
+
+        try:
+            self.connection.send_messages([message])
+        except self.RETRYABLE_ERRORS as e:
+            logger.warning(f"SMTP session lost ({e}), reconnecting")
+            self.reconnect()
+            self.connection.send_messages([message])
+        self.sent += 1
+
+
+class SMTPConnectionPool:
+    """Fixed-size pool of PooledConnection, created lazily and checked out per message"""
+
+    def __init__(self, config=None):
+        self._config = config
+        self._pool = None
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+
+    def _configure(self):
+        config = self._config or get_smtp_pool_settings()
+        self.size = max(config['POOL_SIZE'], 1)
+        self.backend = config['BACKEND'] or settings.EMAIL_BACKEND
+        self.checkout_timeout = config['CHECKOUT_TIMEOUT']
+        # Pool-wide: a lone sender gets the whole rate, concurrent ones share it
+        self.bucket = TokenBucket(config['RATE_PER_MINUTE'] / 60.0, config['BURST'])
+
+        pool = queue.LifoQueue()  # most recently used session first: idle ones time out, hot ones stay open
+        for _ in range(self.size):
+            pool.put(PooledConnection(self.backend, config['MAX_MESSAGES_PER_CONNECTION'], config['TIMEOUT']))
+        return pool
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = self._configure()
+        return self._pool
+
+    @property
+    def is_configured(self):
+        """False when SMTP is selected without credentials"""
+        self.pool
+        return not self.backend.endswith('smtp.EmailBackend') or bool(getattr(settings, 'EMAIL_HOST_USER', ''))
+
+    @contextmanager
+    def connection(self):
+        """Check out a session, once a rate limit token is available (never waiting while holding one)"""
+        pool = self.pool
+        self.bucket.acquire()
+        pooled = pool.get(timeout=self.checkout_timeout)
+        try:
+            yield pooled
+        finally:
+            pool.put(pooled)
+
+    def build_message(self, to, subject, html_content, text_content=None, from_email=None, headers=None,
+                      reply_to=None, attachments=None):
+        message = EmailMultiAlternatives(
+            subject=subject,
+            body=text_content or strip_tags(html_content),
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            to=[to] if isinstance(to, str) else list(to),
+            headers=headers or {},
+            reply_to=[reply_to] if reply_to else None,
+        )
+        message.attach_alternative(html_content, 'text/html')
+        for path in attachments or []:
+            message.attach_file(path)
+        return message
+
+    def send_message(self, message):
+        """Send a prepared EmailMessage through a pooled session; raises on failure"""
+        try:
+            with self.connection() as pooled:
+                pooled.send(message)
+        except Exception:
+            self.failed += 1
+            raise
+        self.sent += 1
+        return True
+
+    def send(self, to, subject, html_content, text_content=None, **kwargs):
+        """Build and send one email; raises on failure"""
+        return self.send_message(self.build_message(to, subject, html_content, text_content, **kwargs))
+
+    def close_all(self):
+        if self._pool is None:
+            return
+        for _ in range(self.size):
+            pooled = self.pool.get()
+            pooled.close()
+            self.pool.put(pooled)
+
+
+# Global instance
+smtp_pool = SMTPConnectionPool()
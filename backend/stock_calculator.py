@@ -7,6 +7,7 @@ from django.utils import timezone
 from datetime import datetime, timedelta
 import logging
 from .models import Product, Order, AdminStock, Category
+from .time_series import daily_buckets, series
 import math
 
 logger = logging.getLogger(__name__)
@@ -322,23 +323,19 @@ class StockCalculator:
     
     # Helper methods for calculations
     def get_daily_sales(self, product: Product, start_date: datetime, end_date: datetime) -> List[int]:
-        """Get daily sales for a product"""
+        """Get daily sales (units ordered per day, zero-filled) for a product"""
         try:
-            orders = Order.objects.filter(
-                items__product=product,
-                created_at__range=(start_date, end_date),
-                status__in=['CONFIRMED', 'PROCESSING', 'SHIPPED', 'DELIVERED']
+            buckets = daily_buckets(
+                Order.objects.filter(
+                    product=product,
+                    status__in=['CONFIRMED', 'PROCESSING', 'SHIPPED', 'DELIVERED']
+                ),
+                'created_at',
+                start=timezone.localdate(start_date),
+                end=timezone.localdate(end_date),
+                quantity=Sum('quantity'),
             )
-            
-            daily_sales = {}
-            for order in orders:
-                date = order.created_at.date()
-                quantity = order.items.filter(product=product).aggregate(
-                    total=Sum('quantity')
-                )['total'] or 0
-                daily_sales[date] = daily_sales.get(date, 0) + quantity
-            
-            return list(daily_sales.values())
+            return series(buckets, 'quantity')
             
         except Exception as e:
             logger.error(f"Error getting daily sales: {e}")
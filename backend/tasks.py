@@ -17,12 +17,14 @@ from django.core.mail import send_mail, send_mass_mail
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.contrib.auth import get_user_model
-import yagmail
 import logging
 import time
 from datetime import datetime, timedelta
 from typing import List, Dict, Any
 
+from .newsletter_templates import compile_template, subscriber_variables
+from .smtp_pool import smtp_pool
+
 # Setup logging
 logger = logging.getLogger(__name__)
 
@@ -32,27 +34,7 @@ logger = logging.getLogger(__name__)
 User = get_user_model()
 
 class EmailService:
-    """Enhanced email service for bulk operations"""
-    
-    def __init__(self):
-        self.yag = None
-        self.setup_yagmail()
-    
-    def setup_yagmail(self):
-        """Setup yagmail with configuration"""
-        try:
-            self.yag = yagmail.SMTP(
-                user=settings.EMAIL_HOST_USER,
-                password=settings.EMAIL_HOST_PASSWORD,
-                host=settings.EMAIL_HOST,
-                port=settings.EMAIL_PORT,
-                smtp_starttls=settings.EMAIL_USE_TLS,
-                smtp_ssl=settings.EMAIL_USE_SSL
-            )
-            logger.info("Yagmail setup successful")
-        except Exception as e:
-            logger.error(f"Error setting up yagmail: {e}")
-            self.yag = None
+    """Enhanced email service for bulk operations (sends through the shared SMTP pool)"""
     
     def send_email_batch(self, email_batch: List[Dict[str, Any]]) -> Dict[str, int]:
         """Send a batch of emails"""
@@ -66,9 +48,6 @@ class EmailService:
                 else:
                     failed += 1
                 
-                # Small delay to avoid overwhelming SMTP server
-                time.sleep(0.1)
-                
             except Exception as e:
                 logger.error(f"Error sending email to {email_data.get('to_email')}: {e}")
                 failed += 1
@@ -80,23 +59,13 @@ class EmailService:
         }
     
     def send_single_email(self, to_email: str, subject: str, html_content: str, text_content: str = None) -> bool:
-        """Send single email"""
+        """Send single email through a pooled, rate-limited SMTP session"""
         try:
-            if not self.yag:
-                self.setup_yagmail()
-            
-            if not self.yag:
-                logger.error("Yagmail not initialized, falling back to Django send_mail")
-                return self._fallback_send_email(to_email, subject, html_content, text_content)
-            
-            contents = [html_content]
-            if text_content:
-                contents.insert(0, text_content)
-            
-            self.yag.send(
+            smtp_pool.send(
                 to=to_email,
                 subject=subject,
-                contents=contents
+                html_content=html_content,
+                text_content=text_content
             )
             
             logger.info(f"Email sent successfully to {to_email}")
@@ -187,19 +156,19 @@ def send_newsletter_task(self, newsletter_id: int):
         total_sent = 0
         total_failed = 0
         
+        # Parsed and CSS-inlined once, then filled per subscriber
+        html_template = compile_template(newsletter_data['html_content'], html=True)
+        subject_template = compile_template(newsletter_data['subject'])
+        
         for batch_index, batch in enumerate(batches):
             logger.info(f"Processing batch {batch_index + 1}/{len(batches)} for newsletter {newsletter_id}")
             
             # Prepare email data for batch
             email_batch = []
             for subscriber in batch:
-                personalized_content = newsletter_data['html_content'].format(
-                    name=getattr(subscriber, 'name', 'Subscriber'),
-                    email=getattr(subscriber, 'email', '')
-                )
-                personalized_subject = newsletter_data['subject'].format(
-                    name=getattr(subscriber, 'name', 'Subscriber')
-                )
+                variables = subscriber_variables(subscriber)
+                personalized_content = html_template.render(variables)
+                personalized_subject = subject_template.render(variables)
                 
                 email_batch.append({
                     'to_email': getattr(subscriber, 'email'),
@@ -267,9 +236,6 @@ def send_bulk_notification_task(self, notification_data: Dict[str, Any], recipie
                 else:
                     failed += 1
                 
-                # Small delay
-                time.sleep(0.2)
-                
             except Exception as e:
                 logger.error(f"Error sending notification to {recipient.email}: {e}")
                 failed += 1
@@ -403,4 +369,110 @@ def test_email_configuration(self):
             
     except Exception as e:
         logger.error(f"Error in email configuration test: {e}")
-        raise self.retry(countdown=60)
\ No newline at end of file
+        raise self.retry(countdown=60)
+
+
+@shared_task
+def rebuild_similarity_index_task(k: int = None):
+    """Rebuild the persisted product similarity index used by the recommendation engine"""
+    from .similarity_index import product_similarity_index
+    
+    try:
+        meta = product_similarity_index.build(k=k)
+        if not meta:
+            return "No active products"
+        return f"Similarity index built for {meta['size']} products (k={meta['k']})"
+        
+    except Exception as e:
+        logger.error(f"Error rebuilding similarity index: {e}")
+        return "Similarity index rebuild failed"
+
+@shared_task
+def rebuild_collaborative_model_task(k: int = None):
+    """Rebuild the item-item collaborative filtering model from recorded behaviors"""
+    from .collaborative_filtering import collaborative_model
+    
+    try:
+        meta = collaborative_model.build(k=k)
+        if not meta:
+            return "No behaviors recorded"
+        return f"Collaborative model built for {meta['size']} products ({meta['actors']} users/sessions)"
+        
+    except Exception as e:
+        logger.error(f"Error rebuilding collaborative model: {e}")
+        return "Collaborative model rebuild failed"
+
+@shared_task
+def flush_view_counts_task():
+    """Flush buffered product views to products.views_count (schedule every minute)"""
+    from .view_counter import view_counter
+    
+    try:
+        flushed = view_counter.flush()
+        return f"{flushed} product views flushed"
+        
+    except Exception as e:
+        logger.error(f"Error flushing product view counts: {e}")
+        return "Product view flush failed"
+
+
+@shared_task
+def resume_newsletter_campaigns_task():
+    """Resume newsletter campaigns interrupted mid-send (schedule every few minutes)"""
+    from .newsletter_dispatch import resume_stale_campaigns
+    
+    try:
+        resumed = resume_stale_campaigns()
+        return f"{len(resumed)} newsletter campaigns resumed"
+        
+    except Exception as e:
+        logger.error(f"Error resuming newsletter campaigns: {e}")
+        return "Newsletter campaign resume failed"
+
+
+@shared_task
+def render_receipt_pdfs_task(receipt_ids=None, workers=None):
+    """Render visitor QR receipts to PDF files in a process pool (default: receipts without a PDF yet)"""
+    from .models_visitor import QRReceipt
+    from .receipts import store_receipt_pdfs
+    
+    try:
+        if receipt_ids is None:
+            receipt_ids = list(QRReceipt.objects.filter(receipt_pdf='').values_list('id', flat=True)[:500])
+        rendered = store_receipt_pdfs(receipt_ids, workers=workers)
+        return f"{rendered} receipts rendered"
+        
+    except Exception as e:
+        logger.error(f"Error rendering receipt PDFs: {e}")
+        return "Receipt rendering failed"
+
+
+@shared_task
+def export_job_task(job_id):
+    """Write the file of a queued admin export (see backend/exports.py)"""
+    from .exports import run_export_job
+    
+    try:
+        job = run_export_job(job_id)
+        if job['status'] != 'done':
+            return f"Export {job_id} failed"
+        return f"Export {job_id}: {job['rows']} rows"
+        
+    except Exception as e:
+        logger.error(f"Error running export job {job_id}: {e}")
+        return "Export job failed"
+
+
+@shared_task
+def rebuild_daily_metrics_task(days=3):
+    """Rebuild the last days of the DailyMetrics rollup (schedule nightly, repairs bulk updates)"""
+    from .daily_metrics import rebuild
+    
+    try:
+        today = timezone.localdate()
+        rows = rebuild(today - timedelta(days=days - 1), today)
+        return f"{rows} daily metrics rows rebuilt for {days} days"
+        
+    except Exception as e:
+        logger.error(f"Error rebuilding daily metrics: {e}")
+        return "Daily metrics rebuild failed"
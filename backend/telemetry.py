@@ -0,0 +1,403 @@
+# backend/telemetry.py
+"""
+Request-level performance telemetry exposed in the Prometheus text format
+Latency, query and cache statistics per URL route, merged across workers through the cache
+"""
+
+import hmac
+import logging
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import BaseCache
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TELEMETRY_SETTINGS = {
+    'ENABLED': True,
+    'LATENCY_BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),  # seconds
+    'QUERY_BUCKETS': (0, 1, 2, 5, 10, 20, 50, 100, 200),  # queries per request
+    'PUBLISH_INTERVAL': 15,  # seconds between snapshots published to the cache, None: this process only
+    'WORKER_TTL': 120,  # seconds a silent worker's snapshot is still merged
+    'METRICS_TOKEN': '',  # bearer token accepted by the metrics endpoint (staff sessions always are)
+}
+
+WORKERS_KEY = 'telemetry:workers'
+WORKER_KEY = 'telemetry:worker:{worker}'
+SEPARATOR = '\x1f'  # joins label values into JSON-friendly keys
+
+# name: (help, label names, bucket setting or None for counters)
+METRICS = {
+    'vgk_http_requests_total': ('HTTP requests served', ('route', 'method', 'status'), None),
+    'vgk_http_request_duration_seconds': ('HTTP request latency', ('route',), 'LATENCY_BUCKETS'),
+    'vgk_db_queries_per_request': ('Database queries per HTTP request', ('route',), 'QUERY_BUCKETS'),
+    'vgk_db_queries_total': ('Database queries', ('route',), None),
+    'vgk_db_query_seconds_total': ('Time spent in database queries', ('route',), None),
+    'vgk_cache_requests_total': ('Default cache lookups', ('route', 'result'), None),
+    'vgk_function_duration_seconds': ('Latency of @monitor_performance functions', ('function',), 'LATENCY_BUCKETS'),
+    'vgk_function_db_queries_total': ('Database queries of @monitor_performance functions', ('function',), None),
+}
+
+
+def get_telemetry_settings():
+    config = dict(DEFAULT_TELEMETRY_SETTINGS)
+    performance = getattr(settings, 'PERFORMANCE_SETTINGS', {})
+    config['SLOW_REQUEST_THRESHOLD'] = performance.get('SLOW_QUERY_THRESHOLD', 1.0)
+    config['MAX_QUERIES_PER_REQUEST'] = performance.get('MAX_QUERIES_PER_REQUEST', 20)
+    config.update(getattr(settings, 'TELEMETRY_SETTINGS', {}))
+    return config
+
+
+class RequestStats:
+    """Database and cache activity of the request (or function) being measured on this thread"""
+
+    __slots__ = ('queries', 'db_time', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+
+_MISS = object()
+
+
+def instrument_cache(backend):
+    """Count hits and misses of ``backend.get``/``get_many`` (once per backend instance)"""
+    if getattr(backend, '_telemetry_instrumented', False):
+        return backend
+    get, get_many = backend.get, backend.get_many
+
+    def instrumented_get(key, default=None, *args, **kwargs):
+        value = get(key, _MISS, *args, **kwargs)
+        telemetry.count_cache(value is not _MISS)
+        return default if value is _MISS else value
+
+    def instrumented_get_many(keys, *args, **kwargs):
+        keys = list(keys)
+        values = get_many(keys, *args, **kwargs)
+        telemetry.count_cache(True, len(values))
+        telemetry.count_cache(False, len(keys) - len(values))
+        return values
+
+    backend.get = instrumented_get
+    if type(backend).get_many is not BaseCache.get_many:
+        # The default get_many loops over get(), already counted
+        backend.get_many = instrumented_get_many
+    backend._telemetry_instrumented = True
+    return backend
+
+
+def route_of(request):
+    """URL pattern that served ``request`` (bounded label), 'unmatched' for 404s before resolution"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return '/' + match.route if match.route else (match.view_name or 'unmatched')
+
+
+def _merge(target, snapshot):
+    for key, value in snapshot['counters'].items():
+        target['counters'][key] = target['counters'].get(key, 0) + value
+    for key, values in snapshot['histograms'].items():
+        merged = target['histograms'].get(key)
+        if merged is None or len(merged) != len(values):
+            target['histograms'][key] = list(values)
+        else:
+            target['histograms'][key] = [a + b for a, b in zip(merged, values)]
+    return target
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def quantile(q, buckets, counts):
+    """Estimate a quantile from non-cumulative bucket counts (last one: +Inf), like histogram_quantile"""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    for index, count in enumerate(counts):
+        if cumulative + count >= rank and count:
+            if index == len(buckets):
+                return buckets[-1]  # beyond the largest bound
+            lower = buckets[index - 1] if index else 0
+            return lower + (buckets[index] - lower) * (rank - cumulative) / count
+        cumulative += count
+    return buckets[-1]
+
+
+class Telemetry:
+    """Per-process registry of counters and histograms, sharded per thread"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._config = None
+        self._published_at = 0.0
+
+    @property
+    def config(self):
+        if self._config is None:
+            self._config = get_telemetry_settings()
+        return self._config
+
+    @property
+    def enabled(self):
+        return self.config['ENABLED']
+
+    @property
+    def worker(self):
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    # ============ RECORDING ============
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {'counters': {}, 'histograms': {}}
+            self._shards.append(shard)  # list.append is atomic: no lock
+        return shard
+
+    def inc(self, name, labels, value=1):
+        counters = self._shard()['counters']
+        key = name + SEPARATOR + SEPARATOR.join(labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        buckets = self.config[METRICS[name][2]]
+        histograms = self._shard()['histograms']
+        key = name + SEPARATOR + SEPARATOR.join(labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            # bucket counts (the last one is +Inf), sum, count
+            histogram = histograms[key] = [0] * (len(buckets) + 3)
+        histogram[bisect_left(buckets, value)] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+    def current(self):
+        """RequestStats of the measurement running on this thread, if any"""
+        return getattr(self._local, 'stats', None)
+
+    def count_cache(self, hit, count=1):
+        # Lookups outside a measurement (publishing, tasks) are not attributed to any route
+        stats = self.current()
+        if stats is None:
+            return
+        if hit:
+            stats.cache_hits += count
+        else:
+            stats.cache_misses += count
+
+    def measure(self, stats=None):
+        """Context manager collecting database activity into ``stats`` (a fresh RequestStats by default)"""
+        return _Measurement(self, stats)
+
+    def record_request(self, route, method, status, duration, stats=None):
+        stats = stats or RequestStats()
+        self.inc('vgk_http_requests_total', (route, method, f'{str(status)[:1]}xx'))
+        self.observe('vgk_http_request_duration_seconds', (route,), duration)
+        self.observe('vgk_db_queries_per_request', (route,), stats.queries)
+        if stats.queries:
+            self.inc('vgk_db_queries_total', (route,), stats.queries)
+            self.inc('vgk_db_query_seconds_total', (route,), stats.db_time)
+        if stats.cache_hits:
+            self.inc('vgk_cache_requests_total', (route, 'hit'), stats.cache_hits)
+        if stats.cache_misses:
+            self.inc('vgk_cache_requests_total', (route, 'miss'), stats.cache_misses)
+
+        if duration > self.config['SLOW_REQUEST_THRESHOLD']:
+            logger.warning(f"Slow request: {method} {route} took {duration:.2f}s "
+                           f"with {stats.queries} queries ({stats.db_time:.2f}s in database)")
+        elif stats.queries > self.config['MAX_QUERIES_PER_REQUEST']:
+            logger.warning(f"High query count: {method} {route} made {stats.queries} queries in {duration:.2f}s")
+
+    def record_function(self, name, duration, stats):
+        self.observe('vgk_function_duration_seconds', (name,), duration)
+        if stats.queries:
+            self.inc('vgk_function_db_queries_total', (name,), stats.queries)
+
+    # ============ AGGREGATION ============
+
+    def snapshot(self):
+        """Merged shards of this process"""
+        merged = {'counters': {}, 'histograms': {}}
+        for shard in list(self._shards):
+            # dict()/list() copies are atomic under the GIL, writers never wait
+            _merge(merged, {
+                'counters': dict(shard['counters']),
+                'histograms': {key: list(values) for key, values in dict(shard['histograms']).items()},
+            })
+        return merged
+
+    def maybe_publish(self):
+        interval = self.config['PUBLISH_INTERVAL']
+        if interval is None or time.monotonic() - self._published_at < interval:
+            return
+        self.publish()
+
+    def publish(self):
+        """Store this worker's snapshot in the cache for the metrics endpoint of any worker"""
+        self._published_at = time.monotonic()
+        worker = self.worker
+        try:
+            cache.set(WORKER_KEY.format(worker=worker), self.snapshot(), self.config['WORKER_TTL'])
+            workers = cache.get(WORKERS_KEY) or {}
+            now = time.time()
+            workers = {name: seen for name, seen in workers.items() if now - seen < self.config['WORKER_TTL']}
+            workers[worker] = now
+            # Racy between workers, but every worker re-registers each interval
+            cache.set(WORKERS_KEY, workers, None)
+        except Exception as e:
+            logger.error(f"Error publishing telemetry snapshot: {e}")
+
+    def collect(self):
+        """Snapshot of every live worker (this one read live)"""
+        merged = self.snapshot()
+        if self.config['PUBLISH_INTERVAL'] is None:
+            return merged
+        try:
+            worker = self.worker
+            others = [name for name in (cache.get(WORKERS_KEY) or {}) if name != worker]
+            snapshots = cache.get_many([WORKER_KEY.format(worker=name) for name in others])
+            for snapshot in snapshots.values():
+                _merge(merged, snapshot)
+        except Exception as e:
+            logger.error(f"Error collecting telemetry snapshots: {e}")
+        return merged
+
+    def reset(self):
+        for shard in list(self._shards):
+            shard['counters'].clear()
+            shard['histograms'].clear()
+
+    # ============ EXPOSITION ============
+
+    def render_prometheus(self, snapshot=None):
+        snapshot = snapshot or self.collect()
+        series = {}
+        for kind in ('counters', 'histograms'):
+            for key, value in snapshot[kind].items():
+                name, *labels = key.split(SEPARATOR)
+                if name in METRICS:
+                    series.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, (description, label_names, buckets_setting) in METRICS.items():
+            if name not in series:
+                continue
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {"histogram" if buckets_setting else "counter"}')
+            for labels, value in sorted(series[name]):
+                if buckets_setting is None:
+                    lines.append(f'{name}{_labels(label_names, labels)} {_number(value)}')
+                    continue
+                bounds = [_number(bound) for bound in self.config[buckets_setting]] + ['+Inf']
+                cumulative = 0
+                for bound, count in zip(bounds, value[:-2]):
+                    cumulative += count
+                    le = 'le="%s"' % bound
+                    lines.append(f'{name}_bucket{_labels(label_names, labels, le)} {cumulative}')
+                lines.append(f'{name}_sum{_labels(label_names, labels)} {_number(value[-2])}')
+                lines.append(f'{name}_count{_labels(label_names, labels)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+    def report(self, route=None, snapshot=None):
+        """{route: requests, p50/p95/p99 latency, average queries and database time}"""
+        snapshot = snapshot or self.collect()
+        latency_buckets = self.config['LATENCY_BUCKETS']
+        counters = snapshot['counters']
+        routes = {}
+        for key, histogram in snapshot['histograms'].items():
+            name, *labels = key.split(SEPARATOR)
+            if name != 'vgk_http_request_duration_seconds' or (route is not None and labels[0] != route):
+                continue
+            count = histogram[-1]
+            queries = counters.get(f'vgk_db_queries_total{SEPARATOR}{labels[0]}', 0)
+            db_time = counters.get(f'vgk_db_query_seconds_total{SEPARATOR}{labels[0]}', 0.0)
+            routes[labels[0]] = {
+                'request_count': count,
+                'avg_duration': histogram[-2] / count if count else 0,
+                'p50': quantile(0.5, latency_buckets, histogram[:-2]),
+                'p95': quantile(0.95, latency_buckets, histogram[:-2]),
+                'p99': quantile(0.99, latency_buckets, histogram[:-2]),
+                'avg_queries': queries / count if count else 0,
+                'avg_db_time': db_time / count if count else 0,
+            }
+        if route is not None:
+            return routes.get(route)
+        return routes
+
+
+class _Measurement:
+    """Installs a RequestStats as this thread's execute wrapper on every database connection"""
+
+    def __init__(self, telemetry, stats=None):
+        self.telemetry = telemetry
+        self.stats = stats if stats is not None else RequestStats()
+        self._stack = None
+        self._previous = None
+
+    def __enter__(self):
+        local = self.telemetry._local
+        self._previous = getattr(local, 'stats', None)
+        local.stats = self.stats
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self.stats))
+        return self.stats
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+        self.telemetry._local.stats = self._previous
+        if self._previous is not None:
+            # Nested measurement (function inside a request): the outer execute
+            # wrapper saw the queries, cache lookups only reach the current stats
+            self._previous.cache_hits += self.stats.cache_hits
+            self._previous.cache_misses += self.stats.cache_misses
+        return False
+
+
+def is_authorized(request):
+    """Staff session, or the METRICS_TOKEN bearer token (for the Prometheus scraper)"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated and user.is_staff:
+        return True
+    token = telemetry.config['METRICS_TOKEN']
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and hmac.compare_digest(header, f'Bearer {token}')
+
+
+# Global instance
+telemetry = Telemetry()
@@ -1,3 +1,1736 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import re
+import shutil
+import smtplib
+import tempfile
+import threading
+import time
+from unittest import mock
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+from types import SimpleNamespace
 
-# Create your tests here.
+import numpy as np
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db.models import Case, ExpressionWrapper, Q, Value
+from django.db.models.expressions import CombinedExpression
+from django.db.models.signals import post_delete, post_save
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from scipy import sparse
+
+from .ai_engine import AIRecommendationEngine, ProductSimilarityEngine
+from .behavior_pipeline import BehaviorPipeline, MemoryEventQueue, RedisEventStream
+from .collaborative_filtering import CollaborativeFilteringModel
+from .middleware import APIThrottleMiddleware, PerformanceMonitoringMiddleware, SecurityMiddleware
+from .exports import EXPORTS, Export, UsersExport, as_datetime, get_export_job, iter_csv, start_export_job, write_xlsx
+from .daily_metrics import order_snapshot, rebuild, record_change, user_snapshot
+from .dropbox_storage import DropboxError, DropboxStorage, DropboxStorageService
+from .fragment_cache import bump_topics, get_fragment
+from .newsletter_dispatch import CampaignDispatcher, SendLogBuffer, iter_keyset_chunks, record_dispatch_failure, write_send_logs
+from .newsletter_stats import STATUS_FIELDS, get_campaigns_stats, record_status_change, summarize
+from .models_visitor import VisitorCart, VisitorCartItem
+from .newsletter_templates import _compile, compile_template
+from .product_cards import annotate_product_cards, get_visitor_flags
+from .query_profiler import QueryProfile, QueryProfiler, fingerprint
+from .rate_limit import MemoryRateLimitBackend, RateLimiter, RedisRateLimitBackend
+from .receipts import ReceiptPage, iter_receipt_pdf, qr_matrix, qr_modules, render_receipts
+from .search import InMemorySearchBackend, fold
+from .smtp_pool import PooledConnection, SMTPConnectionPool, TokenBucket, get_smtp_pool_settings
+from .telemetry import Telemetry, instrument_cache, quantile, telemetry
+from .time_series import daily_buckets, day_range, series
+from .user_badges import CacheBadgeStore, RequestBadges, UserBadgeCounters
+from .view_counter import MemoryViewBuffer, ViewCounter
+from .similarity_index import ProductSimilarityIndex, top_k_neighbours
+
+
+class TopKNeighboursTests(SimpleTestCase):
+
+    def test_matches_dense_brute_force_with_small_blocks(self):
+        rng = np.random.default_rng(0)
+        matrix = sparse.random(60, 40, density=0.2, format='csr', random_state=1, dtype=np.float32)
+        norms = np.sqrt(matrix.multiply(matrix).sum(axis=1)).A.ravel()
+        norms[norms == 0] = 1
+        matrix = sparse.diags(1 / norms) @ matrix
+
+        neighbors, scores = top_k_neighbours(matrix.tocsr(), 5, block_elements=7 * 60)
+
+        dense = (matrix @ matrix.T).toarray()
+        np.fill_diagonal(dense, -np.inf)
+        for row in rng.choice(60, 10, replace=False):
+            expected = np.sort(dense[row])[::-1][:5]
+            expected = expected[expected > 0]
+            np.testing.assert_allclose(scores[row][:len(expected)], expected, rtol=1e-5)
+            self.assertNotIn(row, neighbors[row])
+
+    def test_k_larger_than_catalog(self):
+        matrix = sparse.csr_matrix(np.array([[1, 0], [1, 0], [0, 1]], dtype=np.float32))
+
+        neighbors, scores = top_k_neighbours(matrix, 5)
+
+        self.assertEqual(neighbors.shape, (3, 5))
+        self.assertEqual(list(neighbors[0]), [1, -1, -1, -1, -1])
+        self.assertEqual(list(neighbors[2]), [-1] * 5)
+
+
+class ProductSimilarityIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.index_dir)
+        self.index = ProductSimilarityIndex(path=self.index_dir)
+        self.documents = {
+            'phone': 'samsung galaxy phone android smartphone screen',
+            'phone-case': 'samsung galaxy phone case android smartphone cover',
+            'sofa': 'leather sofa living room furniture',
+            'table': 'wooden table living room furniture',
+        }
+
+    def build(self, k=2):
+        return self.index.build_from_documents(list(self.documents), list(self.documents.values()), k=k)
+
+    def test_build_and_lookup(self):
+        meta = self.build()
+
+        self.assertEqual(meta['size'], 4)
+        neighbours = self.index.get_neighbours('phone')
+        self.assertEqual(neighbours[0][0], 'phone-case')
+        self.assertNotIn('phone', [pid for pid, score in neighbours])
+        self.assertEqual(self.index.get_neighbours('sofa')[0][0], 'table')
+
+    def test_incremental_update_reaches_existing_neighbours(self):
+        self.build()
+
+        self.index.update_document('charger', 'samsung galaxy phone charger android smartphone')
+
+        self.assertIn('phone', [pid for pid, score in self.index.get_neighbours('charger')])
+        self.assertIn('charger', [pid for pid, score in self.index.get_neighbours('phone')])
+
+    def test_edit_drops_product_from_previous_neighbours(self):
+        self.build()
+        self.assertIn('phone', [pid for pid, score in self.index.get_neighbours('phone-case')])
+
+        self.index.update_document('phone', 'oak dining table furniture')
+
+        self.assertNotIn('phone', [pid for pid, score in self.index.get_neighbours('phone-case')])
+        self.assertIn('phone', [pid for pid, score in self.index.get_neighbours('table')])
+
+    def test_removed_product_has_no_neighbours(self):
+        self.build()
+
+        self.index.update_document('phone', None)
+
+        self.assertEqual(self.index.get_neighbours('phone'), [])
+
+    def test_missing_index_returns_nothing(self):
+        self.assertFalse(self.index.is_available())
+        self.assertEqual(self.index.get_neighbours('phone'), [])
+
+    def test_only_saves_touching_indexed_fields_update_the_index(self):
+        from .models import Product
+        from .signals import update_product_similarity_index
+
+        product = Product(title='Samsung Galaxy', description='phone', status='ACTIVE', views_count=3)
+        with mock.patch('django.db.transaction.on_commit') as on_commit:
+            product.views_count = 4
+            update_product_similarity_index(Product, product, created=False)
+            self.assertFalse(on_commit.called)
+
+            product.title = 'Samsung Galaxy S21'
+            update_product_similarity_index(Product, product, created=False)
+            self.assertEqual(on_commit.call_count, 1)
+
+            product.status = 'SOLD'
+            update_product_similarity_index(Product, product, created=False)
+            self.assertEqual(on_commit.call_count, 2)
+
+
+class BehaviorProfileTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.engine = AIRecommendationEngine()
+
+    def behavior(self, action_type, category_id, price, condition='BON', city='DOUALA'):
+        product = SimpleNamespace(category_id=category_id, condition=condition, city=city, price=Decimal(price))
+        return SimpleNamespace(
+            user_id='user-1', session_id='', product_id='product', product=product, action_type=action_type,
+        )
+
+    def test_new_behavior_is_folded_into_cached_profile(self):
+        cache.set(self.engine._preferences_cache_key('user-1'), self.engine._empty_profile())
+
+        self.engine.record_behavior(self.behavior('VIEW', 'cat-a', '5000'))
+        self.engine.record_behavior(self.behavior('PURCHASE', 'cat-b', '20000', condition='NEUF'))
+
+        preferences = self.engine.analyze_user_behavior(user_id='user-1')
+        self.assertEqual(preferences['categories'].most_common(1), [('cat-b', 5)])
+        self.assertEqual(preferences['conditions'], {'BON': 1, 'NEUF': 5})
+        self.assertEqual(preferences['cities'], {'DOUALA': 6})
+        self.assertEqual(preferences['price_range'], {'min': 5000.0, 'max': 20000.0})
+
+    def test_uncached_profile_is_left_for_next_aggregation(self):
+        self.engine.record_behavior(self.behavior('VIEW', 'cat-a', '5000'))
+
+        self.assertIsNone(cache.get(self.engine._preferences_cache_key('user-1')))
+
+
+class CollaborativeFilteringModelTests(SimpleTestCase):
+
+    def setUp(self):
+        self.model_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.model_dir)
+        self.model = CollaborativeFilteringModel(path=self.model_dir)
+
+    def test_co_interacted_products_are_recommended(self):
+        meta = self.model.build_from_interactions([
+            ('u:1', 'phone', 1), ('u:1', 'case', 5),
+            ('u:2', 'phone', 3), ('u:2', 'case', 1),
+            ('s:abc', 'phone', 1), ('s:abc', 'charger', 2),
+            ('u:3', 'sofa', 5), ('u:3', 'table', 3),
+        ], k=3)
+
+        self.assertEqual(meta['size'], 5)
+        self.assertEqual(meta['actors'], 4)
+        ranked = [pid for pid, score in self.model.score({'phone': 1})]
+        self.assertEqual(ranked[:2], ['case', 'charger'])
+        self.assertNotIn('sofa', ranked)
+
+    def test_history_and_exclusions_are_not_recommended(self):
+        self.model.build_from_interactions([
+            ('u:1', 'phone', 1), ('u:1', 'case', 1), ('u:1', 'charger', 1),
+        ], k=3)
+
+        ranked = [pid for pid, score in self.model.score({'phone': 2}, exclude=['case'])]
+
+        self.assertEqual(ranked, ['charger'])
+
+    def test_unbuilt_model_scores_nothing(self):
+        self.assertEqual(self.model.score({'phone': 1}), [])
+
+
+class ProductSimilarityEngineTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.engine = ProductSimilarityEngine()
+        self.product = SimpleNamespace(id='p1', category_id='cat', condition='BON', city='DOUALA',
+                                       price=Decimal('10000'), seller_id='seller')
+
+    def rank(self):
+        with mock.patch('backend.models.Product.objects') as objects:
+            objects.only.return_value.get.return_value = self.product
+            candidates = objects.filter.return_value.exclude.return_value
+            candidates.annotate.return_value.order_by.return_value.values_list.return_value = ['p2', 'p3']
+            ids = self.engine._rank_similar_product_ids('p1', 12)
+        return ids, objects, candidates
+
+    def when_clauses(self, expression):
+        if isinstance(expression, ExpressionWrapper):
+            return self.when_clauses(expression.expression)
+        if isinstance(expression, CombinedExpression):
+            return self.when_clauses(expression.lhs) + self.when_clauses(expression.rhs)
+        if isinstance(expression, Case):
+            return list(expression.cases)
+        return []
+
+    def lookups(self, q):
+        for child in q.children:
+            if isinstance(child, Q):
+                yield from self.lookups(child)
+            else:
+                yield child
+
+    def test_case_weights_match_the_python_scoring(self):
+        ids, objects, candidates = self.rank()
+
+        self.assertEqual(ids, ['p2', 'p3'])
+        score = candidates.annotate.call_args.kwargs['similarity_score']
+        whens = {tuple(self.lookups(when.condition)): when.result for when in self.when_clauses(score)}
+        weights = {lookups: result.value for lookups, result in whens.items() if isinstance(result, Value)}
+        self.assertEqual(weights, {
+            (('category_id', 'cat'),): 3.0,
+            (('condition', 'BON'),): 2.0,
+            (('city', 'DOUALA'),): 1.0,
+            (('seller_id', 'seller'),): 1.0,
+        })
+        price_result = [result for result in whens.values() if not isinstance(result, Value)]
+        self.assertEqual(len(price_result), 1)
+        self.assertIn('Value(2.0)', repr(price_result[0]))
+        candidates.annotate.return_value.order_by.assert_called_once_with('-similarity_score', '-views_count')
+
+    def test_product_itself_is_excluded(self):
+        ids, objects, candidates = self.rank()
+
+        objects.filter.return_value.exclude.assert_called_once_with(id='p1')
+        self.assertEqual(objects.filter.call_args.kwargs, {'status': 'ACTIVE'})
+
+    def test_price_window_is_thirty_percent(self):
+        ids, objects, candidates = self.rank()
+
+        candidate_filter = dict(self.lookups(objects.filter.call_args.args[0]))
+        self.assertAlmostEqual(candidate_filter['price__gte'], 7000.0)
+        self.assertAlmostEqual(candidate_filter['price__lte'], 13000.0)
+
+        # Same bounds as |p1 - p2| / max(p1, p2) < 0.3
+        score = candidates.annotate.call_args.kwargs['similarity_score']
+        price_when = [when for when in self.when_clauses(score) if not isinstance(when.result, Value)][0]
+        window = dict(self.lookups(price_when.condition))
+        self.assertAlmostEqual(window['price__gt'], 7000.0)
+        self.assertAlmostEqual(window['price__lt'], 10000 / 0.7)
+
+    def test_cached_ids_are_refiltered_on_active_status(self):
+        cache.set(self.engine.SCOPE_KEY.format(product_id='p1'), ('cat', 'DOUALA'))
+        cache.set(self.engine._cache_key('p1'), {'limit': 12, 'ids': ['p2', 'p3', 'p4']})
+
+        with mock.patch('backend.models.Product.objects') as objects:
+            objects.filter.return_value.select_related.return_value = [
+                SimpleNamespace(id='p4'), SimpleNamespace(id='p2'),
+            ]
+            products = self.engine.get_similar_products('p1', limit=3)
+
+        self.assertFalse(objects.only.called)
+        objects.filter.assert_called_once_with(id__in=['p2', 'p3', 'p4'], status='ACTIVE')
+        self.assertEqual([product.id for product in products], ['p2', 'p4'])
+
+    def test_save_in_same_category_or_city_invalidates_cached_lists(self):
+        cache.set(self.engine.SCOPE_KEY.format(product_id='p1'), ('cat', 'DOUALA'))
+        key = self.engine._cache_key('p1')
+
+        self.engine.invalidate('p9', {('other', 'YAOUNDE')})
+        self.assertEqual(self.engine._cache_key('p1'), key)
+
+        self.engine.invalidate('p9', {('other', 'DOUALA')})
+        self.assertNotEqual(self.engine._cache_key('p1'), key)
+
+
+def insert_product(product):
+    """
+    INSERT a Product with SQL: the products table still has NOT NULL columns
+    from 0001_initial (is_premium, is_approved, rejection_reason) that the
+    model no longer declares, so Product.objects.create() cannot fill them.
+    """
+    from django.db import connection
+
+    fields = product._meta.local_concrete_fields
+    columns = [field.column for field in fields] + ['is_premium', 'is_approved', 'rejection_reason']
+    values = [field.get_db_prep_save(field.pre_save(product, True), connection) for field in fields] + [False, True, '']
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {connection.ops.quote_name(product._meta.db_table)} "
+            f"({', '.join(connection.ops.quote_name(column) for column in columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(values))})",
+            values,
+        )
+    return product
+
+
+class ProductSimilarityRankingQueryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        from .models import Category, Product, User
+
+        seller = User.objects.create_user('seller', 'seller@example.com', 'x', phone='690000001')
+        other_seller = User.objects.create_user('other', 'other@example.com', 'x', phone='690000002')
+        phones = Category.objects.create(name='Phones', slug='phones')
+        sofas = Category.objects.create(name='Sofas', slug='sofas')
+
+        def product(slug, category, condition, city, price, owner=seller, status='ACTIVE'):
+            return insert_product(Product(
+                title=slug, slug=slug, description=slug, category=category, seller=owner,
+                condition=condition, city=city, price=Decimal(price), status=status,
+            ))
+
+        cls.reference = product('reference', phones, 'BON', 'DOUALA', '10000')
+        # 3 + 2 + 1 + 1 + 2 * (1 - 1000 / 11000)
+        cls.twin = product('twin', phones, 'BON', 'DOUALA', '11000')
+        # 2 + 2 * (1 - 1000 / 10000)
+        cls.same_condition = product('same-condition', sofas, 'BON', 'YAOUNDE', '9000', other_seller)
+        # 3, price outside the window
+        cls.same_category = product('same-category', phones, 'NEUF', 'YAOUNDE', '50000', other_seller)
+        product('unrelated', sofas, 'NEUF', 'GAROUA', '100000', other_seller)
+        product('sold-twin', phones, 'BON', 'DOUALA', '10000', status='SOLD')
+
+    def test_candidates_are_ranked_by_weighted_score(self):
+        ids = ProductSimilarityEngine()._rank_similar_product_ids(self.reference.id, 12)
+
+        self.assertEqual(ids, [str(self.twin.id), str(self.same_condition.id), str(self.same_category.id)])
+
+    def test_unknown_product_ranks_nothing(self):
+        self.assertIsNone(ProductSimilarityEngine()._rank_similar_product_ids(self.same_category.id.hex[::-1], 12))
+
+
+class InMemorySearchBackendTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.products = [
+            self.product('phone', 'Téléphone Samsung Galaxy', 'Écran intact', 'Électronique'),
+            self.product('case', 'Coque de protection', 'Pour téléphone samsung', 'Électronique'),
+            self.product('sofa', 'Canapé en cuir', 'Salon trois places', 'Maison'),
+        ]
+        self.backend = InMemorySearchBackend(loader=lambda: self.products)
+
+    def product(self, pk, title, description, category, status='ACTIVE'):
+        return SimpleNamespace(
+            pk=pk, title=title, description=description, city='DOUALA', status=status,
+            category=SimpleNamespace(name=category),
+        )
+
+    def ranked(self, query):
+        return [pid for pid, score in self.backend.rank(query)]
+
+    def test_fold_strips_french_accents(self):
+        self.assertEqual(fold('Téléphone Œuvre à Noël'), 'telephone oeuvre a noel')
+
+    def test_accent_insensitive_match_ranks_title_first(self):
+        self.assertEqual(self.ranked('telephone'), ['phone', 'case'])
+        self.assertEqual(self.ranked('CANAPÉ'), ['sofa'])
+
+    def test_all_terms_required_and_last_term_is_prefix(self):
+        self.assertEqual(self.ranked('samsung ecr'), ['phone'])
+        self.assertEqual(self.ranked('samsung cuir'), [])
+
+    def test_index_updates_and_removals(self):
+        self.backend.index_product(self.product('sofa', 'Canapé vendu', '', 'Maison', status='SOLD'))
+        self.backend.index_product(self.product('chair', 'Chaise en cuir', '', 'Maison'))
+
+        self.assertEqual(self.ranked('cuir'), ['chair'])
+
+        self.backend.remove_product('chair')
+        self.assertEqual(self.ranked('cuir'), [])
+
+    def test_other_workers_replay_changes_without_reloading(self):
+        loads = []
+
+        def loader():
+            loads.append(1)
+            return list(self.products)
+
+        writer = InMemorySearchBackend(loader=loader)
+        reader = InMemorySearchBackend(loader=loader)
+        writer.reload_interval = reader.reload_interval = 0
+        self.assertEqual([pid for pid, score in reader.rank('cuir')], ['sofa'])
+
+        writer.index_product(self.product('chair', 'Chaise en cuir', '', 'Maison'))
+        writer.remove_product('sofa')
+
+        self.assertEqual([pid for pid, score in reader.rank('cuir')], ['chair'])
+        self.assertEqual(len(loads), 2)
+
+        writer.rebuild(self.products)
+        self.assertEqual([pid for pid, score in reader.rank('cuir')], ['sofa'])
+        self.assertEqual(len(loads), 3)
+
+
+class ProductSearchViewTests(TestCase):
+
+    def test_search_without_matches_renders_an_empty_list(self):
+        response = self.client.get('/products/', {'q': 'zzzzqq'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['products']), [])
+
+    def test_query_without_search_terms_renders_an_empty_list(self):
+        response = self.client.get('/products/', {'q': '!!'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['products']), [])
+
+
+class ProductCardAnnotationTests(SimpleTestCase):
+
+    def setUp(self):
+        self.objects = {}
+        for model in ('ProductLike', 'ProductComment', 'VisitorFavorite', 'VisitorCartItem', 'VisitorCompare'):
+            patcher = mock.patch(f'backend.product_cards.{model}.objects')
+            self.objects[model] = patcher.start()
+            self.addCleanup(patcher.stop)
+
+        likes = self.objects['ProductLike'].filter.return_value.values_list.return_value
+        likes.annotate.return_value.order_by.return_value = [(1, 'LIKE', 4), (1, 'DISLIKE', 1)]
+        comments = self.objects['ProductComment'].filter.return_value.filter.return_value
+        comments.values_list.return_value.annotate.return_value.order_by.return_value = [(1, 2)]
+
+    def union(self, rows=()):
+        favorites = self.objects['VisitorFavorite'].filter.return_value.filter.return_value
+        tagged = favorites.annotate.return_value.values_list.return_value.order_by.return_value
+        tagged.union.return_value = list(rows)
+        return tagged.union
+
+    def queries(self):
+        """Evaluated querysets: the grouped counts plus the visitor UNION"""
+        return (self.objects['ProductLike'].filter.call_count
+                + self.objects['ProductComment'].filter.call_count
+                + self.union().call_count)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self.union()
+        counts = []
+        for size in (1, 40):
+            for objects in self.objects.values():
+                objects.reset_mock(return_value=False)
+            products = annotate_product_cards([SimpleNamespace(id=i) for i in range(1, size + 1)], 'session')
+            self.assertEqual(len(products), size)
+            counts.append(self.queries())
+
+        self.assertEqual(counts, [3, 3])
+        self.assertEqual((products[0].likes_count, products[0].dislikes_count, products[0].comments_count), (4, 1, 2))
+        self.assertEqual((products[1].likes_count, products[1].comments_count), (0, 0))
+
+    def test_union_rows_set_each_flag(self):
+        union = self.union([(1, 'favorite'), (1, 'cart'), (2, 'compare')])
+
+        products = annotate_product_cards([SimpleNamespace(id=1), SimpleNamespace(id=2), SimpleNamespace(id=3)], 'abc')
+
+        self.assertEqual(union.call_count, 1)
+        self.assertTrue(union.call_args.kwargs['all'])
+        flags = [(p.is_favorited, p.is_in_cart, p.is_comparing) for p in products]
+        self.assertEqual(flags, [(True, True, False), (False, False, True), (False, False, False)])
+        self.objects['VisitorFavorite'].filter.assert_called_once_with(session_key='abc')
+        self.objects['VisitorCartItem'].filter.assert_called_once_with(cart__session_key='abc')
+        self.objects['VisitorCompare'].filter.assert_called_once_with(session_key='abc')
+
+    def test_no_session_means_no_flags(self):
+        self.assertEqual(get_visitor_flags(None, [1, 2]), {})
+
+        products = annotate_product_cards([SimpleNamespace(id=1)])
+
+        self.assertFalse(self.objects['VisitorFavorite'].filter.called)
+        self.assertEqual((products[0].is_favorited, products[0].is_in_cart, products[0].is_comparing),
+                         (False, False, False))
+
+    def test_listings_count_top_level_comments_only(self):
+        annotate_product_cards([SimpleNamespace(id=1)])
+
+        self.objects['ProductComment'].filter.return_value.filter.assert_called_once_with(parent=None)
+
+
+class FragmentCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.builds = []
+
+    def fragment(self, name, topics):
+        def build():
+            self.builds.append(name)
+            return [name, len(self.builds)]
+        return get_fragment(name, build, topics)
+
+    def test_fragment_is_built_once_per_topic_version(self):
+        first = self.fragment('featured', ['products'])
+        second = self.fragment('featured', ['products'])
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.builds, ['featured'])
+
+    def test_bumping_a_topic_only_rebuilds_dependent_fragments(self):
+        self.fragment('featured', ['products', 'engagement'])
+        self.fragment('testimonials', ['reviews'])
+
+        bump_topics('engagement')
+        self.fragment('featured', ['products', 'engagement'])
+        self.fragment('testimonials', ['reviews'])
+
+        self.assertEqual(self.builds, ['featured', 'testimonials', 'featured'])
+
+
+class ViewCounterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.counter = ViewCounter()
+        self.counter._buffer = MemoryViewBuffer()
+        self.counter.flush_interval = 3600
+        self.counter.max_pending = 1000
+
+    def test_views_are_buffered_and_flushed_grouped_by_increment(self):
+        for product_id in ['a', 'a', 'b', 'c', 'c']:
+            self.counter.record_view(product_id)
+
+        self.assertEqual(self.counter.pending_views('a'), 2)
+        with mock.patch('backend.view_counter.apply_view_increments', return_value=5) as apply:
+            self.assertEqual(self.counter.flush(), 5)
+
+        apply.assert_called_once_with({'a': 2, 'b': 1, 'c': 2})
+        self.assertEqual(self.counter.pending_views('a'), 0)
+
+    def test_failed_flush_keeps_increments(self):
+        self.counter.record_view('a')
+
+        with mock.patch('backend.view_counter.apply_view_increments', side_effect=Exception('db down')):
+            self.assertEqual(self.counter.flush(), 0)
+
+        self.assertEqual(self.counter.pending_views('a'), 1)
+
+    def test_full_buffer_triggers_flush(self):
+        self.counter.max_pending = 2
+        with mock.patch('backend.view_counter.apply_view_increments', return_value=2) as apply:
+            self.counter.record_view('a')
+            self.counter.record_view('b')
+
+        apply.assert_called_once_with({'a': 1, 'b': 1})
+
+
+class BehaviorPipelineTests(SimpleTestCase):
+    BROWSER = 'Mozilla/5.0 (Linux; Android 13) AppleWebKit/537.36 Chrome/120.0 Mobile Safari/537.36'
+
+    def setUp(self):
+        self.pipeline = BehaviorPipeline()
+        self.pipeline._configure()
+        self.pipeline._queue = MemoryEventQueue(maxsize=2)
+        self.pipeline.consumer_thread = False
+
+    def test_bots_are_filtered_and_actions_sampled(self):
+        self.assertTrue(self.pipeline.should_track('VIEW', self.BROWSER))
+        self.assertFalse(self.pipeline.should_track('VIEW', 'Googlebot/2.1 (+http://www.google.com/bot.html)'))
+        self.assertFalse(self.pipeline.should_track('VIEW', ''))
+
+        self.pipeline.sample_rates = {'VIEW': 0}
+        self.assertFalse(self.pipeline.should_track('VIEW', self.BROWSER))
+        self.assertTrue(self.pipeline.should_track('SEARCH', self.BROWSER))
+
+    def test_full_queue_drops_events_instead_of_blocking(self):
+        for _ in range(3):
+            self.pipeline.publish(user_id='u', action_type='VIEW', product_slug='phone')
+
+        self.assertEqual(self.pipeline.queue.size(), 2)
+        self.assertEqual(self.pipeline.dropped, 1)
+
+    def test_drain_persists_events_in_batches(self):
+        self.pipeline.batch_size = 1
+        self.pipeline.publish(user_id='u', action_type='VIEW', product_slug='phone')
+        self.pipeline.publish(user_id='u', action_type='SEARCH', metadata={'search_query': 'sofa'})
+
+        with mock.patch('backend.behavior_pipeline.persist_events', side_effect=len) as persist:
+            self.assertEqual(self.pipeline.drain(), 2)
+
+        self.assertEqual(persist.call_count, 2)
+        self.assertEqual(persist.call_args_list[0].args[0][0]['product_slug'], 'phone')
+        self.assertEqual(self.pipeline.persisted, 2)
+
+
+class FakeStreamClient:
+    """Consumer group semantics of a Redis stream, with a controllable clock (ms)"""
+
+    def __init__(self):
+        self.now = 0
+        self.entries = {}
+        self.pending = {}
+        self.delivered = set()
+        self.streams = {}
+
+    def xgroup_create(self, *args, **kwargs):
+        pass
+
+    def xadd(self, name, fields, maxlen=None, approximate=True):
+        if name != RedisEventStream.STREAM:
+            self.streams.setdefault(name, []).append(fields)
+            return None
+        entry_id = f'{len(self.entries) + len(self.delivered) + 1}-0'
+        self.entries[entry_id] = fields
+        return entry_id
+
+    def deliver(self, entry_id, consumer):
+        times = self.pending.get(entry_id, {}).get('times_delivered', 0) + 1
+        self.pending[entry_id] = {'message_id': entry_id, 'consumer': consumer,
+                                  'delivered_at': self.now, 'times_delivered': times}
+        self.delivered.add(entry_id)
+
+    def xreadgroup(self, group, consumer, streams, count, block):
+        new = [entry_id for entry_id in self.entries if entry_id not in self.delivered][:count]
+        for entry_id in new:
+            self.deliver(entry_id, consumer)
+        return [[RedisEventStream.STREAM, [(entry_id, self.entries[entry_id]) for entry_id in new]]] if new else []
+
+    def xpending_range(self, name, groupname, min, max, count, consumername=None, idle=None):
+        return [dict(item) for item in self.pending.values() if self.now - item['delivered_at'] >= idle][:count]
+
+    def xclaim(self, name, groupname, consumername, min_idle_time, message_ids):
+        for entry_id in message_ids:
+            self.deliver(entry_id, consumername)
+        return [(entry_id, self.entries.get(entry_id)) for entry_id in message_ids]
+
+    def xack(self, name, group, *ids):
+        for entry_id in ids:
+            self.pending.pop(entry_id, None)
+
+    def xdel(self, name, *ids):
+        for entry_id in ids:
+            self.entries.pop(entry_id, None)
+
+    def xlen(self, name):
+        return len(self.entries)
+
+
+class RedisEventStreamTests(SimpleTestCase):
+
+    def setUp(self):
+        self.client = FakeStreamClient()
+        self.stream = RedisEventStream(self.client, maxlen=1000, claim_idle_time=60, max_deliveries=3)
+        self.pipeline = BehaviorPipeline()
+        self.pipeline._configure()
+        self.pipeline._queue = self.stream
+        self.pipeline.consumer_thread = False
+
+    def test_unacknowledged_events_are_redelivered_after_the_idle_time(self):
+        self.pipeline.publish(user_id='u', action_type='VIEW', product_slug='phone')
+
+        with mock.patch('backend.behavior_pipeline.persist_events', side_effect=Exception('db down')):
+            self.assertEqual(self.pipeline.consume_batch(timeout=0), 1)
+        # Still pending but not idle long enough: nothing to read
+        self.assertEqual(self.stream.get_batch(10, 0), ([], []))
+
+        self.client.now += 60000
+        with mock.patch('backend.behavior_pipeline.persist_events', side_effect=len) as persist:
+            self.assertEqual(self.pipeline.consume_batch(timeout=0), 1)
+
+        self.assertEqual(persist.call_args.args[0][0]['product_slug'], 'phone')
+        self.assertEqual((self.client.pending, self.client.entries), ({}, {}))
+
+    def test_events_delivered_too_often_are_dead_lettered(self):
+        self.pipeline.publish(user_id='u', action_type='VIEW', product_slug='phone')
+
+        with mock.patch('backend.behavior_pipeline.persist_events', side_effect=Exception('bad event')):
+            for _ in range(3):
+                self.pipeline.consume_batch(timeout=0)
+                self.client.now += 60000
+            self.assertEqual(self.pipeline.consume_batch(timeout=0), 0)
+
+        self.assertEqual(self.stream.dead_lettered, 1)
+        self.assertEqual(len(self.client.streams[RedisEventStream.DEAD_LETTER_STREAM]), 1)
+        self.assertEqual(self.client.pending, {})
+
+
+class FakeSubscriberQuerySet:
+    """Just enough of a queryset for keyset pagination"""
+
+    def __init__(self, pks):
+        self.pks = sorted(pks)
+
+    def order_by(self, *fields):
+        return self
+
+    def filter(self, pk__gt):
+        return FakeSubscriberQuerySet([pk for pk in self.pks if pk > pk__gt])
+
+    def count(self):
+        return len(self.pks)
+
+    def exists(self):
+        return bool(self.pks)
+
+    def __getitem__(self, page):
+        return [SimpleNamespace(pk=pk) for pk in self.pks[page]]
+
+
+class CampaignDispatcherTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.campaign = SimpleNamespace(
+            pk='c1', name='Promo', status='DRAFT', total_recipients=0, sent_count=0,
+            dispatch_cursor=None, dispatch_updated_at=None, sent_at=None,
+        )
+        self.subscribers = FakeSubscriberQuerySet(range(1, 8))
+        patcher = mock.patch('backend.models_newsletter.NewsletterCampaign.objects')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_keyset_chunks_resume_after_cursor(self):
+        chunks = [[s.pk for s in chunk] for chunk in iter_keyset_chunks(self.subscribers, 3, after=2)]
+
+        self.assertEqual(chunks, [[3, 4, 5], [6, 7]])
+
+    def test_interrupted_campaign_resumes_from_checkpoint(self):
+        sent_chunks = []
+
+        def crash_on_second_chunk(campaign, subscribers):
+            if sent_chunks:
+                raise RuntimeError('worker killed')
+            sent_chunks.append([s.pk for s in subscribers])
+            return len(subscribers)
+
+        with self.assertRaises(RuntimeError):
+            CampaignDispatcher(crash_on_second_chunk, chunk_size=3).dispatch(self.campaign, self.subscribers)
+
+        self.assertEqual(self.campaign.status, 'SENDING')
+        self.assertEqual((self.campaign.dispatch_cursor, self.campaign.sent_count), (3, 3))
+
+        def send(campaign, subscribers):
+            sent_chunks.append([s.pk for s in subscribers])
+            return len(subscribers)
+
+        # Subscriber 4 was mailed before the crash, the rest of its chunk was not
+        with mock.patch.object(CampaignDispatcher, '_already_sent', return_value={4}):
+            stats = CampaignDispatcher(send, chunk_size=3).dispatch(self.campaign, self.subscribers)
+
+        self.assertEqual(sent_chunks, [[1, 2, 3], [5, 6], [7]])
+        self.assertTrue(stats['resumed'])
+        self.assertEqual(stats['sent'], 3)
+        self.assertEqual((self.campaign.status, self.campaign.sent_count), ('SENT', 6))
+
+    def test_failed_send_stays_resumable_until_retries_run_out(self):
+        from .newsletter_email_service import NewsletterEmailService
+
+        sent_chunks = []
+        failing = [True]
+
+        def send(campaign, subscribers):
+            if failing[0] and sent_chunks:
+                raise smtplib.SMTPServerDisconnected('connection lost')
+            sent_chunks.append([s.pk for s in subscribers])
+            return len(subscribers)
+
+        service = SimpleNamespace(
+            _subscriber_queryset=lambda campaign, subscribers: self.subscribers, _send_chunk=send,
+        )
+        with self.settings(NEWSLETTER_SETTINGS={'DISPATCH_CHUNK_SIZE': 3, 'MAX_RETRIES': 2}):
+            NewsletterEmailService.send_campaign(service, self.campaign)
+            self.assertEqual(self.campaign.status, 'SENDING')
+
+            failing[0] = False
+            with mock.patch.object(CampaignDispatcher, '_already_sent', return_value=set()):
+                stats = NewsletterEmailService.send_campaign(service, self.campaign)
+
+        self.assertTrue(stats['resumed'])
+        self.assertEqual(sent_chunks, [[1, 2, 3], [4, 5, 6], [7]])
+        self.assertEqual((self.campaign.status, self.campaign.sent_count), ('SENT', 7))
+
+    def test_campaign_is_failed_after_max_retries_and_resumed_on_resend(self):
+        self.campaign.status = 'SENDING'
+        self.campaign.dispatch_updated_at = datetime(2026, 10, 1, tzinfo=dt_timezone.utc)
+        self.campaign.dispatch_cursor = 3
+
+        with self.settings(NEWSLETTER_SETTINGS={'MAX_RETRIES': 2}):
+            self.assertFalse(record_dispatch_failure(self.campaign))
+            self.assertTrue(record_dispatch_failure(self.campaign))
+        self.assertEqual(self.campaign.status, 'FAILED')
+
+        sent_chunks = []
+        dispatcher = CampaignDispatcher(lambda campaign, subscribers: sent_chunks.append(
+            [s.pk for s in subscribers]) or len(subscribers), chunk_size=3)
+        with mock.patch.object(CampaignDispatcher, '_already_sent', return_value=set()):
+            self.assertTrue(dispatcher.dispatch(self.campaign, self.subscribers)['resumed'])
+        self.assertEqual(sent_chunks, [[4, 5, 6], [7]])
+
+    def test_campaign_is_dispatched_by_one_worker_at_a_time(self):
+        dispatcher = CampaignDispatcher(lambda campaign, subscribers: len(subscribers), chunk_size=3)
+        token = dispatcher._acquire(self.campaign)
+
+        self.assertIsNone(dispatcher.dispatch(self.campaign, self.subscribers))
+
+        dispatcher._release(self.campaign, token)
+        self.assertEqual(dispatcher.dispatch(self.campaign, self.subscribers)['sent'], 7)
+
+
+class SendLogBufferTests(SimpleTestCase):
+
+    def setUp(self):
+        self.campaign = SimpleNamespace(pk='c1', name='Promo')
+
+    def test_results_are_written_once_per_batch(self):
+        buffer = SendLogBuffer(self.campaign, batch_size=2)
+
+        with mock.patch('backend.newsletter_dispatch.write_send_logs') as write:
+            buffer.add('s1')
+            buffer.add('s2', 'mailbox full')
+            buffer.add('s3')
+            self.assertEqual(write.call_count, 1)
+            buffer.flush()
+
+        self.assertEqual(write.call_args_list[0].args[1], [('s1', None), ('s2', 'mailbox full')])
+        self.assertEqual(write.call_args_list[1].args[1], [('s3', None)])
+        self.assertEqual((buffer.sent, buffer.failed), (2, 1))
+
+    def test_one_insert_and_one_update_per_batch(self):
+        with mock.patch('backend.models_newsletter.NewsletterLog.objects') as logs, \
+                mock.patch('backend.models_newsletter.NewsletterSubscriber.objects') as subscribers, \
+                mock.patch('backend.newsletter_stats.apply_status_deltas') as counters:
+            write_send_logs(self.campaign, [('s2', None), ('s1', None), ('s3', 'refused')])
+
+        rows = logs.bulk_create.call_args.args[0]
+        self.assertEqual([(row.subscriber_id, row.status) for row in rows], [('s2', 'SENT'), ('s1', 'SENT'), ('s3', 'FAILED')])
+        subscribers.filter.assert_called_once_with(pk__in=['s1', 's2'])
+        subscribers.filter.return_value.update.assert_called_once()
+        counters.assert_called_once_with({'c1': {'SENT': 2, 'FAILED': 1}})
+
+
+class SMTPConnectionPoolTests(SimpleTestCase):
+    LOCMEM = 'django.core.mail.backends.locmem.EmailBackend'
+
+    def make_pool(self, **overrides):
+        config = get_smtp_pool_settings()
+        config.update(dict(BACKEND=self.LOCMEM, RATE_PER_MINUTE=0), **overrides)
+        return SMTPConnectionPool(config)
+
+    def test_token_bucket_allows_burst_then_paces(self):
+        bucket = TokenBucket(rate=100, capacity=2)
+
+        with mock.patch('backend.smtp_pool.time.sleep') as sleep:
+            waits = [bucket.acquire() for _ in range(4)]
+
+        self.assertEqual(waits[:2], [0, 0])
+        self.assertAlmostEqual(waits[3], 0.02, delta=0.005)
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_sessions_are_reused_across_messages(self):
+        pool = self.make_pool(POOL_SIZE=2)
+
+        with mock.patch('backend.smtp_pool.get_connection', wraps=mail.get_connection) as connect:
+            for index in range(5):
+                pool.send(f'user{index}@example.cm', 'Bonjour', '<p>Offre</p>')
+
+        self.assertEqual(connect.call_count, 1)  # LIFO: the hot session keeps being reused
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        self.assertEqual(pool.sent, 5)
+
+    def test_lone_sender_gets_the_whole_pool_rate(self):
+        pool = self.make_pool(POOL_SIZE=4, RATE_PER_MINUTE=6000, BURST=1)
+
+        with mock.patch('backend.smtp_pool.time.sleep') as sleep:
+            for index in range(3):
+                pool.send(f'user{index}@example.cm', 'Bonjour', '<p>Offre</p>')
+
+        # 100 mails/s for the pool (third mail 20ms out), not 25/s for the one session a single thread reuses
+        self.assertEqual(pool.bucket.rate, 100)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertAlmostEqual(sleep.call_args.args[0], 0.02, delta=0.005)
+
+    def test_lost_session_is_reopened_and_message_retried(self):
+        pooled = PooledConnection(self.LOCMEM, max_messages=0, timeout=5)
+        pooled.open()
+        pooled.connection.send_messages = mock.Mock(side_effect=smtplib.SMTPServerDisconnected('gone'))
+
+        pooled.send(SMTPConnectionPool().build_message('a@example.cm', 'Bonjour', '<p>Salut</p>'))
+
+        self.assertEqual(pooled.reconnects, 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class NewsletterTemplateCompilerTests(SimpleTestCase):
+    HTML = (
+        '<html><head><style>p {{ color: red; }}</style></head>'
+        '<body><p>Bonjour {name}</p><a href="https://vgk.cm/desabonnement/?email={email}">{promo}</a></body></html>'
+    )
+
+    def test_css_is_inlined_once_and_slots_survive(self):
+        compiled = _compile(self.HTML, html=True)
+
+        html = compiled.render({'name': 'Aïcha <3', 'email': 'a@vgk.cm', 'promo': '-20%'})
+
+        self.assertIn('<p style="color:red">Bonjour Aïcha &lt;3</p>', html)
+        self.assertIn('?email=a@vgk.cm">-20%</a>', html)
+        self.assertNotIn('<style>', html)
+
+    def test_bound_template_round_trips_through_source(self):
+        compiled = _compile('Promo {promo} pour {name} {{code}}', html=False)
+
+        bound = compiled.bind({'promo': '-20%'})
+
+        self.assertEqual(bound.slots, ('name',))
+        self.assertEqual(bound.to_source(), 'Promo -20% pour {name} {{code}}')
+        self.assertEqual(compile_template(bound.to_source()).render({'name': 'Paul'}), 'Promo -20% pour Paul {code}')
+
+    def test_missing_variable_is_left_visible(self):
+        self.assertEqual(_compile('Salut {name}', html=False).render({}), 'Salut {name}')
+
+
+class NewsletterCampaignStatsTests(SimpleTestCase):
+
+    def counts(self, **values):
+        counts = dict.fromkeys(STATUS_FIELDS.values(), 0)
+        counts.update(values)
+        return counts
+
+    def test_summary_counts_opens_and_clicks_as_delivered(self):
+        stats = summarize(self.counts(sent=6, opened=2, clicked=1, unsubscribed=1, failed=1, bounced=1),
+                          SimpleNamespace(total_recipients=12))
+
+        self.assertEqual(stats['sent_count'], 10)
+        self.assertEqual(stats['opened_count'], 3)
+        self.assertEqual(stats['failed_count'], 2)
+        self.assertAlmostEqual(stats['open_rate'], 30.0)
+        self.assertAlmostEqual(stats['failure_rate'], 2 / 12 * 100)
+
+    def test_status_change_moves_one_unit_between_counters(self):
+        with mock.patch('backend.newsletter_stats.apply_status_deltas') as apply:
+            record_status_change('c1', 'SENT', 'OPENED')
+            record_status_change('c1', None, 'SENT')
+            record_status_change('c1', 'SENT', 'SENT')
+
+        self.assertEqual(apply.call_args_list[0].args[0], {'c1': {'OPENED': 1, 'SENT': -1}})
+        self.assertEqual(apply.call_args_list[1].args[0], {'c1': {'SENT': 1}})
+        self.assertEqual(apply.call_count, 2)
+
+    def test_deleted_log_is_removed_from_its_counter(self):
+        from .models_newsletter import NewsletterLog
+
+        log = NewsletterLog(campaign_id='c1', status='OPENED')
+        with mock.patch('backend.newsletter_stats.apply_status_deltas') as apply:
+            post_delete.send(sender=NewsletterLog, instance=log)
+
+        apply.assert_called_once_with({'c1': {'OPENED': -1}})
+
+    def test_removing_logs_never_creates_missing_counters(self):
+        with mock.patch('backend.models_newsletter.NewsletterCampaignStats.objects') as objects, \
+                mock.patch('backend.newsletter_stats.rebuild_campaign_stats') as rebuild:
+            objects.filter.return_value.values_list.return_value = ['c1']
+            record_status_change('c1', 'SENT', None)
+            record_status_change('c2', 'SENT', None)
+
+        self.assertEqual(objects.filter.return_value.update.call_count, 1)
+        self.assertEqual([list(call.args[0]) for call in rebuild.call_args_list], [[], []])
+
+    def test_only_campaigns_without_counters_are_aggregated(self):
+        materialized = SimpleNamespace(pk='c1', total_recipients=5, stats=SimpleNamespace(**self.counts(sent=5)))
+        missing = SimpleNamespace(pk='c2', total_recipients=3)
+
+        with mock.patch('backend.newsletter_stats._materialized_counts',
+                        side_effect=lambda campaign: self.counts(sent=5) if campaign.pk == 'c1' else None), \
+                mock.patch('backend.newsletter_stats.rebuild_campaign_stats',
+                           return_value={'c2': self.counts(sent=2, failed=1)}) as rebuild:
+            campaigns = get_campaigns_stats([materialized, missing])
+
+        rebuild.assert_called_once_with(['c2'])
+        self.assertEqual([c.campaign_stats['sent_count'] for c in campaigns], [5, 2])
+
+
+class NewsletterLogCleanupTests(SimpleTestCase):
+
+    def test_cleanup_rebuilds_counters_instead_of_updating_them_per_log(self):
+        from .models_newsletter import NewsletterLog
+        from .newsletter_email_service import NewsletterEmailService
+
+        remaining = ['l1', 'l2', 'l3']
+        old_logs = mock.Mock()
+        old_logs.values_list.side_effect = lambda *fields, **kwargs: (
+            list(remaining) if fields == ('pk',) else mock.Mock(**{'distinct.return_value.order_by.return_value': ['c1']})
+        )
+
+        def delete_batch(pk__in):
+            batch = mock.Mock()
+
+            def delete():
+                for pk in pk__in:
+                    remaining.remove(pk)
+                    post_delete.send(sender=NewsletterLog, instance=NewsletterLog(campaign_id='c1', status='SENT'))
+                return len(pk__in), {}
+            batch.delete.side_effect = delete
+            return batch
+
+        with mock.patch('backend.newsletter_email_service.NewsletterLog') as logs, \
+                mock.patch('backend.newsletter_email_service.rebuild_campaign_stats') as rebuild, \
+                mock.patch('backend.newsletter_stats.apply_status_deltas') as apply:
+            logs.objects.filter.side_effect = lambda **kwargs: delete_batch(**kwargs) if 'pk__in' in kwargs else old_logs
+            deleted = NewsletterEmailService.cleanup_old_logs(SimpleNamespace(cleanup_batch_size=2), days=90)
+
+        self.assertEqual(deleted, 3)
+        self.assertEqual(remaining, [])
+        self.assertFalse(apply.called)
+        rebuild.assert_called_once_with(['c1'])
+
+        # Outside the cleanup, deletions update the counters again
+        with mock.patch('backend.newsletter_stats.apply_status_deltas') as apply:
+            post_delete.send(sender=NewsletterLog, instance=NewsletterLog(campaign_id='c1', status='SENT'))
+        apply.assert_called_once_with({'c1': {'SENT': -1}})
+
+
+class VisitorCartTotalsTests(SimpleTestCase):
+
+    def test_item_writes_move_cached_totals_without_reading_items(self):
+        cart = VisitorCart(session_key='abc')
+        item = VisitorCartItem(cart=cart, quantity=2, unit_price=Decimal('1500'))
+
+        with mock.patch('backend.models_visitor.VisitorCart.objects') as objects:
+            post_save.send(sender=VisitorCartItem, instance=item, created=True)
+            self.assertEqual((cart.total_items, cart.total_amount), (2, Decimal('3000')))
+
+            item.quantity = 5
+            post_save.send(sender=VisitorCartItem, instance=item, created=False)
+            self.assertEqual((cart.total_items, cart.total_amount), (5, Decimal('7500')))
+
+            post_delete.send(sender=VisitorCartItem, instance=item)
+
+        self.assertTrue(cart.is_empty)
+        self.assertEqual(cart.total_amount, 0)
+        self.assertEqual(objects.filter.return_value.update.call_count, 3)
+
+    def test_saving_a_loaded_cart_never_writes_its_totals(self):
+        cart = VisitorCart(session_key='abc', items_count=3)
+        cart._state.adding = False
+
+        with mock.patch('django.db.models.Model.save') as save:
+            cart.save()
+
+        update_fields = save.call_args.kwargs['update_fields']
+        self.assertIn('visitor_name', update_fields)
+        self.assertNotIn('items_count', update_fields)
+        self.assertNotIn('items_total', update_fields)
+
+
+class UserBadgeCountersTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.counters = UserBadgeCounters()
+        self.counters._store = CacheBadgeStore(60)
+        self.counts = {'unread_notifications': 3, 'unread_messages': 1, 'favorites': 7}
+        self.counter_mocks = {field: mock.Mock(return_value=value) for field, value in self.counts.items()}
+        patcher = mock.patch.dict('backend.user_badges.COUNTERS', self.counter_mocks)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_counters_are_counted_once_then_served_from_cache(self):
+        self.assertEqual(self.counters.get_all(42), self.counts)
+        self.assertEqual(self.counters.get_all(42), self.counts)
+
+        for counter in self.counter_mocks.values():
+            counter.assert_called_once_with(42)
+
+    def test_invalidation_recounts_only_the_dropped_counter(self):
+        self.counters.get_all(42)
+        self.counters.invalidate([42, 43], 'favorites')
+        self.counters.get_all(42)
+
+        self.assertEqual(self.counter_mocks['favorites'].call_count, 2)
+        self.assertEqual(self.counter_mocks['unread_messages'].call_count, 1)
+
+    def test_request_badges_load_lazily_and_once(self):
+        with mock.patch('backend.user_badges.user_badges', self.counters):
+            badges = RequestBadges(42)
+            notifications = badges.counter('unread_notifications')
+            favorites = badges.counter('favorites')
+            self.assertEqual(self.counter_mocks['favorites'].call_count, 0)
+
+            self.assertEqual((notifications(), str(favorites)), (3, '7'))
+            favorites()
+
+        self.assertEqual(self.counter_mocks['favorites'].call_count, 1)
+
+
+class ReceiptRendererTests(SimpleTestCase):
+
+    def receipt(self, lines=3):
+        return {
+            'number': 'VGK00000042', 'date': '18/10/2026 14:30', 'name': 'Aïcha (Akwa)', 'phone': '+237600000000',
+            'email': '', 'address': 'Douala',
+            'lines': [{'title': f'Produit {index}', 'quantity': 2, 'unit_price': Decimal('2500'), 'total': Decimal('5000')}
+                      for index in range(lines)],
+            'subtotal': Decimal('5000') * lines, 'delivery': Decimal('2000'), 'total': Decimal('5000') * lines + 2000,
+            'qr_payload': '{"receipt_number": "VGK00000042"}',
+        }
+
+    def test_pdf_is_streamed_with_a_valid_cross_reference_table(self):
+        chunks = list(iter_receipt_pdf(self.receipt(lines=80)))
+        pdf = b''.join(chunks)
+
+        self.assertGreater(len(chunks), 5)
+        self.assertTrue(pdf.startswith(b'%PDF-1.4') and pdf.endswith(b'%%EOF\n'))
+        xref = int(pdf.rsplit(b'startxref\n', 1)[1].split(b'\n')[0])
+        entries = pdf[xref:].split(b'\n')[3:]
+        for number in range(1, int(pdf[xref:].split(b'\n')[1].split()[1])):
+            self.assertTrue(pdf[int(entries[number - 1][:10]):].startswith(b'%d 0 obj' % number))
+        pages = pdf.count(b'/Type /Page ')
+        self.assertGreater(pages, 1)
+        self.assertIn(b'/Count %d' % pages, pdf)
+
+    def test_qr_rectangles_cover_exactly_the_dark_modules(self):
+        rows = qr_modules('{"receipt_number": "VGK00000042"}')
+        page = ReceiptPage()
+        page.qr(rows, 0, 0, len(rows))
+
+        dark = set()
+        for op in page.ops:
+            match = re.fullmatch(rb'([\d.]+) ([\d.]+) ([\d.]+) [\d.]+ re', op)
+            if match:
+                x, y, width = (round(float(value)) for value in match.groups())
+                dark.update((len(rows) - 1 - y, column) for column in range(x, x + width))
+        expected = {(r, c) for r, row in enumerate(rows) for c, module in enumerate(row) if module == '1'}
+        self.assertEqual(dark, expected)
+
+    def test_qr_matrix_is_computed_once_per_payload(self):
+        cache.clear()
+        with mock.patch('backend.receipts.qr_modules', wraps=qr_modules) as modules:
+            first = qr_matrix('{"receipt_number": "VGK1"}')
+            second = qr_matrix('{"receipt_number": "VGK1"}')
+
+        self.assertEqual(first, second)
+        modules.assert_called_once()
+
+    def test_batch_rendering_writes_one_file_per_receipt(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        receipts = [dict(self.receipt(), number=f'VGK{index}') for index in range(3)]
+
+        paths = render_receipts(receipts, directory, workers=1)
+
+        self.assertEqual([path.rsplit('/', 1)[1] for path in paths], ['receipt_VGK0.pdf', 'receipt_VGK1.pdf', 'receipt_VGK2.pdf'])
+        with open(paths[0], 'rb') as handle:
+            self.assertTrue(handle.read().startswith(b'%PDF'))
+
+
+class LocalDropboxClient:
+    """
+    Same interface as DropboxClient on a local directory, with the upload
+    session rules that matter here (offsets must line up, chunks of a
+    concurrent session may arrive in any order).
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.sessions = {}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _path(self, path):
+        return os.path.join(self.root, path.lstrip('/'))
+
+    def _metadata(self, path):
+        with open(self._path(path), 'rb') as handle:
+            content = handle.read()
+        return {
+            'path_display': path, 'size': len(content),
+            'content_hash': hashlib.sha256(content).hexdigest(), 'rev': f'{int(time.time() * 1000):x}',
+        }
+
+    def _record(self, call):
+        with self._lock:
+            self.calls.append(call)
+
+    def upload(self, path, data):
+        self._record('upload')
+        if os.path.exists(self._path(path)):
+            raise DropboxError(f'files/upload failed: 409 - path/conflict {path}')
+        os.makedirs(os.path.dirname(self._path(path)), exist_ok=True)
+        with open(self._path(path), 'wb') as handle:
+            handle.write(data)
+        return self._metadata(path)
+
+    def start_upload_session(self):
+        self._record('start_upload_session')
+        session_id = hashlib.sha1(os.urandom(16)).hexdigest()
+        self.sessions[session_id] = {}
+        return session_id
+
+    def append_upload_session(self, session_id, offset, data, close=False):
+        self._record('append_upload_session')
+        with self._lock:
+            self.sessions[session_id][offset] = bytes(data)
+
+    def finish_upload_session(self, session_id, size, path):
+        self._record('finish_upload_session')
+        chunks = self.sessions.pop(session_id)
+        content, offset = bytearray(), 0
+        for chunk_offset in sorted(chunks):
+            if chunk_offset != offset:
+                raise DropboxError(f'upload_session/finish failed: 409 - incorrect_offset {chunk_offset}')
+            content += chunks[chunk_offset]
+            offset += len(chunks[chunk_offset])
+        if offset != size:
+            raise DropboxError(f'upload_session/finish failed: 409 - incorrect_offset {offset} != {size}')
+        return self.upload(path, bytes(content))
+
+    def download(self, path):
+        self._record('download')
+        try:
+            with open(self._path(path), 'rb') as handle:
+                return handle.read()
+        except FileNotFoundError:
+            raise DropboxError(f'files/download failed: 409 - path/not_found {path}')
+
+    def delete(self, path):
+        self._record('delete')
+        try:
+            os.remove(self._path(path))
+        except FileNotFoundError:
+            raise DropboxError(f'files/delete_v2 failed: 409 - path_lookup/not_found {path}')
+
+    def get_metadata(self, path):
+        self._record('get_metadata')
+        return self._metadata(path) if os.path.exists(self._path(path)) else None
+
+    def create_shared_link(self, path):
+        self._record('create_shared_link')
+        return f'https://www.dropbox.com/s/{hashlib.sha1(path.encode()).hexdigest()[:15]}{path}?dl=0'
+
+
+class DictStorageIndex:
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def set(self, name, **fields):
+        self.entries.setdefault(name, {}).update(fields)
+
+    def delete(self, name):
+        self.entries.pop(name, None)
+
+
+class DropboxStorageRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.client = LocalDropboxClient(os.path.join(self.root, 'dropbox'))
+        self.storage = DropboxStorage(
+            local_storage=FileSystemStorage(location=os.path.join(self.root, 'local'), base_url='/media/'),
+            client=self.client, index=DictStorageIndex(),
+            config={'CHUNKED_UPLOAD_THRESHOLD': 4096, 'CHUNK_SIZE': 1024, 'UPLOAD_WORKERS': 3, 'SHARED_URL_TTL': 3600},
+        )
+
+    def route_to_dropbox(self, enabled=True):
+        return mock.patch.object(self.storage.dropbox_service, 'should_use_dropbox', return_value=enabled)
+
+    def test_routing_decision_reads_the_database_size_once_per_interval(self):
+        service = DropboxStorageService()
+        with mock.patch.object(service, 'is_enabled', return_value=True), \
+                mock.patch.object(service, 'get_database_size_gb', return_value=0.5) as db_size:
+            for _ in range(3):
+                self.assertFalse(service.should_use_dropbox(1024))
+
+        db_size.assert_called_once()
+
+    def test_large_file_is_uploaded_in_parallel_chunks(self):
+        content = os.urandom(10 * 1024 + 17)
+
+        with self.route_to_dropbox():
+            name = self.storage.save('products/video.mp4', ContentFile(content))
+
+        self.assertEqual(self.client.calls.count('append_upload_session'), 11)
+        self.assertEqual(self.storage.open(name).read(), content)
+        self.assertEqual(self.storage.size(name), len(content))
+
+    def test_metadata_and_shared_url_are_served_from_the_index(self):
+        with self.route_to_dropbox():
+            name = self.storage.save('products/photo.jpg', ContentFile(b'jpeg'))
+        self.client.calls.clear()
+
+        first = self.storage.url(name)
+        self.assertEqual(self.storage.url(name), first)
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(self.storage.size(name), 4)
+
+        self.assertTrue(first.startswith('https://dl.dropboxusercontent.com/'))
+        self.assertEqual(self.client.calls, ['create_shared_link'])
+
+    def test_files_below_the_threshold_stay_local(self):
+        with self.route_to_dropbox(enabled=False):
+            name = self.storage.save('products/small.jpg', ContentFile(b'small'))
+
+        self.assertEqual(self.storage.url(name), '/media/products/small.jpg')
+        self.assertEqual(self.storage.open(name).read(), b'small')
+        self.assertEqual(self.client.calls, [])
+
+
+class SlidingWindowRateLimitTests(SimpleTestCase):
+
+    def test_previous_window_is_weighted_by_its_overlap(self):
+        backend = MemoryRateLimitBackend()
+        results = [backend.hit('ip', 3, 60, now=10 + second) for second in range(4)]
+
+        self.assertEqual([result.allowed for result in results], [True, True, True, False])
+        self.assertEqual(results[-1].retry_after, 47)
+        # Half of the previous window still counts: 1.5 + 1 fits, 1.5 + 2 does not
+        self.assertTrue(backend.hit('ip', 3, 60, now=90).allowed)
+        self.assertFalse(backend.hit('ip', 3, 60, now=90).allowed)
+
+    def test_memory_backend_keeps_a_bounded_number_of_keys(self):
+        backend = MemoryRateLimitBackend(max_keys=100)
+        for index in range(1000):
+            backend.hit(f'ip{index}', 10, 60)
+
+        self.assertEqual(len(backend._counters), 100)
+        self.assertIn('ip999', backend._counters)
+
+    def test_redis_reset_deletes_only_the_two_live_windows(self):
+        client = mock.Mock()
+        backend = RedisRateLimitBackend(client)
+        backend.reset('login:1.2.3.4', 3600, now=7300)
+
+        client.delete.assert_called_once_with('ratelimit:login:1.2.3.4:2', 'ratelimit:login:1.2.3.4:1')
+        client.scan_iter.assert_not_called()
+
+    def limiter(self, routes):
+        limiter = RateLimiter()
+        limiter._backend = MemoryRateLimitBackend()
+        limiter._routes = routes
+        return limiter
+
+    def test_api_middleware_applies_the_first_matching_route(self):
+        limiter = self.limiter([
+            {'prefix': '/api/newsletter/', 'limit': 1, 'window': 60},
+            {'prefix': '/api/', 'limit': 5, 'window': 60},
+        ])
+        middleware = APIThrottleMiddleware(lambda request: HttpResponse())
+        factory = RequestFactory()
+
+        with mock.patch('backend.middleware.rate_limiter', limiter):
+            first = middleware.process_request(factory.post('/api/newsletter/subscribe/', REMOTE_ADDR='1.2.3.4'))
+            blocked = middleware.process_request(factory.post('/api/newsletter/subscribe/', REMOTE_ADDR='1.2.3.4'))
+            other = middleware.process_request(factory.get('/api/dashboard-stats/', REMOTE_ADDR='1.2.3.4'))
+            page = middleware.process_request(factory.get('/produits/', REMOTE_ADDR='1.2.3.4'))
+
+        self.assertIsNone(first)
+        self.assertEqual(blocked.status_code, 429)
+        self.assertIn('Retry-After', blocked)
+        self.assertIsNone(other)
+        self.assertIsNone(page)
+
+    def test_failed_logins_block_until_a_successful_login(self):
+        limiter = self.limiter([])
+        with mock.patch('backend.middleware.rate_limiter', limiter):
+            middleware = SecurityMiddleware(lambda request: HttpResponse())
+            request = RequestFactory().post('/auth/login/', REMOTE_ADDR='5.6.7.8')
+            for _ in range(5):
+                self.assertIsNone(middleware.process_request(request))
+                middleware.process_response(request, HttpResponse(status=400))
+
+            self.assertEqual(middleware.process_request(request).status_code, 429)
+            middleware.process_response(request, HttpResponse(status=200))
+            self.assertIsNone(middleware.process_request(request))
+
+
+class ListExport(Export):
+    name = 'list'
+    title = 'Liste'
+    columns = [
+        ('Nom', 'name', None),
+        ('Montant', 'amount', None),
+        ('Date', 'created_at', lambda value: as_datetime(value, 'Jamais')),
+    ]
+
+    def __init__(self, values=()):
+        self.data = list(values)
+
+    def values(self, params, chunk_size):
+        return iter(self.data)
+
+
+class StreamingExportTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.values = [(f'Article {index}', Decimal('2500.50'), None) for index in range(5)]
+
+    def test_csv_is_streamed_in_chunks_of_rows(self):
+        chunks = list(iter_csv(ListExport(self.values), {}, chunk_size=2))
+
+        self.assertEqual(chunks[0], 'Nom,Montant,Date\r\n')
+        self.assertEqual([chunk.count('\r\n') for chunk in chunks[1:]], [2, 2, 1])
+        self.assertEqual(chunks[1].split('\r\n')[0], 'Article 0,2500.50,Jamais')
+
+    def test_xlsx_keeps_numbers_and_styles_the_header(self):
+        import openpyxl
+
+        values = self.values + [('Contrôle\x07', 3, None)]
+        output = io.BytesIO()
+        self.assertEqual(write_xlsx(ListExport(values), {}, output), 6)
+
+        sheet = openpyxl.load_workbook(io.BytesIO(output.getvalue()))['Liste']
+        self.assertTrue(sheet['A1'].font.bold)
+        self.assertEqual(sheet['B2'].value, 2500.5)
+        self.assertEqual(sheet['A7'].value, 'Contrôle')
+        self.assertEqual(sheet.max_row, 7)
+
+    def test_background_job_writes_a_downloadable_file(self):
+        from .exports import run_export_job
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with mock.patch.dict(EXPORTS, {'list': lambda: ListExport(self.values)}), \
+                mock.patch('backend.exports.default_storage', FileSystemStorage(location=directory)), \
+                mock.patch('backend.tasks.export_job_task.delay', side_effect=run_export_job):
+            job = start_export_job('list', 'csv', {'status': 'PAID'}, user_id=7)
+
+        job = get_export_job(job['id'])
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['rows'], 5)
+        self.assertEqual(job['user_id'], '7')
+        with open(os.path.join(directory, job['path']), encoding='utf-8') as exported:
+            self.assertEqual(len(exported.read().splitlines()), 6)
+
+    def test_browser_export_buttons_land_on_the_job_page(self):
+        from .exports import export_job_response, export_response
+
+        job = {'id': 'abc', 'name': 'list', 'format': 'csv', 'status': 'pending', 'rows': None, 'error': None,
+               'user_id': '7'}
+        factory = RequestFactory()
+
+        def request(path, accept, **params):
+            request = factory.get(path, params, HTTP_ACCEPT=accept)
+            request.user = SimpleNamespace(pk=7, is_superuser=False)
+            return request
+
+        with mock.patch.dict(EXPORTS, {'list': lambda: ListExport(self.values)}), \
+                mock.patch('backend.exports.start_export_job', return_value=job):
+            page = export_response(request('/export/', 'text/html,application/xhtml+xml', background='1'), 'list')
+            script = export_response(request('/export/', 'application/json', background='1'), 'list')
+
+        status_url = '/admin-panel/export/jobs/abc/'
+        self.assertEqual((page.status_code, page['Location']), (302, status_url))
+        self.assertEqual(script.status_code, 202)
+
+        with mock.patch('backend.exports.get_export_job', return_value=job), \
+                mock.patch('backend.exports.render', return_value=HttpResponse('page')) as render:
+            export_job_response(request(status_url, 'text/html'), 'abc')
+            polled = export_job_response(request(status_url, '*/*'), 'abc')
+
+        self.assertEqual(render.call_args.args[1], 'backend/admin/exports/job.html')
+        self.assertEqual(render.call_args.args[2]['job']['status_url'], status_url)
+        self.assertEqual(polled['Content-Type'], 'application/json')
+
+    def test_users_export_reads_only_its_columns(self):
+        user_ids = '0c6d3c4e-1a84-4f0b-9a53-3a3f5d7f1c11,5e0b2f1a-7b7c-4d35-8f3c-2b9e6c4d8a22'
+        queryset = UsersExport().get_queryset({'user_ids': user_ids}).values_list('email')
+        sql = str(queryset.query)
+
+        self.assertIn(' IN ', sql)
+        self.assertNotIn('password', sql)
+
+
+class DailyMetricsRollupTests(SimpleTestCase):
+
+    def setUp(self):
+        from .models import Category, Order, Product
+
+        self.product = Product(city='DOUALA', category=Category(pk='0c6d3c4e-1a84-4f0b-9a53-3a3f5d7f1c11'), source='CLIENT')
+        self.order = Order(product=self.product, status='PAID', total_amount=Decimal('10000'), payment_method='MTN_MONEY')
+        self.order.created_at = datetime(2026, 10, 18, 9, 30, tzinfo=dt_timezone.utc)
+
+    def recorded(self, instance, old, new):
+        with mock.patch('backend.daily_metrics.apply_deltas') as apply_deltas:
+            record_change(instance, old, new)
+        return apply_deltas.call_args[0][0] if apply_deltas.called else None
+
+    def test_delivery_adds_revenue_and_commission_to_every_dimension(self):
+        before = order_snapshot(self.order)
+        self.order.status = 'DELIVERED'
+
+        deltas = self.recorded(self.order, before, order_snapshot(self.order))
+
+        day = date(2026, 10, 18)
+        self.assertEqual(set(deltas), {
+            (day, 'ALL', ''), (day, 'PAYMENT_METHOD', 'MTN_MONEY'),
+            (day, 'CITY', 'DOUALA'), (day, 'CATEGORY', '0c6d3c4e-1a84-4f0b-9a53-3a3f5d7f1c11'),
+        })
+        self.assertEqual(deltas[(day, 'ALL', '')], {
+            'orders_count': 0, 'delivered_orders': 1, 'revenue': Decimal('10000'), 'commission': Decimal('800.00'),
+        })
+
+    def test_new_and_deleted_orders_count_whole_contributions(self):
+        created = self.recorded(self.order, None, order_snapshot(self.order))
+        deleted = self.recorded(self.order, order_snapshot(self.order), None)
+
+        day = date(2026, 10, 18)
+        self.assertEqual(created[(day, 'ALL', '')], {'orders_count': 1})
+        self.assertEqual(deleted[(day, 'CITY', 'DOUALA')], {'orders_count': -1})
+
+    def test_unchanged_state_writes_nothing(self):
+        self.order.notes = 'Appeler avant livraison'
+        self.assertIsNone(self.recorded(self.order, order_snapshot(self.order), order_snapshot(self.order)))
+
+    def test_moving_a_user_only_touches_city_rows(self):
+        from .models import User
+
+        user = User(user_type='CLIENT', city='DOUALA', date_joined=datetime(2026, 10, 1, 12, tzinfo=dt_timezone.utc))
+        before = user_snapshot(user)
+        user.city = 'YAOUNDE'
+
+        deltas = self.recorded(user, before, user_snapshot(user))
+
+        day = date(2026, 10, 1)
+        self.assertEqual(deltas, {
+            (day, 'CITY', 'DOUALA'): {'signups': -1, 'client_signups': -1},
+            (day, 'CITY', 'YAOUNDE'): {'signups': 1, 'client_signups': 1},
+        })
+
+    def test_rebuild_reads_sources_inside_its_transaction(self):
+        events = []
+        atomic = mock.MagicMock()
+        atomic.return_value.__enter__.side_effect = lambda: events.append('begin')
+        atomic.return_value.__exit__.side_effect = lambda *exc: events.append('commit')
+
+        with mock.patch('backend.daily_metrics.transaction.atomic', atomic), \
+                mock.patch('backend.daily_metrics.compute', side_effect=lambda *args: events.append('compute') or {}), \
+                mock.patch('backend.models.DailyMetrics.objects'):
+            rebuild(date(2026, 10, 1), date(2026, 10, 18))
+
+        self.assertEqual(events, ['begin', 'compute', 'commit'])
+
+
+class DailyBucketsTests(SimpleTestCase):
+
+    def grouped_queryset(self, rows):
+        queryset = mock.MagicMock()
+        for method in ('filter', 'annotate', 'values', 'order_by'):
+            getattr(queryset, method).return_value = queryset
+        queryset.__iter__.return_value = iter(rows)
+        return queryset
+
+    def test_missing_days_are_zero_filled_in_one_query(self):
+        queryset = self.grouped_queryset([
+            {'bucket': date(2026, 10, 16), 'orders': 3, 'revenue': Decimal('7500')},
+            {'bucket': date(2026, 10, 18), 'orders': 1, 'revenue': None},
+        ])
+
+        buckets = daily_buckets(queryset, 'created_at', days=4, end=date(2026, 10, 18),
+                                orders=mock.sentinel.count, revenue=mock.sentinel.sum)
+
+        queryset.filter.assert_called_once_with(created_at__date__gte=date(2026, 10, 15), created_at__date__lte=date(2026, 10, 18))
+        queryset.values.assert_called_once_with('bucket')
+        self.assertEqual([bucket['date'] for bucket in buckets], [date(2026, 10, day) for day in range(15, 19)])
+        self.assertEqual(series(buckets, 'orders'), [0, 3, 0, 1])
+        self.assertEqual(series(buckets, 'revenue'), [0, Decimal('7500'), 0, 0])
+
+    def test_day_range_ends_today_by_default(self):
+        with mock.patch('backend.time_series.timezone.localdate', return_value=date(2026, 10, 18)):
+            self.assertEqual(day_range(7), (date(2026, 10, 12), date(2026, 10, 18)))
+        self.assertEqual(day_range(start=date(2026, 1, 1), end=date(2026, 1, 31)), (date(2026, 1, 1), date(2026, 1, 31)))
+
+
+class TelemetryTests(SimpleTestCase):
+
+    def make_telemetry(self, **overrides):
+        registry = Telemetry()
+        registry._config = dict({
+            'ENABLED': True,
+            'LATENCY_BUCKETS': (0.1, 0.5, 1.0),
+            'QUERY_BUCKETS': (0, 5, 20),
+            'PUBLISH_INTERVAL': None,
+            'WORKER_TTL': 120,
+            'METRICS_TOKEN': '',
+            'SLOW_REQUEST_THRESHOLD': 1.0,
+            'MAX_QUERIES_PER_REQUEST': 20,
+        }, **overrides)
+        return registry
+
+    def test_quantiles_interpolate_within_buckets(self):
+        # 50 requests under 100ms, 40 between 100 and 500ms, 10 between 500ms and 1s
+        counts = [50, 40, 10, 0]
+
+        self.assertAlmostEqual(quantile(0.5, (0.1, 0.5, 1.0), counts), 0.1)
+        self.assertAlmostEqual(quantile(0.95, (0.1, 0.5, 1.0), counts), 0.75)
+        self.assertAlmostEqual(quantile(0.99, (0.1, 0.5, 1.0), counts), 0.95)
+        self.assertIsNone(quantile(0.5, (0.1, 0.5, 1.0), [0, 0, 0, 0]))
+
+    def test_prometheus_text_merges_thread_shards(self):
+        import threading
+
+        registry = self.make_telemetry()
+        registry.record_request('/products/<uuid:pk>/', 'GET', 200, 0.05)
+        worker = threading.Thread(target=registry.record_request, args=('/products/<uuid:pk>/', 'GET', 404, 0.7))
+        worker.start()
+        worker.join()
+
+        text = registry.render_prometheus()
+
+        self.assertIn('# TYPE vgk_http_request_duration_seconds histogram', text)
+        self.assertIn('vgk_http_requests_total{route="/products/<uuid:pk>/",method="GET",status="2xx"} 1', text)
+        self.assertIn('vgk_http_requests_total{route="/products/<uuid:pk>/",method="GET",status="4xx"} 1', text)
+        self.assertIn('vgk_http_request_duration_seconds_bucket{route="/products/<uuid:pk>/",le="0.1"} 1', text)
+        self.assertIn('vgk_http_request_duration_seconds_bucket{route="/products/<uuid:pk>/",le="1.0"} 2', text)
+        self.assertIn('vgk_http_request_duration_seconds_bucket{route="/products/<uuid:pk>/",le="+Inf"} 2', text)
+        self.assertIn('vgk_http_request_duration_seconds_count{route="/products/<uuid:pk>/"} 2', text)
+        self.assertEqual(registry.report('/products/<uuid:pk>/')['request_count'], 2)
+
+    def test_cache_hits_and_misses_are_counted_inside_a_measurement(self):
+        from django.core.cache.backends.locmem import LocMemCache
+
+        backend = instrument_cache(LocMemCache('telemetry-tests', {}))
+        backend.set('present', 'value')
+
+        with telemetry.measure() as stats:
+            self.assertEqual(backend.get('present'), 'value')
+            self.assertEqual(backend.get('absent', 'fallback'), 'fallback')
+            self.assertEqual(backend.get_many(['present', 'absent']), {'present': 'value'})
+
+        self.assertEqual((stats.cache_hits, stats.cache_misses), (2, 2))
+        self.assertIs(instrument_cache(backend).get, backend.get)
+
+    def test_middleware_records_route_and_status(self):
+        registry = self.make_telemetry()
+        request = RequestFactory().get('/products/42/')
+        request.resolver_match = SimpleNamespace(route='products/<int:pk>/', view_name='backend:product_detail')
+        middleware = PerformanceMonitoringMiddleware(lambda request: HttpResponse(status=201))
+
+        with mock.patch('backend.middleware.telemetry', registry):
+            response = middleware(request)
+
+        self.assertEqual(response.status_code, 201)
+        report = registry.report()
+        self.assertEqual(list(report), ['/products/<int:pk>/'])
+        self.assertEqual(report['/products/<int:pk>/']['request_count'], 1)
+
+
+class QueryProfilerTests(SimpleTestCase):
+
+    def make_profiler(self, **overrides):
+        profiler = QueryProfiler()
+        profiler._config = dict({
+            'ENABLED': True,
+            'SAMPLE_RATE': 1.0,
+            'N_PLUS_ONE_THRESHOLD': 3,
+            'SLOW_QUERY_THRESHOLD': 0.1,
+            'EXPLAIN': True,
+            'MAX_EXPLAINS_PER_REQUEST': 3,
+            'MAX_FINGERPRINTS': 100,
+            'MAX_SQL_LENGTH': 2000,
+        }, **overrides)
+        return profiler
+
+    def run_queries(self, profile, statements):
+        context = {'connection': SimpleNamespace(alias='default')}
+        for sql, params in statements:
+            profile(lambda *args: None, sql, params, False, context)
+
+    def test_fingerprint_ignores_literals_and_in_list_lengths(self):
+        first = fingerprint('SELECT * FROM "products" WHERE "products"."id" IN (%s, %s, %s) AND price > 2500')
+        second = fingerprint('SELECT *  FROM "products" WHERE "products"."id" IN (%s) AND price > 10')
+        other = fingerprint('SELECT * FROM "products" WHERE "products"."status" = \'ACTIVE\'')
+
+        self.assertEqual(first, second)
+        self.assertEqual(first[1], 'SELECT * FROM "products" WHERE "products"."id" IN (...) AND price > ?')
+        self.assertNotEqual(first[0], other[0])
+
+    def test_repeated_fingerprint_is_reported_as_n_plus_one(self):
+        profiler = self.make_profiler()
+        profile = QueryProfile()
+        self.run_queries(profile, [('SELECT * FROM "categories" WHERE "is_active"', ())] + [
+            ('SELECT COUNT(*) FROM "products" WHERE "category_id" = %s', (category,)) for category in range(8)
+        ])
+
+        profiler.record('/', profile)
+        report = profiler.report(sort='n_plus_one', snapshot=profiler.snapshot())
+
+        self.assertEqual(profile.queries, 9)
+        self.assertEqual(report[0]['sql'], 'SELECT COUNT(*) FROM "products" WHERE "category_id" = ?')
+        self.assertEqual((report[0]['calls_per_request'], report[0]['is_n_plus_one']), (8.0, True))
+        self.assertFalse(report[1]['is_n_plus_one'])
+
+    def test_slow_select_is_explained_once(self):
+        profiler = self.make_profiler()
+        slow = QueryProfile()
+        slow.queries_by_fingerprint = {
+            'a' * 16: ['SELECT * FROM "orders" WHERE "status" = ?', 1, 0.3, 0.3,
+                       ('SELECT * FROM "orders" WHERE "status" = %s', ('PENDING',), 'default')],
+        }
+
+        with mock.patch('backend.query_profiler.explain', return_value='SCAN orders') as explain:
+            profiler.record('/orders/', slow)
+            profiler.record('/orders/', slow)
+
+        explain.assert_called_once_with('SELECT * FROM "orders" WHERE "status" = %s', ('PENDING',), 'default')
+        entry = profiler.report(snapshot=profiler.snapshot())[0]
+        self.assertEqual((entry['explain'], entry['calls'], entry['sampled_requests']), ('SCAN orders', 2, 2))
@@ -0,0 +1,49 @@
+# backend/time_series.py
+"""
+Zero-filled daily time series in one grouped query
+"""
+
+from datetime import timedelta
+
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def iter_days(start, end):
+    """Every date from ``start`` to ``end`` (inclusive)"""
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+def day_range(days=None, start=None, end=None):
+    """(start, end) dates: ``days`` days ending ``end`` (default today), or explicit bounds"""
+    end = end or timezone.localdate()
+    if start is None:
+        start = end - timedelta(days=(days or 1) - 1)
+    return start, end
+
+
+def daily_buckets(queryset, date_field, days=None, start=None, end=None, **aggregates):
+    """
+    One dict per day (``date`` plus one key per aggregate) of ``queryset``
+    grouped on the local date of ``date_field``, zero-filled, oldest first.
+    """
+    start, end = day_range(days, start, end)
+    grouped = queryset.filter(**{
+        f'{date_field}__date__gte': start,
+        f'{date_field}__date__lte': end,
+    }).annotate(bucket=TruncDate(date_field)).values('bucket').annotate(**aggregates).order_by('bucket')
+
+    found = {row.pop('bucket'): row for row in grouped}
+    buckets = []
+    for day in iter_days(start, end):
+        row = found.get(day, {})
+        buckets.append(dict({name: row.get(name) or 0 for name in aggregates}, date=day))
+    return buckets
+
+
+def series(buckets, name):
+    """Values of one aggregate from ``daily_buckets`` rows"""
+    return [bucket[name] for bucket in buckets]
@@ -17,7 +17,10 @@ urlpatterns = [
     
     # Newsletter subscription
     path('api/newsletter/subscribe/', views.newsletter_subscribe, name='newsletter_subscribe'),
-    
+
+    # Prometheus scrape endpoint (staff session or METRICS_TOKEN bearer)
+    path('metrics/', views.prometheus_metrics, name='prometheus_metrics'),
+
     # Mobile API endpoints
     path('mobile/api/', include('backend.mobile.urls')),
     
@@ -25,6 +25,7 @@ urlpatterns = [
     path('users/<uuid:pk>/toggle-status/', views_admin.admin_user_toggle_status, name='user_toggle_status'),
     path('users/bulk-actions/', views_admin.AdminUserBulkActionsView.as_view(), name='user_bulk_actions'),
     path('export/users/', views_admin.admin_export_users, name='export_users'),
+    path('export/jobs/<str:job_id>/', views_admin.admin_export_job, name='export_job'),
     path('ajax/quick-action/', views_admin.admin_quick_action, name='admin_quick_action'),
     
     # ============= PRODUCT MANAGEMENT =============
@@ -0,0 +1,228 @@
+# backend/user_badges.py
+"""
+Cached user badge counters for the global template context
+Counted once per user, dropped by the signals when the underlying rows change
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_BADGES_SETTINGS = {
+    'BACKEND': 'auto',  # auto, redis, cache
+    'TIMEOUT': 60 * 60,  # safety net, invalidation is signal driven
+    'CATEGORIES_TTL': 300,  # seconds the main categories stay in process memory
+}
+
+BADGE_KEY = 'user_badges:{user_id}'
+
+
+def get_user_badges_settings():
+    config = dict(DEFAULT_USER_BADGES_SETTINGS)
+    config.update(getattr(settings, 'USER_BADGES_SETTINGS', {}))
+    return config
+
+
+def count_unread_notifications(user_id):
+    from .models import Notification
+    return Notification.objects.filter(user_id=user_id, is_read=False).count()
+
+
+def count_unread_messages(user_id):
+    from .models import Message
+    return Message.objects.filter(
+        Q(chat__buyer_id=user_id) | Q(chat__seller_id=user_id), is_read=False
+    ).exclude(sender_id=user_id).count()
+
+
+def count_favorites(user_id):
+    from .models import Favorite
+    return Favorite.objects.filter(user_id=user_id).count()
+
+
+COUNTERS = {
+    'unread_notifications': count_unread_notifications,
+    'unread_messages': count_unread_messages,
+    'favorites': count_favorites,
+}
+
+
+class CacheBadgeStore:
+    """One cache key per user and counter"""
+
+    name = 'cache'
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+
+    def _keys(self, user_id, fields):
+        return {f'{BADGE_KEY.format(user_id=user_id)}:{field}': field for field in fields}
+
+    def get(self, user_id):
+        keys = self._keys(user_id, COUNTERS)
+        return {keys[key]: value for key, value in cache.get_many(list(keys)).items()}
+
+    def set(self, user_id, values):
+        cache.set_many({key: values[field] for key, field in self._keys(user_id, values).items()}, self.timeout)
+
+    def delete(self, user_ids, fields):
+        cache.delete_many([key for user_id in user_ids for key in self._keys(user_id, fields)])
+
+
+class RedisBadgeStore:
+    """One Redis hash per user"""
+
+    name = 'redis'
+
+    def __init__(self, client, timeout):
+        self.client = client
+        self.timeout = timeout
+
+    def get(self, user_id):
+        stored = self.client.hgetall(BADGE_KEY.format(user_id=user_id))
+        return {
+            (field.decode() if isinstance(field, bytes) else field): int(value)
+            for field, value in stored.items()
+        }
+
+    def set(self, user_id, values):
+        key = BADGE_KEY.format(user_id=user_id)
+        pipeline = self.client.pipeline()
+        pipeline.hset(key, mapping=values)
+        pipeline.expire(key, self.timeout)
+        pipeline.execute()
+
+    def delete(self, user_ids, fields):
+        pipeline = self.client.pipeline()
+        for user_id in user_ids:
+            pipeline.hdel(BADGE_KEY.format(user_id=user_id), *fields)
+        pipeline.execute()
+
+
+def _redis_client():
+    try:
+        from django_redis import get_redis_connection
+    except ImportError:
+        return None
+    if 'django_redis' not in cache.__class__.__module__:
+        return None
+    try:
+        return get_redis_connection('default')
+    except Exception as e:
+        logger.warning(f"Redis unavailable for user badges, using the default cache: {e}")
+        return None
+
+
+class UserBadgeCounters:
+    """Single entry point for the cached badge counters"""
+
+    def __init__(self):
+        self._store = None
+
+    @property
+    def store(self):
+        if self._store is None:
+            config = get_user_badges_settings()
+            client = _redis_client() if config['BACKEND'] in ('auto', 'redis') else None
+            if client is not None:
+                self._store = RedisBadgeStore(client, config['TIMEOUT'])
+            else:
+                self._store = CacheBadgeStore(config['TIMEOUT'])
+        return self._store
+
+    def get_all(self, user_id):
+        """Every counter of ``user_id``, counting (and storing) only the missing ones"""
+        try:
+            values = self.store.get(user_id)
+        except Exception as e:
+            logger.error(f"Error reading badge counters of user {user_id}: {e}")
+            values = {}
+
+        missing = {field: counter(user_id) for field, counter in COUNTERS.items() if field not in values}
+        if missing:
+            try:
+                self.store.set(user_id, missing)
+            except Exception as e:
+                logger.error(f"Error caching badge counters of user {user_id}: {e}")
+            values.update(missing)
+        return values
+
+    def invalidate(self, user_ids, *fields):
+        """Drop ``fields`` (all counters by default) of one user id or a list of them"""
+        if not isinstance(user_ids, (list, tuple, set)):
+            user_ids = [user_ids]
+        user_ids = [user_id for user_id in user_ids if user_id is not None]
+        if not user_ids:
+            return
+        try:
+            self.store.delete(user_ids, fields or tuple(COUNTERS))
+        except Exception as e:
+            logger.error(f"Error invalidating badge counters of users {user_ids}: {e}")
+
+
+# Global instance
+user_badges = UserBadgeCounters()
+
+
+class RequestBadges:
+    """Counters of one user, loaded on first access and memoized for the request"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._values = None
+
+    def __getitem__(self, field):
+        if self._values is None:
+            self._values = user_badges.get_all(self.user_id)
+        return self._values[field]
+
+    def counter(self, field):
+        return BadgeCounter(self, field)
+
+
+class BadgeCounter:
+    """
+    Template value resolved on use: the template engine calls it, so pages
+    that never show the badge never load the counters.
+    """
+
+    def __init__(self, badges, field):
+        self.badges = badges
+        self.field = field
+
+    def __call__(self):
+        return self.badges[self.field]
+
+    def __int__(self):
+        return self()
+
+    def __str__(self):
+        return str(self())
+
+
+_categories = {'value': None, 'expires': 0}
+_categories_lock = threading.Lock()
+
+
+def get_main_categories():
+    """Six main categories, shared by every request of the process for CATEGORIES_TTL seconds"""
+    from .models import Category
+
+    now = time.monotonic()
+    if _categories['value'] is None or now >= _categories['expires']:
+        with _categories_lock:
+            if _categories['value'] is None or now >= _categories['expires']:
+                _categories['value'] = list(Category.objects.filter(parent=None, is_active=True).order_by('order')[:6])
+                _categories['expires'] = now + get_user_badges_settings()['CATEGORIES_TTL']
+    return _categories['value']
+
+
+def reset_main_categories():
+    """Forget the main categories of this process (other processes wait for the TTL)"""
+    _categories['value'] = None
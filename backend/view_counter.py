@@ -0,0 +1,198 @@
+# backend/view_counter.py
+"""
+Write-behind product view counter
+Views are buffered (Redis hash or per-process dict) and flushed to the database in bulk
+"""
+
+import atexit
+import logging
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VIEW_COUNTER_SETTINGS = {
+    'BACKEND': 'auto',  # auto, redis, memory
+    'FLUSH_INTERVAL': 60,
+    'MAX_PENDING': 1000,  # memory backend: flush early once this many products are buffered
+}
+
+
+def get_view_counter_settings():
+    config = dict(DEFAULT_VIEW_COUNTER_SETTINGS)
+    config.update(getattr(settings, 'VIEW_COUNTER_SETTINGS', {}))
+    return config
+
+
+def apply_view_increments(increments):
+    """Add {product_id: views} to products.views_count; one UPDATE per distinct increment"""
+    from .models import Product
+
+    by_amount = defaultdict(list)
+    for product_id, amount in increments.items():
+        if amount > 0:
+            by_amount[int(amount)].append(product_id)
+
+    for amount, product_ids in by_amount.items():
+        # Sorted ids: concurrent flushes lock rows in the same order
+        Product.objects.filter(id__in=sorted(product_ids, key=str)).update(
+            views_count=F('views_count') + amount
+        )
+    return sum(increments.values())
+
+
+class MemoryViewBuffer:
+    """Per-process increment buffer"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = Counter()
+
+    def add(self, product_id, amount=1):
+        with self._lock:
+            self._pending[str(product_id)] += amount
+            return len(self._pending)
+
+    def pending(self, product_id):
+        with self._lock:
+            return self._pending.get(str(product_id), 0)
+
+    def take(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        return pending
+
+    def restore(self, increments):
+        with self._lock:
+            self._pending.update(increments)
+
+
+class RedisViewBuffer:
+    """Shared increment buffer in a Redis hash"""
+
+    name = 'redis'
+    KEY = 'view_counter:pending'
+
+    def __init__(self, client):
+        self.client = client
+
+    def add(self, product_id, amount=1):
+        self.client.hincrby(self.KEY, str(product_id), amount)
+        return 0  # size is not tracked, flushes are time based
+
+    def pending(self, product_id):
+        return int(self.client.hget(self.KEY, str(product_id)) or 0)
+
+    def take(self):
+        flushing = f'{self.KEY}:flushing:{uuid.uuid4().hex}'
+        try:
+            self.client.rename(self.KEY, flushing)
+        except Exception:
+            # Nothing pending (or another worker just took it)
+            return Counter()
+        pending = self.client.hgetall(flushing)
+        self.client.delete(flushing)
+        return Counter({
+            (key.decode() if isinstance(key, bytes) else key): int(value)
+            for key, value in pending.items()
+        })
+
+    def restore(self, increments):
+        pipeline = self.client.pipeline()
+        for product_id, amount in increments.items():
+            pipeline.hincrby(self.KEY, product_id, amount)
+        pipeline.execute()
+
+
+def _redis_client():
+    try:
+        from django_redis import get_redis_connection
+    except ImportError:
+        return None
+    if 'django_redis' not in cache.__class__.__module__:
+        return None
+    try:
+        client = get_redis_connection('default')
+        client.ping()
+        return client
+    except Exception as e:
+        logger.warning(f"Redis unavailable for view counter, using in-process buffer: {e}")
+        return None
+
+
+class ViewCounter:
+    """Single entry point for product view counting"""
+
+    def __init__(self):
+        self._buffer = None
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.time()
+
+    @property
+    def buffer(self):
+        if self._buffer is None:
+            config = get_view_counter_settings()
+            self.flush_interval = config['FLUSH_INTERVAL']
+            self.max_pending = config['MAX_PENDING']
+            client = _redis_client() if config['BACKEND'] in ('auto', 'redis') else None
+            self._buffer = RedisViewBuffer(client) if client is not None else MemoryViewBuffer()
+        return self._buffer
+
+    def record_view(self, product_id, amount=1):
+        """Count a view; never touches the products table on the request path (except on flush)"""
+        try:
+            size = self.buffer.add(product_id, amount)
+        except Exception as e:
+            logger.error(f"Error buffering view for product {product_id}: {e}")
+            return
+        if size >= self.max_pending or time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def pending_views(self, product_id):
+        """Views recorded but not flushed yet, to display an up-to-date count"""
+        try:
+            return self.buffer.pending(product_id)
+        except Exception:
+            return 0
+
+    def get_views(self, product):
+        return product.views_count + self.pending_views(product.pk)
+
+    def flush(self):
+        """Write buffered increments to the database; returns the number of views flushed"""
+        if not self._flush_lock.acquire(blocking=False):
+            return 0
+        try:
+            self._last_flush = time.time()
+            increments = self.buffer.take()
+            if not increments:
+                return 0
+            try:
+                return apply_view_increments(increments)
+            except Exception as e:
+                logger.error(f"Error flushing {len(increments)} product view counts: {e}")
+                self.buffer.restore(increments)
+                return 0
+        finally:
+            self._flush_lock.release()
+
+
+# Global instance
+view_counter = ViewCounter()
+
+
+@atexit.register
+def _flush_at_exit():
+    if isinstance(view_counter._buffer, MemoryViewBuffer):
+        try:
+            view_counter.flush()
+        except Exception:
+            pass
@@ -12,9 +12,9 @@ from django.contrib.auth.views import LoginView, LogoutView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth import login, authenticate
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, HttpResponseForbidden
 from django.urls import reverse_lazy, reverse
-from django.db.models import Q, Count, Avg, Sum, F
+from django.db.models import Q, Count, Avg, Sum
 from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
@@ -59,6 +59,12 @@ except ImportError:
 
 # Import 2FA functions
 from .two_factor_auth import resend_2fa_code, enable_2fa_for_user, verify_2fa_code
+from .search import search_products
+from .product_cards import annotate_card_counts, annotate_visitor_flags, annotate_listing_context
+from .fragment_cache import get_fragment
+from .user_badges import user_badges
+from .view_counter import view_counter
+from .daily_metrics import daily_metrics, metric_breakdown, metric_totals
 
 # Import modular visitor views
 from .views_visitor import (
@@ -150,97 +156,81 @@ def get_cache_key(prefix, *args):
 class HomeView(TemplateView):
     template_name = 'backend/visitor/home.html'
     
+    # Session-independent fragments: (builder, topics invalidated by signals.py)
+    FRAGMENTS = {
+        'featured_products': ('build_featured_products', ['products', 'engagement']),
+        'recent_products': ('build_recent_products', ['products', 'engagement']),
+        'main_categories': ('build_main_categories', ['categories']),
+        'stats': ('build_stats', ['products', 'users', 'orders']),
+        'testimonials': ('build_testimonials', ['reviews']),
+    }
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Get or create visitor session for cart functionality
+        # Fragments partagés, servis depuis le cache
+        for name, (builder, topics) in self.FRAGMENTS.items():
+            context[name] = get_fragment(f'home_{name}', getattr(self, builder), topics, CACHE_TIMEOUT)
+        
+        # Visitor session, if any: the home page does not create sessions or carts
         session_key = self.request.session.session_key
-        if not session_key:
-            self.request.session.create()
-            session_key = self.request.session.session_key
+        visitor_cart = None
+        total_favorites = total_compares = 0
         
-        # Get visitor cart for product integration
-        visitor_cart, created = VisitorCart.objects.get_or_create(
-            session_key=session_key,
-            defaults={'session_key': session_key}
-        )
+        # Per-visitor flags layered on the cached products (one query, none without a session)
+        annotate_visitor_flags(context['featured_products'] + context['recent_products'], session_key)
+        
+        if session_key:
+            visitor_cart = VisitorCart.objects.filter(session_key=session_key).first()
+            total_favorites = VisitorFavorite.objects.filter(session_key=session_key).count()
+            total_compares = VisitorCompare.objects.filter(session_key=session_key).count()
+        
+        # Add visitor data to context
+        context.update({
+            'visitor_cart': visitor_cart,
+            'total_favorites': total_favorites,
+            'total_compares': total_compares,
+        })
         
-        # Produits en vedette
-        featured_products = Product.objects.filter(
+        return context
+    
+    def build_featured_products(self):
+        """Produits en vedette, avec compteurs likes/commentaires"""
+        products = list(Product.objects.filter(
             is_featured=True, 
             status='ACTIVE'
-        ).select_related('category', 'seller').prefetch_related('images')[:8]
-        
-        # Produits récents
-        recent_products = Product.objects.filter(
+        ).select_related('category', 'seller').prefetch_related('images')[:8])
+        # La page d'accueil compte aussi les réponses
+        return annotate_card_counts(products, top_level_only=False)
+    
+    def build_recent_products(self):
+        """Produits récents, avec compteurs likes/commentaires"""
+        products = list(Product.objects.filter(
             status='ACTIVE'
-        ).select_related('category', 'seller').prefetch_related('images').order_by('-created_at')[:12]
-        
-        # Add visitor interaction data to products
-        if session_key:
-            # Get visitor favorites
-            favorite_product_ids = set(
-                VisitorFavorite.objects.filter(session_key=session_key)
-                .values_list('product_id', flat=True)
-            )
-            
-            # Get visitor cart items
-            cart_product_ids = set(
-                visitor_cart.items.values_list('product_id', flat=True)
-            )
-            
-            # Get visitor compares
-            compare_product_ids = set(
-                VisitorCompare.objects.filter(session_key=session_key)
-                .values_list('product_id', flat=True)
-            )
-            
-            # Add flags to products
-            for product in featured_products:
-                product.is_favorited = product.id in favorite_product_ids
-                product.is_in_cart = product.id in cart_product_ids
-                product.is_comparing = product.id in compare_product_ids
-                # Get like counts
-                product.likes_count = ProductLike.objects.filter(product=product, like_type='LIKE').count()
-                product.comments_count = ProductComment.objects.filter(product=product, is_approved=True).count()
-            
-            for product in recent_products:
-                product.is_favorited = product.id in favorite_product_ids
-                product.is_in_cart = product.id in cart_product_ids
-                product.is_comparing = product.id in compare_product_ids
-                # Get like counts
-                product.likes_count = ProductLike.objects.filter(product=product, like_type='LIKE').count()
-                product.comments_count = ProductComment.objects.filter(product=product, is_approved=True).count()
-        
-        # Catégories principales
-        context['main_categories'] = Category.objects.filter(
+        ).select_related('category', 'seller').prefetch_related('images').order_by('-created_at')[:12])
+        return annotate_card_counts(products, top_level_only=False)
+    
+    def build_main_categories(self):
+        """Catégories principales"""
+        return list(Category.objects.filter(
             parent=None, 
             is_active=True
-        ).order_by('order')[:8]
-        
-        # Statistiques
-        context['stats'] = {
+        ).order_by('order')[:8])
+    
+    def build_stats(self):
+        """Statistiques"""
+        return {
             'total_products': Product.objects.filter(status='ACTIVE').count(),
             'total_users': User.objects.filter(user_type='CLIENT').count(),
             'total_orders': Order.objects.filter(status='DELIVERED').count(),
             'cities_count': len(getattr(settings, 'VGK_SETTINGS', {}).get('SUPPORTED_CITIES', ['DOUALA', 'YAOUNDE']))
         }
-        
-        # Témoignages (derniers avis 5 étoiles)
-        context['testimonials'] = Review.objects.filter(
+    
+    def build_testimonials(self):
+        """Témoignages (derniers avis 5 étoiles)"""
+        return list(Review.objects.filter(
             overall_rating=5
-        ).select_related('reviewer', 'order__product').order_by('-created_at')[:6]
-        
-        # Add visitor data to context
-        context.update({
-            'featured_products': featured_products,
-            'recent_products': recent_products,
-            'visitor_cart': visitor_cart,
-            'total_favorites': VisitorFavorite.objects.filter(session_key=session_key).count() if session_key else 0,
-            'total_compares': VisitorCompare.objects.filter(session_key=session_key).count() if session_key else 0,
-        })
-        
-        return context
+        ).select_related('reviewer', 'order__product').order_by('-created_at')[:6])
 
 
 class CustomLoginView(LoginView):
@@ -375,27 +365,21 @@ class DashboardView(LoginRequiredMixin, TemplateView):
 
     def get_admin_context(self):
                 """Contexte complet pour le dashboard administrateur avec noms de champs corrects"""
-                now = timezone.now()
-                today = now.date()
-                this_month = now.replace(day=1).date()
-                last_month = (now.replace(day=1) - timedelta(days=1)).replace(day=1).date()
+                today = timezone.localdate()
+                this_month = today.replace(day=1)
+                last_month = (this_month - timedelta(days=1)).replace(day=1)
+                
+                # Agrégats journaliers (daily_metrics) au lieu de COUNT/SUM sur orders/users
+                month_totals = metric_totals(this_month, today)
                 
                 # =========================
                 # STATISTIQUES PRINCIPALES
                 # =========================
                 
                 # Utilisateurs
-                total_users = User.objects.filter(user_type='CLIENT').count()
-                new_users_this_month = User.objects.filter(
-                    user_type='CLIENT',
-                    date_joined__date__gte=this_month
-                ).count()
-                
-                new_users_last_month = User.objects.filter(
-                    user_type='CLIENT',
-                    date_joined__date__gte=last_month,
-                    date_joined__date__lt=this_month
-                ).count()
+                total_users = metric_totals()['client_signups']
+                new_users_this_month = month_totals['client_signups']
+                new_users_last_month = metric_totals(last_month, this_month - timedelta(days=1))['client_signups']
                 
                 # Calcul pourcentage croissance utilisateurs
                 if new_users_last_month > 0:
@@ -409,26 +393,17 @@ class DashboardView(LoginRequiredMixin, TemplateView):
                 low_stock_count = AdminStock.objects.filter(quantity__lte=5).count()
                 
                 # Commandes
-                today_orders = Order.objects.filter(created_at__date=today).count()
+                today_orders = metric_totals(today, today)['orders_count']
                 pending_orders = Order.objects.filter(status__in=['PENDING', 'PAID']).count()
                 
                 # Revenus et commissions
-                monthly_revenue = Order.objects.filter(
-                    status='DELIVERED',
-                    created_at__date__gte=this_month
-                ).aggregate(total=Sum('total_amount'))['total'] or Decimal('0')
-                
-                monthly_commission = Order.objects.filter(
-                    status='DELIVERED',
-                    created_at__date__gte=this_month
-                ).aggregate(total=Sum('commission_amount'))['total'] or Decimal('0')
+                monthly_revenue = month_totals['revenue']
+                monthly_commission = month_totals['commission']
                 
                 # Paiements mobiles
-                mobile_payments = Payment.objects.filter(
-                    order__payment_method__in=['MTN_MONEY', 'ORANGE_MONEY'],
-                    status='COMPLETED',
-                    created_at__date__gte=this_month
-                ).count()
+                mobile_payments = metric_totals(
+                    this_month, today, 'PAYMENT_METHOD', keys=['MTN_MONEY', 'ORANGE_MONEY']
+                )['completed_payments']
                 
                 # Points de retrait
                 pickup_points_count = PickupPoint.objects.filter(is_active=True).count()
@@ -449,35 +424,24 @@ class DashboardView(LoginRequiredMixin, TemplateView):
                 # =========================
                 
                 # Données des ventes sur 7 jours
-                daily_sales_labels = []
-                daily_sales_data = []
-                
-                for i in range(7):
-                    date = today - timedelta(days=6-i)
-                    daily_sales_labels.append(date.strftime('%a'))
-                    
-                    daily_revenue = Order.objects.filter(
-                        created_at__date=date,
-                        status='DELIVERED'
-                    ).aggregate(total=Sum('total_amount'))['total'] or 0
-                    
-                    daily_sales_data.append(float(daily_revenue))
+                daily_rows = daily_metrics(today - timedelta(days=6), today)
+                daily_sales_labels = [row['date'].strftime('%a') for row in daily_rows]
+                daily_sales_data = [float(row['revenue']) for row in daily_rows]
                 
                 # Données des méthodes de paiement
-                payment_methods = Order.objects.filter(
-                    status='DELIVERED',
-                    created_at__date__gte=this_month
-                ).values('payment_method').annotate(
-                    count=Count('id')
-                ).order_by('-count')
+                payment_methods = sorted(
+                    [(method, values['delivered_orders']) for method, values
+                     in metric_breakdown('PAYMENT_METHOD', this_month, today).items() if values['delivered_orders']],
+                    key=lambda pm: pm[1], reverse=True
+                )
                 
                 payment_methods_labels = []
                 payment_methods_data = []
                 
-                for pm in payment_methods:
-                    method_name = dict(Order.PAYMENT_METHODS).get(pm['payment_method'], pm['payment_method'])
+                for method, count in payment_methods:
+                    method_name = dict(Order.PAYMENT_METHODS).get(method, method)
                     payment_methods_labels.append(method_name)
-                    payment_methods_data.append(pm['count'])
+                    payment_methods_data.append(count)
                 
                 # =========================
                 # TOP CATÉGORIES
@@ -549,10 +513,11 @@ class DashboardView(LoginRequiredMixin, TemplateView):
                 
                 # Obtenir les statistiques par ville
                 city_stats = []
-                total_users_all_cities = User.objects.filter(user_type='CLIENT').count()
+                total_users_all_cities = total_users
+                city_signups = metric_breakdown('CITY')
                 
                 for city_code, city_name in User.CITIES:
-                    city_users = User.objects.filter(city=city_code, user_type='CLIENT').count()
+                    city_users = city_signups.get(city_code, {}).get('client_signups', 0)
                     city_percentage = round((city_users / total_users_all_cities * 100), 1) if total_users_all_cities > 0 else 0
                     
                     city_stats.append({
@@ -562,17 +527,9 @@ class DashboardView(LoginRequiredMixin, TemplateView):
                     })
                 
                 # Revenus par ville principale
-                douala_revenue = Order.objects.filter(
-                    product__city='DOUALA',
-                    status='DELIVERED',
-                    created_at__date__gte=this_month
-                ).aggregate(total=Sum('total_amount'))['total'] or Decimal('0')
-                
-                yaounde_revenue = Order.objects.filter(
-                    product__city='YAOUNDE',
-                    status='DELIVERED',
-                    created_at__date__gte=this_month
-                ).aggregate(total=Sum('total_amount'))['total'] or Decimal('0')
+                city_revenue = metric_breakdown('CITY', this_month, today)
+                douala_revenue = city_revenue.get('DOUALA', {}).get('revenue', Decimal('0'))
+                yaounde_revenue = city_revenue.get('YAOUNDE', {}).get('revenue', Decimal('0'))
                 
                 # =========================
                 # COMMANDES URGENTES
@@ -694,17 +651,15 @@ class DashboardView(LoginRequiredMixin, TemplateView):
                 # =========================
                 
                 # Taux de conversion (commandes payées / visiteurs uniques)
-                total_orders_this_month = Order.objects.filter(
-                    created_at__date__gte=this_month
-                ).count()
+                total_orders_this_month = month_totals['orders_count']
                 
                 conversion_rate = round((total_orders_this_month / total_users * 100), 1) if total_users > 0 else 0
                 
                 # Panier moyen
-                average_order_value = Order.objects.filter(
-                    status='DELIVERED',
-                    created_at__date__gte=this_month
-                ).aggregate(avg=Avg('total_amount'))['avg'] or Decimal('0')
+                average_order_value = (
+                    month_totals['revenue'] / month_totals['delivered_orders']
+                    if month_totals['delivered_orders'] else Decimal('0')
+                )
                 
                 # Taux de retour (simulation)
                 return_rate = 2.1  # Simulé
@@ -841,11 +796,7 @@ class ProductListView(ListView):
         # Filtres de recherche
         search = self.request.GET.get('q')
         if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) | 
-                Q(description__icontains=search) |
-                Q(category__name__icontains=search)
-            )
+            queryset = search_products(queryset, search)
             
             # Enregistrer la recherche
             SearchHistory.objects.create(
@@ -878,14 +829,16 @@ class ProductListView(ListView):
         if condition:
             queryset = queryset.filter(condition=condition)
         
-        # Tri
-        sort = self.request.GET.get('sort', '-created_at')
+        # Tri (par pertinence par défaut lors d'une recherche)
+        sort = self.request.GET.get('sort', 'relevance' if search else '-created_at')
         if sort == 'price_asc':
             queryset = queryset.order_by('price')
         elif sort == 'price_desc':
             queryset = queryset.order_by('-price')
         elif sort == 'popular':
             queryset = queryset.order_by('-views_count')
+        elif sort == 'relevance' and search:
+            queryset = queryset.order_by('-search_rank', '-created_at')
         else:
             queryset = queryset.order_by('-created_at')
         
@@ -903,41 +856,7 @@ class ProductListView(ListView):
         visitor_cart, created = VisitorCart.objects.get_or_create(session_key=session_key)
         
         # Annotate products with visitor interaction data
-        products = context['products']
-        if products:
-            # Get current visitor's favorites, comparisons, and cart items
-            visitor_favorites = set(VisitorFavorite.objects.filter(
-                session_key=session_key
-            ).values_list('product_id', flat=True))
-            
-            visitor_compares = set(VisitorCompare.objects.filter(
-                session_key=session_key
-            ).values_list('product_id', flat=True))
-            
-            cart_items = set(VisitorCartItem.objects.filter(
-                cart=visitor_cart
-            ).values_list('product_id', flat=True))
-            
-            # Annotate each product
-            for product in products:
-                product.is_favorited = product.id in visitor_favorites
-                product.is_comparing = product.id in visitor_compares
-                product.is_in_cart = product.id in cart_items
-                
-                # Get like counts
-                likes_count = ProductLike.objects.filter(
-                    product=product, like_type='LIKE'
-                ).count()
-                dislikes_count = ProductLike.objects.filter(
-                    product=product, like_type='DISLIKE'
-                ).count()
-                product.likes_count = likes_count
-                product.dislikes_count = dislikes_count
-                
-                # Get comments count
-                product.comments_count = ProductComment.objects.filter(
-                    product=product, is_approved=True, parent=None
-                ).count()
+        annotate_listing_context(context, session_key)
         
         # Get visitor favorites and comparisons count for display
         total_favorites = VisitorFavorite.objects.filter(session_key=session_key).count()
@@ -973,8 +892,8 @@ class ProductDetailView(DetailView):
     def get_object(self):
         product = get_object_or_404(Product, slug=self.kwargs['slug'], status='ACTIVE')
         
-        # Incrémenter le compteur de vues
-        Product.objects.filter(id=product.id).update(views_count=F('views_count') + 1)
+        # Incrémenter le compteur de vues (écriture différée)
+        view_counter.record_view(product.id)
         
         # Track analytics
         track_analytics(
@@ -1239,6 +1158,7 @@ class CategoryView(ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['category'] = self.category
+        annotate_listing_context(context, self.request.session.session_key)
         return context
 
 
@@ -1424,6 +1344,7 @@ class ChatDetailView(LoginRequiredMixin, DetailView):
             chat=chat,
             is_read=False
         ).exclude(sender=self.request.user).update(is_read=True)
+        user_badges.invalidate(self.request.user.id, 'unread_messages')
         
         return chat
     
@@ -1858,12 +1779,9 @@ class SearchView(TemplateView):
         
         if query:
             # Recherche dans les produits
-            products = Product.objects.filter(
-                Q(title__icontains=query) |
-                Q(description__icontains=query) |
-                Q(category__name__icontains=query),
-                status='ACTIVE'
-            ).select_related('category', 'seller').prefetch_related('images')
+            products = search_products(
+                Product.objects.filter(status='ACTIVE'), query
+            ).select_related('category', 'seller').prefetch_related('images').order_by('-search_rank', '-created_at')
             
             # Pagination
             paginator = Paginator(products, 24)
@@ -1873,7 +1791,7 @@ class SearchView(TemplateView):
             context.update({
                 'query': query,
                 'products': page_obj,
-                'total_results': products.count(),
+                'total_results': paginator.count,
                 'suggestions': self.get_search_suggestions(query)
             })
             
@@ -1881,7 +1799,7 @@ class SearchView(TemplateView):
             SearchHistory.objects.create(
                 user=self.request.user if self.request.user.is_authenticated else None,
                 search_term=query,
-                results_count=products.count(),
+                results_count=paginator.count,
                 ip_address=self.request.META.get('REMOTE_ADDR', '127.0.0.1')
             )
         
@@ -1985,9 +1903,9 @@ class ProductViewAjax(View):
     
     def post(self, request, pk):
         try:
-            product = get_object_or_404(Product, id=pk)
-            Product.objects.filter(id=pk).update(views_count=F('views_count') + 1)
-            return JsonResponse({'success': True, 'views': product.views_count + 1})
+            product = get_object_or_404(Product.objects.only('id', 'views_count'), id=pk)
+            view_counter.record_view(product.id)
+            return JsonResponse({'success': True, 'views': view_counter.get_views(product)})
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
 
@@ -3809,6 +3727,10 @@ class ProductListView(ListView):
             'category__name', 'category__slug'
         )
         
+        search = self.request.GET.get('q', '').strip()
+        if search:
+            queryset = search_products(queryset, search)
+        
         # Apply filters
         category = self.request.GET.get('category')
         if category:
@@ -3840,6 +3762,8 @@ class ProductListView(ListView):
             queryset = queryset.order_by('-views_count')
         elif sort_by == 'recent':
             queryset = queryset.order_by('-created_at')
+        elif search and 'sort' not in self.request.GET:
+            queryset = queryset.order_by('-search_rank', '-created_at')
         else:
             queryset = queryset.order_by('-created_at')
         
@@ -3861,6 +3785,7 @@ class ProductListView(ListView):
         
         context['categories'] = categories
         context['current_filters'] = self.request.GET
+        annotate_listing_context(context, self.request.session.session_key)
         return context
 
 
@@ -3884,8 +3809,8 @@ class ProductDetailView(DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Increment view count (async)
-        self.increment_view_count()
+        # Increment view count (buffered)
+        view_counter.record_view(self.object.id)
         
         # Get related products
         related_products = Product.objects.select_related(
@@ -3905,24 +3830,6 @@ class ProductDetailView(DetailView):
         context['related_products'] = related_products
         return context
     
-    def increment_view_count(self):
-        """Increment view count asynchronously"""
-        try:
-            # Use cache to batch updates
-            cache_key = f"product_views_{self.object.id}"
-            current_views = cache.get(cache_key, 0)
-            cache.set(cache_key, current_views + 1, 60 * 5)  # 5 minutes
-            
-            # Update database periodically
-            if current_views % 10 == 0:  # Update every 10 views
-                Product.objects.filter(id=self.object.id).update(
-                    views_count=F('views_count') + current_views + 1
-                )
-                cache.delete(cache_key)
-        except Exception as e:
-            logger.error(f"Error incrementing view count: {e}")
-
-
 # ============= OPTIMIZED SEARCH VIEWS =============
 
 class OptimizedSearchView(ListView):
@@ -3937,15 +3844,14 @@ class OptimizedSearchView(ListView):
         if not query:
             return Product.objects.none()
         
-        # Use SQLite-compatible search with Q objects
-        queryset = Product.objects.select_related(
+        # Full-text search (PostgreSQL tsvector, SQLite FTS5 or in-process index)
+        queryset = search_products(
+            Product.objects.filter(status='ACTIVE'), query
+        ).select_related(
             'seller', 'category'
         ).prefetch_related(
             'images'
-        ).filter(
-            Q(title__icontains=query) | Q(description__icontains=query),
-            status='ACTIVE'
-        ).order_by('-created_at').only(
+        ).order_by('-search_rank', '-created_at').only(
             'id', 'title', 'slug', 'price', 'condition', 'city',
             'seller__email', 'category__name'
         )
@@ -4109,33 +4015,17 @@ def clear_user_cache(user_id):
 
 # ============= PERFORMANCE MONITORING =============
 
-class PerformanceMiddleware:
-    """Middleware to monitor query performance"""
-    
-    def __init__(self, get_response):
-        self.get_response = get_response
-    
-    def __call__(self, request):
-        from django.db import connection
-        from django.utils import timezone
-        
-        start_time = timezone.now()
-        
-        response = self.get_response(request)
-        
-        end_time = timezone.now()
-        duration = (end_time - start_time).total_seconds()
-        
-        # Log slow requests
-        if duration > 1.0:  # Log requests taking more than 1 second
-            logger.warning(f"Slow request: {request.path} took {duration:.2f}s")
-        
-        # Log query count
-        query_count = len(connection.queries)
-        if query_count > 20:  # Log requests with more than 20 queries
-            logger.warning(f"High query count: {request.path} made {query_count} queries")
-        
-        return response
+# Mesure unifiée dans backend.telemetry (histogrammes par route, endpoint Prometheus)
+from .middleware import PerformanceMonitoringMiddleware as PerformanceMiddleware
+
+
+def prometheus_metrics(request):
+    """Métriques de performance au format texte Prometheus (staff ou jeton METRICS_TOKEN)"""
+    from .telemetry import is_authorized, telemetry
+
+    if not is_authorized(request):
+        return HttpResponseForbidden('Forbidden')
+    return HttpResponse(telemetry.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 # ============= BULK OPERATIONS =============
@@ -4176,6 +4066,7 @@ def bulk_create_notifications(users, notification_data):
         # Clear user cache
         for user in users:
             clear_user_cache(user.id)
+        user_badges.invalidate([user.id for user in users], 'unread_notifications')
         
         return len(notifications)
     except Exception as e:
@@ -4496,8 +4387,7 @@ class VisitorProductDetailView(DetailView):
         product = self.get_object()
         
         # Increment view count
-        product.views_count += 1
-        product.save(update_fields=['views_count'])
+        view_counter.record_view(product.id)
         
         # Related products
         context['related_products'] = Product.objects.filter(
@@ -4568,13 +4458,15 @@ def visitor_add_to_cart(request, product_id):
         )
         
         if not created:
+            # Panier déjà chargé : les signaux mettent aussi ses totaux à jour
+            cart_item.cart = visitor_cart
             cart_item.quantity += 1
             cart_item.save()
         
         return JsonResponse({
             'success': True,
             'message': 'Produit ajouté au panier',
-            'cart_count': VisitorCartItem.objects.filter(cart=visitor_cart).count()
+            'cart_count': visitor_cart.total_items
         })
         
     except Exception as e:
@@ -4980,7 +4872,7 @@ class VisitorProductListView(ListView):
         # Get visitor favorites and comparisons count for display
         total_favorites = VisitorFavorite.objects.filter(session_key=session_key).count()
         total_compares = VisitorCompare.objects.filter(session_key=session_key).count()
-        cart_count = VisitorCartItem.objects.filter(cart=visitor_cart).count()
+        cart_count = visitor_cart.total_items
         
         # Add context data
         context.update({
@@ -5048,9 +4940,7 @@ class VisitorProductDetailView(DetailView):
         product = context['product']
         
         # Increment view count
-        product.views_count = F('views_count') + 1
-        product.save()
-        product.refresh_from_db()
+        view_counter.record_view(product.id)
         
         # Get visitor session
         session_key = self.request.session.session_key
@@ -5072,7 +4962,7 @@ class VisitorProductDetailView(DetailView):
                 session_key=session_key, product=product
             ).exists(),
             'similar_products': self.get_similar_products(product),
-            'cart_count': VisitorCartItem.objects.filter(cart=visitor_cart).count(),
+            'cart_count': visitor_cart.total_items,
         })
         
         return context
@@ -5112,13 +5002,15 @@ def visitor_add_to_cart(request, product_id):
         )
         
         if not created:
+            # Panier déjà chargé : les signaux mettent aussi ses totaux à jour
+            cart_item.cart = visitor_cart
             cart_item.quantity += 1
             cart_item.save()
         
         return JsonResponse({
             'success': True,
             'message': 'Produit ajouté au panier',
-            'cart_count': VisitorCartItem.objects.filter(cart=visitor_cart).count()
+            'cart_count': visitor_cart.total_items
         })
         
     except Exception as e:
@@ -5299,7 +5191,7 @@ def visitor_cart_status(request):
     
     try:
         visitor_cart = VisitorCart.objects.get(session_key=session_key)
-        cart_count = VisitorCartItem.objects.filter(cart=visitor_cart).count()
+        cart_count = visitor_cart.total_items
     except VisitorCart.DoesNotExist:
         cart_count = 0
     
@@ -18,8 +18,6 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import UserCreationForm
 from django import forms
 import json
-import csv
-import openpyxl
 from datetime import datetime, timedelta
 from django.utils import timezone
 from django.core.mail import send_mail, send_mass_mail
@@ -40,6 +38,10 @@ except ImportError as e:
     print(f"⚠️ Error importing models: {e}")
     MAIN_MODELS_AVAILABLE = False
 
+from .user_badges import user_badges
+from .exports import export_job_response, export_response
+from .daily_metrics import daily_metrics, metric_breakdown, metric_totals
+
 import random  # Add this for AdminStockAddView
 from decimal import Decimal
 from django.utils.text import slugify
@@ -657,95 +659,18 @@ class AdminAnalyticsView(ListView):
 # ============ EXPORT FUNCTIONS ============
 @admin_required
 def admin_export_users(request):
-    """Export users data to Excel/CSV"""
+    """Export users data to Excel/CSV (streamed, or as a background job for large exports)"""
     try:
-        export_format = request.GET.get('format', 'excel')
-        
-        if export_format == 'excel':
-            # Create Excel file
-            response = HttpResponse(
-                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-            response['Content-Disposition'] = f'attachment; filename="users_export_{timezone.now().strftime("%Y%m%d_%H%M")}.xlsx"'
-            
-            # Create workbook and worksheet
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = "Utilisateurs"
-            
-            # Headers
-            headers = [
-                'ID', 'Email', 'Prénom', 'Nom', 'Téléphone', 'Ville',
-                'Type utilisateur', 'Statut', 'Vérifié', 'Score confiance',
-                'Points fidélité', 'Date inscription', 'Dernière connexion'
-            ]
-            ws.append(headers)
-            
-            # Data
-            for user in User.objects.all().order_by('-date_joined'):
-                row = [
-                    str(user.id),  # Convert UUID to string
-                    user.email,
-                    user.first_name,
-                    user.last_name,
-                    getattr(user, 'phone', '') or '',
-                    getattr(user, 'city', '') or '',
-                    getattr(user, 'get_user_type_display', lambda: user.user_type)(),
-                    'Actif' if user.is_active else 'Inactif',
-                    'Oui' if getattr(user, 'is_verified', False) else 'Non',
-                    getattr(user, 'trust_score', 0),
-                    getattr(user, 'loyalty_points', 0),
-                    user.date_joined.strftime('%Y-%m-%d %H:%M'),
-                    user.last_login.strftime('%Y-%m-%d %H:%M') if user.last_login else 'Jamais'
-                ]
-                ws.append(row)
-            
-            # Style the headers
-            for cell in ws[1]:
-                cell.font = openpyxl.styles.Font(bold=True)
-                cell.fill = openpyxl.styles.PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
-            
-            # Save workbook
-            wb.save(response)
-            return response
-            
-        else:  # CSV format
-            response = HttpResponse(content_type='text/csv')
-            response['Content-Disposition'] = f'attachment; filename="users_export_{timezone.now().strftime("%Y%m%d_%H%M")}.csv"'
-            
-            writer = csv.writer(response)
-            
-            # Headers
-            writer.writerow([
-                'ID', 'Email', 'Prénom', 'Nom', 'Téléphone', 'Ville',
-                'Type utilisateur', 'Statut', 'Vérifié', 'Score confiance',
-                'Points fidélité', 'Date inscription', 'Dernière connexion'
-            ])
-            
-            # Data
-            for user in User.objects.all().order_by('-date_joined'):
-                writer.writerow([
-                    str(user.id),  # Convert UUID to string
-                    user.email,
-                    user.first_name,
-                    user.last_name,
-                    getattr(user, 'phone', '') or '',
-                    getattr(user, 'city', '') or '',
-                    getattr(user, 'get_user_type_display', lambda: user.user_type)(),
-                    'Actif' if user.is_active else 'Inactif',
-                    'Oui' if getattr(user, 'is_verified', False) else 'Non',
-                    getattr(user, 'trust_score', 0),
-                    getattr(user, 'loyalty_points', 0),
-                    user.date_joined.strftime('%Y-%m-%d %H:%M'),
-                    user.last_login.strftime('%Y-%m-%d %H:%M') if user.last_login else 'Jamais'
-                ])
-            
-            return response
-        
+        return export_response(request, 'users')
     except Exception as e:
         messages.error(request, f'Erreur lors de l\'export: {e}')
         return redirect('admin_panel:users')
 
+@admin_required
+def admin_export_job(request, job_id):
+    """Status of a background export, or its file with ?download=1"""
+    return export_job_response(request, job_id)
+
 # ============ USER STATUS ACTIONS ============
 @admin_required
 @require_http_methods(["POST"])
@@ -1068,23 +993,13 @@ def get_daily_sales_data(days=7):
     if not MAIN_MODELS_AVAILABLE:
         return {}
     
-    today = timezone.now().date()
-    data = {'labels': [], 'sales': [], 'revenue': []}
-    
-    for i in range(days):
-        date = today - timedelta(days=days-1-i)
-        data['labels'].append(date.strftime('%a'))
-        
-        daily_orders = Order.objects.filter(created_at__date=date).count()
-        daily_revenue = Order.objects.filter(
-            created_at__date=date,
-            status__in=['DELIVERED', 'COMPLETED']
-        ).aggregate(total=Sum('total_amount'))['total'] or 0
-        
-        data['sales'].append(daily_orders)
-        data['revenue'].append(float(daily_revenue))
-    
-    return data
+    today = timezone.localdate()
+    rows = daily_metrics(today - timedelta(days=days-1), today)
+    return {
+        'labels': [row['date'].strftime('%a') for row in rows],
+        'sales': [row['orders_count'] for row in rows],
+        'revenue': [float(row['revenue']) for row in rows],
+    }
 
 def get_top_categories():
     """Get top performing categories"""
@@ -1099,29 +1014,31 @@ def get_top_categories():
     except:
         return []
 
+def _month_bounds():
+    """(today, first day of this month, first day of last month)"""
+    today = timezone.localdate()
+    this_month = today.replace(day=1)
+    last_month = (this_month - timedelta(days=1)).replace(day=1)
+    return today, this_month, last_month
+
+def _growth_rate(current, previous):
+    if previous > 0:
+        return round(((current - previous) / previous) * 100, 1)
+    return 0
+
 def get_user_growth_data():
     """Get user growth statistics"""
     if not MAIN_MODELS_AVAILABLE:
         return {}
     
-    today = timezone.now().date()
-    this_month = today.replace(day=1)
-    last_month = (this_month - timedelta(days=1)).replace(day=1)
-    
-    this_month_users = User.objects.filter(date_joined__date__gte=this_month).count()
-    last_month_users = User.objects.filter(
-        date_joined__date__gte=last_month,
-        date_joined__date__lt=this_month
-    ).count()
-    
-    growth_rate = 0
-    if last_month_users > 0:
-        growth_rate = round(((this_month_users - last_month_users) / last_month_users) * 100, 1)
+    today, this_month, last_month = _month_bounds()
+    this_month_users = metric_totals(this_month, today)['signups']
+    last_month_users = metric_totals(last_month, this_month - timedelta(days=1))['signups']
     
     return {
         'this_month': this_month_users,
         'last_month': last_month_users,
-        'growth_rate': growth_rate
+        'growth_rate': _growth_rate(this_month_users, last_month_users)
     }
 
 def get_revenue_growth_data():
@@ -1129,39 +1046,25 @@ def get_revenue_growth_data():
     if not MAIN_MODELS_AVAILABLE:
         return {}
     
-    today = timezone.now().date()
-    this_month = today.replace(day=1)
-    last_month = (this_month - timedelta(days=1)).replace(day=1)
-    
-    this_month_revenue = Order.objects.filter(
-        created_at__date__gte=this_month,
-        status__in=['DELIVERED', 'COMPLETED']
-    ).aggregate(total=Sum('total_amount'))['total'] or 0
-    
-    last_month_revenue = Order.objects.filter(
-        created_at__date__gte=last_month,
-        created_at__date__lt=this_month,
-        status__in=['DELIVERED', 'COMPLETED']
-    ).aggregate(total=Sum('total_amount'))['total'] or 0
-    
-    growth_rate = 0
-    if last_month_revenue > 0:
-        growth_rate = round(((this_month_revenue - last_month_revenue) / last_month_revenue) * 100, 1)
+    today, this_month, last_month = _month_bounds()
+    this_month_revenue = metric_totals(this_month, today)['revenue']
+    last_month_revenue = metric_totals(last_month, this_month - timedelta(days=1))['revenue']
     
     return {
         'this_month': float(this_month_revenue),
         'last_month': float(last_month_revenue),
-        'growth_rate': growth_rate
+        'growth_rate': float(_growth_rate(this_month_revenue, last_month_revenue))
     }
 
 def get_city_statistics():
     """Get statistics by city"""
     try:
-        city_stats = []
-        total_users = User.objects.filter(user_type='CLIENT').count()
+        signups = metric_breakdown('CITY')
+        total_users = metric_totals()['client_signups']
         
+        city_stats = []
         for city_code, city_name in getattr(User, 'CITIES', []):
-            city_users = User.objects.filter(city=city_code, user_type='CLIENT').count()
+            city_users = signups.get(city_code, {}).get('client_signups', 0)
             percentage = round((city_users / total_users * 100), 1) if total_users > 0 else 0
             
             city_stats.append({
@@ -2823,9 +2726,10 @@ def admin_notification_send_bulk(request):
         action = request.POST.get('action')
         
         if action == 'mark_read':
-            updated = Notification.objects.filter(
-                id__in=notification_ids
-            ).update(is_read=True)
+            notifications = Notification.objects.filter(id__in=notification_ids)
+            user_ids = list(notifications.values_list('user_id', flat=True).distinct())
+            updated = notifications.update(is_read=True)
+            user_badges.invalidate(user_ids, 'unread_notifications')
             
             return JsonResponse({
                 'success': True,
@@ -3415,12 +3319,14 @@ class AdminReportsView(AdminRequiredMixin, TemplateView):
             context['total_revenue'] = Payment.objects.filter(status='COMPLETED').aggregate(Sum('amount'))['amount__sum'] or 0
         return context
 
-class ExportReportsView(AdminRequiredMixin, TemplateView):
-    template_name = 'backend/admin/reports/export.html'
+class ExportReportsView(AdminRequiredMixin, View):
+    """Export any registered table (?type=users|orders|payments|stock) to Excel/CSV"""
     
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        return context
+    def get(self, request, *args, **kwargs):
+        try:
+            return export_response(request, request.GET.get('type', 'orders'))
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
 
 class AdminUserDeleteView(AdminRequiredMixin, DeleteView):
     model = User
@@ -3828,12 +3734,11 @@ class AdminOrderCancelView(AdminRequiredMixin, TemplateView):
         context['order'] = get_object_or_404(Order, pk=self.kwargs['pk'])
         return context
 
-class ExportOrdersView(AdminRequiredMixin, TemplateView):
-    template_name = 'backend/admin/orders/export.html'
+class ExportOrdersView(AdminRequiredMixin, View):
+    """Export orders to Excel/CSV (?format=excel|csv)"""
     
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        return context
+    def get(self, request, *args, **kwargs):
+        return export_response(request, 'orders')
 
 class AdminOrderBulkActionsView(AdminRequiredMixin, TemplateView):
     template_name = 'backend/admin/orders/bulk_actions.html'
@@ -3873,12 +3778,11 @@ class AdminPaymentRefundView(AdminRequiredMixin, TemplateView):
         context['payment'] = get_object_or_404(Payment, pk=self.kwargs['pk'])
         return context
 
-class ExportPaymentsView(AdminRequiredMixin, TemplateView):
-    template_name = 'backend/admin/payments/export.html'
+class ExportPaymentsView(AdminRequiredMixin, View):
+    """Export payments to Excel/CSV (?format=excel|csv)"""
     
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        return context
+    def get(self, request, *args, **kwargs):
+        return export_response(request, 'payments')
 
 class AdminPaymentBulkActionsView(AdminRequiredMixin, TemplateView):
     template_name = 'backend/admin/payments/bulk_actions.html'
@@ -3938,12 +3842,11 @@ class AdminStockImportView(AdminRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         return context
 
-class AdminStockExportView(AdminRequiredMixin, TemplateView):
-    template_name = 'backend/admin/stock/export.html'
+class AdminStockExportView(AdminRequiredMixin, View):
+    """Export stock to Excel/CSV (?format=excel|csv)"""
     
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        return context
+    def get(self, request, *args, **kwargs):
+        return export_response(request, 'stock')
 
 class AdminStockMovementsView(AdminRequiredMixin, ListView):
     model = AdminStock
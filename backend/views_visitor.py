@@ -4,7 +4,7 @@ from django.views.generic import TemplateView, ListView, DetailView, View
 from django.views import View
 from django.http import JsonResponse, HttpResponse
 from django.urls import reverse_lazy, reverse
-from django.db.models import Q, Count, Avg, Sum, F
+from django.db.models import Q, Count, Avg, Sum
 from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
@@ -41,6 +41,8 @@ from .models_visitor import (
     VisitorSession
 )
 from .models_advanced import ProductRecommendation
+from .product_cards import annotate_listing_context
+from .view_counter import view_counter
 from .forms import (
     CustomSignupForm, CustomLoginForm, ProductForm, 
     OrderForm, ReviewForm, ChatMessageForm, ProfileForm,
@@ -118,11 +120,14 @@ class VisitorProductListView(ListView):
             product_count=Count('products', filter=Q(products__status='ACTIVE'))
         )
         
+        # Card counts and visitor flags for the current page
+        annotate_listing_context(context, session_key)
+        
         context.update({
             'categories': categories,
             'recommendations': recommendations,
             'current_filters': self.request.GET.dict(),
-            'total_products': self.get_queryset().count(),
+            'total_products': context['paginator'].count if context.get('paginator') else len(context['products']),
         })
         
         return context
@@ -224,6 +229,9 @@ class VisitorCategoryDetailView(ListView):
         # Get visitor cart
         context['visitor_cart'] = self._get_visitor_cart(session_key)
         
+        # Card counts and visitor flags for the current page
+        annotate_listing_context(context, session_key)
+        
         # Get subcategories
         context['subcategories'] = Category.objects.filter(
             parent=self.category
@@ -394,9 +402,8 @@ class VisitorProductDetailView(DetailView):
                 }
             )
             
-            # Increment product view count
-            product.views_count = F('views_count') + 1
-            product.save()
+            # Increment product view count (buffered, flushed in bulk)
+            view_counter.record_view(product.id)
         except Exception as e:
             logger.error(f"Error tracking product view: {e}")
     
@@ -2,7 +2,7 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import TemplateView, View
 from django.views import View
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, FileResponse, StreamingHttpResponse
 from django.urls import reverse_lazy, reverse
 from django.utils import timezone
 from django.utils.decorators import method_decorator
@@ -24,9 +24,6 @@ import urllib.parse
 import os
 import sys
 from decimal import Decimal
-import qrcode
-import io
-import base64
 from PIL import Image
 
 from .models import (
@@ -36,6 +33,7 @@ from .models_visitor import (
     VisitorCart, VisitorCartItem, WhatsAppRequest, QRReceipt,
     VisitorBehavior, VisitorSession
 )
+from .receipts import iter_receipt_pdf, qr_matrix, receipt_data
 from .utils import (
     send_sms_notification, send_email_notification, 
     process_payment, track_analytics, generate_pickup_code,
@@ -363,7 +361,7 @@ def visitor_cart_checkout(request):
     def _create_qr_receipt(self, visitor_cart, orders):
         """Create QR receipt for orders"""
         try:
-            # Generate QR code
+            # QR payload only: the image is rendered from it once per content (see receipts.qr_matrix)
             qr_data = {
                 'cart_id': str(visitor_cart.id),
                 'session_key': visitor_cart.session_key,
@@ -372,17 +370,7 @@ def visitor_cart_checkout(request):
                 'orders': [str(order.id) for order in orders],
                 'timestamp': visitor_cart.created_at.isoformat()
             }
-            
-            qr = qrcode.QRCode(version=1, box_size=10, border=5)
-            qr.add_data(json.dumps(qr_data))
-            qr.make(fit=True)
-            
-            img = qr.make_image(fill_color="black", back_color="white")
-            
-            # Convert to base64
-            buffer = io.BytesIO()
-            img.save(buffer, format='PNG')
-            qr_code_data = base64.b64encode(buffer.getvalue()).decode()
+            qr_code_data = json.dumps(qr_data, sort_keys=True)
             
             # Create QR receipt
             qr_receipt = QRReceipt.objects.create(
@@ -660,15 +648,19 @@ def visitor_download_receipt(request):
             messages.error(request, "Reçu non trouvé")
             return redirect('backend:visitor_cart')
         
-        # Get orders
-        orders = Order.objects.filter(id__in=qr_receipt.orders)
+        filename = f"receipt_{qr_receipt.receipt_number}.pdf"
         
-        # Generate PDF receipt
-        pdf_content = generate_receipt_pdf(qr_receipt, orders)
+        # Receipt already rendered by the batch task (render_receipt_pdfs_task)
+        if qr_receipt.receipt_pdf:
+            return FileResponse(qr_receipt.receipt_pdf.open('rb'), as_attachment=True, filename=filename,
+                                content_type='application/pdf')
         
-        # Create response
-        response = HttpResponse(pdf_content, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="receipt_{qr_receipt.receipt_number}.pdf"'
+        # Get orders
+        orders = Order.objects.filter(id__in=qr_receipt.orders).select_related('product')
+        
+        # Generate PDF receipt, streamed page by page
+        response = StreamingHttpResponse(generate_receipt_pdf(qr_receipt, orders), content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
         
         return response
         
@@ -679,51 +671,9 @@ def visitor_download_receipt(request):
 
 
 def generate_receipt_pdf(qr_receipt, orders):
-    """Generate PDF receipt with QR code"""
-    try:
-        # This is a simplified implementation
-        # In production, you would use a proper PDF library like ReportLab
-        
-        # For now, return a simple text representation
-        receipt_text = f"""
-        VIDÉ-GRENIER KAMER - RECEIPT
-        =============================
-        
-        Receipt Number: {qr_receipt.receipt_number}
-        Date: {qr_receipt.created_at.strftime('%d/%m/%Y %H:%M')}
-        
-        Customer Information:
-        Name: {qr_receipt.visitor_name}
-        Phone: {qr_receipt.visitor_phone}
-        Email: {qr_receipt.visitor_email}
-        
-        Orders:
-        """
-        
-        for order in orders:
-            receipt_text += f"""
-        - {order.product.title}
-          Quantity: {order.quantity}
-          Unit Price: {order.unit_price:,} FCFA
-          Total: {order.total_amount:,} FCFA
-        """
-        
-        receipt_text += f"""
-        
-        Subtotal: {qr_receipt.total_amount:,} FCFA
-        Delivery Cost: {qr_receipt.delivery_cost:,} FCFA
-        Total: {qr_receipt.total_amount + qr_receipt.delivery_cost:,} FCFA
-        
-        QR Code: {qr_receipt.qr_code_data[:50]}...
-        
-        Thank you for your purchase!
-        """
-        
-        return receipt_text.encode('utf-8')
-        
-    except Exception as e:
-        logger.error(f"Error generating PDF receipt: {e}")
-        return b"Error generating receipt"
+    """Generate PDF receipt with QR code, as an iterator of byte chunks"""
+    data = receipt_data(qr_receipt, orders)
+    return iter_receipt_pdf(data, qr_matrix(data['qr_payload']))
 
 
 # ============= WHATSAPP INTEGRATION =============
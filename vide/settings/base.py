@@ -81,6 +81,8 @@ LOCAL_APPS = [
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
+    # Performance monitoring middleware (first: times the whole stack)
+    'backend.middleware.PerformanceMonitoringMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -91,8 +93,6 @@ MIDDLEWARE = [
     'allauth.account.middleware.AccountMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    # Performance monitoring middleware
-    'backend.views.PerformanceMiddleware',
 ]
 
 ROOT_URLCONF = 'vide.urls'
@@ -383,6 +383,9 @@ NEWSLETTER_SETTINGS = {
     'BATCH_DELAY': 5,  # seconds between batches
     'MAX_RETRIES': 3,
     'RETRY_DELAY': 300,  # 5 minutes
+    'DISPATCH_CHUNK_SIZE': 1000,  # Subscribers per keyset page / checkpoint
+    'DISPATCH_STALE_AFTER': 600,  # seconds without checkpoint before a SENDING campaign is resumed
+    'LOG_BATCH_SIZE': 200,  # Send results per NewsletterLog bulk insert / email_count update
 }
 
 # Performance Settings
@@ -395,6 +398,123 @@ PERFORMANCE_SETTINGS = {
     'SLOW_QUERY_THRESHOLD': 1.0,  # seconds
 }
 
+# Recommendation Engine Settings
+RECOMMENDATION_SETTINGS = {
+    'SIMILARITY_INDEX_DIR': BASE_DIR / 'ml_cache' / 'similarity',  # Memory-mapped top-K index
+    'SIMILARITY_TOP_K': 20,  # Neighbours kept per product
+    'SIMILARITY_BLOCK_ELEMENTS': 16 * 1024 * 1024,  # Max floats per dense similarity block (64 MB)
+    'SIMILARITY_RELOAD_INTERVAL': 60,  # seconds between index freshness checks
+    'SIMILARITY_OVERLAY_TIMEOUT': 86400,  # Incremental updates kept until next rebuild
+    'COLLABORATIVE_MODEL_DIR': BASE_DIR / 'ml_cache' / 'collaborative',  # Item-item CF neighbours
+    'COLLABORATIVE_HISTORY_SIZE': 50,  # Recent interactions used to score a user
+}
+
+# Product full-text search (backend/search.py)
+SEARCH_SETTINGS = {
+    'BACKEND': 'auto',  # auto, postgres (tsvector + GIN), sqlite_fts (FTS5) or memory
+    'MAX_RESULTS': 500,  # Ranked ids handed back to the ORM by the sqlite_fts/memory backends
+    'MIN_PREFIX_LENGTH': 2,  # Last query term matches as a prefix from this length
+    'MEMORY_RELOAD_INTERVAL': 60,  # seconds between in-process index freshness checks
+}
+
+# Product view counter (backend/view_counter.py)
+VIEW_COUNTER_SETTINGS = {
+    'BACKEND': 'auto',  # auto (Redis when the default cache is django_redis), redis or memory
+    'FLUSH_INTERVAL': 60,  # seconds between bulk flushes to products.views_count
+    'MAX_PENDING': 1000,  # memory backend: flush early once this many products are buffered
+}
+
+# Header badge counters and main categories of the template context (backend/user_badges.py)
+USER_BADGES_SETTINGS = {
+    'BACKEND': 'auto',  # auto (Redis hash per user when the default cache is django_redis), redis or cache
+    'TIMEOUT': 3600,  # seconds; safety net, counters are invalidated by signals
+    'CATEGORIES_TTL': 300,  # seconds the main categories stay in process memory
+}
+
+# Asynchronous behavior tracking (backend/behavior_pipeline.py)
+BEHAVIOR_TRACKING_SETTINGS = {
+    'ENABLED': True,
+    'BACKEND': 'auto',  # auto (Redis stream when the default cache is django_redis), redis or memory
+    'QUEUE_SIZE': 10000,  # memory backend: events beyond this are dropped
+    'STREAM_MAXLEN': 100000,  # redis backend: approximate stream cap
+    'BATCH_SIZE': 500,  # events per bulk_create
+    'FLUSH_INTERVAL': 2,  # seconds the consumer waits for a batch
+    'CONSUMER_THREAD': True,  # False when running manage.py consume_behavior_events instead
+    'SAMPLE_RATES': {},  # e.g. {'VIEW': 0.25} to keep one product view in four
+    'CLAIM_IDLE_TIME': 60,  # redis backend: seconds before unacknowledged events are redelivered
+    'MAX_DELIVERIES': 5,  # redis backend: deliveries before an event goes to behavior_events:dead
+}
+
+# Pooled SMTP transport shared by the email senders (backend/smtp_pool.py)
+SMTP_POOL_SETTINGS = {
+    'BACKEND': None,  # None: EMAIL_BACKEND; locmem/filebased/console backends as local stand-ins
+    'POOL_SIZE': 4,  # persistent authenticated sessions (and newsletter worker threads)
+    'RATE_PER_MINUTE': 1000,  # whole pool, shared by every sender; 0 disables rate limiting
+    'BURST': 10,  # mails the pool may send back to back after being idle
+    'MAX_MESSAGES_PER_CONNECTION': 500,  # session recycled after this many mails
+    'TIMEOUT': 30,  # SMTP socket timeout (seconds)
+    'CHECKOUT_TIMEOUT': 60,  # seconds to wait for a free session
+}
+
+# Visitor PDF receipts and QR codes (backend/receipts.py)
+RECEIPT_SETTINGS = {
+    'QR_STORAGE_DIR': 'receipts/qr',  # content-addressed QR PNGs in the default storage
+    'QR_CACHE_TIMEOUT': 60 * 60 * 24 * 30,  # QR module matrices in the cache (seconds)
+    'WORKERS': None,  # batch rendering processes, None: one per CPU
+}
+
+# Local/Dropbox storage router (backend/dropbox_storage.py); credentials come from DROPBOX_* env vars
+DROPBOX_STORAGE_SETTINGS = {
+    'DB_SIZE_CHECK_INTERVAL': 300,  # seconds the routing decision (database size) is cached
+    'SHARED_URL_TTL': 60 * 60 * 24 * 6,  # seconds a Dropbox shared link is reused
+    'CHUNKED_UPLOAD_THRESHOLD': 16 * 1024 * 1024,  # bytes; larger files use a parallel upload session
+    'CHUNK_SIZE': 8 * 1024 * 1024,  # must be a multiple of 4 MB
+    'UPLOAD_WORKERS': 4,  # threads sending chunks of one upload
+    'INDEX_CACHE_TIMEOUT': 60 * 60 * 24,  # StoredFile index entries in the cache (seconds)
+}
+
+# Sliding-window rate limits of APIThrottleMiddleware and SecurityMiddleware (backend/rate_limit.py)
+RATE_LIMIT_SETTINGS = {
+    'BACKEND': 'auto',  # auto (shared Redis counters when the default cache is django_redis), redis or memory
+    'MAX_KEYS': 10000,  # memory backend: LRU bound on tracked IP/route counters per process
+    'ROUTES': [  # APIThrottleMiddleware, first matching path prefix wins; optional 'methods'
+        {'prefix': '/api/newsletter/subscribe/', 'limit': 10, 'window': 60, 'methods': ['POST']},
+        {'prefix': '/api/campay/webhook/', 'limit': 600, 'window': 60},
+        {'prefix': '/api/', 'limit': 100, 'window': 60},
+    ],
+    'LOGIN': {'path': '/auth/login/', 'limit': 5, 'window': 3600},  # SecurityMiddleware failed logins per IP
+}
+
+# Streaming admin exports (backend/exports.py)
+EXPORT_SETTINGS = {
+    'CHUNK_SIZE': 2000,  # rows per cursor round trip / streamed CSV chunk
+    'BACKGROUND_THRESHOLD': 100000,  # larger exports run as a job writing to the default storage; None: never
+    'STORAGE_DIR': 'exports',
+    'JOB_TIMEOUT': 60 * 60 * 24,  # seconds a finished export stays downloadable
+}
+
+# Request telemetry (backend/telemetry.py, Prometheus text at /metrics/)
+TELEMETRY_SETTINGS = {
+    'ENABLED': True,
+    'LATENCY_BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),  # seconds
+    'QUERY_BUCKETS': (0, 1, 2, 5, 10, 20, 50, 100, 200),  # queries per request
+    'PUBLISH_INTERVAL': 15,  # seconds between worker snapshots published to the cache
+    'WORKER_TTL': 120,  # seconds a silent worker is still merged
+    'METRICS_TOKEN': config('METRICS_TOKEN', default=''),  # bearer token for the Prometheus scraper
+}
+
+# Sampling SQL profiler (backend/query_profiler.py, manage.py optimize_performance --queries)
+QUERY_PROFILER_SETTINGS = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 0.05,  # fraction of requests profiled
+    'N_PLUS_ONE_THRESHOLD': 5,  # same query fingerprint this many times in one request
+    'SLOW_QUERY_THRESHOLD': 0.1,  # seconds before a SELECT is EXPLAINed
+    'EXPLAIN': True,
+    'MAX_EXPLAINS_PER_REQUEST': 3,
+    'MAX_FINGERPRINTS': 1000,  # per process
+    'MAX_SQL_LENGTH': 2000,
+}
+
 # Logging - ENHANCED
 LOGS_DIR = BASE_DIR / 'logs'
 os.makedirs(LOGS_DIR, exist_ok=True)
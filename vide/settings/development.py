@@ -37,7 +37,7 @@ CHANNEL_LAYERS = {
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 # Disable performance monitoring middleware for development
-MIDDLEWARE = [mw for mw in MIDDLEWARE if 'PerformanceMiddleware' not in mw]
+MIDDLEWARE = [mw for mw in MIDDLEWARE if not mw.endswith(('PerformanceMiddleware', 'PerformanceMonitoringMiddleware'))]
 
 # Disable PostgreSQL specific features
 INSTALLED_APPS = [app for app in INSTALLED_APPS if app != 'django.contrib.postgres']